@@ -0,0 +1,53 @@
+from alembic import op
+import sqlalchemy as sa
+
+from app import geo
+
+
+# revision identifiers, used by Alembic.
+revision = "0003_job_geo_cell"
+down_revision = "0002_safetap_models"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column("jobs", sa.Column("geo_cell", sa.String(length=32), nullable=True))
+
+    # Backfill existing jobs in batches.
+    bind = op.get_bind()
+    jobs = sa.table(
+        "jobs",
+        sa.column("id", sa.Integer),
+        sa.column("latitude", sa.Float),
+        sa.column("longitude", sa.Float),
+        sa.column("geo_cell", sa.String),
+    )
+    last_id = 0
+    while True:
+        rows = bind.execute(
+            sa.select(jobs.c.id, jobs.c.latitude, jobs.c.longitude)
+            .where(jobs.c.id > last_id)
+            .order_by(jobs.c.id)
+            .limit(5000)
+        ).all()
+        if not rows:
+            break
+        updates = [
+            {"job_id": row.id, "cell": geo.cell_for(row.latitude, row.longitude)}
+            for row in rows
+            if row.latitude is not None and row.longitude is not None
+        ]
+        if updates:
+            bind.execute(
+                jobs.update().where(jobs.c.id == sa.bindparam("job_id")).values(geo_cell=sa.bindparam("cell")),
+                updates,
+            )
+        last_id = rows[-1].id
+
+    op.create_index("idx_jobs_status_geo_cell", "jobs", ["status", "geo_cell"])
+
+
+def downgrade() -> None:
+    op.drop_index("idx_jobs_status_geo_cell", table_name="jobs")
+    op.drop_column("jobs", "geo_cell")
@@ -0,0 +1,29 @@
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = "0004_keyset_indexes"
+down_revision = "0003_job_geo_cell"
+branch_labels = None
+depends_on = None
+
+# (index, table, columns) backing the (created_at, id) keyset listings.
+INDEXES = [
+    ("idx_users_created_at_id", "users", ["created_at", "id"]),
+    ("idx_partner_profiles_approval_created_at_id", "partner_profiles", ["approval_status", "created_at", "id"]),
+    ("idx_jobs_created_at_id", "jobs", ["created_at", "id"]),
+    ("idx_jobs_status_created_at_id", "jobs", ["status", "created_at", "id"]),
+    ("idx_jobs_customer_created_at_id", "jobs", ["customer_id", "created_at", "id"]),
+    ("idx_jobs_worker_created_at_id", "jobs", ["worker_id", "created_at", "id"]),
+    ("idx_transactions_user_created_at_id", "transactions", ["user_id", "created_at", "id"]),
+]
+
+
+def upgrade() -> None:
+    for name, table, columns in INDEXES:
+        op.create_index(name, table, columns)
+
+
+def downgrade() -> None:
+    for name, table, _ in reversed(INDEXES):
+        op.drop_index(name, table_name=table)
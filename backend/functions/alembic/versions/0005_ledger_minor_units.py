@@ -0,0 +1,38 @@
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "0005_ledger_minor_units"
+down_revision = "0004_keyset_indexes"
+branch_labels = None
+depends_on = None
+
+# (table, float column, integer minor-unit column)
+MONEY_COLUMNS = [
+    ("wallets", "balance", "balance_minor"),
+    ("wallets", "total_earnings", "total_earnings_minor"),
+    ("transactions", "amount", "amount_minor"),
+]
+
+
+def upgrade() -> None:
+    for table, old, new in MONEY_COLUMNS:
+        op.add_column(table, sa.Column(new, sa.BigInteger(), nullable=False, server_default="0"))
+        op.execute(f"UPDATE {table} SET {new} = CAST(ROUND(COALESCE({old}, 0) * 100) AS BIGINT)")
+    for table in ("wallets", "transactions"):
+        with op.batch_alter_table(table) as batch:
+            for t, old, _ in MONEY_COLUMNS:
+                if t == table:
+                    batch.drop_column(old)
+
+
+def downgrade() -> None:
+    for table, old, new in MONEY_COLUMNS:
+        op.add_column(table, sa.Column(old, sa.Float(), nullable=True))
+        op.execute(f"UPDATE {table} SET {old} = {new} / 100.0")
+    for table in ("wallets", "transactions"):
+        with op.batch_alter_table(table) as batch:
+            for t, _, new in MONEY_COLUMNS:
+                if t == table:
+                    batch.drop_column(new)
@@ -0,0 +1,38 @@
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "0006_outbox_events"
+down_revision = "0005_ledger_minor_units"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "event_sequences",
+        sa.Column("user_id", sa.Integer(), sa.ForeignKey("users.id", ondelete="CASCADE"), primary_key=True),
+        sa.Column("last_seq", sa.BigInteger(), nullable=False),
+    )
+    op.create_table(
+        "outbox_events",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("user_id", sa.Integer(), sa.ForeignKey("users.id", ondelete="CASCADE"), nullable=False),
+        sa.Column("seq", sa.BigInteger(), nullable=False),
+        sa.Column("type", sa.String(length=50), nullable=False),
+        sa.Column("job_id", sa.Integer(), sa.ForeignKey("jobs.id", ondelete="CASCADE"), nullable=True),
+        sa.Column("payload", sa.JSON(), nullable=True),
+        sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now()),
+        sa.Column("delivered_at", sa.DateTime(timezone=True), nullable=True),
+        sa.Column("claimed_until", sa.DateTime(timezone=True), nullable=True),
+    )
+    op.create_index("idx_outbox_events_user_seq", "outbox_events", ["user_id", "seq"], unique=True)
+    op.create_index("idx_outbox_events_delivered_at_id", "outbox_events", ["delivered_at", "id"])
+
+
+def downgrade() -> None:
+    op.drop_index("idx_outbox_events_delivered_at_id", table_name="outbox_events")
+    op.drop_index("idx_outbox_events_user_seq", table_name="outbox_events")
+    op.drop_table("outbox_events")
+    op.drop_table("event_sequences")
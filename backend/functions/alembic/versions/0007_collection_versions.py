@@ -0,0 +1,21 @@
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "0007_collection_versions"
+down_revision = "0006_outbox_events"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "collection_versions",
+        sa.Column("key", sa.String(length=64), primary_key=True),
+        sa.Column("version", sa.BigInteger(), nullable=False),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("collection_versions")
@@ -0,0 +1,25 @@
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "0008_earnings_rollups"
+down_revision = "0007_collection_versions"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Filled for existing history by scripts/backfill_earnings_rollups.py.
+    op.create_table(
+        "earnings_rollups",
+        sa.Column("user_id", sa.Integer(), sa.ForeignKey("users.id", ondelete="CASCADE"), primary_key=True),
+        sa.Column("day", sa.Date(), primary_key=True),
+        sa.Column("type", sa.String(length=50), primary_key=True),
+        sa.Column("amount_minor", sa.BigInteger(), nullable=False),
+        sa.Column("count", sa.Integer(), nullable=False),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("earnings_rollups")
@@ -0,0 +1,44 @@
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "0009_stat_counters"
+down_revision = "0008_earnings_rollups"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    counters = op.create_table(
+        "stat_counters",
+        sa.Column("name", sa.String(length=64), primary_key=True),
+        sa.Column("shard", sa.Integer(), primary_key=True),
+        sa.Column("value", sa.BigInteger(), nullable=False),
+    )
+
+    # Seed from the current tables; the app's reconciler keeps them honest after.
+    users = sa.table("users", sa.column("role", sa.String))
+    jobs = sa.table("jobs", sa.column("status", sa.String), sa.column("price", sa.Float))
+    profiles = sa.table("partner_profiles", sa.column("approval_status", sa.String))
+    bind = op.get_bind()
+    values = {
+        "total_users": bind.scalar(sa.select(sa.func.count()).select_from(users).where(users.c.role == "user")),
+        "total_partners": bind.scalar(
+            sa.select(sa.func.count()).select_from(users)
+            .where(users.c.role.in_(["individual_partner", "agency_partner"]))
+        ),
+        "total_jobs": bind.scalar(sa.select(sa.func.count()).select_from(jobs)),
+        "total_revenue_minor": bind.scalar(
+            sa.select(sa.func.coalesce(sa.func.sum(sa.func.round(jobs.c.price * 100)), 0))
+            .where(jobs.c.status == "completed")
+        ),
+        "pending_partners": bind.scalar(
+            sa.select(sa.func.count()).select_from(profiles).where(profiles.c.approval_status == "pending")
+        ),
+    }
+    op.bulk_insert(counters, [{"name": name, "shard": 0, "value": int(value)} for name, value in values.items()])
+
+
+def downgrade() -> None:
+    op.drop_table("stat_counters")
@@ -0,0 +1,20 @@
+from alembic import op
+
+from app import search
+
+
+# revision identifiers, used by Alembic.
+revision = "0010_user_search"
+down_revision = "0009_stat_counters"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # FTS5 table + triggers on SQLite, tsvector/trigram-indexed table + triggers
+    # on PostgreSQL; both are filled from the existing users here.
+    search.install(op.get_bind())
+
+
+def downgrade() -> None:
+    search.uninstall(op.get_bind())
@@ -0,0 +1,51 @@
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "0011_job_analytics"
+down_revision = "0010_user_search"
+branch_labels = None
+depends_on = None
+
+def _dimensions():
+    return [
+        sa.Column("period", sa.String(length=8), primary_key=True),
+        sa.Column("service_type", sa.String(length=100), primary_key=True),
+        sa.Column("city", sa.String(length=100), primary_key=True),
+        sa.Column("bucket_start", sa.DateTime(), primary_key=True),
+    ]
+
+
+def upgrade() -> None:
+    op.add_column("jobs", sa.Column("city", sa.String(length=100), nullable=True))
+    op.create_index("idx_jobs_accepted_at", "jobs", ["accepted_at"])
+    op.create_index("idx_jobs_completed_at", "jobs", ["completed_at"])
+    # Filled for existing history by scripts/backfill_job_analytics.py.
+    op.create_table(
+        "job_rollups",
+        *_dimensions(),
+        sa.Column("shard", sa.Integer(), primary_key=True),
+        sa.Column("created", sa.Integer(), nullable=False),
+        sa.Column("accepted", sa.Integer(), nullable=False),
+        sa.Column("completed", sa.Integer(), nullable=False),
+        sa.Column("revenue_minor", sa.BigInteger(), nullable=False),
+        sa.Column("accept_seconds", sa.BigInteger(), nullable=False),
+    )
+    op.create_table(
+        "job_latency_rollups",
+        *_dimensions(),
+        sa.Column("bucket", sa.Integer(), primary_key=True),
+        sa.Column("shard", sa.Integer(), primary_key=True),
+        sa.Column("count", sa.Integer(), nullable=False),
+    )
+    op.create_index("ix_job_rollups_bucket_start", "job_rollups", ["bucket_start"])
+    op.create_index("ix_job_latency_rollups_bucket_start", "job_latency_rollups", ["bucket_start"])
+
+
+def downgrade() -> None:
+    op.drop_table("job_latency_rollups")
+    op.drop_table("job_rollups")
+    op.drop_index("idx_jobs_completed_at", table_name="jobs")
+    op.drop_index("idx_jobs_accepted_at", table_name="jobs")
+    op.drop_column("jobs", "city")
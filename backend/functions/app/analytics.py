@@ -0,0 +1,379 @@
+import logging
+import os
+import random
+import threading
+from bisect import bisect_left
+from collections import defaultdict
+from datetime import date, datetime, timedelta, timezone
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from sqlalchemy import func, or_, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session
+
+from . import models
+from .database import begin_reconcile_snapshot
+from .money import from_minor, to_minor
+
+logger = logging.getLogger(__name__)
+
+# Job lifecycle counters per UTC hour and day, service type and city,
+# maintained in the same transaction as the job writes (job_created /
+# job_accepted / job_completed) so the admin charts read a few hundred
+# rollup rows instead of scanning jobs. `catch_up` recomputes recent days
+# from the jobs table and fixes whatever the live path missed.
+#
+# Every event also counts towards ALL in each dimension (service "*", city
+# "*", and both), so a chart for one service, one city or everything is a
+# primary key range of a few rows per bucket, however many services and
+# cities there are. Since every job write lands on the ALL rows, those are
+# spread over ANALYTICS_ROLLUP_SHARDS shards, like app.stats counters;
+# reads sum the shards.
+
+PERIODS = {"hour": timedelta(hours=1), "day": timedelta(days=1)}
+# Most buckets one chart may ask for: 90 days of hours, a year of days.
+MAX_BUCKETS = {"hour": 90 * 24, "day": 366}
+ANALYTICS_CATCH_UP_DAYS = int(os.getenv("ANALYTICS_CATCH_UP_DAYS", "2"))
+ANALYTICS_CATCH_UP_INTERVAL_SECONDS = float(os.getenv("ANALYTICS_CATCH_UP_INTERVAL_SECONDS", "900"))
+ANALYTICS_ROLLUP_SHARDS = int(os.getenv("ANALYTICS_ROLLUP_SHARDS", "8"))
+# Shard only the catch-up writes, so its corrections never wait on live writes.
+RECONCILE_SHARD = -1
+
+# Upper bounds (seconds) of the acceptance latency histogram buckets; one
+# more bucket counts everything slower. Stored by index, so changing the
+# bounds requires a backfill.
+LATENCY_BOUNDS_SECONDS = (5, 10, 15, 30, 45, 60, 90, 120, 180, 240, 300, 450, 600, 900, 1200, 1800,
+                          2700, 3600, 7200, 14400, 28800, 86400)
+
+METRICS = ("created", "accepted", "completed", "revenue_minor", "accept_seconds")
+ALL = "*"
+# Primary key order of both rollup tables.
+DIMENSIONS = ("period", "service_type", "city", "bucket_start")
+
+catch_up_runs = {"runs": 0, "last_run_at": None, "last_corrected": 0}
+
+
+def _utc(value: Optional[datetime]) -> datetime:
+    if value is None:
+        return datetime.utcnow()
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def bucket_start(value: datetime, period: str) -> datetime:
+    if period == "day":
+        return value.replace(hour=0, minute=0, second=0, microsecond=0)
+    return value.replace(minute=0, second=0, microsecond=0)
+
+
+def latency_bucket(seconds: float) -> int:
+    return bisect_left(LATENCY_BOUNDS_SECONDS, seconds)
+
+
+class Tally:
+    """Rollup deltas gathered in memory, written with one upsert per table."""
+
+    def __init__(self):
+        self.counters: Dict[tuple, list] = defaultdict(lambda: [0] * len(METRICS))
+        self.latency: Dict[tuple, int] = defaultdict(int)
+
+    @staticmethod
+    def _keys(at: datetime, job):
+        for period in PERIODS:
+            for service_type in (job.service_type or "", ALL):
+                for city in (job.city or "", ALL):
+                    yield period, service_type, city, bucket_start(at, period)
+
+    def add(self, at: datetime, job, **deltas: int):
+        for key in self._keys(at, job):
+            row = self.counters[key]
+            for name, delta in deltas.items():
+                row[METRICS.index(name)] += delta
+
+    def add_latency(self, at: datetime, job, seconds: float):
+        for key in self._keys(at, job):
+            self.latency[key + (latency_bucket(seconds),)] += 1
+
+    def created(self, job):
+        self.add(_utc(job.created_at), job, created=1)
+
+    def accepted(self, job):
+        accepted_at = _utc(job.accepted_at)
+        seconds = max(0, int((accepted_at - _utc(job.created_at)).total_seconds()))
+        self.add(accepted_at, job, accepted=1, accept_seconds=seconds)
+        self.add_latency(accepted_at, job, seconds)
+
+    def completed(self, job):
+        self.add(_utc(job.completed_at), job, completed=1, revenue_minor=to_minor(job.price or 0))
+
+
+def _write(db: Session, tally: Tally, reconcile: bool = False):
+    """
+    Add `tally` to the rollups: rows with an ALL dimension on a random shard,
+    the others on shard 0; corrections from the catch-up all on RECONCILE_SHARD.
+    """
+    dialect = postgresql if db.get_bind().dialect.name == "postgresql" else sqlite
+    shard = RECONCILE_SHARD if reconcile else random.randrange(ANALYTICS_ROLLUP_SHARDS)
+    shard_of = lambda key: shard if reconcile or ALL in key[1:3] else 0
+    rows = [dict(zip(DIMENSIONS, key), shard=shard_of(key), **dict(zip(METRICS, values)))
+            for key, values in sorted(tally.counters.items()) if any(values)]
+    if rows:
+        rollup = models.JobRollup
+        stmt = dialect.insert(rollup).values(rows)
+        db.execute(stmt.on_conflict_do_update(
+            index_elements=[getattr(rollup, name) for name in DIMENSIONS + ("shard",)],
+            set_={name: getattr(rollup, name) + getattr(stmt.excluded, name) for name in METRICS},
+        ))
+    rows = [dict(zip(DIMENSIONS + ("bucket",), key), shard=shard_of(key), count=count)
+            for key, count in sorted(tally.latency.items()) if count]
+    if rows:
+        latency = models.JobLatencyRollup
+        stmt = dialect.insert(latency).values(rows)
+        db.execute(stmt.on_conflict_do_update(
+            index_elements=[getattr(latency, name) for name in DIMENSIONS + ("bucket", "shard")],
+            set_={"count": latency.count + stmt.excluded.count},
+        ))
+
+
+# Live path, inside the caller's transaction. A job's created_at is the
+# server default and may not be loaded yet, in which case "now" is used.
+
+def job_created(db: Session, jobs: Iterable[models.Job]):
+    tally = Tally()
+    for job in jobs:
+        tally.created(job)
+    _write(db, tally)
+
+
+def job_accepted(db: Session, job: models.Job):
+    tally = Tally()
+    tally.accepted(job)
+    _write(db, tally)
+
+
+def job_completed(db: Session, job: models.Job):
+    tally = Tally()
+    tally.completed(job)
+    _write(db, tally)
+
+
+# Reads.
+
+def buckets(period: str, start: datetime, end: datetime) -> List[datetime]:
+    """Bucket starts covering [start, end], oldest first."""
+    first, last = bucket_start(_utc(start), period), bucket_start(_utc(end), period)
+    count = int((last - first) / PERIODS[period]) + 1
+    if count > MAX_BUCKETS[period]:
+        raise ValueError(f"At most {MAX_BUCKETS[period]} {period} buckets per request")
+    return [first + PERIODS[period] * i for i in range(max(count, 0))]
+
+
+def _slice(model, period: str, starts: List[datetime], service_type: Optional[str] = ALL, city: Optional[str] = ALL):
+    """Rows of one period and bucket range; None for a dimension means every value except ALL."""
+    conditions = [model.period == period, model.bucket_start >= starts[0], model.bucket_start <= starts[-1]]
+    for column, value in ((model.service_type, service_type), (model.city, city)):
+        conditions.append(column != ALL if value is None else column == value)
+    return conditions
+
+
+def _percentiles(counts: Dict[int, int], quantiles=(0.5, 0.9, 0.99)) -> Dict[str, Optional[float]]:
+    """Quantiles of a latency histogram, interpolated linearly inside a bucket."""
+    total = sum(counts.values())
+    result = {}
+    for q in quantiles:
+        name = f"p{int(q * 100)}_seconds"
+        if not total:
+            result[name] = None
+            continue
+        rank, seen = q * total, 0
+        for bucket in sorted(counts):
+            if seen + counts[bucket] >= rank:
+                lower = LATENCY_BOUNDS_SECONDS[bucket - 1] if bucket else 0
+                if bucket >= len(LATENCY_BOUNDS_SECONDS):
+                    result[name] = float(lower)  # slower than the last bound
+                else:
+                    fraction = (rank - seen) / counts[bucket]
+                    result[name] = round(lower + (LATENCY_BOUNDS_SECONDS[bucket] - lower) * fraction, 1)
+                break
+            seen += counts[bucket]
+    return result
+
+
+def series(db: Session, period: str, start: datetime, end: datetime, service_type: Optional[str] = None,
+           city: Optional[str] = None) -> List[dict]:
+    """One zero-filled point per bucket: lifecycle counts, revenue and acceptance latency."""
+    starts = buckets(period, start, end)
+    if not starts:
+        return []
+    rollup, latency = models.JobRollup, models.JobLatencyRollup
+    service_type, city = service_type or ALL, city or ALL
+    totals = {
+        row[0]: {name: int(value) for name, value in zip(METRICS, row[1:])} for row in db.execute(
+            select(rollup.bucket_start, *(func.sum(getattr(rollup, name)) for name in METRICS))
+            .where(*_slice(rollup, period, starts, service_type, city))
+            .group_by(rollup.bucket_start)
+        )
+    }
+    histograms: Dict[datetime, Dict[int, int]] = defaultdict(dict)
+    for at, bucket, count in db.execute(
+        select(latency.bucket_start, latency.bucket, func.sum(latency.count))
+        .where(*_slice(latency, period, starts, service_type, city))
+        .group_by(latency.bucket_start, latency.bucket)
+    ):
+        histograms[at][bucket] = int(count)
+
+    empty = dict.fromkeys(METRICS, 0)
+    points = []
+    for at in starts:
+        values = totals.get(at, empty)
+        points.append(dict(
+            start=at, created=values["created"], accepted=values["accepted"], completed=values["completed"],
+            revenue_minor=values["revenue_minor"], revenue=from_minor(values["revenue_minor"]),
+            accept_mean_seconds=round(values["accept_seconds"] / values["accepted"], 1) if values["accepted"] else None,
+            **_percentiles(histograms.get(at, {})),
+        ))
+    return points
+
+
+def breakdown(db: Session, by: str, period: str, start: datetime, end: datetime) -> List[dict]:
+    """Totals over [start, end] per service_type or city, largest job count first."""
+    starts = buckets(period, start, end)
+    if not starts:
+        return []
+    rollup, latency = models.JobRollup, models.JobLatencyRollup
+    key, latency_key = getattr(rollup, by), getattr(latency, by)
+    # One dimension broken down, the other summed over (ALL).
+    dims = {"service_type": None, "city": ALL} if by == "service_type" else {"service_type": ALL, "city": None}
+    rows = db.execute(
+        select(key.label("key"), *(func.sum(getattr(rollup, name)).label(name) for name in METRICS))
+        .where(*_slice(rollup, period, starts, **dims))
+        .group_by(key)
+    ).all()
+    histograms: Dict[str, Dict[int, int]] = defaultdict(dict)
+    for value, bucket, count in db.execute(
+        select(latency_key, latency.bucket, func.sum(latency.count))
+        .where(*_slice(latency, period, starts, **dims))
+        .group_by(latency_key, latency.bucket)
+    ):
+        histograms[value][bucket] = int(count)
+
+    result = []
+    for row in rows:
+        values = {name: int(getattr(row, name) or 0) for name in METRICS}
+        result.append(dict(
+            key=row.key or None, created=values["created"], accepted=values["accepted"],
+            completed=values["completed"], revenue_minor=values["revenue_minor"],
+            revenue=from_minor(values["revenue_minor"]),
+            accept_mean_seconds=round(values["accept_seconds"] / values["accepted"], 1) if values["accepted"] else None,
+            **_percentiles(histograms.get(row.key, {})),
+        ))
+    result.sort(key=lambda item: (-item["created"], -item["completed"], item["key"] or ""))
+    return result
+
+
+# Catch-up: recompute whole days from the jobs table.
+
+def _truth(db: Session, day: date) -> Tally:
+    start = datetime.combine(day, datetime.min.time())
+    end = start + timedelta(days=1)
+    job = models.Job
+    columns = (job.service_type, job.city, job.price, job.status, job.created_at, job.accepted_at,
+               job.completed_at)
+    in_day = lambda column: (column >= start) & (column < end)
+    tally = Tally()
+    rows = db.execute(
+        select(*columns).where(or_(in_day(job.created_at), in_day(job.accepted_at), in_day(job.completed_at)))
+        .execution_options(yield_per=5000)
+    )
+    for row in rows:
+        if start <= _utc(row.created_at) < end:
+            tally.created(row)
+        if row.accepted_at is not None and start <= _utc(row.accepted_at) < end:
+            tally.accepted(row)
+        if row.status == "completed" and row.completed_at is not None and start <= _utc(row.completed_at) < end:
+            tally.completed(row)
+    return tally
+
+
+def _stored(db: Session, day: date) -> Tally:
+    start = datetime.combine(day, datetime.min.time())
+    end = start + timedelta(days=1)
+    rollup, latency = models.JobRollup, models.JobLatencyRollup
+    tally = Tally()
+    for row in db.execute(select(rollup).where(rollup.bucket_start >= start, rollup.bucket_start < end)).scalars():
+        values = tally.counters[(row.period, row.service_type, row.city, row.bucket_start)]
+        for i, name in enumerate(METRICS):
+            values[i] += getattr(row, name)
+    for row in db.execute(select(latency).where(latency.bucket_start >= start, latency.bucket_start < end)).scalars():
+        tally.latency[(row.period, row.service_type, row.city, row.bucket_start, row.bucket)] += row.count
+    return tally
+
+
+def reconcile_day(db: Session, day: date) -> int:
+    """
+    Bring one UTC day's rollups in line with the jobs table by adding the
+    difference to RECONCILE_SHARD. Like app.stats.reconcile, jobs and
+    rollups are read from one snapshot and live writes are never blocked;
+    when another process is already catching up, nothing is done. Returns
+    the number of rows corrected; the caller commits.
+    """
+    if not begin_reconcile_snapshot(db, "analytics.catch_up"):
+        return 0
+    truth, stored = _truth(db, day), _stored(db, day)
+    delta = Tally()
+    for key in set(truth.counters) | set(stored.counters):
+        want = truth.counters.get(key, [0] * len(METRICS))
+        have = stored.counters.get(key, [0] * len(METRICS))
+        if want != have:
+            delta.counters[key] = [w - h for w, h in zip(want, have)]
+    for key in set(truth.latency) | set(stored.latency):
+        diff = truth.latency.get(key, 0) - stored.latency.get(key, 0)
+        if diff:
+            delta.latency[key] = diff
+    try:
+        _write(db, delta, reconcile=True)
+    except OperationalError as e:
+        # SQLite: something committed after the snapshot; the next run retries.
+        db.rollback()
+        logger.info("Job analytics for %s skipped: %s", day, e)
+        return 0
+    return len(delta.counters) + len(delta.latency)
+
+
+def catch_up(session_factory, days: int = ANALYTICS_CATCH_UP_DAYS,
+             today: Optional[date] = None) -> Iterator[Tuple[date, int]]:
+    """Reconcile the last `days` UTC days, newest first, one transaction per day; yields (day, rows corrected)."""
+    today = today or datetime.utcnow().date()
+    for offset in range(days):
+        day = today - timedelta(days=offset)
+        db = session_factory()
+        try:
+            corrected = reconcile_day(db, day)
+            db.commit()
+        finally:
+            db.close()
+        if corrected:
+            logger.info("Job analytics for %s: %d rollup rows corrected", day, corrected)
+        yield day, corrected
+
+
+def start_catch_up(session_factory, interval_seconds: float = ANALYTICS_CATCH_UP_INTERVAL_SECONDS,
+                   days: int = ANALYTICS_CATCH_UP_DAYS) -> threading.Event:
+    """Run `catch_up` now and every `interval_seconds` on a daemon thread until the returned event is set."""
+    stop = threading.Event()
+
+    def _loop():
+        while True:
+            try:
+                corrected = sum(rows for _, rows in catch_up(session_factory, days))
+                catch_up_runs.update(runs=catch_up_runs["runs"] + 1, last_run_at=datetime.utcnow().isoformat(),
+                                     last_corrected=corrected)
+            except Exception as e:
+                logger.warning("Job analytics catch-up failed: %s", e)
+            if stop.wait(interval_seconds):
+                return
+
+    threading.Thread(target=_loop, name="analytics-catch-up", daemon=True).start()
+    return stop
@@ -1,18 +1,25 @@
-import bcrypt
+import os
 import jwt
 from datetime import datetime, timedelta
 from typing import Optional
 
+from . import hashing
+
 SECRET_KEY = "SUPER_SECRET_KEY_FOR_JWT_CLENZY_TOKEN" # In production, keep this in .env
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60 * 24 * 7 # 7 days long expiration for easy mobile testing
 
+# Resolved users are cached per process so authenticated requests don't pay a
+# users-table lookup every time. Set PRINCIPAL_CACHE_SIZE=0 to disable.
+PRINCIPAL_CACHE_SIZE = int(os.getenv("PRINCIPAL_CACHE_SIZE", "10000"))
+PRINCIPAL_CACHE_TTL_SECONDS = float(os.getenv("PRINCIPAL_CACHE_TTL_SECONDS", "60"))
+
+# Synchronous helpers for scripts; request handlers go through hashing.hasher.
 def verify_password(plain_password, hashed_password):
-    return bcrypt.checkpw(plain_password.encode('utf-8'), hashed_password.encode('utf-8'))
+    return hashing.check_password(plain_password, hashed_password)
 
 def get_password_hash(password):
-    salt = bcrypt.gensalt()
-    return bcrypt.hashpw(password.encode('utf-8'), salt).decode('utf-8')
+    return hashing.hash_password(password)
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
@@ -27,32 +34,85 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
 # Dependency snippet for verifying token could be here
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
-from .database import get_db
+from .database import SessionLocal, get_db
 from sqlalchemy.orm import Session
 from . import models, schemas
+from .cache import TTLCache
 import jwt
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="api/users/login")
 
-def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
-    credentials_exception = HTTPException(
+principal_cache = TTLCache(maxsize=PRINCIPAL_CACHE_SIZE, ttl=PRINCIPAL_CACHE_TTL_SECONDS)
+
+# Columns copied into the cache; the password hash never leaves the DB row.
+_CACHED_USER_COLUMNS = (
+    "id", "full_name", "email", "phone", "role", "is_active",
+    "is_verified", "is_online", "created_at", "updated_at",
+)
+
+def _credentials_exception():
+    return HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
+
+def _decode_token(token: str) -> dict:
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        email: str = payload.get("email")
-        if email is None:
-            raise credentials_exception
-        token_data = schemas.TokenData(email=email)
+        return jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
     except jwt.PyJWTError:
-        raise credentials_exception
-        
-    user = db.query(models.User).filter(models.User.email == token_data.email).first()
+        raise _credentials_exception()
+
+def invalidate_principal(user: models.User):
+    """Drop a user from the principal cache after their row was changed."""
+    principal_cache.pop(user.id)
+    principal_cache.pop(user.email)
+
+def _resolve_principal(payload: dict, db: Optional[Session] = None):
+    """
+    The token's user as a cached column dict, or the freshly loaded row on a
+    miss, so status and role always come from the users table (at most
+    PRINCIPAL_CACHE_TTL_SECONDS stale) rather than from the token claims.
+    """
+    email: str = payload.get("email")
+    if email is None:
+        raise _credentials_exception()
+    token_data = schemas.TokenData(email=email, role=payload.get("role"))
+
+    cache_key = payload.get("user_id") or token_data.email
+    cached = principal_cache.get(cache_key)
+    if cached is not None and cached["email"] == token_data.email:
+        return cached, None
+
+    if db is None:
+        # Short-lived session, so the connection goes back to the pool before
+        # the route runs instead of being held for the whole request.
+        with SessionLocal() as session:
+            user = session.query(models.User).filter(models.User.email == token_data.email).first()
+    else:
+        user = db.query(models.User).filter(models.User.email == token_data.email).first()
     if user is None:
-        raise credentials_exception
-    return user
+        raise _credentials_exception()
+    cached = {name: getattr(user, name) for name in _CACHED_USER_COLUMNS}
+    principal_cache.set(cache_key, cached)
+    return cached, user
+
+def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+    cached, user = _resolve_principal(_decode_token(token), db)
+    # Detached copy on a hit: routes only read attributes off the current user.
+    return user if user is not None else models.User(**cached)
+
+def get_current_principal(token: str = Depends(oauth2_scheme)) -> schemas.Principal:
+    """
+    Lightweight alternative to get_current_user for routes that only need the
+    caller's id and role. Resolved through the principal cache like
+    get_current_user (the DB is only read on a miss); deactivated accounts are
+    refused.
+    """
+    cached, _ = _resolve_principal(_decode_token(token))
+    if not cached["is_active"]:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Inactive user")
+    return schemas.Principal(id=cached["id"], role=cached["role"], email=cached["email"])
 
 def get_current_admin(current_user: models.User = Depends(get_current_user)):
     if current_user.role != "admin":
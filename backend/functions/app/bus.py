@@ -0,0 +1,618 @@
+import asyncio
+import json
+import logging
+import os
+import uuid
+from collections import defaultdict
+from typing import Callable, Dict, Iterator, List, Optional, Set, Tuple
+
+from . import database, job_participants
+from .database import SQLALCHEMY_DATABASE_URL
+
+logger = logging.getLogger(__name__)
+
+# Websocket messages between worker processes. Every process listens on the
+# shared CONTROL channel and on its own inbox. Processes announce the users
+# whose sockets they hold (claim/release) on CONTROL, so each one keeps a
+# user -> processes table and a personal message goes only to the inboxes of
+# the processes that hold that user; only broadcasts go to everyone.
+#
+# WS_BUS picks the transport:
+#   memory   - one process, nothing leaves it (default)
+#   postgres - LISTEN/NOTIFY on WS_BUS_URL, else DATABASE_URL; it needs a
+#              session-level connection, so point it past PgBouncer
+#   unix     - the broker in this module on the socket at WS_BUS_URL
+#              (python -m app.bus PATH), for local multi-worker runs and tests
+WS_BUS = os.getenv("WS_BUS", "memory").lower()
+WS_BUS_URL = os.getenv("WS_BUS_URL", "")
+# Outgoing operations are collected for this long and sent as one payload per
+# channel, split to stay under WS_BUS_BATCH_BYTES (Postgres caps NOTIFY
+# payloads at 8000 bytes; a single operation bigger than a transport's cap
+# is dropped with a warning).
+WS_BUS_BATCH_MS = float(os.getenv("WS_BUS_BATCH_MS", "2"))
+WS_BUS_BATCH_BYTES = int(os.getenv("WS_BUS_BATCH_BYTES", "7500"))
+# Every process beats on CONTROL this often; a peer not heard from for
+# WS_BUS_PEER_TIMEOUT_SECONDS is taken for dead and its routes are dropped.
+WS_BUS_HEARTBEAT_SECONDS = float(os.getenv("WS_BUS_HEARTBEAT_SECONDS", "10"))
+WS_BUS_PEER_TIMEOUT_SECONDS = float(os.getenv("WS_BUS_PEER_TIMEOUT_SECONDS", "35"))
+# First wait before reconnecting a transport whose connection broke; it
+# doubles up to WS_BUS_RECONNECT_MAX_SECONDS between attempts.
+WS_BUS_RECONNECT_SECONDS = float(os.getenv("WS_BUS_RECONNECT_SECONDS", "0.5"))
+WS_BUS_RECONNECT_MAX_SECONDS = float(os.getenv("WS_BUS_RECONNECT_MAX_SECONDS", "30"))
+
+CONTROL = "ws_bus"
+
+OnPayload = Callable[[str, str], None]
+OnReconnect = Callable[[], None]
+
+
+def inbox(process_id: str) -> str:
+    return f"ws_bus_{process_id}"
+
+
+def _call_in(loop: asyncio.AbstractEventLoop, fn, *args):
+    """Run fn(*args) on `loop`: directly when already there, else thread-safely."""
+    try:
+        running = asyncio.get_running_loop()
+    except RuntimeError:
+        running = None
+    if running is loop:
+        fn(*args)
+    elif not loop.is_closed():
+        loop.call_soon_threadsafe(fn, *args)
+
+
+async def _reconnect(connect, what: str):
+    """Await connect() until it succeeds, backing off between attempts."""
+    delay = WS_BUS_RECONNECT_SECONDS
+    while True:
+        await asyncio.sleep(delay)
+        try:
+            return await connect()
+        except Exception as e:
+            logger.warning("Websocket bus reconnect to %s failed: %s", what, e)
+            delay = min(delay * 2, WS_BUS_RECONNECT_MAX_SECONDS)
+
+
+# --- transports: text payloads on named channels ---
+
+class Transport:
+    # Largest payload the transport can carry, in UTF-8 bytes; None if unbounded.
+    max_payload_bytes: Optional[int] = None
+
+    async def start(self, channels: List[str], on_payload: OnPayload, on_reconnect: Optional[OnReconnect] = None):
+        """Subscribe to `channels`; after a broken connection is re-established, on_reconnect is called."""
+        raise NotImplementedError
+
+    async def publish(self, channel: str, payload: str):
+        raise NotImplementedError
+
+    async def stop(self):
+        pass
+
+
+class MemoryTransport(Transport):
+    """Channels inside this process; buses sharing a hub see each other."""
+
+    def __init__(self, hub: Optional[Dict[str, list]] = None):
+        self.hub = _memory_hub if hub is None else hub
+        self._subscriptions: List[Tuple[str, tuple]] = []
+
+    async def start(self, channels, on_payload, on_reconnect=None):
+        subscriber = (asyncio.get_running_loop(), on_payload)
+        for channel in channels:
+            self.hub.setdefault(channel, []).append(subscriber)
+            self._subscriptions.append((channel, subscriber))
+
+    async def publish(self, channel, payload):
+        for loop, on_payload in list(self.hub.get(channel, ())):
+            _call_in(loop, on_payload, channel, payload)
+
+    async def stop(self):
+        for channel, subscriber in self._subscriptions:
+            self.hub.get(channel, []).remove(subscriber)
+        self._subscriptions.clear()
+
+
+_memory_hub: Dict[str, list] = {}
+
+
+class PostgresTransport(Transport):
+    """
+    LISTEN/NOTIFY over two asyncpg connections: one listens, one notifies.
+    A listener that drops is replaced in the background; a closed notifier
+    is reopened by the next publish.
+    """
+
+    max_payload_bytes = 7999
+
+    def __init__(self, url: str):
+        scheme, sep, rest = url.partition("://")
+        self.dsn = f"postgresql{sep}{rest}"  # asyncpg takes a plain libpq URL
+        self._listener = None
+        self._notifier = None
+        self._lock = asyncio.Lock()
+        self._channels: List[str] = []
+        self._on_payload: Optional[OnPayload] = None
+        self._on_reconnect: Optional[OnReconnect] = None
+        self._relisten: Optional[asyncio.Task] = None
+
+    async def start(self, channels, on_payload, on_reconnect=None):
+        import asyncpg
+
+        self._channels, self._on_payload, self._on_reconnect = list(channels), on_payload, on_reconnect
+        self._listener = await self._listen()
+        self._notifier = await asyncpg.connect(self.dsn)
+
+    async def _listen(self):
+        import asyncpg
+
+        connection = await asyncpg.connect(self.dsn)
+        for channel in self._channels:
+            await connection.add_listener(channel, self._notified)
+        connection.add_termination_listener(self._terminated)
+        return connection
+
+    def _notified(self, connection, pid, channel, payload):
+        try:
+            self._on_payload(channel, payload)
+        except Exception as e:
+            logger.warning("Websocket bus payload on %s failed: %s", channel, e)
+
+    def _terminated(self, connection):
+        # stop() forgets the listener before closing it, so this is a real loss.
+        if connection is self._listener and self._relisten is None:
+            logger.warning("Websocket bus lost its LISTEN connection; reconnecting")
+            self._listener = None
+            self._relisten = asyncio.get_running_loop().create_task(self._restore())
+
+    async def _restore(self):
+        try:
+            self._listener = await _reconnect(self._listen, "postgres")
+        finally:
+            self._relisten = None
+        if self._on_reconnect is not None:
+            self._on_reconnect()
+
+    async def publish(self, channel, payload):
+        import asyncpg
+
+        async with self._lock:
+            if self._notifier is None or self._notifier.is_closed():
+                self._notifier = await asyncpg.connect(self.dsn)
+            await self._notifier.execute("SELECT pg_notify($1, $2)", channel, payload)
+
+    async def stop(self):
+        if self._relisten is not None:
+            self._relisten.cancel()
+        listener, notifier = self._listener, self._notifier
+        self._listener = self._notifier = None
+        for connection in (listener, notifier):
+            if connection is not None and not connection.is_closed():
+                await connection.close()
+
+
+# The unix-socket broker speaks newline-delimited frames; payloads are JSON,
+# which never contains a raw newline:
+#   client -> broker   "S <channel>"            subscribe
+#                      "P <channel> <payload>"  publish
+#   broker -> client   "M <channel> <payload>"  message
+
+class Broker:
+    """Minimal pub/sub server on a unix socket."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.subscribers: Dict[str, Set[asyncio.StreamWriter]] = defaultdict(set)
+        self._server = None
+        self.relayed = 0
+
+    async def start(self):
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        self._server = await asyncio.start_unix_server(self._serve, path=self.path, limit=2 ** 24)
+
+    async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        channels = []
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    return
+                kind, _, rest = line.decode().rstrip("\n").partition(" ")
+                if kind == "S":
+                    channels.append(rest)
+                    self.subscribers[rest].add(writer)
+                elif kind == "P":
+                    channel = rest.partition(" ")[0]
+                    frame = b"M " + line[2:]
+                    for subscriber in list(self.subscribers.get(channel, ())):
+                        subscriber.write(frame)
+                    self.relayed += 1
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            for channel in channels:
+                self.subscribers[channel].discard(writer)
+            writer.close()
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+        for writers in self.subscribers.values():
+            for writer in writers:
+                writer.close()
+        self.subscribers.clear()
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+
+class UnixSocketTransport(Transport):
+    """Client of the Broker; reconnects and resubscribes when the broker goes away."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._channels: List[str] = []
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._reader_task: Optional[asyncio.Task] = None
+
+    async def start(self, channels, on_payload, on_reconnect=None):
+        self._channels = list(channels)
+        reader = await self._connect()
+        self._reader_task = asyncio.create_task(self._run(reader, on_payload, on_reconnect))
+
+    async def _connect(self) -> asyncio.StreamReader:
+        reader, writer = await asyncio.open_unix_connection(self.path, limit=2 ** 24)
+        writer.write("".join(f"S {channel}\n" for channel in self._channels).encode())
+        await writer.drain()
+        self._writer = writer
+        return reader
+
+    async def _run(self, reader: asyncio.StreamReader, on_payload: OnPayload, on_reconnect: Optional[OnReconnect]):
+        while True:
+            try:
+                await self._read(reader, on_payload)
+                logger.warning("Websocket bus broker at %s went away; reconnecting", self.path)
+            except (ConnectionError, OSError, asyncio.IncompleteReadError) as e:
+                logger.warning("Websocket bus connection to %s failed: %s; reconnecting", self.path, e)
+            writer, self._writer = self._writer, None
+            if writer is not None:
+                writer.close()
+            reader = await _reconnect(self._connect, self.path)
+            if on_reconnect is not None:
+                on_reconnect()
+
+    async def _read(self, reader: asyncio.StreamReader, on_payload: OnPayload):
+        while True:
+            line = await reader.readline()
+            if not line:
+                return
+            channel, _, payload = line.decode()[2:].rstrip("\n").partition(" ")
+            try:
+                on_payload(channel, payload)
+            except Exception as e:
+                logger.warning("Websocket bus payload on %s failed: %s", channel, e)
+
+    async def publish(self, channel, payload):
+        if self._writer is None:
+            raise ConnectionError(f"not connected to the broker at {self.path}")
+        self._writer.write(f"P {channel} {payload}\n".encode())
+        await self._writer.drain()
+
+    async def stop(self):
+        if self._reader_task is not None:
+            self._reader_task.cancel()
+        if self._writer is not None:
+            self._writer.close()
+        self._writer = self._reader_task = None
+
+
+# --- routing ---
+
+class MessageBus:
+    """
+    Routes ConnectionManager sends to the other worker processes.
+
+    Outgoing operations are JSON arrays, batched per channel into payloads of
+    {"from": process_id, "ops": [...]}:
+      ["hello"]                    a process started; others answer with claims
+      ["claim", user_id]           the sender now holds sockets of user_id
+      ["release", user_id]         ... and no longer does
+      ["bye"]                      the sender is shutting down
+      ["beat"]                     the sender is alive (every heartbeat_seconds)
+      ["send", user_id, text, key] deliver an encoded frame (key: coalesce key)
+      ["loc", user_id, fix]        deliver a job position (tracking.Fix.wire())
+      ["broadcast", text]          deliver to every local socket
+      ["pin", client_key]          the client just wrote: read it from the primary
+      ["job", id, customer_id, worker_id, status]
+                                   a job's participants changed (app.job_participants)
+    A process that dies without "bye" keeps its routes until it has been
+    silent for peer_timeout_seconds; frames sent there meanwhile are lost,
+    which resume already covers. A peer heard from again after that is
+    asked for its claims with a "hello". After its transport reconnects, a
+    process may have missed anything, so it forgets its routes and says
+    "bye" and "hello" again to rebuild them on both sides.
+    """
+
+    def __init__(self, transport: Transport, process_id: Optional[str] = None,
+                 batch_ms: float = WS_BUS_BATCH_MS, batch_bytes: int = WS_BUS_BATCH_BYTES,
+                 heartbeat_seconds: float = WS_BUS_HEARTBEAT_SECONDS,
+                 peer_timeout_seconds: float = WS_BUS_PEER_TIMEOUT_SECONDS):
+        self.transport = transport
+        self.process_id = process_id or uuid.uuid4().hex[:12]
+        self.batch_seconds = batch_ms / 1000
+        self.batch_bytes = min(batch_bytes, transport.max_payload_bytes or batch_bytes)
+        self._head = '{"from":"%s","ops":[' % self.process_id
+        self.manager = None
+        # user_id -> other processes holding sockets for that user, and back.
+        self.routes: Dict[int, Set[str]] = {}
+        self.processes: Dict[str, Set[int]] = {}
+        # Other process -> loop time it was last heard from.
+        self.last_seen: Dict[str, float] = {}
+        self.heartbeat_seconds = heartbeat_seconds
+        self.peer_timeout_seconds = peer_timeout_seconds
+        self._heartbeat: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._pending: Dict[str, List[str]] = defaultdict(list)
+        self._flusher: Optional[asyncio.Task] = None
+        self.payloads_sent = 0
+        self.ops_sent = 0
+        self.ops_received = 0
+        self.frames_received = 0
+        self.publish_failures = 0
+        self.oversized_ops = 0
+        self.peers_expired = 0
+        self.reconnects = 0
+
+    async def start(self, manager):
+        self.manager = manager
+        self._loop = asyncio.get_running_loop()
+        await self.transport.start([CONTROL, inbox(self.process_id)], self._receive, self._reconnected)
+        self._announce()
+        self._heartbeat = self._loop.create_task(self._beat())
+        database.share_read_your_writes(self.pin_reads)
+        job_participants.share_changes(self.job_changed)
+
+    async def stop(self):
+        if self._loop is None:
+            return
+        database.share_read_your_writes(None)
+        job_participants.share_changes(None)
+        if self._heartbeat is not None:
+            self._heartbeat.cancel()
+            self._heartbeat = None
+        self._enqueue(CONTROL, ["bye"])
+        if self._flusher is not None:
+            await self._flusher
+        await self.transport.stop()
+        self._loop = None
+
+    def _announce(self):
+        self._enqueue(CONTROL, ["hello"])
+        for user_id in list(self.manager.active_connections):
+            self._enqueue(CONTROL, ["claim", user_id])
+
+    def _reconnected(self):
+        self.reconnects += 1
+        logger.info("Websocket bus reconnected; rebuilding routes")
+        for process_id in list(self.processes):
+            self._drop(process_id)
+        self._enqueue(CONTROL, ["bye"])
+        self._announce()
+
+    async def _beat(self):
+        while True:
+            await asyncio.sleep(self.heartbeat_seconds)
+            self._enqueue(CONTROL, ["beat"])
+            now = self._loop.time()
+            for process_id, seen in list(self.last_seen.items()):
+                if now - seen > self.peer_timeout_seconds:
+                    logger.warning("Websocket bus peer %s went silent; dropping its %d routes",
+                                   process_id, len(self.processes.get(process_id, ())))
+                    self._drop(process_id)
+                    self.peers_expired += 1
+
+    # --- outgoing (called by ConnectionManager) ---
+
+    def claim(self, user_id: int):
+        self._enqueue(CONTROL, ["claim", user_id])
+
+    def release(self, user_id: int):
+        self._enqueue(CONTROL, ["release", user_id])
+
+    def is_connected(self, user_id: int) -> bool:
+        return bool(self.routes.get(user_id))
+
+    def send(self, user_id: int, text: str, key=None) -> int:
+        """Forward a frame to the processes holding the user; returns how many."""
+        processes = self.routes.get(user_id)
+        if not processes:
+            return 0
+        op = self._encode(["send", user_id, text, list(key) if isinstance(key, tuple) else key])
+        if op is None:
+            return 0
+        for process_id in processes:
+            self._enqueue(inbox(process_id), op)
+        return len(processes)
+
+    def send_location(self, user_id: int, wire: list) -> int:
+        # Positions travel unencoded: each receiving connection encodes them
+        # for its own protocol.
+        processes = self.routes.get(user_id)
+        if not processes:
+            return 0
+        op = self._encode(["loc", user_id, wire])
+        if op is None:
+            return 0
+        for process_id in processes:
+            self._enqueue(inbox(process_id), op)
+        return len(processes)
+
+    def pin_reads(self, client_key: str):
+        """Tell the other processes' replica routers that the client just wrote."""
+        if self.processes:
+            self._enqueue(CONTROL, ["pin", client_key])
+
+    def job_changed(self, row: job_participants.JobRow):
+        """Have the other processes' job participants tables follow a committed change."""
+        if self.processes:
+            self._enqueue(CONTROL, ["job", *row])
+
+    def broadcast(self, text: str):
+        if self.processes:
+            self._enqueue(CONTROL, ["broadcast", text])
+
+    def _encode(self, op: list) -> Optional[str]:
+        """The op as JSON, or None (logged) if even a payload of just this op is too big to publish."""
+        text = json.dumps(op, separators=(",", ":"), ensure_ascii=False)
+        limit = self.transport.max_payload_bytes
+        if limit is not None and len(self._head) + len(text.encode()) + 2 > limit:
+            self.oversized_ops += 1
+            logger.warning("Websocket bus dropped a %r op of %d bytes (limit %d)", op[0], len(text.encode()), limit)
+            return None
+        return text
+
+    def _enqueue(self, channel: str, op):
+        if self._loop is None:
+            return
+        if isinstance(op, list):
+            op = self._encode(op)
+            if op is None:
+                return
+        _call_in(self._loop, self._append, channel, op)
+
+    def _append(self, channel: str, op: str):
+        self._pending[channel].append(op)
+        if self._flusher is None:
+            self._flusher = self._loop.create_task(self._flush())
+
+    def _payloads(self, ops: List[str]) -> Iterator[str]:
+        head = self._head
+        batch, size = [], len(head) + 2
+        for op in ops:
+            length = len(op.encode())
+            if batch and size + length + 1 > self.batch_bytes:
+                yield head + ",".join(batch) + "]}"
+                batch, size = [], len(head) + 2
+            batch.append(op)
+            size += length + 1
+        if batch:
+            yield head + ",".join(batch) + "]}"
+
+    async def _flush(self):
+        try:
+            while self._pending:
+                await asyncio.sleep(self.batch_seconds)
+                pending, self._pending = self._pending, defaultdict(list)
+                for channel, ops in pending.items():
+                    # One publish per payload, so a failure loses only its own ops.
+                    for payload in self._payloads(ops):
+                        try:
+                            await self.transport.publish(channel, payload)
+                        except Exception as e:
+                            self.publish_failures += 1
+                            logger.warning("Websocket bus publish to %s failed: %s", channel, e)
+                            continue
+                        self.payloads_sent += 1
+                    self.ops_sent += len(ops)
+        finally:
+            self._flusher = None
+
+    # --- incoming ---
+
+    def _receive(self, channel: str, payload: str):
+        message = json.loads(payload)
+        sender = message["from"]
+        if sender == self.process_id:
+            return
+        if sender not in self.processes and not any(op[0] in ("hello", "bye") for op in message["ops"]):
+            # Expired earlier, or started before we did: ask for its claims.
+            self.processes[sender] = set()
+            self._enqueue(inbox(sender), ["hello"])
+        for op in message["ops"]:
+            self.ops_received += 1
+            kind = op[0]
+            if kind == "send":
+                self.frames_received += 1
+                _, user_id, text, key = op
+                self.manager.deliver(user_id, text, tuple(key) if isinstance(key, list) else key)
+            elif kind == "loc":
+                self.frames_received += 1
+                self.manager.deliver_location(op[1], op[2])
+            elif kind == "broadcast":
+                self.frames_received += 1
+                self.manager.deliver_all(op[1])
+            elif kind == "pin":
+                database.get_replica_router().mark_write(op[1], share=False)
+            elif kind == "job":
+                job_participants.remember(job_participants.JobRow(*op[1:]), share=False)
+            elif kind == "claim":
+                self.routes.setdefault(op[1], set()).add(sender)
+                self.processes.setdefault(sender, set()).add(op[1])
+            elif kind == "release":
+                self._forget(sender, op[1])
+            elif kind == "hello":
+                self.processes.setdefault(sender, set())
+                for user_id in list(self.manager.active_connections):
+                    self._enqueue(inbox(sender), ["claim", user_id])
+            elif kind == "bye":
+                self._drop(sender)
+        if sender in self.processes:
+            self.last_seen[sender] = self._loop.time()
+
+    def _drop(self, process_id: str):
+        for user_id in list(self.processes.get(process_id, ())):
+            self._forget(process_id, user_id)
+        self.processes.pop(process_id, None)
+        self.last_seen.pop(process_id, None)
+
+    def _forget(self, process_id: str, user_id: int):
+        processes = self.routes.get(user_id)
+        if processes is not None:
+            processes.discard(process_id)
+            if not processes:
+                del self.routes[user_id]
+        self.processes.get(process_id, set()).discard(user_id)
+
+    def stats(self) -> dict:
+        return {
+            "process_id": self.process_id,
+            "transport": type(self.transport).__name__,
+            "peers": len(self.processes),
+            "remote_users": len(self.routes),
+            "payloads_sent": self.payloads_sent,
+            "ops_sent": self.ops_sent,
+            "ops_received": self.ops_received,
+            "frames_received": self.frames_received,
+            "publish_failures": self.publish_failures,
+            "oversized_ops": self.oversized_ops,
+            "peers_expired": self.peers_expired,
+            "reconnects": self.reconnects,
+        }
+
+
+def from_env() -> MessageBus:
+    if WS_BUS == "postgres":
+        return MessageBus(PostgresTransport(WS_BUS_URL or SQLALCHEMY_DATABASE_URL))
+    if WS_BUS == "unix":
+        return MessageBus(UnixSocketTransport(WS_BUS_URL or "/tmp/clenzy-ws-bus.sock"))
+    return MessageBus(MemoryTransport())
+
+
+async def _serve_forever(path: str):
+    broker = Broker(path)
+    await broker.start()
+    logger.info("Websocket bus broker listening on %s", path)
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await broker.stop()
+
+
+if __name__ == "__main__":
+    import sys
+
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(_serve_forever(sys.argv[1] if len(sys.argv) > 1 else "/tmp/clenzy-ws-bus.sock"))
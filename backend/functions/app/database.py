@@ -1,17 +1,65 @@
+import itertools
+import logging
 import os
+import threading
+import time
 import urllib.parse
-import psycopg2
-import urllib.parse
-from sqlalchemy import create_engine
+import zlib
+from typing import Callable, Optional
+import jwt
+from fastapi import Request
+from sqlalchemy import create_engine, event, func, select
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.pool import NullPool, QueuePool
 from dotenv import load_dotenv
 
+from . import sqlite_tuning
+from .cache import TTLCache
+from .db_metrics import InstrumentedQueuePool, pool_metrics, route_label
+
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
+def env_flag(name: str, default: bool = False) -> bool:
+    return os.getenv(name, str(default)).strip().lower() in ("1", "true", "yes", "on")
+
 # Fallback to a local SQLite database if no DATABASE_URL is found
 SQLALCHEMY_DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./sql_app.db")
 
+# Production profile for file-backed SQLite: WAL journal, synchronous=NORMAL,
+# busy timeout, mmap, page cache, in-memory temp tables, a single-writer queue
+# and periodic checkpoint/optimize. Set SQLITE_TUNING=0 for stock settings.
+SQLITE_TUNING = env_flag("SQLITE_TUNING", True)
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "10000"))
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+SQLITE_CACHE_SIZE_KB = int(os.getenv("SQLITE_CACHE_SIZE_KB", "65536"))
+SQLITE_MAINTENANCE_INTERVAL_SECONDS = float(os.getenv("SQLITE_MAINTENANCE_INTERVAL_SECONDS", "300"))
+
+# Optional read replicas (comma separated). Read-only GET routes are spread over
+# them with DB_REPLICA_BALANCING = round_robin | least_connections.
+DATABASE_REPLICA_URLS = [u.strip() for u in os.getenv("DATABASE_REPLICA_URLS", "").split(",") if u.strip()]
+DB_REPLICA_BALANCING = os.getenv("DB_REPLICA_BALANCING", "round_robin").lower()
+# After a client writes, its reads stay on the primary for this long so it
+# never sees replication lag on its own changes.
+DB_READ_YOUR_WRITES_SECONDS = float(os.getenv("DB_READ_YOUR_WRITES_SECONDS", "5"))
+
+# Serve the hot booking/wallet routes from native async handlers on a parallel
+# async engine (aiosqlite locally, asyncpg for Postgres).
+DB_ASYNC_ROUTES = env_flag("DB_ASYNC_ROUTES")
+
+# Connection pool. DB_POOL_MODE=null opens a connection per checkout, which is
+# what you want behind PgBouncer in transaction pooling mode.
+DB_POOL_MODE = os.getenv("DB_POOL_MODE", "queue").lower()
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "-1"))
+DB_POOL_PRE_PING = env_flag("DB_POOL_PRE_PING")
+# get_db sessions holding a connection longer than this are logged with their route.
+DB_SLOW_SESSION_MS = float(os.getenv("DB_SLOW_SESSION_MS", "500"))
+
 def create_database_if_not_exists(url):
     """
     For local Postgres (e.g., running on localhost), try to create the database
@@ -30,6 +78,8 @@ def create_database_if_not_exists(url):
 
     db_name = parsed.path.lstrip("/")
     try:
+        import psycopg2
+
         connection = psycopg2.connect(
             host=parsed.hostname,
             user=parsed.username or "postgres",
@@ -53,23 +103,330 @@ def create_database_if_not_exists(url):
     except Exception as e:
         print(f"Failed to verify/create database: {e}")
 
-create_database_if_not_exists(SQLALCHEMY_DATABASE_URL)
+def _pool_options(url: str, queue_pool=InstrumentedQueuePool) -> dict:
+    if url.startswith("sqlite") and ":memory:" in url:
+        # In-memory SQLite lives and dies with its single connection.
+        return {}
+    if DB_POOL_MODE == "null":
+        return {"poolclass": NullPool, "pool_pre_ping": DB_POOL_PRE_PING}
+    return {
+        "poolclass": queue_pool,
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_pre_ping": DB_POOL_PRE_PING,
+    }
 
-# SQLite needs connect_args={"check_same_thread": False}, Postgres doesn't
-if SQLALCHEMY_DATABASE_URL.startswith("sqlite"):
-    engine = create_engine(
-        SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
+def _is_tuned_sqlite(url: str) -> bool:
+    return SQLITE_TUNING and url.startswith("sqlite") and ":memory:" not in url
+
+def _create_engine(url: str, queue_pool=InstrumentedQueuePool, writer_queue=None):
+    # SQLite needs connect_args={"check_same_thread": False}, Postgres doesn't
+    if not url.startswith("sqlite"):
+        return create_engine(url, **_pool_options(url, queue_pool))
+    new_engine = create_engine(
+        url,
+        connect_args={"check_same_thread": False},
+        **_pool_options(url, queue_pool),
     )
-else:
-    engine = create_engine(SQLALCHEMY_DATABASE_URL)
+    if _is_tuned_sqlite(url):
+        sqlite_tuning.install(
+            new_engine, SQLITE_BUSY_TIMEOUT_MS, SQLITE_MMAP_SIZE, SQLITE_CACHE_SIZE_KB, writer_queue
+        )
+    return new_engine
+
+# Writers on the primary SQLite file queue here instead of fighting over the lock.
+sqlite_writer_queue = sqlite_tuning.SingleWriterQueue() if _is_tuned_sqlite(SQLALCHEMY_DATABASE_URL) else None
+
+# Engines are built on first use rather than at import, so importing the app
+# (uvicorn workers, alembic, pytest collection) does no database work.
+_engine = None
+_engine_lock = threading.Lock()
 
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+def get_engine():
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                new_engine = _create_engine(SQLALCHEMY_DATABASE_URL, writer_queue=sqlite_writer_queue)
+                SessionLocal.configure(bind=new_engine)
+                _engine = new_engine
+    return _engine
+
+def dispose_engines():
+    if _engine is not None:
+        _engine.dispose()
+    if _replica_router is not None:
+        _replica_router.dispose()
+
+def start_sqlite_maintenance():
+    """Start the periodic checkpoint/optimize task; returns its stop event, or
+    None when the primary isn't a tuned SQLite file."""
+    if not _is_tuned_sqlite(SQLALCHEMY_DATABASE_URL):
+        return None
+    return sqlite_tuning.start_maintenance(get_engine(), SQLITE_MAINTENANCE_INTERVAL_SECONDS)
+
+def begin_reconcile_snapshot(db, name: str) -> bool:
+    """
+    Start a reconciliation job's transaction on a snapshot, so the counters
+    and the recount they are compared with see the same committed writes.
+    Nothing is locked: live writers go on, and the job adds its corrections
+    to rows only reconcilers write. Returns False (do nothing) when another
+    process is already running the job called `name`.
+
+    On PostgreSQL that is a REPEATABLE READ transaction holding a
+    transaction-level advisory lock. SQLite in WAL mode snapshots a deferred
+    transaction at its first read; there the correction fails with "database
+    is locked" if anything committed since, and the next run tries again.
+    """
+    if db.get_bind().dialect.name != "postgresql":
+        db.connection().exec_driver_sql("BEGIN")
+        return True
+    db.connection(execution_options={"isolation_level": "REPEATABLE READ"})
+    if not db.scalar(select(func.pg_try_advisory_xact_lock(zlib.crc32(name.encode())))):
+        db.rollback()
+        return False
+    return True
+
+class _LazySessionmaker(sessionmaker):
+    def __call__(self, **local_kw):
+        if _engine is None:
+            get_engine()
+        return super().__call__(**local_kw)
+
+SessionLocal = _LazySessionmaker(autocommit=False, autoflush=False)
 
 Base = declarative_base()
 
-def get_db():
+# Track how long each session actually holds a pooled connection: from the
+# first statement of a transaction until it commits, rolls back or closes.
+@event.listens_for(SessionLocal, "after_begin")
+def _mark_connection_acquired(session, transaction, connection):
+    session.info["_connection_since"] = time.perf_counter()
+
+@event.listens_for(SessionLocal, "after_transaction_end")
+def _accumulate_connection_hold(session, transaction):
+    since = session.info.pop("_connection_since", None)
+    if since is not None and transaction.parent is None:
+        session.info["connection_held_ms"] = (
+            session.info.get("connection_held_ms", 0.0) + (time.perf_counter() - since) * 1000
+        )
+
+def _client_key(request: Optional[Request]) -> Optional[str]:
+    # The token's user identifies "the same client" for read-your-writes, so
+    # the pin survives a token refresh. The claims are only a routing hint
+    # here; the route's auth dependency verifies the signature.
+    if request is None:
+        return None
+    scheme, _, token = request.headers.get("authorization", "").partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        return None
+    try:
+        claims = jwt.decode(token, options={"verify_signature": False})
+    except jwt.PyJWTError:
+        return None
+    user_id = claims.get("user_id")
+    return f"user:{user_id}" if user_id is not None else claims.get("email")
+
+# Sync side of the async request sessions (see get_async_db), so their writes
+# are tracked by the same events as SessionLocal's.
+class _AsyncRequestSession(Session):
+    pass
+
+# Any write flushed by a request session pins that client's reads to the primary.
+def _flag_session_write(session, flush_context):
+    session.info["wrote"] = True
+
+def _flag_bulk_write(orm_execute_state):
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        orm_execute_state.session.info["wrote"] = True
+
+def _pin_writer_to_primary(session):
+    if session.info.pop("wrote", False) and session.info.get("client_key"):
+        get_replica_router().mark_write(session.info["client_key"])
+
+for _target in (SessionLocal, _AsyncRequestSession):
+    event.listen(_target, "after_flush", _flag_session_write)
+    event.listen(_target, "do_orm_execute", _flag_bulk_write)
+    event.listen(_target, "after_commit", _pin_writer_to_primary)
+
+# Set by app.bus while it runs: called with a client key after each pinning
+# write so every worker process pins that client, not just this one.
+_share_pin: Optional[Callable[[str], None]] = None
+
+def share_read_your_writes(publish: Optional[Callable[[str], None]]):
+    global _share_pin
+    _share_pin = publish
+
+def get_db(request: Request = None):
     db = SessionLocal()
+    db.info["client_key"] = _client_key(request)
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+        held_ms = db.info.pop("connection_held_ms", None)
+        if held_ms is not None:
+            route = route_label(request.scope) if request is not None else "<no request>"
+            slow = held_ms > DB_SLOW_SESSION_MS
+            pool_metrics.observe_session(route, held_ms, slow)
+            if slow:
+                logger.warning("Slow DB session: %s held a connection for %.0f ms", route, held_ms)
+
+
+
+class ReplicaRouter:
+    """
+    Picks a read replica per request and remembers which clients just wrote.
+    Pins are per process; share_read_your_writes spreads them to the others.
+    """
+
+    def __init__(self, urls, balancing=DB_REPLICA_BALANCING, sticky_seconds=DB_READ_YOUR_WRITES_SECONDS):
+        self.urls = list(urls)
+        self.balancing = balancing
+        self.engines = [_create_engine(url, queue_pool=QueuePool) for url in self.urls]
+        self.sessionmakers = [sessionmaker(autocommit=False, autoflush=False, bind=e) for e in self.engines]
+        self.active = [0] * len(self.urls)
+        self.served = [0] * len(self.urls)
+        self.primary_reads = 0
+        self._round_robin = itertools.count()
+        self._lock = threading.Lock()
+        self._recent_writers = TTLCache(maxsize=100_000, ttl=sticky_seconds)
+
+    def mark_write(self, client_key: str, share: bool = True):
+        if self.engines:
+            self._recent_writers.set(client_key, True)
+            if share and _share_pin is not None:
+                _share_pin(client_key)
+
+    def acquire(self, client_key: Optional[str]) -> Optional[int]:
+        """Index of the replica to read from, or None to stay on the primary."""
+        if not self.engines or (client_key and self._recent_writers.get(client_key)):
+            with self._lock:
+                self.primary_reads += 1
+            return None
+        with self._lock:
+            if self.balancing == "least_connections":
+                index = min(range(len(self.active)), key=self.active.__getitem__)
+            else:
+                index = next(self._round_robin) % len(self.engines)
+            self.active[index] += 1
+            self.served[index] += 1
+        return index
+
+    def release(self, index: int):
+        with self._lock:
+            self.active[index] -= 1
+
+    def dispose(self):
+        for e in self.engines:
+            e.dispose()
+
+    def stats(self) -> dict:
+        return {
+            "balancing": self.balancing,
+            "primary_reads": self.primary_reads,
+            "replicas": [
+                {"url": e.url.render_as_string(hide_password=True), "active": a, "served": n}
+                for e, a, n in zip(self.engines, self.active, self.served)
+            ],
+        }
+
+_replica_router = None
+
+def get_replica_router() -> ReplicaRouter:
+    global _replica_router
+    if _replica_router is None:
+        with _engine_lock:
+            if _replica_router is None:
+                _replica_router = ReplicaRouter(DATABASE_REPLICA_URLS)
+    return _replica_router
+
+def configure_replicas(urls, balancing=DB_REPLICA_BALANCING, sticky_seconds=DB_READ_YOUR_WRITES_SECONDS):
+    """Swap the replica set at runtime (used by tests and local tooling)."""
+    global _replica_router
+    old, _replica_router = _replica_router, ReplicaRouter(urls, balancing, sticky_seconds)
+    if old is not None:
+        old.dispose()
+
+def get_read_db(request: Request = None):
+    """
+    Session for read-only routes: a replica when one is configured and the
+    caller hasn't written recently, the primary otherwise.
+    """
+    router = get_replica_router()
+    index = None
+    if request is None or request.method in ("GET", "HEAD"):
+        index = router.acquire(_client_key(request))
+    if index is None:
+        yield from get_db(request)
+        return
+    db = router.sessionmakers[index]()
+    try:
+        yield db
+    finally:
+        db.close()
+        router.release(index)
+
+
+def async_database_url(url: str) -> str:
+    """Map a sync DATABASE_URL onto the matching asyncio driver."""
+    scheme, sep, rest = url.partition("://")
+    base = scheme.split("+")[0]
+    if base == "sqlite":
+        return f"sqlite+aiosqlite{sep}{rest}"
+    if base in ("postgresql", "postgres"):
+        return f"postgresql+asyncpg{sep}{rest}"
+    return url
+
+_async_engine = None
+_async_sessionmaker = None
+
+def get_async_engine():
+    global _async_engine, _async_sessionmaker
+    if _async_engine is None:
+        from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+        from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+        with _engine_lock:
+            if _async_engine is None:
+                new_engine = create_async_engine(
+                    async_database_url(SQLALCHEMY_DATABASE_URL),
+                    **_pool_options(SQLALCHEMY_DATABASE_URL, queue_pool=AsyncAdaptedQueuePool),
+                )
+                if _is_tuned_sqlite(SQLALCHEMY_DATABASE_URL):
+                    # PRAGMAs only: a blocking writer queue has no place on the event loop,
+                    # async writers rely on busy_timeout instead.
+                    sqlite_tuning.install(
+                        new_engine.sync_engine, SQLITE_BUSY_TIMEOUT_MS, SQLITE_MMAP_SIZE, SQLITE_CACHE_SIZE_KB
+                    )
+                # expire_on_commit=False: attribute access after commit must not trigger
+                # implicit (blocking) IO on an async session.
+                _async_sessionmaker = async_sessionmaker(
+                    new_engine, autoflush=False, expire_on_commit=False, sync_session_class=_AsyncRequestSession
+                )
+                _async_engine = new_engine
+    return _async_engine
+
+async def dispose_async_engine():
+    if _async_engine is not None:
+        await _async_engine.dispose()
+
+async def get_async_db(request: Request = None):
+    if _async_sessionmaker is None:
+        get_async_engine()
+    async with _async_sessionmaker() as db:
+        db.sync_session.info["client_key"] = _client_key(request)
+        yield db
+
+
+def __getattr__(name):
+    # Backwards-compatible module attributes for the lazily built engines.
+    if name == "engine":
+        return get_engine()
+    if name == "async_engine":
+        return get_async_engine()
+    if name == "replica_router":
+        return get_replica_router()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,121 @@
+import bisect
+import threading
+import time
+
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import QueuePool
+
+def route_label(scope) -> str:
+    """
+    "METHOD /path/{param}" label for per-route metrics, from the route the
+    request matched, so /jobs/17 and /jobs/18 share a label. Unmatched paths
+    all share one, so probing URLs can't grow the tables.
+    """
+    template = getattr(scope.get("route"), "path", None)
+    if template is None:
+        return f"{scope['method']} <unmatched>"
+    # Depending on the FastAPI version, routes of an included router carry
+    # the full path or only their own part of it; any prefix is taken from
+    # the front of the real path.
+    path = scope["path"].split("/")
+    own = template.split("/")[1:]
+    prefix = path[: max(len(path) - len(own), 1)]
+    return f"{scope['method']} {'/'.join(prefix + own)}"
+
+
+# Upper bounds (ms) of the checkout-wait histogram buckets; the last bucket is open.
+WAIT_BUCKETS_MS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+
+class Histogram:
+    def __init__(self, buckets=WAIT_BUCKETS_MS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.total = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.total += value
+
+    def snapshot(self) -> dict:
+        labels = [f"le_{b}ms" for b in self.buckets] + [f"gt_{self.buckets[-1]}ms"]
+        count = sum(self.counts)
+        return {
+            "count": count,
+            "avg_ms": round(self.total / count, 3) if count else 0.0,
+            "buckets": dict(zip(labels, self.counts)),
+        }
+
+
+class PoolMetrics:
+    """Process-wide counters for pool checkouts and per-route session hold times."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.checkout_wait = Histogram()
+            self.checkout_timeouts = 0
+            self.slow_sessions = 0
+            self.routes = {}
+
+    def observe_wait(self, wait_ms: float, timed_out: bool = False):
+        with self._lock:
+            self.checkout_wait.observe(wait_ms)
+            if timed_out:
+                self.checkout_timeouts += 1
+
+    def observe_session(self, route: str, held_ms: float, slow: bool):
+        with self._lock:
+            stats = self.routes.setdefault(route, {"sessions": 0, "total_ms": 0.0, "max_ms": 0.0})
+            stats["sessions"] += 1
+            stats["total_ms"] += held_ms
+            stats["max_ms"] = max(stats["max_ms"], held_ms)
+            if slow:
+                self.slow_sessions += 1
+
+    def snapshot(self, pool) -> dict:
+        status = {"pool_class": type(pool).__name__}
+        if isinstance(pool, QueuePool):
+            status.update(
+                size=pool.size(),
+                checked_in=pool.checkedin(),
+                checked_out=pool.checkedout(),
+                overflow=pool.overflow(),
+            )
+        with self._lock:
+            routes = {
+                route: {
+                    "sessions": s["sessions"],
+                    "avg_held_ms": round(s["total_ms"] / s["sessions"], 3),
+                    "max_held_ms": round(s["max_ms"], 3),
+                }
+                for route, s in self.routes.items()
+            }
+            status.update(
+                checkout_wait=self.checkout_wait.snapshot(),
+                checkout_timeouts=self.checkout_timeouts,
+                slow_sessions=self.slow_sessions,
+                routes=routes,
+            )
+        return status
+
+
+pool_metrics = PoolMetrics()
+
+
+class InstrumentedQueuePool(QueuePool):
+    """QueuePool that records how long each checkout waited for a connection."""
+
+    def _do_get(self):
+        start = time.perf_counter()
+        timed_out = False
+        try:
+            return super()._do_get()
+        except PoolTimeoutError:
+            timed_out = True
+            raise
+        finally:
+            pool_metrics.observe_wait((time.perf_counter() - start) * 1000, timed_out)
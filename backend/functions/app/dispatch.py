@@ -0,0 +1,171 @@
+import asyncio
+import logging
+import os
+from typing import Dict, Iterable, List, Optional, Set
+
+from . import geo, models
+
+logger = logging.getLogger(__name__)
+
+DISPATCH_ENABLED = os.getenv("DISPATCH_ENABLED", "true").lower() in ("1", "true", "yes", "on")
+# Partners offered a job per wave.
+DISPATCH_FANOUT = int(os.getenv("DISPATCH_FANOUT", "10"))
+# Search radius (km) of each successive wave; a job stops widening once taken.
+DISPATCH_WAVE_RADII_KM = [float(r) for r in os.getenv("DISPATCH_WAVE_RADII_KM", "3,8,15,30").split(",") if r.strip()]
+DISPATCH_WAVE_INTERVAL_SECONDS = float(os.getenv("DISPATCH_WAVE_INTERVAL_SECONDS", "20"))
+
+
+class Dispatcher:
+    """
+    Pushes new jobs to the nearest online partners over the websocket manager.
+
+    Online partners live in an in-memory GridIndex keyed by user id (data:
+    lower-cased services and service radius). Each job is offered in waves of
+    `fanout` partners at growing radii until it is accepted or the waves run out.
+    """
+
+    def __init__(self, fanout: int = DISPATCH_FANOUT, wave_radii_km: Iterable[float] = DISPATCH_WAVE_RADII_KM,
+                 wave_interval: float = DISPATCH_WAVE_INTERVAL_SECONDS):
+        self.fanout = fanout
+        self.wave_radii_km = list(wave_radii_km)
+        self.wave_interval = wave_interval
+        self.partners = geo.GridIndex()
+        self._offered: Dict[int, Set[int]] = {}
+        self._waves: Dict[int, asyncio.Task] = {}
+        self.jobs_dispatched = 0
+        self.offers_sent = 0
+
+    # --- presence ---
+
+    def set_online(self, user_id: int, latitude: float, longitude: float,
+                   services: Iterable[str] = (), radius_km: Optional[float] = None):
+        self.partners.upsert(user_id, latitude, longitude, {
+            "services": {s.lower() for s in services if isinstance(s, str)},
+            "radius_km": radius_km,
+        })
+
+    def move(self, user_id: int, latitude: float, longitude: float) -> bool:
+        """Update the position of a partner that is already online."""
+        entry = self.partners.get(user_id)
+        if entry is None:
+            return False
+        self.partners.upsert(user_id, latitude, longitude, entry[2])
+        return True
+
+    def set_offline(self, user_id: int):
+        self.partners.remove(user_id)
+
+    def is_online(self, user_id: int) -> bool:
+        return user_id in self.partners
+
+    # --- dispatch ---
+
+    def candidates(self, job: dict, radius_km: float, manager, exclude: Set[int] = frozenset()) -> List[tuple]:
+        """Up to `fanout` (distance_km, user_id) of connected partners that can take `job`."""
+        service = (job.get("service_type") or "").lower()
+
+        def eligible(user_id, partner):
+            return (
+                user_id not in exclude
+                and user_id != job.get("customer_id")
+                and (not partner["services"] or service in partner["services"])
+                and manager.is_connected(user_id)
+            )
+
+        hits = self.partners.nearby(job["latitude"], job["longitude"], radius_km, predicate=eligible)
+        picked = []
+        for distance, user_id, partner in hits:
+            if partner["radius_km"] is not None and distance > partner["radius_km"]:
+                continue
+            picked.append((distance, user_id))
+            if len(picked) == self.fanout:
+                break
+        return picked
+
+    async def _offer(self, job: dict, wave: int, manager) -> int:
+        offered = self._offered.setdefault(job["id"], set())
+        picked = self.candidates(job, self.wave_radii_km[wave], manager, offered)
+        for distance, user_id in picked:
+            offered.add(user_id)
+            await manager.send_personal_message(
+                {"type": "job_offer", "wave": wave + 1, "distanceKm": round(distance, 3), "job": job}, user_id
+            )
+        self.offers_sent += len(picked)
+        return len(picked)
+
+    async def dispatch(self, job: dict, manager) -> int:
+        """Send the first wave now and schedule the wider ones. Returns offers sent."""
+        if job.get("latitude") is None or job.get("longitude") is None or not self.wave_radii_km:
+            return 0
+        self.jobs_dispatched += 1
+        sent = await self._offer(job, 0, manager)
+        self._waves[job["id"]] = asyncio.create_task(self._widen(job, manager))
+        return sent
+
+    async def _widen(self, job: dict, manager):
+        try:
+            for wave in range(1, len(self.wave_radii_km)):
+                await asyncio.sleep(self.wave_interval)
+                if job["id"] not in self._offered:
+                    return
+                await self._offer(job, wave, manager)
+            # The last wave gets one interval to be taken.
+            await asyncio.sleep(self.wave_interval)
+        except Exception as e:
+            logger.warning("Dispatch of job %s stopped: %s", job["id"], e)
+        finally:
+            self._waves.pop(job["id"], None)
+        # Waves are over: nobody is told when the job goes after this. Not
+        # reached when cancelled, as close() and shutdown() clean up themselves.
+        self._offered.pop(job["id"], None)
+
+    async def close(self, job_id: int, manager, worker_id: Optional[int] = None):
+        """Stop offering a job and tell the other partners it is gone."""
+        task = self._waves.pop(job_id, None)
+        if task is not None and task is not asyncio.current_task():
+            task.cancel()
+        for user_id in self._offered.pop(job_id, ()):
+            if user_id != worker_id:
+                await manager.send_personal_message({"type": "job_taken", "jobId": job_id}, user_id)
+
+    def shutdown(self):
+        for task in list(self._waves.values()):
+            task.cancel()
+        self._waves.clear()
+        self._offered.clear()
+
+    def stats(self) -> dict:
+        return {
+            "enabled": DISPATCH_ENABLED,
+            "online_partners": len(self.partners),
+            "jobs_dispatched": self.jobs_dispatched,
+            "jobs_in_dispatch": len(self._offered),
+            "offers_sent": self.offers_sent,
+        }
+
+
+dispatcher = Dispatcher()
+
+
+def update_presence(db, user_id: int, is_online: bool, latitude: Optional[float] = None,
+                    longitude: Optional[float] = None) -> Optional[models.User]:
+    """
+    Persist a partner's online flag and mirror it into the dispatch index.
+    Returns None for unknown users and customers, who are never dispatched to.
+    """
+    user = db.get(models.User, user_id)
+    if user is None or user.role == "user":
+        return None
+    if user.is_online != is_online:
+        user.is_online = is_online
+        db.commit()
+    if not is_online:
+        dispatcher.set_offline(user_id)
+    elif latitude is not None and longitude is not None:
+        profile = user.partner_profile
+        dispatcher.set_online(
+            user_id, latitude, longitude,
+            services=(profile.selected_services or []) if profile else [],
+            radius_km=profile.service_radius if profile else None,
+        )
+    return user
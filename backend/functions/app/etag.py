@@ -0,0 +1,153 @@
+import hashlib
+import os
+import random
+import threading
+from typing import Dict, Iterable, Optional, Sequence
+
+from fastapi import Request, Response
+from sqlalchemy import select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from . import models
+from .db_metrics import route_label
+
+# Collections polled by the apps. Writers bump the keys they touch in their
+# own transaction; readers turn the current versions into a weak ETag and
+# answer a matching If-None-Match with 304 before running the listing query.
+
+# Rows the open-jobs version is spread over: every job creation and accept
+# bumps it, so a single row would serialize them. Writers bump one shard,
+# readers tag with all of them.
+ETAG_OPEN_JOBS_SHARDS = int(os.getenv("ETAG_OPEN_JOBS_SHARDS", "8"))
+OPEN_JOBS = [f"jobs:open:{shard}" for shard in range(ETAG_OPEN_JOBS_SHARDS)]
+
+
+def open_jobs_shard() -> str:
+    return random.choice(OPEN_JOBS)
+
+
+def customer_jobs(user_id: int) -> str:
+    return f"jobs:customer:{user_id}"
+
+
+def worker_jobs(user_id: int) -> str:
+    return f"jobs:worker:{user_id}"
+
+
+def wallet(user_id: int) -> str:
+    return f"wallet:{user_id}"
+
+
+def job_keys(job: models.Job) -> list:
+    keys = [customer_jobs(job.customer_id)]
+    if job.worker_id is not None:
+        keys.append(worker_jobs(job.worker_id))
+    return keys
+
+
+def bump(db: Session, keys: Iterable[str]):
+    """Increment the version of each key inside the caller's transaction."""
+    keys = sorted(set(keys))  # fixed order, so concurrent writers can't deadlock
+    if not keys:
+        return
+    dialect = postgresql if db.get_bind().dialect.name == "postgresql" else sqlite
+    stmt = dialect.insert(models.CollectionVersion).values([{"key": key, "version": 1} for key in keys])
+    db.execute(stmt.on_conflict_do_update(
+        index_elements=[models.CollectionVersion.key],
+        set_={"version": models.CollectionVersion.version + 1},
+    ))
+
+
+def versions(db: Session, keys: Sequence[str]) -> list:
+    """Current version of each key, 0 for collections never written."""
+    found = dict(db.execute(
+        select(models.CollectionVersion.key, models.CollectionVersion.version)
+        .where(models.CollectionVersion.key.in_(keys))
+    ).all())
+    return [found.get(key, 0) for key in keys]
+
+
+def _tag(request: Request, user_id: int, keys: Sequence[str], current: Sequence[int], variant: str) -> str:
+    # The query string is part of the tag: each page/position is its own resource.
+    raw = "|".join([request.url.path, request.url.query, str(user_id), variant]
+                   + [f"{k}={v}" for k, v in zip(keys, current)])
+    return 'W/"%s"' % hashlib.blake2b(raw.encode(), digest_size=12).hexdigest()
+
+
+def _matches(header: Optional[str], tag: str) -> bool:
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    # Weak comparison: W/"x" and "x" are the same validator.
+    opaque = tag[2:]
+    return any(candidate.strip().removeprefix("W/") == opaque for candidate in header.split(","))
+
+
+class ConditionalGetMetrics:
+    """Per-route counts of requests, conditional requests and 304s."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._routes: Dict[str, Dict[str, int]] = {}
+
+    def observe(self, route: str, conditional: bool, not_modified: bool):
+        with self._lock:
+            counts = self._routes.setdefault(route, {"requests": 0, "conditional": 0, "not_modified": 0})
+            counts["requests"] += 1
+            counts["conditional"] += conditional
+            counts["not_modified"] += not_modified
+
+    def reset(self):
+        with self._lock:
+            self._routes.clear()
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            routes = {route: dict(counts) for route, counts in self._routes.items()}
+        for counts in routes.values():
+            counts["hit_rate"] = round(counts["not_modified"] / counts["requests"], 4)
+            counts["conditional_hit_rate"] = (
+                round(counts["not_modified"] / counts["conditional"], 4) if counts["conditional"] else 0.0
+            )
+        requests = sum(c["requests"] for c in routes.values())
+        not_modified = sum(c["not_modified"] for c in routes.values())
+        return {
+            "requests": requests,
+            "not_modified": not_modified,
+            "hit_rate": round(not_modified / requests, 4) if requests else 0.0,
+            "routes": routes,
+        }
+
+
+metrics = ConditionalGetMetrics()
+
+
+def _respond(request: Request, response: Response, user_id: int, keys: Sequence[str],
+             current: Sequence[int], variant: str) -> Optional[Response]:
+    tag = _tag(request, user_id, keys, current, variant)
+    header = request.headers.get("if-none-match")
+    hit = _matches(header, tag)
+    metrics.observe(route_label(request.scope), header is not None, hit)
+    headers = {"ETag": tag, "Cache-Control": "private, no-cache"}
+    if hit:
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    return None
+
+
+def not_modified(db: Session, request: Request, response: Response, user_id: int,
+                 keys: Sequence[str], variant: str = "") -> Optional[Response]:
+    """
+    Tag the response with the collections' current ETag, or return a 304 to
+    send instead when the client already has it. Call before the query.
+    `variant` covers anything else the listing depends on (e.g. the caller's
+    search preferences) that has no version key of its own.
+    """
+    return _respond(request, response, user_id, keys, versions(db, keys), variant)
+
+
+async def not_modified_async(db, request: Request, response: Response, user_id: int,
+                             keys: Sequence[str], variant: str = "") -> Optional[Response]:
+    return _respond(request, response, user_id, keys, await db.run_sync(versions, keys), variant)
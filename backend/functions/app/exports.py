@@ -0,0 +1,127 @@
+import csv
+import io
+import json
+import os
+from contextlib import contextmanager
+from datetime import date, datetime
+from typing import Callable, Iterator, List, Optional
+
+from fastapi import HTTPException
+from fastapi.responses import StreamingResponse
+from sqlalchemy import literal, select
+
+from . import models
+from .database import get_read_db
+from .money import from_minor
+
+# Rows fetched per round trip and written per chunk of the response body.
+EXPORT_BATCH_ROWS = int(os.getenv("EXPORT_BATCH_ROWS", "1000"))
+
+FORMATS = {"csv": "text/csv; charset=utf-8", "ndjson": "application/x-ndjson"}
+
+TRANSACTION_COLUMNS = [
+    models.Transaction.id, models.Transaction.user_id, models.Transaction.type,
+    models.Transaction.amount_minor, models.Transaction.job_id, models.Transaction.description,
+    models.Transaction.created_at,
+]
+TRANSACTION_FIELDS = ["id", "user_id", "type", "amount", "amount_minor", "job_id", "description", "created_at"]
+
+# Everything but the OTP, which never leaves the API.
+JOB_COLUMNS = [
+    models.Job.id, models.Job.customer_id, models.Job.worker_id, models.Job.agency_id, models.Job.status,
+    models.Job.service_type, models.Job.price, models.Job.workers_needed, models.Job.latitude,
+    models.Job.longitude, models.Job.address, models.Job.created_at, models.Job.accepted_at,
+    models.Job.completed_at,
+]
+JOB_FIELDS = [column.key for column in JOB_COLUMNS]
+
+
+def transaction_row(row) -> dict:
+    values = row._asdict()
+    values["amount"] = from_minor(values["amount_minor"])
+    return values
+
+
+def created_between(statement, model, start: Optional[datetime], end: Optional[datetime]):
+    """Filter on start <= created_at < end, binding with the column's own type."""
+    if start and end and start >= end:
+        raise HTTPException(status_code=400, detail="start must be before end")
+    if start:
+        statement = statement.where(model.created_at >= literal(start, model.created_at.type))
+    if end:
+        statement = statement.where(model.created_at < literal(end, model.created_at.type))
+    return statement
+
+
+read_session = contextmanager(get_read_db)
+
+
+def stream_rows(statement, batch: int = EXPORT_BATCH_ROWS) -> Iterator[list]:
+    """
+    Lists of up to `batch` result rows. The session is opened here, not taken
+    from the request, because the body is produced after the route returns.
+    yield_per streams through a server-side cursor on PostgreSQL and the
+    native cursor on SQLite, so only one batch is ever held in memory.
+    """
+    with read_session() as db:
+        result = db.execute(statement.execution_options(yield_per=batch))
+        for partition in result.partitions():
+            yield partition
+
+
+def _plain(value):
+    return value.isoformat() if isinstance(value, (datetime, date)) else value
+
+
+def encode(batches: Iterator[list], fields: List[str], fmt: str,
+           transform: Callable = lambda row: row._asdict()) -> Iterator[str]:
+    """One text chunk per batch of rows, CSV (with a header row) or NDJSON."""
+    if fmt == "csv":
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(fields)
+        for rows in batches:
+            for row in rows:
+                values = transform(row)
+                writer.writerow([_plain(values[f]) for f in fields])
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+        if buffer.tell():
+            yield buffer.getvalue()
+    else:
+        for rows in batches:
+            lines = []
+            for row in rows:
+                values = transform(row)
+                lines.append(json.dumps({f: _plain(values[f]) for f in fields}, separators=(",", ":")))
+            yield "\n".join(lines) + "\n"
+
+
+def export_response(statement, fields: List[str], fmt: str, name: str,
+                    transform: Callable = lambda row: row._asdict()) -> StreamingResponse:
+    filename = f"{name}-{datetime.utcnow():%Y%m%d-%H%M%S}.{fmt}"
+    return StreamingResponse(
+        encode(stream_rows(statement), fields, fmt, transform),
+        media_type=FORMATS[fmt],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+
+def transactions_export(fmt: str, start=None, end=None, user_id: Optional[int] = None,
+                        type: Optional[str] = None) -> StreamingResponse:
+    statement = select(*TRANSACTION_COLUMNS).order_by(models.Transaction.id)
+    if user_id is not None:
+        statement = statement.where(models.Transaction.user_id == user_id)
+    if type:
+        statement = statement.where(models.Transaction.type == type)
+    statement = created_between(statement, models.Transaction, start, end)
+    return export_response(statement, TRANSACTION_FIELDS, fmt, "transactions", transaction_row)
+
+
+def jobs_export(fmt: str, start=None, end=None, status: Optional[str] = None) -> StreamingResponse:
+    statement = select(*JOB_COLUMNS).order_by(models.Job.id)
+    if status:
+        statement = statement.where(models.Job.status == status)
+    statement = created_between(statement, models.Job, start, end)
+    return export_response(statement, JOB_FIELDS, fmt, "jobs")
@@ -0,0 +1,140 @@
+import math
+import os
+import threading
+from collections import defaultdict
+from typing import Callable, Dict, Hashable, List, Optional, Tuple
+
+EARTH_RADIUS_KM = 6371.0
+KM_PER_DEGREE_LAT = 111.32
+
+# Size of one grid cell in degrees (~5.5 km north-south). Stored in
+# jobs.geo_cell, so changing it requires re-running the backfill.
+GEO_CELL_DEGREES = 0.05
+
+# Largest radius a nearby search will cover, whatever the profile says.
+MAX_SEARCH_RADIUS_KM = 100.0
+
+# Where /api/bookings/available looks up nearby jobs: "db" (indexed geo_cell
+# query) or "memory" (the process-local `open_jobs` index below).
+NEARBY_JOBS_BACKEND = os.getenv("NEARBY_JOBS_BACKEND", "db").lower()
+
+
+def haversine_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    dlat = math.radians(lat2 - lat1)
+    dlon = math.radians(lon2 - lon1)
+    a = math.sin(dlat / 2) ** 2 + math.cos(math.radians(lat1)) * math.cos(math.radians(lat2)) * math.sin(dlon / 2) ** 2
+    return EARTH_RADIUS_KM * 2 * math.asin(math.sqrt(a))
+
+
+# Cell columns around the globe, numbered -COLUMNS/2 (longitude -180) up to
+# COLUMNS/2 - 1; longitude 180 is the same meridian as -180.
+COLUMNS = round(360 / GEO_CELL_DEGREES)
+
+
+def _wrap_column(col: int) -> int:
+    return (col + COLUMNS // 2) % COLUMNS - COLUMNS // 2
+
+
+def cell_coords(latitude: float, longitude: float) -> Tuple[int, int]:
+    return math.floor(latitude / GEO_CELL_DEGREES), _wrap_column(math.floor(longitude / GEO_CELL_DEGREES))
+
+
+def cell_for(latitude: Optional[float], longitude: Optional[float]) -> Optional[str]:
+    """Grid cell id stored in jobs.geo_cell, e.g. '812:1541'."""
+    if latitude is None or longitude is None:
+        return None
+    row, col = cell_coords(latitude, longitude)
+    return f"{row}:{col}"
+
+
+def covering_cells(latitude: float, longitude: float, radius_km: float) -> List[Tuple[int, int]]:
+    """All grid cells intersecting the bounding box of a circle, wrapping at the antimeridian."""
+    radius_km = min(radius_km, MAX_SEARCH_RADIUS_KM)
+    dlat = radius_km / KM_PER_DEGREE_LAT
+    dlon = radius_km / (KM_PER_DEGREE_LAT * max(math.cos(math.radians(latitude)), 0.01))
+    row_min = math.floor((latitude - dlat) / GEO_CELL_DEGREES)
+    row_max = math.floor((latitude + dlat) / GEO_CELL_DEGREES)
+    col_min = math.floor((longitude - dlon) / GEO_CELL_DEGREES)
+    col_max = math.floor((longitude + dlon) / GEO_CELL_DEGREES)
+    # Columns past either end of the map continue on the other side.
+    cols = sorted({_wrap_column(c) for c in range(col_min, min(col_max, col_min + COLUMNS - 1) + 1)})
+    return [(r, c) for r in range(row_min, row_max + 1) for c in cols]
+
+
+def covering_cell_ids(latitude: float, longitude: float, radius_km: float) -> List[str]:
+    return [f"{r}:{c}" for r, c in covering_cells(latitude, longitude, radius_km)]
+
+
+class GridIndex:
+    """
+    In-memory uniform-grid index of points keyed by id. Lookups only visit the
+    cells covering the search circle, so cost tracks local density rather than
+    the total number of points.
+    """
+
+    def __init__(self):
+        self._cells: Dict[Tuple[int, int], Dict[Hashable, tuple]] = defaultdict(dict)
+        self._cell_of: Dict[Hashable, Tuple[int, int]] = {}
+        self._lock = threading.Lock()
+
+    def upsert(self, key: Hashable, latitude: float, longitude: float, data=None):
+        cell = cell_coords(latitude, longitude)
+        with self._lock:
+            old = self._cell_of.get(key)
+            if old is not None and old != cell:
+                self._drop(key, old)
+            self._cells[cell][key] = (latitude, longitude, data)
+            self._cell_of[key] = cell
+
+    def remove(self, key: Hashable):
+        with self._lock:
+            cell = self._cell_of.get(key)
+            if cell is not None:
+                self._drop(key, cell)
+
+    def _drop(self, key, cell):
+        bucket = self._cells[cell]
+        bucket.pop(key, None)
+        if not bucket:
+            del self._cells[cell]
+        del self._cell_of[key]
+
+    def clear(self):
+        with self._lock:
+            self._cells.clear()
+            self._cell_of.clear()
+
+    def get(self, key: Hashable):
+        with self._lock:
+            cell = self._cell_of.get(key)
+            return None if cell is None else self._cells[cell][key]
+
+    def __contains__(self, key):
+        return key in self._cell_of
+
+    def __len__(self):
+        return len(self._cell_of)
+
+    def nearby(self, latitude: float, longitude: float, radius_km: float, limit: Optional[int] = None,
+               predicate: Optional[Callable[[Hashable, object], bool]] = None) -> List[Tuple[float, Hashable, object]]:
+        """(distance_km, key, data) within `radius_km`, nearest first."""
+        radius_km = min(radius_km, MAX_SEARCH_RADIUS_KM)
+        hits = []
+        with self._lock:
+            for cell in covering_cells(latitude, longitude, radius_km):
+                bucket = self._cells.get(cell)
+                if not bucket:
+                    continue
+                for key, (lat, lon, data) in bucket.items():
+                    if predicate is not None and not predicate(key, data):
+                        continue
+                    distance = haversine_km(latitude, longitude, lat, lon)
+                    if distance <= radius_km:
+                        hits.append((distance, key, data))
+        hits.sort(key=lambda hit: hit[0])
+        return hits[:limit] if limit is not None else hits
+
+
+# Open ("searching") jobs, used by /api/bookings/available when
+# NEARBY_JOBS_BACKEND=memory. Only coherent with a single worker process.
+open_jobs = GridIndex()
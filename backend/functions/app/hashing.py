@@ -0,0 +1,159 @@
+import asyncio
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Optional, Tuple
+
+import bcrypt
+from starlette.concurrency import run_in_threadpool
+
+# bcrypt work factor for new hashes; stored hashes with another cost are
+# upgraded transparently on the next successful login.
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+# Size of the dedicated hashing process pool. 0 hashes on the shared AnyIO
+# threadpool instead (the pre-engine behaviour).
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(os.cpu_count() or 2)))
+# Hash jobs allowed to wait for a free worker before callers get a 503.
+PASSWORD_HASH_QUEUE_LIMIT = int(os.getenv("PASSWORD_HASH_QUEUE_LIMIT", "32"))
+
+logger = logging.getLogger(__name__)
+
+
+class HashingQueueFull(Exception):
+    """Raised when the hashing engine already has its maximum backlog."""
+
+
+def hash_password(password: str, rounds: int = BCRYPT_ROUNDS) -> str:
+    salt = bcrypt.gensalt(rounds=rounds)
+    return bcrypt.hashpw(password.encode('utf-8'), salt).decode('utf-8')
+
+
+def check_password(password: str, hashed_password: str) -> bool:
+    return bcrypt.checkpw(password.encode('utf-8'), hashed_password.encode('utf-8'))
+
+
+def hash_cost(hashed_password: str) -> Optional[int]:
+    # Modular crypt format: $2b$<cost>$<salt+digest>
+    parts = hashed_password.split("$")
+    if len(parts) < 4 or not parts[2].isdigit():
+        return None
+    return int(parts[2])
+
+
+def needs_rehash(hashed_password: str, rounds: int = BCRYPT_ROUNDS) -> bool:
+    return hash_cost(hashed_password) != rounds
+
+
+def _verify_and_upgrade(password: str, hashed_password: str, rounds: int) -> Tuple[bool, Optional[str]]:
+    """Check a password and, if its hash uses a stale cost, return a fresh one."""
+    if not check_password(password, hashed_password):
+        return False, None
+    if needs_rehash(hashed_password, rounds):
+        return True, hash_password(password, rounds)
+    return True, None
+
+
+class HashingEngine:
+    """
+    Runs bcrypt off the request threadpool in a bounded process pool. Callers
+    await the result; once `workers + queue_limit` jobs are in flight new
+    submissions fail fast with HashingQueueFull.
+    """
+
+    def __init__(self, workers: int = PASSWORD_HASH_WORKERS, queue_limit: int = PASSWORD_HASH_QUEUE_LIMIT,
+                 rounds: int = BCRYPT_ROUNDS):
+        self.workers = workers
+        self.queue_limit = queue_limit
+        self.rounds = rounds
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self.completed = 0
+        self.rejected = 0
+        self.restarts = 0
+
+    @property
+    def capacity(self) -> int:
+        return max(self.workers, 1) + self.queue_limit
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                )
+            return self._executor
+
+    def _discard(self, executor: ProcessPoolExecutor):
+        # A worker died (OOM kill, crash) and the pool stays broken for good;
+        # drop it so the next submission spawns a fresh one. Only the first
+        # caller to notice replaces it.
+        with self._lock:
+            if self._executor is not executor:
+                return
+            self._executor = None
+            self.restarts += 1
+        logger.warning("Password hashing pool broke; starting a new one")
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def start(self):
+        """Spawn the worker processes now instead of on the first login."""
+        if self.workers <= 0:
+            return
+        executor = self._get_executor()
+        for future in [executor.submit(hash_cost, "") for _ in range(self.workers)]:
+            future.result()
+
+    async def _run(self, fn, *args):
+        with self._lock:
+            if self._in_flight >= self.capacity:
+                self.rejected += 1
+                raise HashingQueueFull()
+            self._in_flight += 1
+        try:
+            if self.workers <= 0:
+                return await run_in_threadpool(fn, *args)
+            loop = asyncio.get_running_loop()
+            for attempt in range(2):
+                executor = self._get_executor()
+                try:
+                    return await loop.run_in_executor(executor, fn, *args)
+                except BrokenProcessPool:
+                    self._discard(executor)
+                    if attempt:
+                        raise
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+                self.completed += 1
+
+    async def hash(self, password: str) -> str:
+        return await self._run(hash_password, password, self.rounds)
+
+    async def verify(self, password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+        """Returns (matches, upgraded_hash_or_None)."""
+        return await self._run(_verify_and_upgrade, password, hashed_password, self.rounds)
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.workers,
+            "queue_limit": self.queue_limit,
+            "bcrypt_rounds": self.rounds,
+            "in_flight": self._in_flight,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "restarts": self.restarts,
+        }
+
+
+hasher = HashingEngine()
@@ -0,0 +1,89 @@
+import os
+from typing import Callable, NamedTuple, Optional
+
+from sqlalchemy import select
+from starlette.concurrency import run_in_threadpool
+
+from . import models
+from .cache import TTLCache
+from .database import SessionLocal
+
+# Who is on each active job, so the websocket location relay can route a
+# frame to the counterparty without a query per frame. Entries are written
+# when a job is accepted or changes status and loaded from the database (in
+# the threadpool) only on a miss. While the websocket bus runs, every change
+# is also applied by the other worker processes (see share_changes); without
+# it, the TTL bounds how stale their view can get. Completed, cancelled and
+# unknown jobs are kept too, for a shorter while, so clients still sending
+# fixes for them don't cost a query per frame.
+JOB_PARTICIPANTS_CACHE_SIZE = int(os.getenv("JOB_PARTICIPANTS_CACHE_SIZE", "50000"))
+JOB_PARTICIPANTS_CACHE_TTL_SECONDS = float(os.getenv("JOB_PARTICIPANTS_CACHE_TTL_SECONDS", "900"))
+JOB_PARTICIPANTS_SETTLED_TTL_SECONDS = float(os.getenv("JOB_PARTICIPANTS_SETTLED_TTL_SECONDS", "60"))
+
+TERMINAL_STATUSES = ("completed", "cancelled")
+
+
+class Participants(NamedTuple):
+    customer_id: int
+    worker_id: Optional[int]
+    status: str
+
+
+class JobRow(NamedTuple):
+    """The job columns `remember` needs, e.g. as received from another process."""
+    id: int
+    customer_id: int
+    worker_id: Optional[int]
+    status: str
+
+
+cache = TTLCache(maxsize=JOB_PARTICIPANTS_CACHE_SIZE, ttl=JOB_PARTICIPANTS_CACHE_TTL_SECONDS)
+
+
+# Cached for job ids with no row (None itself can't tell a hit from a miss).
+_UNKNOWN = object()
+
+
+# Set by app.bus while it runs: called with each committed change so the
+# other worker processes remember it too.
+_share: Optional[Callable[[JobRow], None]] = None
+
+
+def share_changes(publish: Optional[Callable[[JobRow], None]]):
+    global _share
+    _share = publish
+
+
+def remember(job, share: bool = True) -> Participants:
+    """Record a job's participants after a committed change; terminal jobs only briefly."""
+    participants = Participants(job.customer_id, job.worker_id, job.status)
+    ttl = JOB_PARTICIPANTS_SETTLED_TTL_SECONDS if job.status in TERMINAL_STATUSES else None
+    cache.set(job.id, participants, ttl)
+    if share and _share is not None:
+        _share(JobRow(job.id, *participants))
+    return participants
+
+
+def _load(job_id: int) -> Optional[Participants]:
+    db = SessionLocal()
+    try:
+        row = db.execute(
+            select(models.Job.id, models.Job.customer_id, models.Job.worker_id, models.Job.status)
+            .where(models.Job.id == job_id)
+        ).first()
+    finally:
+        db.close()
+    if row is None:
+        cache.set(job_id, _UNKNOWN, JOB_PARTICIPANTS_SETTLED_TTL_SECONDS)
+        return None
+    return remember(row, share=False)
+
+
+async def lookup(job_id: int) -> Optional[Participants]:
+    """Participants of a job, from the cache or else the database; None for unknown jobs."""
+    participants = cache.get(job_id)
+    if participants is _UNKNOWN:
+        return None
+    if participants is not None:
+        return participants
+    return await run_in_threadpool(_load, job_id)
@@ -0,0 +1,60 @@
+from typing import Tuple
+
+from sqlalchemy import insert, select, update
+from sqlalchemy.orm import Session
+
+from . import etag, models, rollups
+from .money import to_minor
+
+# Platform commission on a completed job, in basis points of the price.
+PLATFORM_COMMISSION_BPS = 1500
+
+
+def split_price(price_minor: int) -> Tuple[int, int]:
+    """(worker_share, platform_commission); the two always add up to the price."""
+    commission = (price_minor * PLATFORM_COMMISSION_BPS + 5000) // 10000
+    return price_minor - commission, commission
+
+
+def post_job_completion(db: Session, job_id: int, worker_id: int, price) -> int:
+    """
+    Credit the worker's wallet and record the earning/commission rows for a
+    completed job. Runs in the caller's transaction, which must be the one
+    that moved the job to "completed" so a job is only ever posted once.
+
+    The balance is incremented server-side, so concurrent postings to the
+    same wallet serialize on the row instead of overwriting each other.
+    Returns the worker's share in minor units.
+    """
+    worker_share, commission = split_price(to_minor(price or 0))
+    credited = db.execute(
+        update(models.Wallet)
+        .where(models.Wallet.user_id == worker_id)
+        .values(
+            balance_minor=models.Wallet.balance_minor + worker_share,
+            total_earnings_minor=models.Wallet.total_earnings_minor + worker_share,
+        )
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    if not credited:
+        db.execute(insert(models.Wallet).values(
+            user_id=worker_id, balance_minor=worker_share, total_earnings_minor=worker_share,
+        ))
+    db.execute(insert(models.Transaction), [
+        {"user_id": worker_id, "type": "earning", "amount_minor": worker_share, "job_id": job_id,
+         "description": "Job earnings"},
+        {"user_id": None, "type": "commission", "amount_minor": commission, "job_id": job_id,
+         "description": "Platform commission"},
+    ])
+    rollups.add(db, [(worker_id, "earning", worker_share)])
+    etag.bump(db, [etag.wallet(worker_id)])
+    return worker_share
+
+
+def is_posted(db: Session, job_id: int) -> bool:
+    """Whether post_job_completion has already run for this job."""
+    return db.scalar(
+        select(models.Transaction.id)
+        .where(models.Transaction.job_id == job_id, models.Transaction.type == "earning")
+        .limit(1)
+    ) is not None
@@ -1,7 +1,18 @@
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, Float, ForeignKey, Text, JSON
+from sqlalchemy import Column, Integer, BigInteger, String, Boolean, Date, DateTime, Float, ForeignKey, Text, JSON, Index, event
+from sqlalchemy.dialects import sqlite
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
 from .database import Base
+from . import geo
+from .money import from_minor, to_minor
+
+# SQLite's CURRENT_TIMESTAMP (the created_at default) stores 'YYYY-MM-DD HH:MM:SS'.
+# Bind datetimes in that same text form so keyset comparisons on created_at
+# order the same way as the stored values.
+CreatedAt = DateTime(timezone=True).with_variant(
+    sqlite.DATETIME(storage_format="%(year)04d-%(month)02d-%(day)02d %(hour)02d:%(minute)02d:%(second)02d"),
+    "sqlite",
+)
 
 class User(Base):
     __tablename__ = "users"
@@ -15,7 +26,7 @@ class User(Base):
     is_active = Column(Boolean, default=True)
     is_verified = Column(Boolean, default=False)
     is_online = Column(Boolean, default=False)
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    created_at = Column(CreatedAt, server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
 
     jobs_as_customer = relationship("Job", foreign_keys="Job.customer_id", back_populates="customer")
@@ -23,6 +34,10 @@ class User(Base):
     wallet = relationship("Wallet", back_populates="user", uselist=False)
     partner_profile = relationship("PartnerProfile", back_populates="user", uselist=False)
 
+    __table_args__ = (
+        Index("idx_users_created_at_id", "created_at", "id"),
+    )
+
 class PartnerProfile(Base):
     __tablename__ = "partner_profiles"
 
@@ -47,9 +62,13 @@ class PartnerProfile(Base):
     selected_services = Column(JSON, default=list)
     custom_skills = Column(JSON, default=list)
     
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    created_at = Column(CreatedAt, server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
 
+    __table_args__ = (
+        Index("idx_partner_profiles_approval_created_at_id", "approval_status", "created_at", "id"),
+    )
+
     user = relationship("User", back_populates="partner_profile")
 
 class Job(Base):
@@ -69,15 +88,34 @@ class Job(Base):
     latitude = Column(Float)
     longitude = Column(Float)
     address = Column(String(255))
+    city = Column(String(100), nullable=True)
     description = Column(Text, nullable=True)
+    # Grid cell of (latitude, longitude), see app.geo; kept in sync on write.
+    geo_cell = Column(String(32), nullable=True)
 
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    created_at = Column(CreatedAt, server_default=func.now())
     accepted_at = Column(DateTime(timezone=True), nullable=True)
     completed_at = Column(DateTime(timezone=True), nullable=True)
 
     customer = relationship("User", foreign_keys=[customer_id], back_populates="jobs_as_customer")
     worker = relationship("User", foreign_keys=[worker_id], back_populates="jobs_as_worker")
 
+    __table_args__ = (
+        Index("idx_jobs_status_geo_cell", "status", "geo_cell"),
+        Index("idx_jobs_created_at_id", "created_at", "id"),
+        Index("idx_jobs_status_created_at_id", "status", "created_at", "id"),
+        Index("idx_jobs_customer_created_at_id", "customer_id", "created_at", "id"),
+        Index("idx_jobs_worker_created_at_id", "worker_id", "created_at", "id"),
+        # Day-by-day scans of the analytics catch-up (app.analytics).
+        Index("idx_jobs_accepted_at", "accepted_at"),
+        Index("idx_jobs_completed_at", "completed_at"),
+    )
+
+@event.listens_for(Job, "before_insert")
+@event.listens_for(Job, "before_update")
+def _maintain_job_geo_cell(mapper, connection, job):
+    job.geo_cell = geo.cell_for(job.latitude, job.longitude)
+
 class Notification(Base):
     __tablename__ = "notifications"
 
@@ -88,30 +126,138 @@ class Notification(Base):
     title = Column(String(255))
     body = Column(Text)
     is_read = Column(Boolean, default=False)
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    created_at = Column(CreatedAt, server_default=func.now())
+
+class OutboxEvent(Base):
+    """
+    Job lifecycle event for one recipient, written in the same transaction as
+    the state change and relayed to the user's websockets by app.outbox.
+    """
+    __tablename__ = "outbox_events"
+
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    seq = Column(BigInteger, nullable=False)  # per-user, gap-free, from event_sequences
+    type = Column(String(50), nullable=False)
+    job_id = Column(Integer, ForeignKey("jobs.id", ondelete="CASCADE"), nullable=True)
+    payload = Column(JSON, default=dict)
+    created_at = Column(CreatedAt, server_default=func.now())
+    delivered_at = Column(DateTime(timezone=True), nullable=True)
+    claimed_until = Column(DateTime(timezone=True), nullable=True)  # lease of the relay sending it
+
+    __table_args__ = (
+        Index("idx_outbox_events_user_seq", "user_id", "seq", unique=True),
+        Index("idx_outbox_events_delivered_at_id", "delivered_at", "id"),
+    )
+
+class CollectionVersion(Base):
+    """Change counter per cached collection (see app.etag), bumped on every write to it."""
+    __tablename__ = "collection_versions"
+
+    key = Column(String(64), primary_key=True)
+    version = Column(BigInteger, nullable=False, default=0)
+
+class StatCounter(Base):
+    """Sharded admin dashboard counter, see app.stats; a counter's value is the sum of its shards."""
+    __tablename__ = "stat_counters"
+
+    name = Column(String(64), primary_key=True)
+    shard = Column(Integer, primary_key=True)
+    value = Column(BigInteger, nullable=False, default=0)
+
+class EventSequence(Base):
+    __tablename__ = "event_sequences"
+
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    last_seq = Column(BigInteger, nullable=False, default=0)
 
 class Wallet(Base):
     __tablename__ = "wallets"
 
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), unique=True)
-    balance = Column(Float, default=0.0)
-    total_earnings = Column(Float, default=0.0)
+    # Integer minor units; `balance` / `total_earnings` below are the float views.
+    balance_minor = Column(BigInteger, nullable=False, default=0, server_default="0")
+    total_earnings_minor = Column(BigInteger, nullable=False, default=0, server_default="0")
     updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
 
     user = relationship("User", back_populates="wallet")
 
+    @property
+    def balance(self) -> float:
+        return from_minor(self.balance_minor)
+
+    @balance.setter
+    def balance(self, value):
+        self.balance_minor = to_minor(value)
+
+    @property
+    def total_earnings(self) -> float:
+        return from_minor(self.total_earnings_minor)
+
+    @total_earnings.setter
+    def total_earnings(self, value):
+        self.total_earnings_minor = to_minor(value)
+
 class Transaction(Base):
     __tablename__ = "transactions"
 
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=True)  # Platform transactions can be platform-wide when user_id is null
     type = Column(String(50)) # earning, commission
-    amount = Column(Float)
+    amount_minor = Column(BigInteger, nullable=False, default=0, server_default="0")
     job_id = Column(Integer, ForeignKey("jobs.id"), nullable=True)
     description = Column(String(255))
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    created_at = Column(CreatedAt, server_default=func.now())
+
+    __table_args__ = (
+        Index("idx_transactions_user_created_at_id", "user_id", "created_at", "id"),
+    )
+
+    @property
+    def amount(self) -> float:
+        return from_minor(self.amount_minor)
+
+    @amount.setter
+    def amount(self, value):
+        self.amount_minor = to_minor(value)
+
+class EarningsRollup(Base):
+    """Per user, UTC day and transaction type totals, maintained by app.rollups."""
+    __tablename__ = "earnings_rollups"
+
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    day = Column(Date, primary_key=True)
+    type = Column(String(50), primary_key=True)
+    amount_minor = Column(BigInteger, nullable=False, default=0)
+    count = Column(Integer, nullable=False, default=0)
+
+class JobRollup(Base):
+    """Job lifecycle totals per UTC hour or day, service type and city ('' if unknown), see app.analytics."""
+    __tablename__ = "job_rollups"
+
+    period = Column(String(8), primary_key=True)  # hour, day
+    service_type = Column(String(100), primary_key=True)  # "*" = all
+    city = Column(String(100), primary_key=True)  # "*" = all
+    bucket_start = Column(DateTime, primary_key=True, index=True)  # indexed for the catch-up
+    shard = Column(Integer, primary_key=True, default=0)  # rows with a "*" are spread over shards
+    created = Column(Integer, nullable=False, default=0)
+    accepted = Column(Integer, nullable=False, default=0)
+    completed = Column(Integer, nullable=False, default=0)
+    revenue_minor = Column(BigInteger, nullable=False, default=0)
+    accept_seconds = Column(BigInteger, nullable=False, default=0)  # sum of accepted_at - created_at
+
+class JobLatencyRollup(Base):
+    """Acceptance latency histogram per rollup bucket; `bucket` indexes app.analytics.LATENCY_BOUNDS_SECONDS."""
+    __tablename__ = "job_latency_rollups"
 
+    period = Column(String(8), primary_key=True)
+    service_type = Column(String(100), primary_key=True)
+    city = Column(String(100), primary_key=True)
+    bucket_start = Column(DateTime, primary_key=True, index=True)
+    bucket = Column(Integer, primary_key=True)
+    shard = Column(Integer, primary_key=True, default=0)
+    count = Column(Integer, nullable=False, default=0)
 
 class EmergencyCenter(Base):
     __tablename__ = "emergency_centers"
@@ -124,7 +270,7 @@ class EmergencyCenter(Base):
     contact_email = Column(String(255), nullable=True)
     is_active = Column(Boolean, default=True)
     service_radius_km = Column(Float, default=10.0)
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    created_at = Column(CreatedAt, server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
 
 
@@ -139,5 +285,5 @@ class PanicAlert(Base):
     longitude = Column(Float, nullable=True)
     status = Column(String(50), default="open")  # open, in_progress, resolved
     notes = Column(Text, nullable=True)
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    created_at = Column(CreatedAt, server_default=func.now())
     resolved_at = Column(DateTime(timezone=True), nullable=True)
@@ -0,0 +1,13 @@
+from decimal import ROUND_HALF_UP, Decimal
+
+# Money is stored as integer minor units (cents); the API still speaks floats.
+MINOR_UNITS_PER_MAJOR = 100
+
+
+def to_minor(amount) -> int:
+    """Major units (e.g. a float price) to integer minor units, rounding half up."""
+    return int((Decimal(str(amount)) * MINOR_UNITS_PER_MAJOR).quantize(Decimal("1"), rounding=ROUND_HALF_UP))
+
+
+def from_minor(amount_minor) -> float:
+    return (amount_minor or 0) / MINOR_UNITS_PER_MAJOR
@@ -0,0 +1,268 @@
+import asyncio
+import logging
+import os
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Iterable, List, Optional
+
+from sqlalchemy import delete, insert, or_, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+
+from . import models
+from .database import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+# Events the relay claims per round trip.
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", "200"))
+# How long a claimed batch is reserved for its relay; if the relay dies
+# before marking it delivered, another one sends it after this.
+OUTBOX_CLAIM_SECONDS = float(os.getenv("OUTBOX_CLAIM_SECONDS", "30"))
+# Idle poll interval; committed events also wake the relay directly.
+OUTBOX_POLL_SECONDS = float(os.getenv("OUTBOX_POLL_SECONDS", "1.0"))
+# Delivered events stay replayable for this long before they are purged.
+OUTBOX_RETENTION_HOURS = float(os.getenv("OUTBOX_RETENTION_HOURS", "72"))
+# Most events a reconnecting client gets back from one resume.
+OUTBOX_REPLAY_LIMIT = int(os.getenv("OUTBOX_REPLAY_LIMIT", "500"))
+
+# Notification title/body per event type; the body is formatted with the payload.
+NOTIFICATION_TEXT = {
+    "job_accepted": ("Job accepted", "A partner accepted your {serviceType} booking."),
+    "job_status_update": ("Job update", "Your {serviceType} job is now {status}."),
+    "job_completed": ("Job completed", "Your {serviceType} job has been completed."),
+    "payment_received": ("Payment received", "{amount:.2f} was added to your wallet."),
+}
+
+
+def event(user_id: int, type: str, job_id: Optional[int] = None, **payload) -> dict:
+    return {"user_id": user_id, "type": type, "job_id": job_id, "payload": payload}
+
+
+def _reserve_seqs(db: Session, user_id: int, count: int) -> int:
+    """Advance the user's sequence by `count`; returns the last number reserved."""
+    dialect = postgresql if db.get_bind().dialect.name == "postgresql" else sqlite
+    stmt = dialect.insert(models.EventSequence).values(user_id=user_id, last_seq=count)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[models.EventSequence.user_id],
+        set_={"last_seq": models.EventSequence.last_seq + count},
+    ).returning(models.EventSequence.last_seq)
+    return db.execute(stmt).scalar_one()
+
+
+def record(db: Session, events: Iterable[dict]) -> List[dict]:
+    """
+    Add events to the outbox inside the caller's transaction, so they commit
+    (or roll back) together with the state change they describe.
+
+    Each recipient's sequence row is bumped once per call; the upsert holds
+    that row until commit, so concurrent writers for the same user get
+    disjoint, ordered ranges. Returns the rows as inserted, with their seq.
+    """
+    by_user = defaultdict(list)
+    for e in events:
+        if e["user_id"] is not None:
+            by_user[e["user_id"]].append(e)
+    rows = []
+    for user_id, user_events in by_user.items():
+        last = _reserve_seqs(db, user_id, len(user_events))
+        first = last - len(user_events) + 1
+        rows.extend({**e, "seq": first + i} for i, e in enumerate(user_events))
+    if rows:
+        db.execute(insert(models.OutboxEvent), rows)
+    return rows
+
+
+def frame(row) -> dict:
+    """Websocket message for an outbox row; clients dedupe on (type, seq)."""
+    return {"type": row.type, "seq": row.seq, "jobId": row.job_id, "data": row.payload or {}}
+
+
+def replay(db: Session, user_id: int, after_seq: int, limit: int = OUTBOX_REPLAY_LIMIT) -> List[dict]:
+    """Frames for the user's events after `after_seq`, oldest first."""
+    rows = db.scalars(
+        select(models.OutboxEvent)
+        .where(models.OutboxEvent.user_id == user_id, models.OutboxEvent.seq > after_seq)
+        .order_by(models.OutboxEvent.seq)
+        .limit(limit)
+    ).all()
+    return [frame(row) for row in rows]
+
+
+def _notification(row: models.OutboxEvent) -> dict:
+    title, body = NOTIFICATION_TEXT.get(row.type, (row.type.replace("_", " ").capitalize(), ""))
+    try:
+        body = body.format(**(row.payload or {}))
+    except (KeyError, ValueError, TypeError):
+        pass
+    return {"user_id": row.user_id, "type": row.type, "job_id": row.job_id, "title": title, "body": body}
+
+
+class OutboxRelay:
+    """
+    Drains committed outbox events to the websocket manager in batches.
+
+    Every worker process runs one, so a batch is claimed before it is sent:
+    a conditional UPDATE leases the rows to this relay for `claim_seconds`,
+    and the other relays skip leased rows. Delivery is still at-least-once:
+    a batch is sent first and only then marked delivered, so if the relay
+    dies in between, the lease runs out and another relay resends it.
+    Notification rows are written only for the events this relay actually
+    marked, so they are never persisted twice. Users who are not connected
+    simply catch up with a resume.
+    """
+
+    def __init__(self, batch_size: int = OUTBOX_BATCH_SIZE, poll_interval: float = OUTBOX_POLL_SECONDS,
+                 retention_hours: float = OUTBOX_RETENTION_HOURS, claim_seconds: float = OUTBOX_CLAIM_SECONDS):
+        self.batch_size = batch_size
+        self.claim = timedelta(seconds=claim_seconds)
+        self.poll_interval = poll_interval
+        self.retention = timedelta(hours=retention_hours)
+        self.manager = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self.batches = 0
+        self.delivered = 0
+        self.send_failures = 0
+        self.purged = 0
+
+    # --- database side (threadpool) ---
+
+    def _claim(self) -> List[models.OutboxEvent]:
+        event, now = models.OutboxEvent, datetime.utcnow()
+        claimable = (event.delivered_at.is_(None), or_(event.claimed_until.is_(None), event.claimed_until < now))
+        # SKIP LOCKED (PostgreSQL) steps past rows another relay is claiming
+        # right now; the outer WHERE re-checks them once that claim commits.
+        batch = (
+            select(event.id).where(*claimable).order_by(event.id).limit(self.batch_size)
+            .with_for_update(skip_locked=True)
+        )
+        db = SessionLocal()
+        try:
+            rows = db.scalars(
+                update(event)
+                .where(event.id.in_(batch.scalar_subquery()), *claimable)
+                .values(claimed_until=now + self.claim)
+                .returning(event)
+                .execution_options(synchronize_session=False)
+            ).all()
+            db.expunge_all()
+            db.commit()
+            return sorted(rows, key=lambda row: row.id)
+        finally:
+            db.close()
+
+    def _mark_delivered(self, rows: List[models.OutboxEvent]) -> int:
+        by_id = {row.id: row for row in rows}
+        db = SessionLocal()
+        try:
+            marked = db.scalars(
+                update(models.OutboxEvent)
+                .where(models.OutboxEvent.id.in_(by_id), models.OutboxEvent.delivered_at.is_(None))
+                .values(delivered_at=datetime.utcnow())
+                .returning(models.OutboxEvent.id)
+                .execution_options(synchronize_session=False)
+            ).all()
+            if marked:
+                db.execute(insert(models.Notification), [_notification(by_id[i]) for i in sorted(marked)])
+            db.commit()
+            return len(marked)
+        finally:
+            db.close()
+
+    def _purge(self) -> int:
+        db = SessionLocal()
+        try:
+            purged = db.execute(
+                delete(models.OutboxEvent)
+                .where(models.OutboxEvent.delivered_at < datetime.utcnow() - self.retention)
+                .execution_options(synchronize_session=False)
+            ).rowcount
+            db.commit()
+            return purged
+        finally:
+            db.close()
+
+    # --- relay loop ---
+
+    async def drain_once(self) -> int:
+        """Relay one batch; returns how many events this call marked delivered."""
+        if self.manager is None:
+            return 0
+        rows = await run_in_threadpool(self._claim)
+        if not rows:
+            return 0
+        for row in sorted(rows, key=lambda r: (r.user_id, r.seq)):
+            try:
+                await self.manager.send_personal_message(frame(row), row.user_id)
+            except Exception as e:
+                # The event stays in the outbox for replay; one bad socket
+                # must not hold up everyone else's batch.
+                self.send_failures += 1
+                logger.debug("Outbox send to user %s failed: %s", row.user_id, e)
+        marked = await run_in_threadpool(self._mark_delivered, rows)
+        self.batches += 1
+        self.delivered += marked
+        return marked
+
+    async def drain(self) -> int:
+        total = 0
+        while True:
+            marked = await self.drain_once()
+            total += marked
+            if marked < self.batch_size:
+                return total
+
+    async def _run(self):
+        last_purge = datetime.utcnow()
+        while True:
+            try:
+                await self.drain()
+                if datetime.utcnow() - last_purge > timedelta(minutes=10):
+                    self.purged += await run_in_threadpool(self._purge)
+                    last_purge = datetime.utcnow()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning("Outbox relay round failed: %s", e)
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+    def start(self, manager):
+        self.manager = manager
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        task, self._task = self._task, None
+        if task is not None:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self._loop = self._wakeup = None
+
+    def wake(self):
+        """Nudge the relay after a commit; safe to call from any thread."""
+        loop, wakeup = self._loop, self._wakeup
+        if loop is not None and wakeup is not None and not loop.is_closed():
+            loop.call_soon_threadsafe(wakeup.set)
+
+    def stats(self) -> dict:
+        return {
+            "running": self._task is not None,
+            "batches": self.batches,
+            "delivered": self.delivered,
+            "send_failures": self.send_failures,
+            "purged": self.purged,
+        }
+
+
+relay = OutboxRelay()
@@ -0,0 +1,88 @@
+import base64
+import json
+import os
+from datetime import datetime
+from typing import Optional, Sequence
+
+from fastapi import HTTPException, Query, Response
+from sqlalchemy import literal, tuple_
+
+DEFAULT_PAGE_SIZE = int(os.getenv("DEFAULT_PAGE_SIZE", "100"))
+MAX_PAGE_SIZE = int(os.getenv("MAX_PAGE_SIZE", "500"))
+
+# Listings keep returning a bare JSON array; the cursor for the following
+# page travels in this header and is absent on the last page.
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+class PageParams:
+    """`?cursor=&limit=` query parameters shared by every paginated listing."""
+
+    def __init__(
+        self,
+        cursor: Optional[str] = Query(None, description=f"Opaque value from the {NEXT_CURSOR_HEADER} header"),
+        limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    ):
+        self.cursor = cursor
+        self.limit = limit
+
+
+class OffsetPageParams(PageParams):
+    """
+    PageParams that also still honour the `?skip=` offset the admin listings
+    took before cursors, for clients that haven't moved over. Without a
+    cursor, `skip` rows are skipped first; the X-Next-Cursor header works
+    from there as usual.
+    """
+
+    def __init__(
+        self,
+        cursor: Optional[str] = Query(None, description=f"Opaque value from the {NEXT_CURSOR_HEADER} header"),
+        limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+        skip: int = Query(0, ge=0, deprecated=True, description=f"Use the {NEXT_CURSOR_HEADER} cursor instead"),
+    ):
+        super().__init__(cursor, limit)
+        self.skip = skip
+
+
+def encode_cursor(*values) -> str:
+    payload = [{"dt": v.isoformat()} if isinstance(v, datetime) else v for v in values]
+    return base64.urlsafe_b64encode(json.dumps(payload, separators=(",", ":")).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> list:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return [datetime.fromisoformat(v["dt"]) if isinstance(v, dict) else v for v in payload]
+    except (ValueError, TypeError, KeyError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def newest_first(query, model, page: PageParams):
+    """
+    Keyset page of `query` ordered by (created_at, id) descending. Fetches one
+    extra row so `finish` can tell whether another page exists; pair with a
+    (..., created_at, id) index so every page is a single index range scan.
+    """
+    keys = (model.created_at, model.id)
+    if page.cursor:
+        values = decode_cursor(page.cursor)
+        if len(values) != 2 or not isinstance(values[0], datetime) or not isinstance(values[1], int):
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        # Bind with the columns' own types so the values compare like stored ones.
+        bound = (literal(value, key.type) for key, value in zip(keys, values))
+        query = query.where(tuple_(*keys) < tuple_(*bound))
+    query = query.order_by(*(key.desc() for key in keys)).limit(page.limit + 1)
+    if not page.cursor and getattr(page, "skip", 0):
+        query = query.offset(page.skip)
+    return query
+
+
+def finish(rows: Sequence, page: PageParams, response: Response, key=lambda row: (row.created_at, row.id)) -> list:
+    """Trim the look-ahead row and, if there was one, emit the next cursor."""
+    rows = list(rows)
+    if len(rows) > page.limit:
+        rows = rows[: page.limit]
+        response.headers[NEXT_CURSOR_HEADER] = encode_cursor(*key(rows[-1]))
+    return rows
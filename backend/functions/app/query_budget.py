@@ -0,0 +1,134 @@
+import os
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, List, Optional
+
+from fastapi import Depends
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from .db_metrics import route_label
+
+# Queries a request may run when its route declares no budget of its own.
+DB_QUERY_BUDGET_DEFAULT = int(os.getenv("DB_QUERY_BUDGET_DEFAULT", "25"))
+# Test mode: a request over its budget raises QueryBudgetExceeded instead of
+# only being counted. The test suite turns this on in conftest.py.
+DB_QUERY_BUDGET_ENFORCE = os.getenv("DB_QUERY_BUDGET_ENFORCE", "false").lower() in ("1", "true", "yes", "on")
+# Statements kept per request for the failure message.
+_KEPT_STATEMENTS = 50
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+class QueryLog:
+    """Statements run by one request (or one `count_queries` block)."""
+
+    def __init__(self):
+        self.count = 0
+        self.statements: List[str] = []
+        self.budget: Optional[int] = None
+
+    def add(self, statement: str):
+        self.count += 1
+        if len(self.statements) < _KEPT_STATEMENTS:
+            self.statements.append(" ".join(statement.split())[:200])
+
+
+# The log object is shared by reference, so queries run from the threadpool
+# (sync routes and dependencies get a copy of the context) still land in it.
+_active_log: ContextVar[Optional[QueryLog]] = ContextVar("active_query_log", default=None)
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _count_query(conn, cursor, statement, parameters, context, executemany):
+    log = _active_log.get()
+    if log is not None:
+        log.add(statement)
+
+
+@contextmanager
+def count_queries():
+    """Count the statements run inside the block, on any engine."""
+    log = QueryLog()
+    token = _active_log.set(log)
+    try:
+        yield log
+    finally:
+        _active_log.reset(token)
+
+
+def query_budget(limit: int):
+    """Route dependency declaring how many queries one request may run."""
+    def _declare():
+        log = _active_log.get()
+        if log is not None:
+            log.budget = limit
+    return Depends(_declare)
+
+
+class RouteQueryStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._routes: Dict[str, Dict[str, int]] = {}
+
+    def observe(self, route: str, log: QueryLog, budget: int):
+        with self._lock:
+            stats = self._routes.setdefault(route, {"requests": 0, "queries": 0, "max_queries": 0,
+                                                    "over_budget": 0, "budget": budget})
+            stats["requests"] += 1
+            stats["queries"] += log.count
+            stats["max_queries"] = max(stats["max_queries"], log.count)
+            stats["over_budget"] += log.count > budget
+            stats["budget"] = budget
+
+    def reset(self):
+        with self._lock:
+            self._routes.clear()
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            routes = {route: dict(stats) for route, stats in self._routes.items()}
+        for stats in routes.values():
+            stats["avg_queries"] = round(stats["queries"] / stats["requests"], 2)
+        return {"enforced": DB_QUERY_BUDGET_ENFORCE, "default_budget": DB_QUERY_BUDGET_DEFAULT, "routes": routes}
+
+
+route_stats = RouteQueryStats()
+
+
+class QueryBudgetMiddleware:
+    """
+    Counts the SQL statements of every HTTP request and records them per route.
+    In enforce mode a request over budget fails as the response starts, so
+    N+1 regressions break the tests that exercise the route.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        log = QueryLog()
+        token = _active_log.set(log)
+
+        async def checked_send(message):
+            if message["type"] == "http.response.start" and DB_QUERY_BUDGET_ENFORCE:
+                budget = DB_QUERY_BUDGET_DEFAULT if log.budget is None else log.budget
+                if log.count > budget:
+                    raise QueryBudgetExceeded(
+                        f"{route_label(scope)} ran {log.count} queries, budget is {budget}:\n  "
+                        + "\n  ".join(log.statements)
+                    )
+            await send(message)
+
+        try:
+            await self.app(scope, receive, checked_send)
+        finally:
+            _active_log.reset(token)
+            route_stats.observe(route_label(scope), log,
+                                DB_QUERY_BUDGET_DEFAULT if log.budget is None else log.budget)
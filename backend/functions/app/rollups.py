@@ -0,0 +1,146 @@
+import logging
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from sqlalchemy import delete, func, insert, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from . import models
+
+logger = logging.getLogger(__name__)
+
+# Largest number of buckets /wallet/summary returns per period.
+MAX_PERIODS = {"day": 366, "week": 104, "month": 36}
+BACKFILL_BATCH_USERS = 500
+
+
+def add(db: Session, entries: Iterable[Tuple[int, str, int]], day: Optional[date] = None):
+    """
+    Fold (user_id, type, amount_minor) postings into today's rollup rows,
+    inside the caller's transaction. Platform rows (no user) are skipped.
+    """
+    day = day or datetime.utcnow().date()
+    totals: Dict[tuple, list] = defaultdict(lambda: [0, 0])
+    for user_id, type, amount_minor in entries:
+        if user_id is not None:
+            totals[(user_id, type)][0] += amount_minor
+            totals[(user_id, type)][1] += 1
+    if not totals:
+        return
+    dialect = postgresql if db.get_bind().dialect.name == "postgresql" else sqlite
+    rollup = models.EarningsRollup
+    stmt = dialect.insert(rollup).values([
+        {"user_id": user_id, "day": day, "type": type, "amount_minor": amount, "count": count}
+        for (user_id, type), (amount, count) in sorted(totals.items())
+    ])
+    db.execute(stmt.on_conflict_do_update(
+        index_elements=[rollup.user_id, rollup.day, rollup.type],
+        set_={"amount_minor": rollup.amount_minor + stmt.excluded.amount_minor,
+              "count": rollup.count + stmt.excluded.count},
+    ))
+
+
+def period_start(day: date, period: str) -> date:
+    if period == "week":
+        return day - timedelta(days=day.weekday())
+    if period == "month":
+        return day.replace(day=1)
+    return day
+
+
+def _step_back(start: date, period: str) -> date:
+    if period == "week":
+        return start - timedelta(weeks=1)
+    if period == "month":
+        return (start - timedelta(days=1)).replace(day=1)
+    return start - timedelta(days=1)
+
+
+def summarize(db: Session, user_id: int, type: str = "earning", period: str = "day", periods: int = 30,
+              today: Optional[date] = None) -> dict:
+    """
+    Chart buckets (oldest first, zero-filled) and today/week/month totals for
+    one user, read from the daily rollups with a single range scan.
+    """
+    today = today or datetime.utcnow().date()
+    starts = [period_start(today, period)]
+    for _ in range(periods - 1):
+        starts.append(_step_back(starts[-1], period))
+    starts.reverse()
+    since = min(starts[0], period_start(today, "month"), period_start(today, "week"))
+
+    rows = db.execute(
+        select(models.EarningsRollup.day, models.EarningsRollup.amount_minor, models.EarningsRollup.count)
+        .where(models.EarningsRollup.user_id == user_id, models.EarningsRollup.type == type,
+               models.EarningsRollup.day >= since)
+    ).all()
+
+    buckets = {start: [0, 0] for start in starts}
+    totals = {"today_minor": 0, "this_week_minor": 0, "this_month_minor": 0}
+    for day, amount, count in rows:
+        bucket = buckets.get(period_start(day, period))
+        if bucket is not None:
+            bucket[0] += amount
+            bucket[1] += count
+        totals["today_minor"] += amount if day == today else 0
+        totals["this_week_minor"] += amount if day >= period_start(today, "week") else 0
+        totals["this_month_minor"] += amount if day >= period_start(today, "month") else 0
+    return {
+        "series": [{"start": start, "amount_minor": amount, "count": count}
+                   for start, (amount, count) in buckets.items()],
+        "totals": totals,
+    }
+
+
+def _as_date(value) -> date:
+    # SQLite's date() hands back text, PostgreSQL a date.
+    return date.fromisoformat(value) if isinstance(value, str) else value
+
+
+def rebuild_users(db: Session, user_ids: List[int]) -> int:
+    """Recompute the rollups of `user_ids` from their transactions; returns rows written."""
+    txn = models.Transaction
+    day = func.date(txn.created_at)
+    rows = [
+        {"user_id": user_id, "day": _as_date(d), "type": type, "amount_minor": amount, "count": count}
+        for user_id, d, type, amount, count in db.execute(
+            select(txn.user_id, day, txn.type, func.sum(txn.amount_minor), func.count())
+            .where(txn.user_id.in_(user_ids))
+            .group_by(txn.user_id, day, txn.type)
+        )
+    ]
+    db.execute(delete(models.EarningsRollup).where(models.EarningsRollup.user_id.in_(user_ids)))
+    if rows:
+        db.execute(insert(models.EarningsRollup), rows)
+    return len(rows)
+
+
+def backfill(session_factory, batch_users: int = BACKFILL_BATCH_USERS) -> Iterator[Tuple[int, int]]:
+    """
+    Rebuild every user's rollups from transaction history, `batch_users` users
+    per transaction, walking user ids with a keyset so memory stays flat.
+    Yields (users, rollup_rows) per batch. Safe to re-run: each batch replaces
+    its users' rows.
+    """
+    last_id = 0
+    while True:
+        db = session_factory()
+        try:
+            user_ids = db.scalars(
+                select(models.Transaction.user_id)
+                .distinct()
+                .where(models.Transaction.user_id > last_id)
+                .order_by(models.Transaction.user_id)
+                .limit(batch_users)
+            ).all()
+            if not user_ids:
+                return
+            written = rebuild_users(db, user_ids)
+            db.commit()
+        finally:
+            db.close()
+        last_id = user_ids[-1]
+        logger.info("Rebuilt earnings rollups for users up to %s", last_id)
+        yield len(user_ids), written
@@ -1,48 +1,89 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from sqlalchemy import func
-from typing import List
+from datetime import datetime, timedelta
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, status
+from sqlalchemy.orm import Session, joinedload, raiseload
+from typing import List, Optional
 
-from .. import models, schemas, auth
-from ..database import get_db
+from .. import models, schemas, auth, analytics, etag, exports, hashing, dispatch, job_participants, outbox, search, stats
+from .. import database
+from ..database import get_db, get_read_db
+from ..db_metrics import pool_metrics
+from ..pagination import OffsetPageParams, PageParams, decode_cursor, finish, newest_first
+from ..query_budget import query_budget, route_stats
+from .ws import location_throttle, manager as ws_manager
 
 router = APIRouter()
 
 @router.get("/stats", response_model=schemas.AdminStatsResponse)
 def get_admin_dashboard_stats(
-    db: Session = Depends(get_db), 
+    db: Session = Depends(get_read_db), 
     current_admin: models.User = Depends(auth.get_current_admin)
 ):
-    total_users = db.query(models.User).filter(models.User.role == "user").count()
-    total_partners = db.query(models.User).filter(
-        models.User.role.in_(["individual_partner", "agency_partner"])
-    ).count()
-    total_jobs = db.query(models.Job).count()
-    
-    # Calculate revenue (just the completed jobs total price for now, or sum of commissions if transactions exist)
-    total_revenue_query = db.query(func.sum(models.Job.price)).filter(models.Job.status == "completed").scalar()
-    total_revenue = total_revenue_query if total_revenue_query else 0.0
-    
-    pending_partners = db.query(models.PartnerProfile).filter(
-        models.PartnerProfile.approval_status == "pending"
-    ).count()
-    
-    return schemas.AdminStatsResponse(
-        total_users=total_users,
-        total_partners=total_partners,
-        total_jobs=total_jobs,
-        total_revenue=total_revenue,
-        pending_partners=pending_partners
-    )
+    # Maintained counters (see app.stats), not COUNT/SUM over the tables;
+    # revenue is the total price of completed jobs.
+    return schemas.AdminStatsResponse(**stats.dashboard(db))
+
+@router.get("/metrics")
+def get_runtime_metrics(current_admin: models.User = Depends(auth.get_current_admin)):
+    return {
+        "principal_cache": auth.principal_cache.stats(),
+        "password_hashing": hashing.hasher.stats(),
+        "db_pool": pool_metrics.snapshot(database.get_engine().pool),
+        "read_replicas": database.get_replica_router().stats(),
+        "sqlite_writer_queue": database.sqlite_writer_queue.stats() if database.sqlite_writer_queue else None,
+        "dispatch": dispatch.dispatcher.stats(),
+        "outbox": outbox.relay.stats(),
+        "websockets": ws_manager.stats(),
+        "job_participants": job_participants.cache.stats(),
+        "location_throttle": location_throttle.stats(),
+        "conditional_get": etag.metrics.snapshot(),
+        "admin_stats": stats.metrics(),
+        "analytics_catch_up": dict(analytics.catch_up_runs),
+        "queries_per_route": route_stats.snapshot(),
+    }
 
-@router.get("/users", response_model=List[schemas.UserResponse])
+@router.get("/users", response_model=List[schemas.UserResponse], dependencies=[query_budget(3)])
 def get_all_users(
-    skip: int = 0, limit: int = 100, 
-    db: Session = Depends(get_db), 
+    response: Response,
+    page: OffsetPageParams = Depends(),
+    db: Session = Depends(get_read_db), 
     current_admin: models.User = Depends(auth.get_current_admin)
 ):
-    users = db.query(models.User).offset(skip).limit(limit).all()
-    return users
+    users = newest_first(db.query(models.User).options(raiseload("*")), models.User, page).all()
+    return finish(users, page, response)
+
+@router.get("/users/search", response_model=List[schemas.AdminUserSearchResult], dependencies=[query_budget(3)])
+def search_users(
+    response: Response,
+    q: str = Query(..., min_length=1, max_length=100),
+    role: Optional[str] = None,
+    page: PageParams = Depends(),
+    db: Session = Depends(get_read_db),
+    current_admin: models.User = Depends(auth.get_current_admin)
+):
+    # Name, email, phone, business name and city through the user_search
+    # index (see app.search); every word of `q` matches as a prefix.
+    after = None
+    if page.cursor:
+        after = decode_cursor(page.cursor)
+        if len(after) != 4 or not all(isinstance(v, int) for v in (after[0], after[1], after[3])) \
+                or not isinstance(after[2], (int, float)):
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+    hits = finish(search.search(db, q, page.limit + 1, after, role), page, response, key=tuple)
+    users = db.query(models.User).options(
+        joinedload(models.User.partner_profile).raiseload("*"), raiseload("*")
+    ).filter(models.User.id.in_([hit.user_id for hit in hits])).all()
+    by_id = {user.id: user for user in users}
+    results = []
+    for hit in hits:
+        user = by_id.get(hit.user_id)
+        if user is None:
+            continue
+        result = schemas.AdminUserSearchResult.model_validate(user)
+        if user.partner_profile:
+            result.business_name = user.partner_profile.business_name
+            result.city = user.partner_profile.city
+        results.append(result)
+    return results
 
 @router.put("/users/{user_id}/status")
 def toggle_user_status(
@@ -61,16 +102,40 @@ def toggle_user_status(
 
     user.is_active = is_active
     db.commit()
+    auth.invalidate_principal(user)
     return {"message": f"User status updated. Active: {is_active}"}
 
-@router.get("/jobs", response_model=List[schemas.JobResponse])
+@router.get("/jobs", response_model=List[schemas.JobResponse], dependencies=[query_budget(3)])
 def get_all_jobs(
-    skip: int = 0, limit: int = 100,
-    db: Session = Depends(get_db),
+    response: Response,
+    page: OffsetPageParams = Depends(),
+    db: Session = Depends(get_read_db),
+    current_admin: models.User = Depends(auth.get_current_admin)
+):
+    jobs = newest_first(db.query(models.Job).options(raiseload("*")), models.Job, page).all()
+    return finish(jobs, page, response)
+
+# Full dumps for finance, streamed as CSV or NDJSON; start/end filter on created_at.
+
+@router.get("/export/jobs")
+def export_jobs(
+    format: str = Query("csv", pattern="^(csv|ndjson)$"),
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    status: Optional[str] = None,
+    current_admin: models.User = Depends(auth.get_current_admin)
+):
+    return exports.jobs_export(format, start, end, status)
+
+@router.get("/export/transactions")
+def export_transactions(
+    format: str = Query("csv", pattern="^(csv|ndjson)$"),
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    type: Optional[str] = None,
     current_admin: models.User = Depends(auth.get_current_admin)
 ):
-    jobs = db.query(models.Job).order_by(models.Job.created_at.desc()).offset(skip).limit(limit).all()
-    return jobs
+    return exports.transactions_export(format, start, end, type=type)
 
 @router.put("/partner-approvals/{profile_id}")
 def approve_or_reject_partner(
@@ -83,6 +148,8 @@ def approve_or_reject_partner(
     if not profile:
         raise HTTPException(status_code=404, detail="Partner profile not found")
         
+    if profile.approval_status == "pending":
+        stats.increment(db, pending_partners=-1)
     if approve:
         profile.approval_status = "approved"
     else:
@@ -91,13 +158,56 @@ def approve_or_reject_partner(
     db.commit()
     return {"message": f"Partner profile has been {profile.approval_status}"}
 
-@router.get("/partner-approvals", response_model=List[schemas.AdminPartnerProfileResponse])
+@router.get("/partner-approvals", response_model=List[schemas.AdminPartnerProfileResponse],
+            dependencies=[query_budget(3)])
 def get_pending_partners(
-    skip: int = 0, limit: int = 100,
-    db: Session = Depends(get_db),
+    response: Response,
+    page: OffsetPageParams = Depends(),
+    db: Session = Depends(get_read_db),
     current_admin: models.User = Depends(auth.get_current_admin)
 ):
-    profiles = db.query(models.PartnerProfile).filter(
+    # The nested `user` comes in with the same SELECT instead of one query per profile.
+    query = db.query(models.PartnerProfile).options(
+        joinedload(models.PartnerProfile.user).raiseload("*"), raiseload("*")
+    ).filter(
         models.PartnerProfile.approval_status == "pending"
-    ).offset(skip).limit(limit).all()
-    return profiles
\ No newline at end of file
+    )
+    return finish(newest_first(query, models.PartnerProfile, page).all(), page, response)
+# Charts for the admin console, read from the hourly/daily job rollups
+# (app.analytics). Times are UTC; start/end default to the last 30 days (or
+# 48 hours for hourly points).
+
+def _analytics_range(period: str, start: Optional[datetime], end: Optional[datetime]):
+    end = end or datetime.utcnow()
+    start = start or end - (timedelta(hours=47) if period == "hour" else timedelta(days=29))
+    try:
+        analytics.buckets(period, start, end)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return start, end
+
+@router.get("/analytics/jobs", response_model=schemas.AnalyticsSeriesResponse, dependencies=[query_budget(3)])
+def get_job_analytics(
+    period: str = Query("day", pattern="^(hour|day)$"),
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    service_type: Optional[str] = None,
+    city: Optional[str] = None,
+    db: Session = Depends(get_read_db),
+    current_admin: models.User = Depends(auth.get_current_admin)
+):
+    start, end = _analytics_range(period, start, end)
+    return {"period": period, "service_type": service_type, "city": city,
+            "points": analytics.series(db, period, start, end, service_type, city)}
+
+@router.get("/analytics/breakdown", response_model=schemas.AnalyticsBreakdownResponse,
+            dependencies=[query_budget(3)])
+def get_job_analytics_breakdown(
+    by: str = Query("service_type", pattern="^(service_type|city)$"),
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    db: Session = Depends(get_read_db),
+    current_admin: models.User = Depends(auth.get_current_admin)
+):
+    start, end = _analytics_range("day", start, end)
+    return {"by": by, "start": start, "end": end, "rows": analytics.breakdown(db, by, "day", start, end)}
@@ -1,68 +1,350 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from .. import models, schemas, auth
-from ..database import get_db
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Query, Request, Response, status
+from pydantic import ValidationError
+from sqlalchemy import case, func, insert, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, raiseload
+from typing import Optional
+from .. import models, schemas, auth, analytics, etag, geo, job_participants, ledger, outbox, stats
+from ..dispatch import DISPATCH_ENABLED, dispatcher
+from ..money import from_minor, to_minor
+from ..pagination import PageParams, decode_cursor, finish, newest_first
+from ..query_budget import query_budget
+from .ws import manager
+from ..database import get_db, get_read_db, get_async_db, DB_ASYNC_ROUTES
+import math
+import os
 import random
 from datetime import datetime
 
 router = APIRouter()
 
+DEFAULT_SERVICE_RADIUS_KM = 15.0
+# Largest batch accepted by POST /bulk.
+BULK_MAX_JOBS = int(os.getenv("BULK_MAX_JOBS", "2000"))
+# Candidates read per nearby page, as a multiple of the page size. The
+# database orders them by a flat-earth distance; they are re-ranked by exact
+# distance here, and the margin absorbs where the two orders disagree.
+NEARBY_CANDIDATE_FACTOR = int(os.getenv("NEARBY_CANDIDATE_FACTOR", "4"))
+# The flat-earth distance may read this much shorter than the exact one, so
+# the next page's lower bound is scaled down by it.
+_FLAT_DISTANCE_SLACK = 0.8
+
 def generate_otp():
     return str(random.randint(1000, 9999))
 
-@router.post("/", response_model=schemas.JobResponse)
-def create_job(job: schemas.JobCreate, db: Session = Depends(get_db), current_user: models.User = Depends(auth.get_current_user)):
-    otp = generate_otp()
-    new_job = models.Job(
-        customer_id=current_user.id,
+# The hot routes below have a sync and a native async implementation; which one
+# gets registered is chosen by DB_ASYNC_ROUTES.
+
+def _job_values(job: schemas.JobCreate, customer_id: int) -> dict:
+    return dict(
+        customer_id=customer_id,
         status="searching",
         service_type=job.service_type,
-        otp=otp,
+        otp=generate_otp(),
         price=job.price,
         workers_needed=job.workers_needed,
         latitude=job.latitude,
         longitude=job.longitude,
         address=job.address,
+        city=job.city,
         description=job.description
     )
+
+def _new_job(job: schemas.JobCreate, customer_id: int) -> models.Job:
+    return models.Job(**_job_values(job, customer_id))
+
+def _schedule_dispatch(background_tasks: BackgroundTasks, job: models.Job):
+    """Offer a new job to nearby online partners once the response is sent."""
+    if DISPATCH_ENABLED:
+        offer = schemas.JobResponse.model_validate(job).model_dump(mode="json", exclude={"otp"})
+        background_tasks.add_task(dispatcher.dispatch, offer, manager)
+
+def create_job(job: schemas.JobCreate, background_tasks: BackgroundTasks, db: Session = Depends(get_db), current_user: schemas.Principal = Depends(auth.get_current_principal)):
+    new_job = _new_job(job, current_user.id)
     db.add(new_job)
+    etag.bump(db, [etag.customer_jobs(current_user.id), etag.open_jobs_shard()])
+    stats.increment(db, total_jobs=1)
+    analytics.job_created(db, [new_job])
     db.commit()
     db.refresh(new_job)
+    index_open_job(new_job)
+    _schedule_dispatch(background_tasks, new_job)
+    return new_job
+
+async def create_job_async(job: schemas.JobCreate, background_tasks: BackgroundTasks, db: AsyncSession = Depends(get_async_db), current_user: schemas.Principal = Depends(auth.get_current_principal)):
+    new_job = _new_job(job, current_user.id)
+    db.add(new_job)
+    await db.run_sync(etag.bump, [etag.customer_jobs(current_user.id), etag.open_jobs_shard()])
+    await db.run_sync(stats.increment, total_jobs=1)
+    await db.run_sync(analytics.job_created, [new_job])
+    await db.commit()
+    await db.refresh(new_job)
+    index_open_job(new_job)
+    _schedule_dispatch(background_tasks, new_job)
     return new_job
 
-@router.get("/customer", response_model=list[schemas.JobResponse])
-def get_customer_jobs(db: Session = Depends(get_db), current_user: models.User = Depends(auth.get_current_user)):
-    return db.query(models.Job).filter(models.Job.customer_id == current_user.id).all()
+router.post("/", response_model=schemas.JobResponse)(create_job_async if DB_ASYNC_ROUTES else create_job)
+
+@router.post("/bulk", response_model=schemas.BulkJobResult)
+def create_jobs_bulk(payload: schemas.BulkJobCreate, background_tasks: BackgroundTasks, db: Session = Depends(get_db), current_user: schemas.Principal = Depends(auth.get_current_principal)):
+    """
+    Create many jobs in one request and one INSERT. Items that fail validation
+    are reported by index in `errors`; the rest are created.
+    """
+    if len(payload.jobs) > BULK_MAX_JOBS:
+        raise HTTPException(status_code=413, detail=f"At most {BULK_MAX_JOBS} jobs per request")
+
+    valid, errors = [], []
+    for index, item in enumerate(payload.jobs):
+        try:
+            valid.append((index, schemas.JobCreate.model_validate(item)))
+        except ValidationError as e:
+            errors.append({"index": index, "errors": e.errors(include_url=False, include_context=False, include_input=False)})
+
+    created, jobs = [], []
+    if valid:
+        # Bulk inserts skip mapper events, so geo_cell is filled in here.
+        rows = [
+            dict(_job_values(job, current_user.id), geo_cell=geo.cell_for(job.latitude, job.longitude))
+            for _, job in valid
+        ]
+        # Unordered RETURNING keeps this a single multi-row INSERT (asking for
+        # parameter order makes SQLite fall back to one INSERT per row). Ids
+        # are assigned in VALUES order, so sorting by id lines rows up with items.
+        jobs = sorted(db.scalars(insert(models.Job).returning(models.Job), rows).all(), key=lambda job: job.id)
+        for job in jobs:
+            db.expunge(job)
+        etag.bump(db, [etag.customer_jobs(current_user.id), etag.open_jobs_shard()])
+        stats.increment(db, total_jobs=len(jobs))
+        analytics.job_created(db, jobs)
+        db.commit()
+        created = [{"index": index, "id": job.id, "otp": job.otp} for (index, _), job in zip(valid, jobs)]
+
+    for job in jobs:
+        index_open_job(job)
+        _schedule_dispatch(background_tasks, job)
+    return {"created": created, "errors": errors}
+
+# List routes load no relationships: raiseload turns an accidental lazy load
+# into an error instead of one extra query per row.
+
+@router.get("/customer", response_model=list[schemas.JobResponse], dependencies=[query_budget(4)])
+def get_customer_jobs(request: Request, response: Response, page: PageParams = Depends(), db: Session = Depends(get_read_db), current_user: schemas.Principal = Depends(auth.get_current_principal)):
+    cached = etag.not_modified(db, request, response, current_user.id, [etag.customer_jobs(current_user.id)])
+    if cached:
+        return cached
+    query = db.query(models.Job).options(raiseload("*")).filter(models.Job.customer_id == current_user.id)
+    return finish(newest_first(query, models.Job, page).all(), page, response)
 
-@router.get("/worker", response_model=list[schemas.JobResponse])
-def get_worker_jobs(db: Session = Depends(get_db), current_user: models.User = Depends(auth.get_current_user)):
-    return db.query(models.Job).filter(models.Job.worker_id == current_user.id).all()
+@router.get("/worker", response_model=list[schemas.JobResponse], dependencies=[query_budget(4)])
+def get_worker_jobs(request: Request, response: Response, page: PageParams = Depends(), db: Session = Depends(get_read_db), current_user: schemas.Principal = Depends(auth.get_current_principal)):
+    cached = etag.not_modified(db, request, response, current_user.id, [etag.worker_jobs(current_user.id)])
+    if cached:
+        return cached
+    query = db.query(models.Job).options(raiseload("*")).filter(models.Job.worker_id == current_user.id)
+    return finish(newest_first(query, models.Job, page).all(), page, response)
 
-@router.get("/available", response_model=list[schemas.JobResponse])
-def get_available_jobs(db: Session = Depends(get_db), current_user: models.User = Depends(auth.get_current_user)):
+def index_open_job(job: models.Job):
+    """Add a searching job to the in-memory nearby index (memory backend only)."""
+    if geo.NEARBY_JOBS_BACKEND != "memory" or job.latitude is None or job.longitude is None:
+        return
+    geo.open_jobs.upsert(job.id, job.latitude, job.longitude, schemas.JobResponse.model_validate(job).model_dump())
+
+def _partner_preferences(profile: Optional[models.PartnerProfile]):
+    """(service radius in km, lower-cased selected services) for a partner."""
+    radius_km = DEFAULT_SERVICE_RADIUS_KM
+    services = set()
+    if profile is not None:
+        radius_km = profile.service_radius or DEFAULT_SERVICE_RADIUS_KM
+        services = {s.lower() for s in (profile.selected_services or []) if isinstance(s, str)}
+    return min(radius_km, geo.MAX_SEARCH_RADIUS_KM), services
+
+def _preferences_variant(radius_km: float, services: set) -> str:
+    # Part of the /available ETag, so a profile edit isn't answered with a
+    # 304 for the listing the old radius or services produced.
+    return f"{radius_km}:{','.join(sorted(services))}"
+
+def _flat_distance_sq(latitude: float, longitude: float):
+    """Squared equirectangular distance to a point, in degrees of latitude, as SQL."""
+    dlon = models.Job.longitude - longitude
+    dlon = case((dlon > 180, dlon - 360), (dlon < -180, dlon + 360), else_=dlon)
+    dx = dlon * math.cos(math.radians(latitude))
+    dy = models.Job.latitude - latitude
+    return dx * dx + dy * dy
+
+def _available_query(latitude, longitude, radius_km, services, page: PageParams):
+    query = select(models.Job).options(raiseload("*")).where(models.Job.status == "searching")
+    if services:
+        query = query.where(func.lower(models.Job.service_type).in_(services))
+    if latitude is None or longitude is None:
+        return newest_first(query, models.Job, page)
+    # Nearest candidates first, bounded, instead of every open job in the cells.
+    distance_sq = _flat_distance_sq(latitude, longitude)
+    query = query.where(models.Job.geo_cell.in_(geo.covering_cell_ids(latitude, longitude, radius_km)))
+    after = _distance_cursor(page)
+    if after is not None:
+        floor = after[0] * _FLAT_DISTANCE_SLACK / geo.KM_PER_DEGREE_LAT
+        query = query.where(distance_sq >= floor * floor)
+    return query.order_by(distance_sq, models.Job.id).limit((page.limit + 1) * NEARBY_CANDIDATE_FACTOR)
+
+def _distance_cursor(page: PageParams):
+    """(distance_km, id) of the last job on the previous nearby page."""
+    if not page.cursor:
+        return None
+    values = decode_cursor(page.cursor)
+    if len(values) != 2 or not isinstance(values[0], (int, float)) or not isinstance(values[1], int):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return tuple(values)
+
+def _nearby_page(ranked, page: PageParams, response: Response):
+    """Keyset page over (distance, id, job) candidates, nearest first."""
+    after = _distance_cursor(page)
+    ranked.sort(key=lambda hit: (hit[0], hit[1]))
+    if after is not None:
+        ranked = [hit for hit in ranked if (hit[0], hit[1]) > after]
+    return finish(ranked[: page.limit + 1], page, response, key=lambda hit: (hit[0], hit[1]))
+
+def _nearest(jobs, latitude, longitude, radius_km, page: PageParams, response: Response):
+    """Exact-distance filter and sort for the candidates from the cell query."""
+    if latitude is None or longitude is None:
+        return finish(jobs, page, response)
+    ranked = []
+    for job in jobs:
+        distance = geo.haversine_km(latitude, longitude, job.latitude, job.longitude)
+        if distance <= radius_km:
+            ranked.append((distance, job.id, job))
+    return [
+        schemas.AvailableJobResponse.model_validate(job).model_copy(update={"distance_km": round(distance, 3)})
+        for distance, _, job in _nearby_page(ranked, page, response)
+    ]
+
+def _nearest_from_memory(latitude, longitude, radius_km, services, page: PageParams, response: Response):
+    def wanted(job_id, job):
+        return not services or (job["service_type"] or "").lower() in services
+    hits = geo.open_jobs.nearby(latitude, longitude, radius_km, predicate=wanted)
+    return [dict(job, distance_km=round(distance, 3)) for distance, _, job in _nearby_page(hits, page, response)]
+
+def _uses_memory_index(latitude, longitude) -> bool:
+    return geo.NEARBY_JOBS_BACKEND == "memory" and latitude is not None and longitude is not None
+
+def get_available_jobs(
+    request: Request,
+    response: Response,
+    latitude: Optional[float] = Query(None, ge=-90, le=90),
+    longitude: Optional[float] = Query(None, ge=-180, le=180),
+    page: PageParams = Depends(),
+    db: Session = Depends(get_read_db),
+    current_user: schemas.Principal = Depends(auth.get_current_principal),
+):
     if current_user.role == "user":
         raise HTTPException(status_code=403, detail="Not authorized")
-    return db.query(models.Job).filter(models.Job.status == "searching").all()
+    profile = db.query(models.PartnerProfile).filter(models.PartnerProfile.user_id == current_user.id).first()
+    radius_km, services = _partner_preferences(profile)
+    cached = etag.not_modified(db, request, response, current_user.id, etag.OPEN_JOBS,
+                               _preferences_variant(radius_km, services))
+    if cached:
+        return cached
+    if _uses_memory_index(latitude, longitude):
+        return _nearest_from_memory(latitude, longitude, radius_km, services, page, response)
+    jobs = db.scalars(_available_query(latitude, longitude, radius_km, services, page)).all()
+    return _nearest(jobs, latitude, longitude, radius_km, page, response)
 
-@router.post("/{job_id}/accept", response_model=schemas.JobResponse)
-def accept_job(job_id: int, db: Session = Depends(get_db), current_user: models.User = Depends(auth.get_current_user)):
-    job = db.query(models.Job).filter(models.Job.id == job_id).first()
-    if not job:
-        raise HTTPException(status_code=404, detail="Job not found")
-    if job.status != "searching":
-        raise HTTPException(status_code=400, detail="Job is no longer available")
+async def get_available_jobs_async(
+    request: Request,
+    response: Response,
+    latitude: Optional[float] = Query(None, ge=-90, le=90),
+    longitude: Optional[float] = Query(None, ge=-180, le=180),
+    page: PageParams = Depends(),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: schemas.Principal = Depends(auth.get_current_principal),
+):
+    if current_user.role == "user":
+        raise HTTPException(status_code=403, detail="Not authorized")
+    profile = await db.scalar(select(models.PartnerProfile).where(models.PartnerProfile.user_id == current_user.id))
+    radius_km, services = _partner_preferences(profile)
+    cached = await etag.not_modified_async(db, request, response, current_user.id, etag.OPEN_JOBS,
+                                           _preferences_variant(radius_km, services))
+    if cached:
+        return cached
+    if _uses_memory_index(latitude, longitude):
+        return _nearest_from_memory(latitude, longitude, radius_km, services, page, response)
+    result = await db.scalars(_available_query(latitude, longitude, radius_km, services, page))
+    return _nearest(result.all(), latitude, longitude, radius_km, page, response)
+
+# Without coordinates the newest open jobs are returned (no distance); with
+# them, only jobs inside the partner's service radius, nearest first. Both
+# are paged with the X-Next-Cursor header.
+router.get("/available", response_model=list[schemas.AvailableJobResponse], dependencies=[query_budget(5)])(
+    get_available_jobs_async if DB_ASYNC_ROUTES else get_available_jobs
+)
+
+def _accept_statement(job_id: int, worker_id: int):
+    """
+    Claim a job in one round trip: the status predicate makes the UPDATE a
+    compare-and-set, so concurrent accepts serialize on the row and only the
+    first one matches. RETURNING hands back the winner's row.
+    """
+    return (
+        update(models.Job)
+        .where(models.Job.id == job_id, models.Job.status == "searching")
+        .values(worker_id=worker_id, status="accepted", accepted_at=datetime.utcnow())
+        .returning(models.Job)
+        .execution_options(synchronize_session=False)
+    )
+
+def _ensure_can_accept(current_user: schemas.Principal):
     if current_user.role == "user":
         raise HTTPException(status_code=403, detail="Only workers can accept jobs")
-        
-    job.worker_id = current_user.id
-    job.status = "accepted"
-    job.accepted_at = datetime.utcnow()
+
+def _not_accepted(exists: bool):
+    if not exists:
+        return HTTPException(status_code=404, detail="Job not found")
+    return HTTPException(status_code=409, detail="Job is no longer available")
+
+def _status_event(job: models.Job, type: str = "job_status_update") -> dict:
+    return outbox.event(job.customer_id, type, job.id, status=job.status, workerId=job.worker_id,
+                        serviceType=job.service_type)
+
+def accept_job(job_id: int, background_tasks: BackgroundTasks, db: Session = Depends(get_db), current_user: schemas.Principal = Depends(auth.get_current_principal)):
+    _ensure_can_accept(current_user)
+    job = db.scalars(_accept_statement(job_id, current_user.id)).first()
+    if job is None:
+        db.rollback()
+        raise _not_accepted(db.scalar(select(models.Job.id).where(models.Job.id == job_id)) is not None)
+    outbox.record(db, [_status_event(job, "job_accepted")])
+    etag.bump(db, etag.job_keys(job) + [etag.open_jobs_shard()])
+    analytics.job_accepted(db, job)
+    # Detach first so commit doesn't expire the returned row and force a reload.
+    db.expunge(job)
     db.commit()
-    db.refresh(job)
+    outbox.relay.wake()
+    geo.open_jobs.remove(job_id)
+    job_participants.remember(job)
+    background_tasks.add_task(dispatcher.close, job_id, manager, current_user.id)
+    return job
+
+async def accept_job_async(job_id: int, background_tasks: BackgroundTasks, db: AsyncSession = Depends(get_async_db), current_user: schemas.Principal = Depends(auth.get_current_principal)):
+    _ensure_can_accept(current_user)
+    job = (await db.scalars(_accept_statement(job_id, current_user.id))).first()
+    if job is None:
+        await db.rollback()
+        raise _not_accepted(await db.scalar(select(models.Job.id).where(models.Job.id == job_id)) is not None)
+    await db.run_sync(outbox.record, [_status_event(job, "job_accepted")])
+    await db.run_sync(etag.bump, etag.job_keys(job) + [etag.open_jobs_shard()])
+    await db.run_sync(analytics.job_accepted, job)
+    await db.commit()
+    outbox.relay.wake()
+    geo.open_jobs.remove(job_id)
+    job_participants.remember(job)
+    background_tasks.add_task(dispatcher.close, job_id, manager, current_user.id)
     return job
 
+router.post("/{job_id}/accept", response_model=schemas.JobResponse)(
+    accept_job_async if DB_ASYNC_ROUTES else accept_job
+)
+
 @router.put("/{job_id}/status", response_model=schemas.JobResponse)
-def update_job_status(job_id: int, new_status: str, db: Session = Depends(get_db), current_user: models.User = Depends(auth.get_current_user)):
+def update_job_status(job_id: int, new_status: str, db: Session = Depends(get_db), current_user: schemas.Principal = Depends(auth.get_current_principal)):
     job = db.query(models.Job).filter(models.Job.id == job_id).first()
     if not job:
         raise HTTPException(status_code=404, detail="Job not found")
@@ -70,7 +352,6 @@ def update_job_status(job_id: int, new_status: str, db: Session = Depends(get_db
     valid_transitions = {
         'accepted': ['arrived'],
         'arrived': ['started'],
-        'started': ['completed'],
     }
     
     if job.worker_id != current_user.id:
@@ -80,35 +361,72 @@ def update_job_status(job_id: int, new_status: str, db: Session = Depends(get_db
         raise HTTPException(status_code=400, detail=f"Cannot transition from {job.status} to {new_status}")
     
     job.status = new_status
+    outbox.record(db, [_status_event(job)])
+    etag.bump(db, etag.job_keys(job))
     db.commit()
+    outbox.relay.wake()
     db.refresh(job)
+    job_participants.remember(job)
     return job
 
+# Statuses from which a correct OTP completes the job.
+COMPLETABLE_STATUSES = ("accepted", "arrived", "started")
+
 @router.post("/{job_id}/verify-otp", response_model=schemas.JobResponse)
-def verify_otp(job_id: int, otp: str, db: Session = Depends(get_db), current_user: models.User = Depends(auth.get_current_user)):
-    job = db.query(models.Job).filter(models.Job.id == job_id).first()
-    if not job:
-        raise HTTPException(status_code=404, detail="Job not found")
-        
-    if job.otp != otp:
-        raise HTTPException(status_code=400, detail="Invalid OTP")
-        
-    job.status = "completed"
-    job.completed_at = datetime.utcnow()
-    
-    # Platform / worker commission logic here
-    worker_share = float(job.price) * 0.85
-    platform_commission = float(job.price) * 0.15
-    
-    worker_wallet = db.query(models.Wallet).filter(models.Wallet.user_id == job.worker_id).first()
-    if worker_wallet:
-        worker_wallet.balance += worker_share
-        worker_wallet.total_earnings += worker_share
-        
-    # Transactions
-    db.add(models.Transaction(user_id=job.worker_id, type="earning", amount=worker_share, job_id=job.id, description="Job earnings"))
-    db.add(models.Transaction(user_id=None, type="commission", amount=platform_commission, job_id=job.id, description="Platform commission"))
-    
+def verify_otp(job_id: int, otp: str, background_tasks: BackgroundTasks, db: Session = Depends(get_db), current_user: schemas.Principal = Depends(auth.get_current_principal)):
+    # Completing the job and posting its ledger entries share one transaction,
+    # and only the request whose UPDATE flips the status gets to post. Status
+    # updates can't complete a job, so this is the only way to "completed".
+    job = db.scalars(
+        update(models.Job)
+        .where(
+            models.Job.id == job_id,
+            models.Job.otp == otp,
+            models.Job.worker_id.isnot(None),
+            models.Job.status.in_(COMPLETABLE_STATUSES),
+        )
+        .values(status="completed", completed_at=datetime.utcnow())
+        .returning(models.Job)
+        .execution_options(synchronize_session=False)
+    ).first()
+    if job is None:
+        db.rollback()
+        job = db.query(models.Job).filter(models.Job.id == job_id).first()
+        if not job:
+            raise HTTPException(status_code=404, detail="Job not found")
+        if job.otp != otp:
+            raise HTTPException(status_code=400, detail="Invalid OTP")
+        if job.status != "completed":
+            raise HTTPException(status_code=409, detail=f"Cannot complete a job that is {job.status}")
+        # Lock the job row before looking at its ledger, so concurrent retries
+        # queue here instead of both posting.
+        db.execute(
+            update(models.Job).where(models.Job.id == job.id)
+            .values(completed_at=models.Job.completed_at)
+            .execution_options(synchronize_session=False)
+        )
+        if ledger.is_posted(db, job.id):
+            db.rollback()
+            return job  # Repeated verification: already posted, nothing to do.
+        # Completed through a status update before those were refused: the
+        # job was counted then, but its earnings were never posted.
+        completed_now = False
+    else:
+        completed_now = True
+
+    worker_share = ledger.post_job_completion(db, job.id, job.worker_id, job.price)
+    events = [outbox.event(job.worker_id, "payment_received", job.id, amount=from_minor(worker_share),
+                           amountMinor=worker_share)]
+    if completed_now:
+        events.insert(0, _status_event(job, "job_completed"))
+        etag.bump(db, etag.job_keys(job))
+        stats.increment(db, total_revenue_minor=to_minor(job.price or 0))
+        analytics.job_completed(db, job)
+    outbox.record(db, events)
+    db.expunge(job)
     db.commit()
-    db.refresh(job)
+    outbox.relay.wake()
+    job_participants.remember(job)
+    # Normally already closed on accept; never leave a finished job in dispatch.
+    background_tasks.add_task(dispatcher.close, job.id, manager, job.worker_id)
     return job
@@ -1,18 +1,27 @@
 from fastapi import APIRouter, Depends, HTTPException, status
 from sqlalchemy.orm import Session
-from .. import models, schemas, auth
+from starlette.concurrency import run_in_threadpool
+from .. import models, schemas, auth, hashing, dispatch, stats
 from ..database import get_db
 from datetime import timedelta
 
 router = APIRouter()
 
-@router.post("/signup", response_model=schemas.UserResponse)
-def signup(user: schemas.UserCreate, db: Session = Depends(get_db)):
-    db_user = db.query(models.User).filter(models.User.email == user.email).first()
-    if db_user:
-        raise HTTPException(status_code=400, detail="Email already registered")
-        
-    hashed_password = auth.get_password_hash(user.password)
+def _hashing_busy():
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail="Authentication is busy, please retry shortly",
+        headers={"Retry-After": "1"},
+    )
+
+def _find_user_by_email(db: Session, email: str):
+    user = db.query(models.User).filter(models.User.email == email).first()
+    # Hand the connection back to the pool while bcrypt runs; loaded
+    # attributes stay readable on the detached instance.
+    db.close()
+    return user
+
+def _create_user(db: Session, user: schemas.UserCreate, hashed_password: str):
     new_user = models.User(
         full_name=user.full_name,
         email=user.email,
@@ -26,17 +35,51 @@ def signup(user: schemas.UserCreate, db: Session = Depends(get_db)):
     # Create empty wallet for user
     new_wallet = models.Wallet(user_id=new_user.id)
     db.add(new_wallet)
+    counter = stats.role_counter(new_user.role)
+    if counter:
+        stats.increment(db, **{counter: 1})
     
     db.commit()
     db.refresh(new_user)
-    
     return new_user
 
+def _store_upgraded_hash(db: Session, user_id: int, hashed_password: str):
+    db.query(models.User).filter(models.User.id == user_id).update(
+        {models.User.hashed_password: hashed_password}, synchronize_session=False
+    )
+    db.commit()
+
+# signup/login are async so bcrypt runs on the hashing engine instead of holding
+# a shared threadpool slot; DB work is still pushed to the threadpool.
+@router.post("/signup", response_model=schemas.UserResponse)
+async def signup(user: schemas.UserCreate, db: Session = Depends(get_db)):
+    db_user = await run_in_threadpool(_find_user_by_email, db, user.email)
+    if db_user:
+        raise HTTPException(status_code=400, detail="Email already registered")
+        
+    try:
+        hashed_password = await hashing.hasher.hash(user.password)
+    except hashing.HashingQueueFull:
+        raise _hashing_busy()
+
+    return await run_in_threadpool(_create_user, db, user, hashed_password)
+
 @router.post("/login", response_model=schemas.Token)
-def login(user_credentials: schemas.LoginRequest, db: Session = Depends(get_db)):
-    user = db.query(models.User).filter(models.User.email == user_credentials.email).first()
+async def login(user_credentials: schemas.LoginRequest, db: Session = Depends(get_db)):
+    user = await run_in_threadpool(_find_user_by_email, db, user_credentials.email)
     
-    if not user or not auth.verify_password(user_credentials.password, user.hashed_password):
+    password_ok = False
+    if user:
+        try:
+            password_ok, upgraded_hash = await hashing.hasher.verify(
+                user_credentials.password, user.hashed_password
+            )
+        except hashing.HashingQueueFull:
+            raise _hashing_busy()
+        if password_ok and upgraded_hash:
+            await run_in_threadpool(_store_upgraded_hash, db, user.id, upgraded_hash)
+
+    if not password_ok:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN, detail="Invalid Credentials"
         )
@@ -51,4 +94,13 @@ def login(user_credentials: schemas.LoginRequest, db: Session = Depends(get_db))
 
 @router.get("/me", response_model=schemas.UserResponse)
 def get_current_user_profile(current_user: models.User = Depends(auth.get_current_user)):
-    return current_user
\ No newline at end of file
+    return current_user
+
+@router.put("/status")
+def update_status(presence: schemas.PresenceUpdate, db: Session = Depends(get_db), current_user: schemas.Principal = Depends(auth.get_current_principal)):
+    """Partner online/offline switch; with coordinates it also (re)positions them for job dispatch."""
+    user = dispatch.update_presence(db, current_user.id, presence.is_online, presence.latitude, presence.longitude)
+    if user is None:
+        raise HTTPException(status_code=403, detail="Only partners can go online")
+    auth.invalidate_principal(user)
+    return {"is_online": user.is_online, "dispatchable": dispatch.dispatcher.is_online(user.id)}
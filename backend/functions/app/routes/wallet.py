@@ -1,18 +1,97 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from .. import models, schemas, auth
-from ..database import get_db
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, status
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, raiseload
+from datetime import datetime
+from typing import Optional
+from .. import models, schemas, auth, etag, exports, rollups
+from ..money import from_minor
+from ..database import get_read_db, get_async_db, DB_ASYNC_ROUTES
+from ..pagination import PageParams, finish, newest_first
+from ..query_budget import query_budget
 
 router = APIRouter()
 
-@router.get("/balance")
-def get_balance(db: Session = Depends(get_db), current_user: models.User = Depends(auth.get_current_user)):
-    wallet = db.query(models.Wallet).filter(models.Wallet.user_id == current_user.id).first()
+def _balance_body(wallet):
     if not wallet:
         return {"balance": 0.0, "total_earnings": 0.0}
     return {"balance": wallet.balance, "total_earnings": wallet.total_earnings}
 
-@router.get("/transactions")
-def get_transactions(db: Session = Depends(get_db), current_user: models.User = Depends(auth.get_current_user)):
-    transactions = db.query(models.Transaction).filter(models.Transaction.user_id == current_user.id).order_by(models.Transaction.created_at.desc()).all()
-    return transactions
+def get_balance(request: Request, response: Response, db: Session = Depends(get_read_db), current_user: schemas.Principal = Depends(auth.get_current_principal)):
+    cached = etag.not_modified(db, request, response, current_user.id, [etag.wallet(current_user.id)])
+    if cached:
+        return cached
+    wallet = db.query(models.Wallet).filter(models.Wallet.user_id == current_user.id).first()
+    return _balance_body(wallet)
+
+async def get_balance_async(request: Request, response: Response, db: AsyncSession = Depends(get_async_db), current_user: schemas.Principal = Depends(auth.get_current_principal)):
+    cached = await etag.not_modified_async(db, request, response, current_user.id, [etag.wallet(current_user.id)])
+    if cached:
+        return cached
+    wallet = await db.scalar(select(models.Wallet).where(models.Wallet.user_id == current_user.id))
+    return _balance_body(wallet)
+
+router.get("/balance")(get_balance_async if DB_ASYNC_ROUTES else get_balance)
+
+def get_transactions(request: Request, response: Response, page: PageParams = Depends(), db: Session = Depends(get_read_db), current_user: schemas.Principal = Depends(auth.get_current_principal)):
+    cached = etag.not_modified(db, request, response, current_user.id, [etag.wallet(current_user.id)])
+    if cached:
+        return cached
+    query = db.query(models.Transaction).options(raiseload("*")).filter(models.Transaction.user_id == current_user.id)
+    return finish(newest_first(query, models.Transaction, page).all(), page, response)
+
+async def get_transactions_async(request: Request, response: Response, page: PageParams = Depends(), db: AsyncSession = Depends(get_async_db), current_user: schemas.Principal = Depends(auth.get_current_principal)):
+    cached = await etag.not_modified_async(db, request, response, current_user.id, [etag.wallet(current_user.id)])
+    if cached:
+        return cached
+    query = select(models.Transaction).options(raiseload("*")).where(models.Transaction.user_id == current_user.id)
+    result = await db.scalars(newest_first(query, models.Transaction, page))
+    return finish(result.all(), page, response)
+
+router.get("/transactions", response_model=list[schemas.TransactionResponse], dependencies=[query_budget(3)])(get_transactions_async if DB_ASYNC_ROUTES else get_transactions)
+
+@router.get("/export")
+def export_transactions(
+    format: str = Query("csv", pattern="^(csv|ndjson)$"),
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    current_user: schemas.Principal = Depends(auth.get_current_principal),
+):
+    """The caller's full transaction history, streamed as CSV or NDJSON."""
+    return exports.transactions_export(format, start, end, user_id=current_user.id)
+
+# Number of latest transactions listed under the summary's chart.
+SUMMARY_RECENT_ITEMS = 10
+
+@router.get("/summary", response_model=schemas.WalletSummaryResponse, dependencies=[query_budget(4)])
+def get_wallet_summary(
+    period: str = Query("day", pattern="^(day|week|month)$"),
+    periods: int = Query(30, ge=1),
+    type: str = Query("earning"),
+    db: Session = Depends(get_read_db),
+    current_user: schemas.Principal = Depends(auth.get_current_principal),
+):
+    """
+    Earnings chart and period totals from the daily rollups (UTC days), plus
+    the few latest transactions; cost grows with the periods asked for, not
+    with the length of the history.
+    """
+    if periods > rollups.MAX_PERIODS[period]:
+        raise HTTPException(status_code=400, detail=f"At most {rollups.MAX_PERIODS[period]} {period} periods")
+    wallet = db.query(models.Wallet).filter(models.Wallet.user_id == current_user.id).first()
+    summary = rollups.summarize(db, current_user.id, type, period, periods)
+    recent = (
+        db.query(models.Transaction)
+        .filter(models.Transaction.user_id == current_user.id)
+        .order_by(models.Transaction.created_at.desc(), models.Transaction.id.desc())
+        .limit(SUMMARY_RECENT_ITEMS)
+        .all()
+    )
+    return {
+        **_balance_body(wallet),
+        "type": type,
+        "period": period,
+        "series": [dict(bucket, amount=from_minor(bucket["amount_minor"])) for bucket in summary["series"]],
+        "totals": summary["totals"],
+        "recent": recent,
+    }
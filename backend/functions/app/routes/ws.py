@@ -1,43 +1,307 @@
+import asyncio
 import json
-from typing import Dict, List, Optional
+import logging
+import os
+from collections import deque
+from typing import Deque, Dict, Hashable, List, Optional, Tuple, Union
 
-from fastapi import APIRouter, WebSocket, WebSocketDisconnect
+from fastapi import APIRouter, HTTPException, WebSocket, WebSocketDisconnect
+from starlette.concurrency import run_in_threadpool
 
 from app.database import SessionLocal
-from app import models
+from app import auth, job_participants, outbox, schemas, tracking
+from app.bus import MessageBus
+from app.dispatch import dispatcher, update_presence
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
+# Messages (or coalesced location slots) a connection may have waiting; a
+# client that falls further behind is evicted and catches up with a resume.
+WS_SEND_QUEUE_SIZE = int(os.getenv("WS_SEND_QUEUE_SIZE", "256"))
+# A single send that takes longer than this also evicts the client.
+WS_SEND_TIMEOUT_SECONDS = float(os.getenv("WS_SEND_TIMEOUT_SECONDS", "10"))
+# Close code for evicted clients: 1013 "try again later".
+EVICTED_CLOSE_CODE = 1013
+# Clients that don't send their token with the handshake must send it as the
+# first message within this long.
+WS_AUTH_TIMEOUT_SECONDS = float(os.getenv("WS_AUTH_TIMEOUT_SECONDS", "10"))
+# Close code for sockets without a valid token for the user in the path.
+UNAUTHORIZED_CLOSE_CODE = 4401
+
+
+def encode(message: dict) -> str:
+    # Same encoding as WebSocket.send_json, done once per fan-out instead of per socket.
+    return json.dumps(message, separators=(",", ":"), ensure_ascii=False)
+
+
+class Connection:
+    """
+    One websocket with a bounded outbound queue and its own writer task, so a
+    slow or dead client only ever holds up itself.
+
+    Entries are encoded frames (or lists of frames sent back to back) and
+    coalesce keys: while a keyed message is still queued, a newer one with the
+    same key replaces it in place instead of queueing behind it. Location
+    fixes are queued as tracking.Fix and encoded by the writer, so a compact
+    connection gets deltas against what it was actually sent, with the fixes
+    queued back to back packed into one frame.
+    """
+
+    def __init__(self, websocket: WebSocket, user_id: int, manager: "ConnectionManager", compact: bool = False):
+        self.websocket = websocket
+        self.user_id = user_id
+        self.manager = manager
+        self.compact = compact
+        self.encoder = tracking.CompactEncoder() if compact else None
+        # Previous position per job of the compact frames this client sent.
+        self.inbound: Dict[int, Tuple[int, int]] = {}
+        self.queue: Deque[Tuple[Optional[Hashable], Union[str, List[str], tracking.Fix, None]]] = deque()
+        self.latest: Dict[Hashable, Union[str, tracking.Fix]] = {}
+        self.closed = False
+        self._loop = asyncio.get_running_loop()
+        self._sending_since: Optional[float] = None
+        self._watchdog: Optional[asyncio.TimerHandle] = None
+        self._ready = asyncio.Event()
+        self._writer = self._loop.create_task(self._write())
+
+    def send(self, frames: Union[str, List[str], tracking.Fix], key: Optional[Hashable] = None):
+        """Queue frames without waiting; safe to call from another thread or event loop."""
+        try:
+            same_loop = asyncio.get_running_loop() is self._loop
+        except RuntimeError:
+            same_loop = False
+        if same_loop:
+            self._put(frames, key)
+        elif not self._loop.is_closed():
+            self._loop.call_soon_threadsafe(self._put, frames, key)
+
+    def send_fix(self, fix: tracking.Fix):
+        self.send(fix, ("location_update", fix.job_id))
+
+    def _put(self, frames, key):
+        if self.closed:
+            return
+        if key is not None and key in self.latest:
+            self.latest[key] = frames
+            self.manager.coalesced += 1
+            return
+        if len(self.queue) >= self.manager.queue_size:
+            self.evict("send queue full")
+            return
+        if key is not None:
+            self.latest[key] = frames
+            frames = None
+        self.queue.append((key, frames))
+        self._ready.set()
+
+    async def _write(self):
+        try:
+            while True:
+                while not self.queue:
+                    self._ready.clear()
+                    await self._ready.wait()
+                key, frames = self.queue.popleft()
+                if key is not None:
+                    frames = self.latest.pop(key)
+                if isinstance(frames, tracking.Fix):
+                    frames = self._encode_fixes(frames)
+                for text in ([frames] if isinstance(frames, str) else frames):
+                    self._sending_since = self._loop.time()
+                    if self._watchdog is None:
+                        self._watchdog = self._loop.call_later(self.manager.send_timeout, self._check_send)
+                    await self.websocket.send_text(text)
+                    self._sending_since = None
+                    self.manager.sent += 1
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # Dead socket: drop it; the receive loop sees the disconnect too.
+            self.manager.send_failures += 1
+            logger.debug("Websocket send to user %s failed: %s", self.user_id, e)
+            self.close()
+
+    def _encode_fixes(self, fix: tracking.Fix) -> str:
+        if not self.compact:
+            return fix.verbose()
+        fixes = [fix]
+        while self.queue and len(fixes) < tracking.MAX_EVENTS_PER_FRAME:
+            key = self.queue[0][0]
+            if key is None or not isinstance(self.latest.get(key), tracking.Fix):
+                break
+            self.queue.popleft()
+            fixes.append(self.latest.pop(key))
+        return self.encoder.encode(fixes)
+
+    def _check_send(self):
+        # One timer per connection instead of a timeout around every send;
+        # it re-arms only while a send is in progress.
+        self._watchdog = None
+        if self.closed or self._sending_since is None:
+            return
+        elapsed = self._loop.time() - self._sending_since
+        if elapsed >= self.manager.send_timeout:
+            self.evict("send timed out")
+        else:
+            self._watchdog = self._loop.call_later(self.manager.send_timeout - elapsed, self._check_send)
+
+    def close(self):
+        """Stop the writer and forget the connection; pending messages are dropped."""
+        if self.closed:
+            return
+        self.closed = True
+        self.queue.clear()
+        self.latest.clear()
+        if self._watchdog is not None:
+            self._watchdog.cancel()
+        if self._writer is not asyncio.current_task():
+            self._writer.cancel()
+        self.manager.remove(self)
+
+    def evict(self, reason: str):
+        if self.closed:
+            return
+        self.manager.evicted += 1
+        logger.info("Evicting slow websocket client of user %s: %s", self.user_id, reason)
+        self.close()
+        self._loop.create_task(self._close_socket())
+
+    async def _close_socket(self):
+        try:
+            await asyncio.wait_for(self.websocket.close(code=EVICTED_CLOSE_CODE), self.manager.send_timeout)
+        except Exception:
+            pass
+
+
 class ConnectionManager:
-    def __init__(self):
-        # Maps user_id to a list of active websocket connections
-        self.active_connections: Dict[int, List[WebSocket]] = {}
-
-    async def connect(self, websocket: WebSocket, user_id: int):
-        await websocket.accept()
-        if user_id not in self.active_connections:
-            self.active_connections[user_id] = []
-        self.active_connections[user_id].append(websocket)
-
-    def disconnect(self, websocket: WebSocket, user_id: int):
-        if user_id in self.active_connections:
-            self.active_connections[user_id].remove(websocket)
-            if not self.active_connections[user_id]:
-                del self.active_connections[user_id]
-
-    async def send_personal_message(self, message: dict, user_id: int):
-        if user_id in self.active_connections:
-            for connection in self.active_connections[user_id]:
-                await connection.send_json(message)
+    """
+    Active websockets per user. Sends only queue on each connection (see
+    Connection), so fan-out to many sockets returns immediately and frames
+    are written concurrently by the per-connection writer tasks.
+
+    With a MessageBus attached, sends for users whose sockets live in another
+    worker process are forwarded there (see app.bus); `deliver` and
+    `deliver_all` are the receiving end and only touch local sockets.
+    """
+
+    def __init__(self, queue_size: int = WS_SEND_QUEUE_SIZE, send_timeout: float = WS_SEND_TIMEOUT_SECONDS):
+        # Maps user_id to a list of active connections
+        self.active_connections: Dict[int, List[Connection]] = {}
+        self.queue_size = queue_size
+        self.send_timeout = send_timeout
+        self.bus: Optional[MessageBus] = None
+        self.sent = 0
+        self.coalesced = 0
+        self.evicted = 0
+        self.send_failures = 0
+
+    async def accept(self, websocket: WebSocket) -> bool:
+        """Complete the handshake; returns whether the connection is compact."""
+        # Clients offering the compact location subprotocol get it (app.tracking).
+        compact = tracking.SUBPROTOCOL in websocket.scope.get("subprotocols", ())
+        await websocket.accept(subprotocol=tracking.SUBPROTOCOL if compact else None)
+        return compact
+
+    def register(self, websocket: WebSocket, user_id: int, compact: bool = False) -> Connection:
+        connection = Connection(websocket, user_id, self, compact)
+        if user_id not in self.active_connections and self.bus is not None:
+            self.bus.claim(user_id)
+        self.active_connections.setdefault(user_id, []).append(connection)
+        return connection
+
+    def remove(self, connection: Connection) -> bool:
+        """Forget a connection; returns True when it was the user's last one."""
+        connections = self.active_connections.get(connection.user_id)
+        if connections is None or connection not in connections:
+            return False
+        connections.remove(connection)
+        if not connections:
+            del self.active_connections[connection.user_id]
+            if self.bus is not None:
+                self.bus.release(connection.user_id)
+            return True
+        return False
+
+    def disconnect(self, connection: Connection) -> bool:
+        """Close a connection after its client went away; returns True if the user has none left."""
+        connection.close()
+        return connection.user_id not in self.active_connections
+
+    def is_connected(self, user_id: int) -> bool:
+        """Whether the user has a socket in this or (with a bus) any other process."""
+        return user_id in self.active_connections or (self.bus is not None and self.bus.is_connected(user_id))
+
+    async def send_personal_message(self, message: dict, user_id: int, coalesce: Optional[Hashable] = None):
+        """
+        Queue `message` on every socket of the user. With `coalesce`, a message
+        still waiting under the same key is replaced rather than followed.
+        """
+        if self.is_connected(user_id):
+            text = encode(message)
+            self.deliver(user_id, text, coalesce)
+            if self.bus is not None:
+                self.bus.send(user_id, text, coalesce)
 
     async def broadcast(self, message: dict):
-        for connections in self.active_connections.values():
-            for connection in connections:
-                await connection.send_json(message)
+        text = encode(message)
+        self.deliver_all(text)
+        if self.bus is not None:
+            self.bus.broadcast(text)
+
+    async def send_location(self, user_id: int, fix: tracking.Fix):
+        """Queue a job position for the user; only the newest per job is kept while queued."""
+        if self.is_connected(user_id):
+            self.deliver_fix(user_id, fix)
+            if self.bus is not None:
+                self.bus.send_location(user_id, fix.wire())
+
+    def deliver_fix(self, user_id: int, fix: tracking.Fix):
+        for connection in list(self.active_connections.get(user_id, ())):
+            connection.send_fix(fix)
+
+    def deliver_location(self, user_id: int, wire: list):
+        self.deliver_fix(user_id, tracking.Fix.from_wire(wire))
+
+    def deliver(self, user_id: int, text: str, coalesce: Optional[Hashable] = None):
+        for connection in list(self.active_connections.get(user_id, ())):
+            connection.send(text, coalesce)
+
+    def deliver_all(self, text: str):
+        for connections in list(self.active_connections.values()):
+            for connection in list(connections):
+                connection.send(text)
+
+    async def start_bus(self, bus: MessageBus):
+        self.bus = bus
+        await bus.start(self)
+
+    async def stop_bus(self):
+        bus, self.bus = self.bus, None
+        if bus is not None:
+            await bus.stop()
+
+    def shutdown(self):
+        for connections in list(self.active_connections.values()):
+            for connection in list(connections):
+                connection.close()
+
+    def stats(self) -> dict:
+        connections = [c for cs in self.active_connections.values() for c in cs]
+        return {
+            "users": len(self.active_connections),
+            "connections": len(connections),
+            "queued": sum(len(c.queue) for c in connections),
+            "sent": self.sent,
+            "coalesced": self.coalesced,
+            "evicted": self.evicted,
+            "send_failures": self.send_failures,
+            "bus": self.bus.stats() if self.bus is not None else None,
+        }
 
 manager = ConnectionManager()
 
-def _get_job_participant_counterparty(job: models.Job, user_id: int) -> Optional[int]:
+def _get_job_participant_counterparty(job: job_participants.Participants, user_id: int) -> Optional[int]:
     """
     Given a job and a user_id (customer or worker), return the other party's user_id,
     or None if the user is not part of this job or the counterparty is missing.
@@ -49,9 +313,99 @@ def _get_job_participant_counterparty(job: models.Job, user_id: int) -> Optional
     return None
 
 
+def _coords(data: dict):
+    """(latitude, longitude) from a client payload, or (None, None) if absent or malformed."""
+    lat, lon = data.get("latitude"), data.get("longitude")
+    if isinstance(lat, (int, float)) and isinstance(lon, (int, float)) and -90 <= lat <= 90 and -180 <= lon <= 180:
+        return lat, lon
+    return None, None
+
+
+def _replay(user_id: int, after_seq: int):
+    db = SessionLocal()
+    try:
+        return outbox.replay(db, user_id, after_seq)
+    finally:
+        db.close()
+
+
+def _set_presence(user_id: int, is_online: bool, latitude=None, longitude=None):
+    db = SessionLocal()
+    try:
+        update_presence(db, user_id, is_online, latitude, longitude)
+    finally:
+        db.close()
+
+
+async def _relay_location(user_id: int, fix: tracking.Fix):
+    # Routed through the in-memory participants table; the database is only
+    # asked (off the event loop) on a miss.
+    job = await job_participants.lookup(fix.job_id)
+    if job is None or job.status in job_participants.TERMINAL_STATUSES:
+        return
+    counterparty_id = _get_job_participant_counterparty(job, user_id)
+    if counterparty_id:
+        await manager.send_location(counterparty_id, fix)
+
+
+location_throttle = tracking.LocationThrottle(_relay_location)
+
+
+async def _track(user_id: int, fix: tracking.Fix):
+    # Only fixes for an active job the sender is on count; anything else
+    # would let a client move itself (or relay to) wherever it likes.
+    job = await job_participants.lookup(fix.job_id)
+    if job is None or job.status in job_participants.TERMINAL_STATUSES:
+        return
+    if _get_job_participant_counterparty(job, user_id) is None:
+        return
+    if job.worker_id == user_id:
+        dispatcher.move(user_id, fix.latitude, fix.longitude)
+    if location_throttle.admit(user_id, fix):
+        await _relay_location(user_id, fix)
+
+
+def _principal(token) -> Optional[schemas.Principal]:
+    if not isinstance(token, str) or not token:
+        return None
+    try:
+        return auth.get_current_principal(token)
+    except HTTPException:
+        return None
+
+
+async def _authenticate(websocket: WebSocket) -> Optional[schemas.Principal]:
+    """
+    The caller, from the access token in the Authorization header or the
+    `token` query parameter, or else in a first {"type": "auth", "token": ..}
+    message (for clients that can't set either on the handshake).
+    """
+    scheme, _, token = websocket.headers.get("authorization", "").partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        token = websocket.query_params.get("token")
+    if not token:
+        try:
+            raw = await asyncio.wait_for(websocket.receive_text(), WS_AUTH_TIMEOUT_SECONDS)
+            message = json.loads(raw)
+        except (asyncio.TimeoutError, json.JSONDecodeError):
+            return None
+        if not isinstance(message, dict) or message.get("type") != "auth":
+            return None
+        token = message.get("token")
+    return await run_in_threadpool(_principal, token)
+
+
 @router.websocket("/ws/{user_id}")
 async def websocket_endpoint(websocket: WebSocket, user_id: int):
-    await manager.connect(websocket, user_id)
+    compact = await manager.accept(websocket)
+    try:
+        principal = await _authenticate(websocket)
+    except WebSocketDisconnect:
+        return
+    if principal is None or principal.id != user_id:
+        await websocket.close(code=UNAUTHORIZED_CLOSE_CODE)
+        return
+    connection = manager.register(websocket, user_id, compact)
     try:
         while True:
             raw = await websocket.receive_text()
@@ -63,31 +417,54 @@ async def websocket_endpoint(websocket: WebSocket, user_id: int):
                 # Non-JSON payloads are ignored for now
                 continue
 
+            if isinstance(message, list):
+                # Compact location events, see app.tracking.
+                if connection.compact:
+                    for fix in tracking.parse(message, connection.inbound):
+                        await _track(user_id, fix)
+                continue
+            if not isinstance(message, dict):
+                continue
+
             msg_type = message.get("type")
 
-            if msg_type == "location_update":
-                job_id = message.get("jobId")
+            if msg_type == "presence":
+                # {"type": "presence", "data": {"online": true, "latitude": .., "longitude": ..}}
+                # Sets the socket's own authenticated user only, and only partners
+                # are dispatched to, so customers don't cost a query here.
+                if principal.role == "user":
+                    continue
                 data = message.get("data") or {}
-                if not job_id:
+                await run_in_threadpool(_set_presence, user_id, bool(data.get("online", True)), *_coords(data))
+
+            elif msg_type == "resume":
+                # {"type": "resume", "lastSeq": n}: resend the events after n, then
+                # a "resumed" marker; "more" asks the client to resume again.
+                last_seq = message.get("lastSeq") or 0
+                if not isinstance(last_seq, int):
                     continue
+                # Queued as one entry, behind whatever is already pending.
+                frames = await run_in_threadpool(_replay, user_id, last_seq)
+                connection.send([encode(frame) for frame in frames] + [encode({
+                    "type": "resumed",
+                    "lastSeq": frames[-1]["seq"] if frames else last_seq,
+                    "more": len(frames) == outbox.OUTBOX_REPLAY_LIMIT,
+                })])
 
-                db = SessionLocal()
-                try:
-                    job = db.query(models.Job).filter(models.Job.id == job_id).first()
-                    if not job:
-                        continue
-
-                    counterparty_id = _get_job_participant_counterparty(job, user_id)
-                    if counterparty_id:
-                        await manager.send_personal_message(
-                            {
-                                "type": "location_update",
-                                "jobId": job_id,
-                                "data": data,
-                            },
-                            counterparty_id,
-                        )
-                finally:
-                    db.close()
+            elif msg_type == "location_update":
+                job_id = message.get("jobId")
+                data = message.get("data")
+                if isinstance(job_id, str) and job_id.isdigit():
+                    job_id = int(job_id)
+                if not job_id or not isinstance(job_id, int) or not isinstance(data, dict):
+                    continue
+                fix = tracking.Fix.from_verbose(job_id, data)
+                if fix is not None:
+                    await _track(user_id, fix)
     except WebSocketDisconnect:
-        manager.disconnect(websocket, user_id)
+        pass
+    finally:
+        # Also after a handler error or cancellation, so neither the
+        # connection nor the user's online flag outlives the socket.
+        if manager.disconnect(connection) and dispatcher.is_online(user_id):
+            await run_in_threadpool(_set_presence, user_id, False)
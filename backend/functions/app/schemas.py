@@ -1,6 +1,6 @@
 from pydantic import BaseModel, EmailStr
 from typing import Optional, List, Any
-from datetime import datetime
+from datetime import date, datetime
 
 # --- Users ---
 class UserBase(BaseModel):
@@ -22,6 +22,10 @@ class UserResponse(UserBase):
     class Config:
         from_attributes = True
 
+class AdminUserSearchResult(UserResponse):
+    business_name: Optional[str] = None
+    city: Optional[str] = None
+
 # --- Auth ---
 class Token(BaseModel):
     access_token: str
@@ -33,6 +37,16 @@ class TokenData(BaseModel):
     email: Optional[str] = None
     role: Optional[str] = None
 
+class Principal(BaseModel):
+    id: int
+    role: str
+    email: Optional[str] = None
+
+class PresenceUpdate(BaseModel):
+    is_online: bool
+    latitude: Optional[float] = None
+    longitude: Optional[float] = None
+
 class LoginRequest(BaseModel):
     email: EmailStr
     password: str
@@ -45,6 +59,7 @@ class JobBase(BaseModel):
     latitude: float
     longitude: float
     address: str
+    city: Optional[str] = None
     description: Optional[str] = None
 
 class JobCreate(JobBase):
@@ -64,6 +79,60 @@ class JobResponse(JobBase):
     class Config:
         from_attributes = True
 
+class BulkJobCreate(BaseModel):
+    # Items are validated one by one so a bad item doesn't reject the batch.
+    jobs: List[Any]
+
+class BulkJobCreated(BaseModel):
+    index: int
+    id: int
+    otp: str
+
+class BulkJobError(BaseModel):
+    index: int
+    errors: List[Any]
+
+class BulkJobResult(BaseModel):
+    created: List[BulkJobCreated]
+    errors: List[BulkJobError]
+
+class AvailableJobResponse(JobResponse):
+    distance_km: Optional[float] = None
+
+# --- Wallet ---
+class TransactionResponse(BaseModel):
+    id: int
+    user_id: Optional[int] = None
+    type: Optional[str] = None
+    amount: float
+    amount_minor: int
+    job_id: Optional[int] = None
+    description: Optional[str] = None
+    created_at: datetime
+
+    class Config:
+        from_attributes = True
+
+class EarningsBucket(BaseModel):
+    start: date
+    amount: float
+    amount_minor: int
+    count: int
+
+class EarningsTotals(BaseModel):
+    today_minor: int
+    this_week_minor: int
+    this_month_minor: int
+
+class WalletSummaryResponse(BaseModel):
+    balance: float
+    total_earnings: float
+    type: str
+    period: str
+    series: List[EarningsBucket]
+    totals: EarningsTotals
+    recent: List[TransactionResponse]
+
 # --- Admin ---
 class AdminStatsResponse(BaseModel):
     total_users: int
@@ -89,3 +158,34 @@ class AdminPartnerProfileResponse(BaseModel):
 
     class Config:
         from_attributes = True
+
+class AnalyticsTotals(BaseModel):
+    created: int
+    accepted: int
+    completed: int
+    revenue: float
+    revenue_minor: int
+    # Acceptance latency (accepted_at - created_at); percentiles are read off
+    # a bucketed histogram, so they are approximate.
+    accept_mean_seconds: Optional[float] = None
+    p50_seconds: Optional[float] = None
+    p90_seconds: Optional[float] = None
+    p99_seconds: Optional[float] = None
+
+class AnalyticsPoint(AnalyticsTotals):
+    start: datetime
+
+class AnalyticsSeriesResponse(BaseModel):
+    period: str
+    service_type: Optional[str] = None
+    city: Optional[str] = None
+    points: List[AnalyticsPoint]
+
+class AnalyticsBreakdownRow(AnalyticsTotals):
+    key: Optional[str] = None
+
+class AnalyticsBreakdownResponse(BaseModel):
+    by: str
+    start: datetime
+    end: datetime
+    rows: List[AnalyticsBreakdownRow]
@@ -0,0 +1,289 @@
+import logging
+import os
+import re
+import unicodedata
+from typing import Callable, List, NamedTuple, Optional, Sequence
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+logger = logging.getLogger(__name__)
+
+# user_search holds one row per user: full_name, email, phone (digits only)
+# and, for partners, the profile's business_name and city. Triggers on users
+# and partner_profiles keep it in sync, so every write path is covered.
+#
+# SQLite: an FTS5 table (rowid = user id) with prefix indexes.
+# PostgreSQL: a table with a tsvector column (GIN) for word prefixes and a
+# trigram index on the lower-cased text for substrings.
+#
+# The index only finds candidates. Ranking every match with bm25 costs time
+# proportional to how common the words are (it walks each word's whole
+# posting list for IDF), which is far over budget for "gmail" at 1M users.
+# Instead candidates are taken newest first in windows of SEARCH_RANK_WINDOW
+# users and ranked within the window here, so a page costs the same however
+# broad the query: results are exactly ranked when the query matches no more
+# than one window, and newer windows come first otherwise.
+SEARCH_RANK_WINDOW = int(os.getenv("SEARCH_RANK_WINDOW", "500"))
+
+# Longest prefix the FTS5 table indexes (prefix = '2 3 4 5 6'). Longer words
+# are looked up by this prefix, which stays an index read, and checked in
+# full when ranking; FTS5 would otherwise merge the posting lists of every
+# indexed word sharing the prefix.
+_SQLITE_PREFIX = 6
+# Query words handed to MATCH; see _candidates.
+_SQLITE_MATCH_WORDS = 2
+
+# Per-column weight of a matching word; a name hit outranks a city hit.
+WEIGHTS = {"full_name": 10.0, "email": 5.0, "phone": 5.0, "business_name": 3.0, "city": 1.0}
+COLUMNS = tuple(WEIGHTS)
+
+_DIGITS_SQL = "replace(replace(replace(replace(replace(replace({0}, ' ', ''), '-', ''), '+', ''), '(', ''), ')', ''), '.', '')"
+
+SQLITE_DDL = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS user_search USING fts5(
+        full_name, email, phone, business_name, city,
+        tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3 4 5 6'
+    )""",
+    f"""CREATE TRIGGER IF NOT EXISTS user_search_ai AFTER INSERT ON users BEGIN
+        INSERT INTO user_search(rowid, full_name, email, phone, business_name, city)
+        SELECT new.id, new.full_name, new.email, {_DIGITS_SQL.format("new.phone")}, p.business_name, p.city
+        FROM (SELECT 1) LEFT JOIN partner_profiles p ON p.user_id = new.id;
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS user_search_au AFTER UPDATE OF full_name, email, phone ON users BEGIN
+        UPDATE user_search SET full_name = new.full_name, email = new.email,
+            phone = {_DIGITS_SQL.format("new.phone")}
+        WHERE rowid = new.id;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS user_search_ad AFTER DELETE ON users BEGIN
+        DELETE FROM user_search WHERE rowid = old.id;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS user_search_profile_ai AFTER INSERT ON partner_profiles BEGIN
+        UPDATE user_search SET business_name = new.business_name, city = new.city WHERE rowid = new.user_id;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS user_search_profile_au AFTER UPDATE OF business_name, city, user_id
+        ON partner_profiles BEGIN
+        UPDATE user_search SET business_name = NULL, city = NULL WHERE rowid = old.user_id;
+        UPDATE user_search SET business_name = new.business_name, city = new.city WHERE rowid = new.user_id;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS user_search_profile_ad AFTER DELETE ON partner_profiles BEGIN
+        UPDATE user_search SET business_name = NULL, city = NULL WHERE rowid = old.user_id;
+    END""",
+]
+SQLITE_POPULATE = f"""
+    INSERT INTO user_search(rowid, full_name, email, phone, business_name, city)
+    SELECT u.id, u.full_name, u.email, {_DIGITS_SQL.format("u.phone")}, p.business_name, p.city
+    FROM users u LEFT JOIN partner_profiles p ON p.user_id = u.id
+"""
+
+POSTGRES_DDL = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    """CREATE TABLE IF NOT EXISTS user_search (
+        user_id integer PRIMARY KEY REFERENCES users(id) ON DELETE CASCADE,
+        full_name text, email text, phone text, business_name text, city text,
+        body text NOT NULL,
+        document tsvector NOT NULL
+    )""",
+    "CREATE INDEX IF NOT EXISTS idx_user_search_document ON user_search USING gin (document)",
+    "CREATE INDEX IF NOT EXISTS idx_user_search_body_trgm ON user_search USING gin (body gin_trgm_ops)",
+    """CREATE OR REPLACE FUNCTION user_search_refresh(uid integer) RETURNS void AS $$
+    BEGIN
+        INSERT INTO user_search(user_id, full_name, email, phone, business_name, city, body, document)
+        SELECT d.id, d.full_name, d.email, d.phone, d.business_name, d.city,
+               lower(concat_ws(' ', d.full_name, d.email, d.phone, d.business_name, d.city)),
+               to_tsvector('simple', concat_ws(' ', d.full_name, translate(d.email, '@._-+', '     '), d.phone,
+                                               d.business_name, d.city))
+        FROM (
+            SELECT u.id, u.full_name, u.email, regexp_replace(u.phone, '\\D', '', 'g') AS phone,
+                   p.business_name, p.city
+            FROM users u LEFT JOIN partner_profiles p ON p.user_id = u.id
+            WHERE u.id = uid
+        ) d
+        ON CONFLICT (user_id) DO UPDATE SET
+            full_name = excluded.full_name, email = excluded.email, phone = excluded.phone,
+            business_name = excluded.business_name, city = excluded.city,
+            body = excluded.body, document = excluded.document;
+    END
+    $$ LANGUAGE plpgsql""",
+    """CREATE OR REPLACE FUNCTION user_search_users_trigger() RETURNS trigger AS $$
+    BEGIN
+        PERFORM user_search_refresh(NEW.id);
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql""",
+    """CREATE OR REPLACE FUNCTION user_search_profiles_trigger() RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP <> 'INSERT' THEN
+            PERFORM user_search_refresh(OLD.user_id);
+        END IF;
+        IF TG_OP <> 'DELETE' THEN
+            PERFORM user_search_refresh(NEW.user_id);
+        END IF;
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql""",
+    "DROP TRIGGER IF EXISTS user_search_users ON users",
+    """CREATE TRIGGER user_search_users AFTER INSERT OR UPDATE OF full_name, email, phone ON users
+        FOR EACH ROW EXECUTE FUNCTION user_search_users_trigger()""",
+    "DROP TRIGGER IF EXISTS user_search_profiles ON partner_profiles",
+    """CREATE TRIGGER user_search_profiles AFTER INSERT OR UPDATE OF business_name, city, user_id OR DELETE
+        ON partner_profiles FOR EACH ROW EXECUTE FUNCTION user_search_profiles_trigger()""",
+]
+POSTGRES_POPULATE = "SELECT user_search_refresh(id) FROM users"
+
+
+def install(conn):
+    """Create the search table and triggers if missing, indexing existing users once."""
+    if conn.dialect.name == "postgresql":
+        exists = conn.execute(text("SELECT to_regclass('user_search')")).scalar() is not None
+        ddl, populate = POSTGRES_DDL, POSTGRES_POPULATE
+    else:
+        exists = conn.execute(
+            text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'user_search'")
+        ).first() is not None
+        ddl, populate = SQLITE_DDL, SQLITE_POPULATE
+    for statement in ddl:
+        conn.execute(text(statement))
+    if not exists:
+        conn.execute(text(populate))
+        if conn.dialect.name != "postgresql":
+            conn.execute(text("INSERT INTO user_search(user_search) VALUES ('optimize')"))
+        logger.info("Indexed existing users for admin search")
+
+
+def uninstall(conn):
+    if conn.dialect.name == "postgresql":
+        conn.execute(text("DROP TRIGGER IF EXISTS user_search_profiles ON partner_profiles"))
+        conn.execute(text("DROP TRIGGER IF EXISTS user_search_users ON users"))
+        for function in ("user_search_profiles_trigger()", "user_search_users_trigger()",
+                         "user_search_refresh(integer)"):
+            conn.execute(text(f"DROP FUNCTION IF EXISTS {function}"))
+    else:
+        for trigger in ("user_search_ai", "user_search_au", "user_search_ad", "user_search_profile_ai",
+                        "user_search_profile_au", "user_search_profile_ad"):
+            conn.execute(text(f"DROP TRIGGER IF EXISTS {trigger}"))
+    conn.execute(text("DROP TABLE IF EXISTS user_search"))
+
+
+_PHONE = re.compile(r"^[\d\s+().-]+$")
+
+
+def _fold(value: str) -> str:
+    # Case and diacritics folded, like the FTS5 unicode61 tokenizer.
+    value = value.lower()
+    if value.isascii():
+        return value
+    return "".join(c for c in unicodedata.normalize("NFKD", value) if not unicodedata.combining(c))
+
+
+def terms(q: str) -> List[str]:
+    """Search words of `q`; a phone-looking query is one digit string."""
+    if _PHONE.match(q.strip()) and any(c.isdigit() for c in q):
+        return ["".join(c for c in q if c.isdigit())]
+    return re.findall(r"[^\W_]+", _fold(q))
+
+
+def scorer(words: Sequence[str]) -> Callable[[object], Optional[float]]:
+    """
+    Score of a candidate's COLUMNS values: per query word its best column hit, weighted
+    by column (exact word 1, word prefix 0.5, inside a word 0.25), summed.
+    None if some word isn't in the row at all.
+    """
+    boundary = r"(?<![^\W_])"
+    patterns = [(word, re.compile(boundary + re.escape(word) + r"(?![^\W_])"), re.compile(boundary + re.escape(word)))
+                for word in words]
+
+    weights = [WEIGHTS[column] for column in COLUMNS]
+
+    def score(row) -> Optional[float]:
+        values = [(weight, _fold(value)) for weight, value in zip(weights, row) if value]
+        total = 0.0
+        for word, exact, prefix in patterns:
+            best = 0.0
+            for weight, value in values:
+                if weight <= best or word not in value:
+                    continue
+                quality = 1.0 if exact.search(value) else 0.5 if prefix.search(value) else 0.25
+                best = max(best, weight * quality)
+            if not best:
+                return None
+            total += best
+        return total
+
+    return score
+
+
+class Hit(NamedTuple):
+    # The window is the candidates with user ids in [window_lo, window_hi);
+    # all four fields together are the keyset cursor.
+    window_hi: int
+    window_lo: int
+    score: float
+    user_id: int
+
+
+def _candidates(db: Session, q: str, words: List[str], role: Optional[str], hi: Optional[int], lo: Optional[int]):
+    if db.get_bind().dialect.name == "postgresql":
+        params = {"tsquery": " & ".join(f"{w}:*" for w in words), "substring": f"%{_fold(q.strip())}%"}
+        source, key = "user_search", "user_search.user_id"
+        where = ["(document @@ to_tsquery('simple', :tsquery) OR body LIKE :substring)"]
+    else:
+        # FTS5 walks every AND-ed posting list to its end, so "com" and "mail"
+        # from an email would cost a pass over most users. The longest words
+        # are usually the selective ones; the others are checked when ranking.
+        selective = sorted(words, key=len, reverse=True)[:_SQLITE_MATCH_WORDS]
+        params = {"match": " AND ".join(f'"{w[:_SQLITE_PREFIX]}"*' for w in selective)}
+        source, key = "user_search", "user_search.rowid"
+        where = ["user_search MATCH :match"]
+    if role is not None:
+        source += f" JOIN users u ON u.id = {key}"
+        where.append("u.role = :role")
+        params["role"] = role
+    if hi is not None:
+        where.append(f"{key} < :hi")
+        params["hi"] = hi
+    if lo is not None:
+        where.append(f"{key} >= :lo")
+        params["lo"] = lo
+    params["window"] = SEARCH_RANK_WINDOW
+    columns = ", ".join(f"user_search.{column}" for column in COLUMNS)
+    return db.execute(text(
+        f"SELECT {key} AS user_id, {columns} FROM {source} WHERE {' AND '.join(where)} "
+        f"ORDER BY {key} DESC LIMIT :window"
+    ), params).all()
+
+
+def search(db: Session, q: str, limit: int, after: Optional[Sequence] = None,
+           role: Optional[str] = None) -> List[Hit]:
+    """
+    Users matching every word of `q` as a word prefix (or, on PostgreSQL, as a
+    substring), best first within each window. `after` is the last Hit of
+    the previous page.
+    """
+    words = terms(q)
+    if not words:
+        return []
+    score = scorer(words)
+    hi, lo, last = (after[0], after[1], (after[2], after[3])) if after else (None, None, None)
+    hits: List[Hit] = []
+    while len(hits) < limit:
+        rows = _candidates(db, q, words, role, hi, lo)
+        if not rows:
+            break
+        if hi is None:
+            # Pin the window so users created while paging don't shift it.
+            hi = rows[0].user_id + 1
+        if lo is None:
+            lo = rows[-1].user_id if len(rows) == SEARCH_RANK_WINDOW else 0
+        scored = ((score(row[1:]), row.user_id) for row in rows)
+        ranked = sorted((hit for hit in scored if hit[0] is not None), key=lambda hit: (-hit[0], -hit[1]))
+        for hit_score, user_id in ranked:
+            if last is not None and (-hit_score, -user_id) <= (-last[0], -last[1]):
+                continue
+            hits.append(Hit(hi, lo, hit_score, user_id))
+            if len(hits) == limit:
+                break
+        if lo == 0:
+            break
+        hi, lo, last = lo, None, None
+    return hits
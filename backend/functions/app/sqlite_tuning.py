@@ -0,0 +1,137 @@
+import collections
+import logging
+import threading
+
+from sqlalchemy import event, text
+
+logger = logging.getLogger(__name__)
+
+_WRITE_PREFIXES = ("INSERT", "UPDATE", "DELETE", "REPLACE", "CREATE", "DROP", "ALTER")
+_HOLDS_WRITER = "sqlite_writer_queue"
+
+
+class SingleWriterQueue:
+    """
+    FIFO lock handing out the one SQLite write slot in arrival order, so
+    concurrent writers queue here instead of spinning in SQLite's busy handler.
+
+    The queue only orders the threads of one process. Across uvicorn workers
+    writers are serialized by SQLite itself: write transactions start with
+    BEGIN IMMEDIATE (see install), so the file lock is taken up front and a
+    writer in another process waits up to busy_timeout for it rather than
+    failing halfway through its transaction.
+
+    A thread that already holds the slot and writes on a second connection is
+    let through instead of queueing behind itself; SQLite's busy_timeout then
+    bounds that wait like it would without the queue.
+    """
+
+    def __init__(self):
+        self._mutex = threading.Lock()
+        # (thread ident, ticket) per writer; the head holds the slot.
+        self._waiters = collections.deque()
+        self._depth = 0
+        self.acquired = 0
+        self.timeouts = 0
+
+    def acquire(self, timeout: float = None) -> bool:
+        me = threading.get_ident()
+        ticket = threading.Event()
+        with self._mutex:
+            if self._waiters and self._waiters[0][0] == me:
+                self._depth += 1
+                return True
+            self._waiters.append((me, ticket))
+            if len(self._waiters) == 1:
+                ticket.set()
+        if not ticket.wait(timeout):
+            with self._mutex:
+                if not ticket.is_set():
+                    self._waiters.remove((me, ticket))
+                    self.timeouts += 1
+                    return False
+        self.acquired += 1
+        return True
+
+    def release(self):
+        with self._mutex:
+            if self._depth:
+                self._depth -= 1
+                return
+            self._waiters.popleft()
+            if self._waiters:
+                self._waiters[0][1].set()
+
+    def stats(self) -> dict:
+        return {"queued": max(len(self._waiters) - 1, 0), "acquired": self.acquired, "timeouts": self.timeouts}
+
+
+def install(engine, busy_timeout_ms: int, mmap_size: int, cache_size_kb: int, writer_queue: SingleWriterQueue = None):
+    """Apply the production PRAGMAs to every new connection and, optionally,
+    serialize write transactions through `writer_queue`."""
+
+    @event.listens_for(engine, "connect")
+    def _apply_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute(f"PRAGMA busy_timeout={int(busy_timeout_ms)}")
+        cursor.execute(f"PRAGMA mmap_size={int(mmap_size)}")
+        cursor.execute(f"PRAGMA cache_size={-int(cache_size_kb)}")
+        cursor.execute("PRAGMA temp_store=MEMORY")
+        cursor.close()
+        # The driver opens a transaction right before the first INSERT/UPDATE/
+        # DELETE; IMMEDIATE takes the write lock there, which is what orders
+        # writers from other processes (busy_timeout bounds the wait).
+        dbapi_connection.isolation_level = "IMMEDIATE"
+
+    if writer_queue is None:
+        return
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _enter_writer_queue(conn, cursor, statement, parameters, context, executemany):
+        if conn.info.get(_HOLDS_WRITER) or not statement.lstrip().upper().startswith(_WRITE_PREFIXES):
+            return
+        if not writer_queue.acquire(timeout=busy_timeout_ms / 1000):
+            raise TimeoutError("Timed out waiting for the SQLite writer queue")
+        conn.info[_HOLDS_WRITER] = True
+
+    def _leave_writer_queue(info):
+        if info.pop(_HOLDS_WRITER, False):
+            writer_queue.release()
+
+    @event.listens_for(engine, "commit")
+    def _release_on_commit(conn):
+        _leave_writer_queue(conn.info)
+
+    @event.listens_for(engine, "rollback")
+    def _release_on_rollback(conn):
+        _leave_writer_queue(conn.info)
+
+    # Safety net for connections returned to the pool mid-transaction.
+    @event.listens_for(engine, "checkin")
+    def _release_on_checkin(dbapi_connection, connection_record):
+        _leave_writer_queue(connection_record.info)
+
+
+def run_maintenance(engine):
+    """Fold the WAL back into the main file and refresh planner statistics."""
+    with engine.connect() as conn:
+        conn.execute(text("PRAGMA wal_checkpoint(TRUNCATE)"))
+        conn.execute(text("PRAGMA optimize"))
+
+
+def start_maintenance(engine, interval_seconds: float) -> threading.Event:
+    """Run `run_maintenance` every `interval_seconds` on a daemon thread until
+    the returned event is set."""
+    stop = threading.Event()
+
+    def _loop():
+        while not stop.wait(interval_seconds):
+            try:
+                run_maintenance(engine)
+            except Exception as e:
+                logger.warning("SQLite maintenance failed: %s", e)
+
+    threading.Thread(target=_loop, name="sqlite-maintenance", daemon=True).start()
+    return stop
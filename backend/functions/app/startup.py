@@ -0,0 +1,98 @@
+import logging
+import os
+import time
+from pathlib import Path
+from typing import Optional
+
+from . import database, geo, models, search
+
+logger = logging.getLogger(__name__)
+
+# Pool connections opened during warm-up (defaults to the configured pool size).
+DB_WARMUP_CONNECTIONS = int(os.getenv("DB_WARMUP_CONNECTIONS", str(database.DB_POOL_SIZE)))
+
+
+def prepare_database():
+    """Create the local Postgres database / SQLite schema if needed."""
+    database.create_database_if_not_exists(database.SQLALCHEMY_DATABASE_URL)
+    if database.SQLALCHEMY_DATABASE_URL.startswith("sqlite"):
+        models.Base.metadata.create_all(bind=database.get_engine())
+        with database.get_engine().begin() as conn:
+            search.install(conn)
+
+
+def warm_pool(connections: int = DB_WARMUP_CONNECTIONS) -> int:
+    """Open `connections` pool connections at once so the first requests don't
+    pay for connection setup. Returns how many were opened."""
+    if database.DB_POOL_MODE == "null" or connections <= 0:
+        return 0
+    engine = database.get_engine()
+    opened = []
+    try:
+        for _ in range(connections):
+            opened.append(engine.connect())
+    finally:
+        for conn in opened:
+            conn.close()
+    return len(opened)
+
+
+def precompile_hot_queries():
+    """
+    Run the statements behind the hottest routes once so their compiled SQL is
+    already in the engine's statement cache. The filters match nothing.
+    """
+    db = database.SessionLocal()
+    try:
+        db.query(models.User).filter(models.User.email == "").first()
+        db.query(models.Job).filter(models.Job.customer_id == -1).all()
+        db.query(models.Job).filter(models.Job.worker_id == -1).all()
+        db.query(models.Job).filter(models.Job.status == "").all()
+        db.query(models.Job).filter(models.Job.id == -1).first()
+        db.query(models.Wallet).filter(models.Wallet.user_id == -1).first()
+        db.query(models.Transaction).filter(models.Transaction.user_id == -1).order_by(
+            models.Transaction.created_at.desc()
+        ).all()
+    finally:
+        db.rollback()
+        db.close()
+
+
+def load_open_jobs() -> int:
+    """Fill geo.open_jobs from the database when NEARBY_JOBS_BACKEND=memory."""
+    if geo.NEARBY_JOBS_BACKEND != "memory":
+        return 0
+    from .routes.booking import index_open_job
+
+    geo.open_jobs.clear()
+    db = database.SessionLocal()
+    try:
+        query = db.query(models.Job).filter(
+            models.Job.status == "searching", models.Job.latitude.isnot(None), models.Job.longitude.isnot(None)
+        )
+        for job in query.yield_per(1000):
+            index_open_job(job)
+    finally:
+        db.close()
+    return len(geo.open_jobs)
+
+
+def warm_up() -> dict:
+    started = time.perf_counter()
+    connections = warm_pool()
+    precompile_hot_queries()
+    open_jobs = load_open_jobs()
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    logger.info("Warm-up opened %d connections and compiled hot queries in %.0f ms", connections, elapsed_ms)
+    return {"connections": connections, "open_jobs_indexed": open_jobs, "elapsed_ms": round(elapsed_ms, 1)}
+
+
+def find_static_dir(base_dir: Path) -> Optional[Path]:
+    """Locate the Flutter web build, bundled next to the backend or in the frontend tree."""
+    web_in_backend = base_dir / "web"
+    web_in_frontend = base_dir.parent.parent / "frontend" / "build" / "web"
+    if web_in_backend.is_dir():
+        return web_in_backend
+    if web_in_frontend.is_dir():
+        return web_in_frontend
+    return None
@@ -0,0 +1,150 @@
+import logging
+import os
+import random
+import threading
+from datetime import datetime
+from typing import Dict, Optional
+
+from sqlalchemy import func, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session
+
+from . import models
+from .cache import TTLCache
+from .database import begin_reconcile_snapshot
+from .money import from_minor
+
+logger = logging.getLogger(__name__)
+
+# Rows each counter is spread over, so concurrent writers (every job creation
+# bumps total_jobs) rarely wait on the same row. Reads sum the shards.
+STAT_COUNTER_SHARDS = int(os.getenv("STAT_COUNTER_SHARDS", "4"))
+# Shard only the reconciler writes, so its corrections never wait on (or
+# conflict with) live increments.
+RECONCILE_SHARD = -1
+STATS_CACHE_TTL_SECONDS = float(os.getenv("STATS_CACHE_TTL_SECONDS", "10"))
+STATS_RECONCILE_INTERVAL_SECONDS = float(os.getenv("STATS_RECONCILE_INTERVAL_SECONDS", "900"))
+
+COUNTERS = ("total_users", "total_partners", "total_jobs", "total_revenue_minor", "pending_partners")
+PARTNER_ROLES = ("individual_partner", "agency_partner")
+
+cache = TTLCache(maxsize=1, ttl=STATS_CACHE_TTL_SECONDS)
+reconciliation = {"runs": 0, "last_run_at": None, "last_drift": {}}
+
+
+def _add(db: Session, rows: list):
+    dialect = postgresql if db.get_bind().dialect.name == "postgresql" else sqlite
+    stmt = dialect.insert(models.StatCounter).values(rows)
+    db.execute(stmt.on_conflict_do_update(
+        index_elements=[models.StatCounter.name, models.StatCounter.shard],
+        set_={"value": models.StatCounter.value + stmt.excluded.value},
+    ))
+
+
+def increment(db: Session, **deltas: int):
+    """Add to counters inside the caller's transaction, e.g. increment(db, total_jobs=1)."""
+    rows = [{"name": name, "shard": random.randrange(STAT_COUNTER_SHARDS), "value": delta}
+            for name, delta in sorted(deltas.items()) if delta]
+    if rows:
+        _add(db, rows)
+
+
+def role_counter(role: Optional[str]) -> Optional[str]:
+    if role == "user":
+        return "total_users"
+    if role in PARTNER_ROLES:
+        return "total_partners"
+    return None
+
+
+def read(db: Session) -> Dict[str, int]:
+    totals = dict(db.execute(
+        select(models.StatCounter.name, func.sum(models.StatCounter.value)).group_by(models.StatCounter.name)
+    ).all())
+    return {name: int(totals.get(name) or 0) for name in COUNTERS}
+
+
+def dashboard(db: Session) -> dict:
+    """Admin dashboard numbers: the counters table, cached for a few seconds."""
+    stats = cache.get("dashboard")
+    if stats is None:
+        counters = read(db)
+        stats = {
+            "total_users": counters["total_users"],
+            "total_partners": counters["total_partners"],
+            "total_jobs": counters["total_jobs"],
+            "total_revenue": from_minor(counters["total_revenue_minor"]),
+            "pending_partners": counters["pending_partners"],
+        }
+        cache.set("dashboard", stats)
+    return stats
+
+
+def recount(db: Session) -> Dict[str, int]:
+    """The counters computed from scratch; what reconciliation converges to."""
+    return {
+        "total_users": db.scalar(select(func.count()).where(models.User.role == "user")),
+        "total_partners": db.scalar(select(func.count()).where(models.User.role.in_(PARTNER_ROLES))),
+        "total_jobs": db.scalar(select(func.count()).select_from(models.Job)),
+        "total_revenue_minor": int(db.scalar(
+            select(func.coalesce(func.sum(func.round(models.Job.price * 100)), 0))
+            .where(models.Job.status == "completed")
+        )),
+        "pending_partners": db.scalar(
+            select(func.count()).where(models.PartnerProfile.approval_status == "pending")
+        ),
+    }
+
+
+def reconcile(db: Session) -> Optional[Dict[str, int]]:
+    """
+    Correct drift (rows written outside the maintained code paths, crashes,
+    manual edits) by adding the difference to RECONCILE_SHARD. The counters
+    and the recount are read from one snapshot, so increments committing
+    meanwhile are in neither and nothing waits for the scan. Returns the
+    non-zero corrections, or None when another process was reconciling.
+    """
+    if not begin_reconcile_snapshot(db, "stats.reconcile"):
+        return None
+    current = read(db)
+    drift = {name: value - current[name] for name, value in recount(db).items() if value != current[name]}
+    if drift:
+        try:
+            _add(db, [{"name": name, "shard": RECONCILE_SHARD, "value": delta}
+                      for name, delta in sorted(drift.items())])
+        except OperationalError as e:
+            # SQLite: something committed after the snapshot; the next run retries.
+            db.rollback()
+            logger.info("Admin stats reconciliation skipped: %s", e)
+            return None
+        logger.info("Admin stats drift corrected: %s", drift)
+    db.commit()
+    cache.clear()
+    reconciliation.update(runs=reconciliation["runs"] + 1, last_run_at=datetime.utcnow().isoformat(),
+                          last_drift=drift)
+    return drift
+
+
+def start_reconciler(session_factory, interval_seconds: float = STATS_RECONCILE_INTERVAL_SECONDS) -> threading.Event:
+    """Reconcile now and then every `interval_seconds` on a daemon thread until the returned event is set."""
+    stop = threading.Event()
+
+    def _loop():
+        while True:
+            db = session_factory()
+            try:
+                reconcile(db)
+            except Exception as e:
+                logger.warning("Admin stats reconciliation failed: %s", e)
+            finally:
+                db.close()
+            if stop.wait(interval_seconds):
+                return
+
+    threading.Thread(target=_loop, name="stats-reconciler", daemon=True).start()
+    return stop
+
+
+def metrics() -> dict:
+    return {"cache": cache.stats(), "reconciliation": dict(reconciliation)}
@@ -0,0 +1,210 @@
+import asyncio
+import json
+import os
+from typing import Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+# Live-tracking location frames.
+#
+# Clients that offer the websocket subprotocol SUBPROTOCOL speak a compact
+# form: a frame that is a JSON array carries location events instead of one
+# verbose {"type": "location_update", ...} object. Each event is
+#   ["L", job_id, lat, lon, heading?, speed?]    absolute position
+#   ["D", job_id, dlat, dlon, heading?, speed?]  change since the previous
+#                                                position for that job on
+#                                                the same connection
+# with lat/lon in 1e-5 degrees (about 1 m), heading in whole degrees and
+# speed in 0.1 m/s; trailing nulls are left out. Several events may share a
+# frame in either direction. Everything else (presence, resume, job events)
+# stays JSON objects, and clients that do not negotiate keep getting the
+# verbose frames.
+SUBPROTOCOL = "clenzy.loc1"
+COORD_SCALE = 100_000
+SPEED_SCALE = 10
+# Most events read from, or packed into, one frame.
+MAX_EVENTS_PER_FRAME = 64
+# A job's position is relayed at most this often per sender; faster updates
+# are coalesced and the newest goes out when the interval is up.
+LOCATION_MIN_INTERVAL_SECONDS = float(os.getenv("LOCATION_MIN_INTERVAL_SECONDS", "2"))
+
+
+def _number(value) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def _small_int(value) -> Optional[int]:
+    return value if isinstance(value, int) and not isinstance(value, bool) and abs(value) < 1_000_000 else None
+
+
+class Fix:
+    """One position of a job, quantized; encodes itself once for verbose clients."""
+
+    __slots__ = ("job_id", "lat", "lon", "heading", "speed", "_data", "_text")
+
+    def __init__(self, job_id: int, lat: int, lon: int, heading: Optional[int] = None,
+                 speed: Optional[int] = None, data: Optional[dict] = None):
+        self.job_id = job_id
+        self.lat = lat
+        self.lon = lon
+        self.heading = heading
+        self.speed = speed
+        self._data = data  # a verbose sender's payload, forwarded as is
+        self._text: Optional[str] = None
+
+    @classmethod
+    def from_verbose(cls, job_id: int, data: dict) -> Optional["Fix"]:
+        lat, lon = data.get("latitude"), data.get("longitude")
+        if not (_number(lat) and _number(lon) and -90 <= lat <= 90 and -180 <= lon <= 180):
+            return None
+        heading, speed = data.get("heading"), data.get("speed")
+        return cls(job_id, round(lat * COORD_SCALE), round(lon * COORD_SCALE),
+                   round(heading) % 360 if _number(heading) and heading >= 0 else None,
+                   round(speed * SPEED_SCALE) if _number(speed) and speed >= 0 else None, data)
+
+    @property
+    def latitude(self) -> float:
+        return self.lat / COORD_SCALE
+
+    @property
+    def longitude(self) -> float:
+        return self.lon / COORD_SCALE
+
+    def data(self) -> dict:
+        if self._data is not None:
+            return self._data
+        data = {"latitude": self.latitude, "longitude": self.longitude}
+        if self.heading is not None:
+            data["heading"] = self.heading
+        if self.speed is not None:
+            data["speed"] = self.speed / SPEED_SCALE
+        return data
+
+    def verbose(self) -> str:
+        if self._text is None:
+            self._text = json.dumps({"type": "location_update", "jobId": self.job_id, "data": self.data()},
+                                    separators=(",", ":"), ensure_ascii=False)
+        return self._text
+
+    def wire(self) -> list:
+        """JSON-able form for the cross-process bus."""
+        return [self.job_id, self.lat, self.lon, self.heading, self.speed, self._data]
+
+    @classmethod
+    def from_wire(cls, wire: list) -> "Fix":
+        return cls(*wire)
+
+
+def parse(events: list, last: Dict[int, Tuple[int, int]]) -> List[Fix]:
+    """
+    Fixes from a compact client frame. `last` holds the sending connection's
+    previous position per job and is updated; malformed events, and deltas
+    without a previous position, are skipped.
+    """
+    fixes = []
+    for event in events[:MAX_EVENTS_PER_FRAME]:
+        if not isinstance(event, list) or len(event) < 4:
+            continue
+        kind, job_id, lat, lon = event[:4]
+        if not (isinstance(job_id, int) and isinstance(lat, int) and isinstance(lon, int)):
+            continue
+        if kind == "D":
+            base = last.get(job_id)
+            if base is None:
+                continue
+            lat, lon = base[0] + lat, base[1] + lon
+        elif kind != "L":
+            continue
+        if not (-90 * COORD_SCALE <= lat <= 90 * COORD_SCALE and -180 * COORD_SCALE <= lon <= 180 * COORD_SCALE):
+            continue
+        last[job_id] = (lat, lon)
+        heading = _small_int(event[4]) if len(event) > 4 else None
+        speed = _small_int(event[5]) if len(event) > 5 else None
+        fixes.append(Fix(job_id, lat, lon, heading, speed))
+    return fixes
+
+
+class CompactEncoder:
+    """Outgoing compact frames for one connection; deltas are against what it was last sent."""
+
+    def __init__(self):
+        self.last: Dict[int, Tuple[int, int]] = {}
+
+    def encode(self, fixes: List[Fix]) -> str:
+        events = []
+        for fix in fixes:
+            base = self.last.get(fix.job_id)
+            if base is None:
+                event = ["L", fix.job_id, fix.lat, fix.lon]
+            else:
+                event = ["D", fix.job_id, fix.lat - base[0], fix.lon - base[1]]
+            self.last[fix.job_id] = (fix.lat, fix.lon)
+            if fix.speed is not None:
+                event += (fix.heading, fix.speed)
+            elif fix.heading is not None:
+                event.append(fix.heading)
+            events.append(event)
+        return json.dumps(events, separators=(",", ":"))
+
+
+class LocationThrottle:
+    """
+    Relays at most one fix per (job, sender) every `interval` seconds. A fix
+    that comes in sooner is held, replacing any fix already held, and goes
+    out through `forward` when the interval is up.
+    """
+
+    def __init__(self, forward: Callable[[int, Fix], Awaitable], interval: float = LOCATION_MIN_INTERVAL_SECONDS):
+        self.forward = forward
+        self.interval = interval
+        # (job_id, sender_id) -> [last relayed at (loop time), held fix or None]
+        self._state: Dict[Tuple[int, int], list] = {}
+        self._tasks: Set[asyncio.Task] = set()
+        self.admitted = 0
+        self.held = 0
+        self.coalesced = 0
+
+    def admit(self, sender_id: int, fix: Fix) -> bool:
+        """True to relay `fix` now; False if the throttle holds it for later."""
+        if self.interval <= 0:
+            self.admitted += 1
+            return True
+        loop = asyncio.get_running_loop()
+        now, key = loop.time(), (fix.job_id, sender_id)
+        state = self._state.get(key)
+        if state is None or (state[1] is None and now - state[0] >= self.interval):
+            self._state[key] = [now, None]
+            self.admitted += 1
+            if self.admitted % 4096 == 0:
+                self._prune(now)
+            return True
+        if state[1] is None:
+            loop.call_at(state[0] + self.interval, self._release, key)
+            self.held += 1
+        else:
+            self.coalesced += 1
+        state[1] = fix
+        return False
+
+    def _release(self, key):
+        state = self._state.get(key)
+        if state is None or state[1] is None:
+            return
+        fix, state[1] = state[1], None
+        loop = asyncio.get_running_loop()
+        state[0] = loop.time()
+        task = loop.create_task(self.forward(key[1], fix))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def _prune(self, now: float):
+        idle = [key for key, (at, held) in self._state.items() if held is None and now - at > 60 * self.interval]
+        for key in idle:
+            del self._state[key]
+
+    def stats(self) -> dict:
+        return {
+            "min_interval_seconds": self.interval,
+            "tracked": len(self._state),
+            "admitted": self.admitted,
+            "held": self.held,
+            "coalesced": self.coalesced,
+        }
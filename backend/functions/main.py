@@ -1,19 +1,62 @@
 import os
+from contextlib import asynccontextmanager
 from pathlib import Path
 
 from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse, RedirectResponse, FileResponse
 from fastapi.staticfiles import StaticFiles
+from starlette.concurrency import run_in_threadpool
 
 from app.routes import user, worker, admin, booking, ws, wallet, safetap
-from app.database import engine, SQLALCHEMY_DATABASE_URL
-from app.models import Base
+from app import analytics, bus, database, dispatch, hashing, outbox, startup, stats
+from app.pagination import NEXT_CURSOR_HEADER
+from app.query_budget import QueryBudgetMiddleware
 
 
 
-if SQLALCHEMY_DATABASE_URL.startswith("sqlite"):
-    Base.metadata.create_all(bind=engine)
+BASE_DIR = Path(__file__).resolve().parent
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Everything that touches the database or filesystem happens here, once per
+    # worker, instead of at import time.
+    app.state.ready = False
+    await run_in_threadpool(startup.prepare_database)
+
+    app.state.static_dir = startup.find_static_dir(BASE_DIR)
+    # Serve Flutter static files under /app
+    if app.state.static_dir and not any(getattr(r, "name", None) == "flutter" for r in app.routes):
+        app.mount(
+            "/app",
+            StaticFiles(directory=str(app.state.static_dir), html=True),
+            name="flutter",
+        )
+
+    sqlite_maintenance = database.start_sqlite_maintenance()
+    stats_reconciler = stats.start_reconciler(database.SessionLocal)
+    analytics_catch_up = analytics.start_catch_up(database.SessionLocal)
+    app.state.warm_up = await run_in_threadpool(startup.warm_up)
+    await run_in_threadpool(hashing.hasher.start)
+    await ws.manager.start_bus(bus.from_env())
+    outbox.relay.start(ws.manager)
+    app.state.ready = True
+    try:
+        yield
+    finally:
+        app.state.ready = False
+        if sqlite_maintenance:
+            sqlite_maintenance.set()
+        stats_reconciler.set()
+        analytics_catch_up.set()
+        dispatch.dispatcher.shutdown()
+        await outbox.relay.stop()
+        await ws.manager.stop_bus()
+        ws.manager.shutdown()
+        hashing.hasher.shutdown()
+        await database.dispose_async_engine()
+        database.dispose_engines()
 
 
 
@@ -21,6 +64,7 @@ app = FastAPI(
     title="Clenzy API",
     description="Backend API for Clenzy User & Worker Apps",
     version="1.0.0",
+    lifespan=lifespan,
 )
 
 
@@ -31,7 +75,9 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[NEXT_CURSOR_HEADER, "ETag"],
 )
+app.add_middleware(QueryBudgetMiddleware)
 
 
 @app.exception_handler(Exception)
@@ -58,24 +104,12 @@ app.include_router(safetap.router, prefix="/api/safetap", tags=["SafeTap"])
 
 
 
-BASE_DIR = Path(__file__).resolve().parent
-
-WEB_IN_BACKEND = BASE_DIR / "web"
-WEB_IN_FRONTEND = BASE_DIR.parent.parent / "frontend" / "build" / "web"
-
-STATIC_DIR = (
-    WEB_IN_BACKEND if WEB_IN_BACKEND.is_dir()
-    else WEB_IN_FRONTEND if WEB_IN_FRONTEND.is_dir()
-    else None
-)
-
-# Serve Flutter static files under /app
-if STATIC_DIR:
-    app.mount(
-        "/app",
-        StaticFiles(directory=str(STATIC_DIR), html=True),
-        name="flutter",
-    )
+@app.get("/readyz")
+def readyz():
+    """Readiness probe: 200 only once startup warm-up has finished."""
+    if not getattr(app.state, "ready", False):
+        return JSONResponse(status_code=503, content={"status": "starting"})
+    return {"status": "ready", "warm_up": app.state.warm_up}
 
 
 
@@ -85,8 +119,9 @@ def root():
     Serve Flutter web app at root if present.
     Otherwise redirect to external Flutter URL or show health JSON.
     """
-    if STATIC_DIR:
-        index_file = STATIC_DIR / "index.html"
+    static_dir = getattr(app.state, "static_dir", None)
+    if static_dir:
+        index_file = static_dir / "index.html"
         if index_file.exists():
             return FileResponse(index_file)
 
@@ -0,0 +1,29 @@
+"""
+Builds earnings_rollups from existing transaction history. Run once after
+migrating; re-running recomputes the rows, so it also repairs drift.
+
+Usage: python scripts/backfill_earnings_rollups.py [users_per_batch]
+"""
+import os
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import rollups
+from app.database import SessionLocal
+
+
+def main():
+    batch = int(sys.argv[1]) if len(sys.argv) > 1 else rollups.BACKFILL_BATCH_USERS
+    started = time.perf_counter()
+    users = rows = 0
+    for batch_users, batch_rows in rollups.backfill(SessionLocal, batch):
+        users += batch_users
+        rows += batch_rows
+        print(f"{users} users, {rows} rollup rows ({time.perf_counter() - started:.1f}s)")
+    print(f"done: {users} users, {rows} rollup rows in {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,29 @@
+"""
+Builds job_rollups / job_latency_rollups from the jobs table, one UTC day
+at a time, newest first. Run once after migrating; re-running only writes
+corrections, so it also repairs drift.
+
+Usage: python scripts/backfill_job_analytics.py [days]
+"""
+import os
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import analytics
+from app.database import SessionLocal
+
+
+def main():
+    days = int(sys.argv[1]) if len(sys.argv) > 1 else 90
+    started = time.perf_counter()
+    corrected = 0
+    for day, rows in analytics.catch_up(SessionLocal, days):
+        corrected += rows
+        print(f"{day}: {rows} rollup rows corrected ({time.perf_counter() - started:.1f}s)")
+    print(f"done: {days} days, {corrected} rollup rows corrected in {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
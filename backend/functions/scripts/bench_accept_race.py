@@ -0,0 +1,131 @@
+"""
+Races partners for the same open jobs and compares job acceptance strategies:
+
+  legacy       SELECT, check status in Python, UPDATE, commit, refresh
+               (the old accept_job)
+  conditional  one UPDATE ... WHERE status='searching' RETURNING
+               (the current accept_job)
+
+Every thread tries to accept every job; a correct strategy has exactly one
+winner per job.
+
+Usage: python scripts/bench_accept_race.py [jobs] [threads]
+"""
+import os
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ["DATABASE_URL"] = f"sqlite:///{tempfile.mkdtemp()}/bench.db"
+os.environ.setdefault("DB_POOL_SIZE", "32")
+os.environ.setdefault("DB_SLOW_SESSION_MS", "60000")
+
+from fastapi import BackgroundTasks, HTTPException
+from sqlalchemy import event
+
+from app import models, schemas, startup
+from app.database import SessionLocal, get_engine
+from app.routes import booking
+
+statements = 0
+
+
+def legacy_accept(job_id, db, principal):
+    job = db.query(models.Job).filter(models.Job.id == job_id).first()
+    if job is None or job.status != "searching":
+        raise HTTPException(status_code=400, detail="Job is no longer available")
+    job.worker_id = principal.id
+    job.status = "accepted"
+    job.accepted_at = datetime.utcnow()
+    db.commit()
+    db.refresh(job)
+    return job
+
+
+def conditional_accept(job_id, db, principal):
+    return booking.accept_job(job_id, BackgroundTasks(), db, principal)
+
+
+def seed_partners(partners: int):
+    db = SessionLocal()
+    try:
+        db.add(models.User(full_name="Bench", email="bench@example.com", phone="555", hashed_password="x", role="user"))
+        workers = [models.User(full_name=f"P{i}", email=f"p{i}@example.com", phone=f"6{i}", hashed_password="x",
+                               role="individual_partner") for i in range(partners)]
+        db.add_all(workers)
+        db.commit()
+        return [w.id for w in workers]
+    finally:
+        db.close()
+
+
+def new_jobs(jobs: int):
+    """Insert `jobs` open jobs and return their ids."""
+    with get_engine().begin() as conn:
+        customer_id = conn.execute(models.User.__table__.select().limit(1)).first().id
+        conn.execute(models.Job.__table__.insert(), [
+            {"customer_id": customer_id, "status": "searching", "service_type": "Cleaning", "otp": "1234",
+             "price": 40.0, "workers_needed": 1, "latitude": 0.0, "longitude": 0.0, "address": "bench"}
+            for _ in range(jobs)
+        ])
+    db = SessionLocal()
+    try:
+        return [job_id for (job_id,) in db.query(models.Job.id).filter(models.Job.status == "searching")]
+    finally:
+        db.close()
+
+
+def race(name, accept, job_ids, partner_ids):
+    global statements
+    statements = 0
+    wins = {}
+    lock = threading.Lock()
+    barrier = threading.Barrier(len(partner_ids))
+
+    def partner(partner_id):
+        principal = schemas.Principal(id=partner_id, role="individual_partner")
+        barrier.wait()
+        for job_id in job_ids:
+            db = SessionLocal()
+            try:
+                accept(job_id, db, principal)
+                with lock:
+                    wins[job_id] = wins.get(job_id, 0) + 1
+            except HTTPException:
+                pass
+            finally:
+                db.close()
+
+    threads = [threading.Thread(target=partner, args=(pid,)) for pid in partner_ids]
+    started = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - started
+    attempts = len(job_ids) * len(partner_ids)
+    double = sum(1 for n in wins.values() if n > 1)
+    print(f"{name:<12} {attempts / elapsed:8.0f} attempts/s  {len(job_ids) / elapsed:7.0f} jobs/s  "
+          f"{statements / attempts:4.1f} stmts/attempt  jobs with >1 winner: {double}")
+
+
+def main():
+    jobs = int(sys.argv[1]) if len(sys.argv) > 1 else 300
+    threads = int(sys.argv[2]) if len(sys.argv) > 2 else 16
+    startup.prepare_database()
+
+    @event.listens_for(get_engine(), "before_cursor_execute")
+    def _count(conn, cursor, statement, parameters, context, executemany):
+        global statements
+        statements += 1
+
+    partner_ids = seed_partners(threads)
+    for name, accept in (("legacy", legacy_accept), ("conditional", conditional_accept)):
+        race(name, accept, new_jobs(jobs), partner_ids)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""
+Requests/second and latency of the hot booking/wallet read routes served by the
+sync (threadpool) handlers versus the native async handlers (DB_ASYNC_ROUTES=1).
+
+Starts a uvicorn server per mode against a scratch SQLite database and drives it
+with `concurrency` simultaneous clients for `seconds`.
+
+Usage: python scripts/bench_async_routes.py [concurrency] [seconds]
+"""
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(BASE_DIR)
+
+PATHS = ["/api/bookings/available", "/api/wallet/balance", "/api/wallet/transactions"]
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def seed(database_url):
+    from datetime import timedelta
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import Session
+    from app import auth, models
+
+    engine = create_engine(database_url)
+    models.Base.metadata.create_all(engine)
+    with Session(engine) as db:
+        user = models.User(full_name="Bench", email="bench@example.com", phone="1",
+                           hashed_password="x", role="individual_partner")
+        db.add(user)
+        db.flush()
+        db.add(models.Wallet(user_id=user.id))
+        for i in range(25):
+            db.add(models.Job(customer_id=user.id, status="searching", service_type="cleaning", otp="1",
+                              price=40.0, workers_needed=1, latitude=0.0, longitude=0.0, address=str(i)))
+            db.add(models.Transaction(user_id=user.id, type="earning", amount=34.0, description="Job earnings"))
+        db.commit()
+        token = auth.create_access_token(
+            {"email": user.email, "role": user.role, "user_id": user.id}, timedelta(hours=1))
+    engine.dispose()
+    return {"Authorization": f"Bearer {token}"}
+
+
+async def drive(base_url, headers, concurrency, seconds):
+    import httpx
+
+    latencies, errors = [], 0
+    deadline = time.perf_counter() + seconds
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, headers=headers, limits=limits, timeout=60) as client:
+        async def worker(offset):
+            nonlocal errors
+            i = offset
+            while time.perf_counter() < deadline:
+                start = time.perf_counter()
+                try:
+                    resp = await client.get(PATHS[i % len(PATHS)])
+                    if resp.status_code != 200:
+                        errors += 1
+                except httpx.HTTPError:
+                    errors += 1
+                latencies.append(time.perf_counter() - start)
+                i += 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker(n) for n in range(concurrency)))
+        elapsed = time.perf_counter() - started
+    latencies.sort()
+    return {
+        "rps": len(latencies) / elapsed,
+        "p50": latencies[len(latencies) // 2] * 1000,
+        "p99": latencies[int(len(latencies) * 0.99)] * 1000,
+        "errors": errors,
+    }
+
+
+def run_mode(async_routes, concurrency, seconds):
+    database_url = f"sqlite:///{tempfile.mkdtemp()}/bench.db"
+    os.environ["DATABASE_URL"] = database_url
+    headers = seed(database_url)
+    port = free_port()
+    env = dict(os.environ, DATABASE_URL=database_url, DB_ASYNC_ROUTES="1" if async_routes else "0",
+               DB_POOL_SIZE="50", DB_MAX_OVERFLOW="50", DB_SLOW_SESSION_MS="60000")
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=BASE_DIR, env=env,
+    )
+    try:
+        for _ in range(100):
+            try:
+                socket.create_connection(("127.0.0.1", port), timeout=0.1).close()
+                break
+            except OSError:
+                time.sleep(0.1)
+        return asyncio.run(drive(f"http://127.0.0.1:{port}", headers, concurrency, seconds))
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main():
+    concurrency = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    seconds = float(sys.argv[2]) if len(sys.argv) > 2 else 10
+    print(f"{concurrency} concurrent clients, {seconds:.0f}s per mode")
+    print(f"{'mode':8} {'req/s':>8} {'p50 ms':>8} {'p99 ms':>8} {'errors':>7}")
+    for name, async_routes in (("sync", False), ("async", True)):
+        r = run_mode(async_routes, concurrency, seconds)
+        print(f"{name:8} {r['rps']:8.1f} {r['p50']:8.1f} {r['p99']:8.1f} {r['errors']:7d}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""
+Creates N jobs through the API, once as N POST /api/bookings/ calls and once
+as a single POST /api/bookings/bulk, and reports wall time and SQL statements.
+
+Usage: python scripts/bench_bulk_jobs.py [jobs]
+"""
+import os
+import sys
+import tempfile
+import time
+from datetime import timedelta
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ["DATABASE_URL"] = f"sqlite:///{tempfile.mkdtemp()}/bench.db"
+os.environ.setdefault("DB_SLOW_SESSION_MS", "60000")
+
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+
+from main import app
+from app import auth, models, startup
+from app.database import SessionLocal, get_engine
+
+statements = 0
+
+
+def job(i: int) -> dict:
+    return {"service_type": "Cleaning", "price": 40.0 + i % 7, "workers_needed": 1,
+            "latitude": 40.7 + (i % 100) / 1000, "longitude": -74.0 + (i // 100) / 1000,
+            "address": f"{i} Office Park"}
+
+
+def main():
+    jobs = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    startup.prepare_database()
+
+    @event.listens_for(get_engine(), "before_cursor_execute")
+    def _count(conn, cursor, statement, parameters, context, executemany):
+        global statements
+        statements += 1
+
+    db = SessionLocal()
+    agency = models.User(full_name="Agency", email="agency@example.com", phone="555",
+                         hashed_password="x", role="agency_partner")
+    db.add(agency)
+    db.commit()
+    token = auth.create_access_token(
+        data={"email": agency.email, "role": agency.role, "user_id": agency.id}, expires_delta=timedelta(hours=1)
+    )
+    db.close()
+    headers = {"Authorization": f"Bearer {token}"}
+    client = TestClient(app)
+    payload = [job(i) for i in range(jobs)]
+
+    global statements
+    statements = 0
+    started = time.perf_counter()
+    for item in payload:
+        assert client.post("/api/bookings/", json=item, headers=headers).status_code == 200
+    single = time.perf_counter() - started
+    print(f"single x{jobs}: {single:7.2f}s  {jobs / single:8.0f} jobs/s  {statements:5d} statements")
+
+    statements = 0
+    started = time.perf_counter()
+    response = client.post("/api/bookings/bulk", json={"jobs": payload}, headers=headers)
+    bulk = time.perf_counter() - started
+    assert response.status_code == 200 and len(response.json()["created"]) == jobs
+    print(f"bulk   x{jobs}: {bulk:7.2f}s  {jobs / bulk:8.0f} jobs/s  {statements:5d} statements"
+          f"  ({single / bulk:.0f}x faster)")
+
+
+if __name__ == "__main__":
+    main()
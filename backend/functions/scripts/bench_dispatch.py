@@ -0,0 +1,104 @@
+"""
+Dispatch latency with many online partners: time from "job created" until the
+first-wave offers are handed to the websocket manager, using the grid index,
+against a linear scan over every online partner.
+
+Sockets are replaced by an in-process manager that only records sends, so the
+numbers are the dispatcher's own cost.
+
+Usage: python scripts/bench_dispatch.py [partners] [jobs]
+"""
+import asyncio
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import geo
+from app.dispatch import Dispatcher
+
+SERVICES = ["cleaning", "plumbing", "electrical", "gardening", "painting"]
+CENTER = (40.7128, -74.0060)
+SPREAD_DEGREES = 1.0
+
+
+class RecordingManager:
+    def __init__(self, user_ids):
+        self.active_connections = {user_id: [None] for user_id in user_ids}
+        self.sent = 0
+
+    def is_connected(self, user_id: int) -> bool:
+        return user_id in self.active_connections
+
+    async def send_personal_message(self, message: dict, user_id: int):
+        self.sent += 1
+
+
+def linear_scan(partners, job, radius_km, fanout):
+    hits = []
+    for user_id, (lat, lon, services) in partners.items():
+        if services and job["service_type"] not in services:
+            continue
+        distance = geo.haversine_km(job["latitude"], job["longitude"], lat, lon)
+        if distance <= radius_km:
+            hits.append((distance, user_id))
+    hits.sort()
+    return hits[:fanout]
+
+
+def percentiles(samples_ms):
+    samples_ms = sorted(samples_ms)
+    p = lambda q: samples_ms[min(int(q * len(samples_ms)), len(samples_ms) - 1)]
+    return f"p50 {statistics.median(samples_ms):7.3f} ms  p99 {p(0.99):7.3f} ms"
+
+
+async def main():
+    partners = int(sys.argv[1]) if len(sys.argv) > 1 else 50_000
+    jobs = int(sys.argv[2]) if len(sys.argv) > 2 else 1_000
+    rng = random.Random(3)
+
+    dispatcher = Dispatcher(fanout=10, wave_radii_km=[3.0, 8.0, 15.0, 30.0], wave_interval=3600)
+    raw = {}
+    started = time.perf_counter()
+    for user_id in range(1, partners + 1):
+        lat = CENTER[0] + rng.uniform(-SPREAD_DEGREES, SPREAD_DEGREES)
+        lon = CENTER[1] + rng.uniform(-SPREAD_DEGREES, SPREAD_DEGREES)
+        services = rng.sample(SERVICES, rng.randint(0, 2))
+        dispatcher.set_online(user_id, lat, lon, services, radius_km=15.0)
+        raw[user_id] = (lat, lon, set(services))
+    elapsed = time.perf_counter() - started
+    print(f"{partners} partners online in {elapsed:.2f}s ({partners / elapsed:,.0f} presence updates/s)")
+
+    manager = RecordingManager(raw)
+    job_list = [
+        {"id": i, "customer_id": 0, "service_type": rng.choice(SERVICES),
+         "latitude": CENTER[0] + rng.uniform(-0.8, 0.8), "longitude": CENTER[1] + rng.uniform(-0.8, 0.8)}
+        for i in range(jobs)
+    ]
+
+    for wave, radius in enumerate(dispatcher.wave_radii_km):
+        samples = []
+        for job in job_list:
+            t0 = time.perf_counter()
+            if wave == 0:
+                await dispatcher.dispatch(job, manager)
+            else:
+                await dispatcher._offer(job, wave, manager)
+            samples.append((time.perf_counter() - t0) * 1000)
+        print(f"grid   wave {wave + 1} ({radius:>4.0f} km)  {percentiles(samples)}")
+
+    samples = []
+    for job in job_list[:100]:
+        t0 = time.perf_counter()
+        linear_scan(raw, job, dispatcher.wave_radii_km[0], dispatcher.fanout)
+        samples.append((time.perf_counter() - t0) * 1000)
+    print(f"linear wave 1 ({dispatcher.wave_radii_km[0]:>4.0f} km)  {percentiles(samples)}")
+    print(f"offers sent: {manager.sent}, avg per job {manager.sent / jobs:.1f}")
+    dispatcher.shutdown()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,88 @@
+"""
+Peak Python memory while exporting the transactions table: building the
+whole list as ORM objects and Pydantic models (what the list routes do),
+against the streaming CSV/NDJSON export at two table sizes.
+
+Memory is traced with tracemalloc around the exact generator the export
+endpoints hand to StreamingResponse; the body is consumed and discarded.
+
+Usage: python scripts/bench_export.py [rows]
+"""
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ["DATABASE_URL"] = f"sqlite:///{tempfile.mkdtemp()}/bench.db"
+os.environ.setdefault("DB_SLOW_SESSION_MS", "600000")
+
+from sqlalchemy import select
+
+from app import exports, models, schemas, startup
+from app.database import SessionLocal, get_engine
+
+EPOCH = datetime(2026, 1, 1)
+
+
+def seed(rows: int, offset: int):
+    with get_engine().begin() as conn:
+        batch = 50_000
+        for start in range(offset, offset + rows, batch):
+            conn.execute(models.Transaction.__table__.insert(), [
+                {"user_id": 1, "type": "earning", "amount_minor": 1000 + i % 5000, "job_id": None,
+                 "description": "Job earnings", "created_at": EPOCH + timedelta(seconds=i)}
+                for i in range(start, min(start + batch, offset + rows))
+            ])
+
+
+def materialized() -> int:
+    db = SessionLocal()
+    try:
+        items = [schemas.TransactionResponse.model_validate(t).model_dump(mode="json")
+                 for t in db.query(models.Transaction).order_by(models.Transaction.id).all()]
+        return len(json.dumps(items))
+    finally:
+        db.close()
+
+
+def streamed(fmt: str) -> int:
+    statement = select(*exports.TRANSACTION_COLUMNS).order_by(models.Transaction.id)
+    chunks = exports.encode(exports.stream_rows(statement), exports.TRANSACTION_FIELDS, fmt,
+                            exports.transaction_row)
+    return sum(len(chunk) for chunk in chunks)
+
+
+def measure(label: str, fn):
+    tracemalloc.start()
+    started = time.perf_counter()
+    size = fn()
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"  {label:<13} {elapsed:7.2f}s  {size / 1e6:8.1f} MB body  peak {peak / 1e6:8.1f} MB")
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 500_000
+    startup.prepare_database()
+    with get_engine().begin() as conn:
+        conn.execute(models.User.__table__.insert().values(
+            id=1, full_name="Bench", email="bench@example.com", phone="555", hashed_password="x",
+            role="individual_partner",
+        ))
+    seeded = 0
+    for total in (rows // 10, rows):
+        seed(total - seeded, seeded)
+        seeded = total
+        print(f"{total} transactions")
+        measure("materialized", materialized)
+        measure("stream csv", lambda: streamed("csv"))
+        measure("stream ndjson", lambda: streamed("ndjson"))
+
+
+if __name__ == "__main__":
+    main()
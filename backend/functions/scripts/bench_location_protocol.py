@@ -0,0 +1,147 @@
+"""
+Live-tracking wire cost: bytes per location update and frames per second on
+one core, for the verbose {"type": "location_update", ...} frame against the
+compact subprotocol (app.tracking) with one event per frame and with packed
+frames, plus the server-side throttle on a client that reports faster than
+LOCATION_MIN_INTERVAL_SECONDS.
+
+Positions are a simulated courier route: a few metres between consecutive
+fixes with heading and speed, which is what the phones send while a job is
+in progress.
+
+Usage: python scripts/bench_location_protocol.py [jobs] [updates per job]
+"""
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import tracking
+from app.routes.ws import ConnectionManager
+
+
+def route(jobs, updates, seed=1):
+    rng = random.Random(seed)
+    data = []
+    for job_id in range(1, jobs + 1):
+        lat, lon = 40.7 + rng.random() / 10, -74.0 + rng.random() / 10
+        heading = rng.uniform(0, 360)
+        for _ in range(updates):
+            heading = (heading + rng.uniform(-15, 15)) % 360
+            lat += rng.uniform(-3e-5, 3e-5)
+            lon += rng.uniform(-3e-5, 3e-5)
+            data.append((job_id, {"latitude": lat, "longitude": lon,
+                                  "heading": round(heading, 1), "speed": round(rng.uniform(2, 12), 2)}))
+    # Interleave the jobs the way they arrive at a dispatcher watching many of them.
+    return sorted(data, key=lambda item: rng.random())
+
+
+def timed(label, count, fn):
+    started = time.perf_counter()
+    frames = fn()
+    elapsed = time.perf_counter() - started
+    print(f"  {label:<34} {count / elapsed:>12,.0f} updates/s  {frames / elapsed:>12,.0f} frames/s")
+
+
+def wire_size(updates):
+    fixes = [tracking.Fix.from_verbose(job_id, data) for job_id, data in updates]
+    verbose = [json.dumps({"type": "location_update", "jobId": job_id, "data": data}, separators=(",", ":"))
+               for job_id, data in updates]
+    single_encoder = tracking.CompactEncoder()
+    single = [single_encoder.encode([fix]) for fix in fixes]
+    packed_encoder = tracking.CompactEncoder()
+    packed = [packed_encoder.encode(fixes[i:i + 16]) for i in range(0, len(fixes), 16)]
+    count = len(updates)
+    print(f"bytes per update ({count} updates)")
+    for label, frames in (("verbose JSON", verbose), ("compact, 1 event per frame", single),
+                          ("compact, 16 events per frame", packed)):
+        size = sum(len(frame.encode()) for frame in frames)
+        print(f"  {label:<34} {size / count:8.1f} B  ({len(frames)} frames)")
+
+    print("codec throughput, one core")
+    timed("verbose encode (json.dumps)", count, lambda: [json.dumps(
+        {"type": "location_update", "jobId": j, "data": d}, separators=(",", ":")) for j, d in updates] and count)
+    timed("compact encode, 1 per frame", count, lambda: [
+        single_encoder.encode([fix]) for fix in fixes] and count)
+    timed("compact encode, 16 per frame", count, lambda: len([
+        packed_encoder.encode(fixes[i:i + 16]) for i in range(0, count, 16)]))
+    timed("verbose decode (json.loads)", count, lambda: [json.loads(frame) for frame in verbose] and count)
+    last = {}
+    timed("compact decode, 1 per frame", count, lambda: [
+        tracking.parse(json.loads(frame), last) for frame in single] and count)
+    last = {}
+    timed("compact decode, 16 per frame", count, lambda: len([
+        tracking.parse(json.loads(frame), last) for frame in packed]))
+
+
+class FakeWebSocket:
+    def __init__(self):
+        self.frames = 0
+        self.bytes = 0
+
+    async def send_text(self, text):
+        self.frames += 1
+        self.bytes += len(text)
+
+    async def close(self, code=1000):
+        pass
+
+
+async def through_manager(updates, jobs):
+    # One dispatcher following every job; its writer packs whatever queued up
+    # since it last ran.
+    fixes = [tracking.Fix.from_verbose(job_id, data) for job_id, data in updates]
+    print(f"through the ConnectionManager to one client following {jobs} jobs, one core")
+    for compact in (False, True):
+        manager = ConnectionManager(queue_size=len(fixes) + 1)
+        websocket = FakeWebSocket()
+        manager.register(websocket, 1, compact=compact)
+        started = time.perf_counter()
+        for i, fix in enumerate(fixes):
+            await manager.send_location(1, fix)
+            if i % 32 == 31:
+                await asyncio.sleep(0)
+        while manager.active_connections[1][0].queue:
+            await asyncio.sleep(0)
+        elapsed = time.perf_counter() - started
+        label = "compact" if compact else "verbose"
+        print(f"  {label:<8} {len(fixes) / elapsed:>10,.0f} updates/s  {websocket.frames:>7} frames "
+              f"{websocket.bytes / len(fixes):6.1f} B/update  {manager.stats()['coalesced']} coalesced")
+        manager.shutdown()
+
+
+async def throttled(seconds=3.0, rate_hz=10):
+    relayed = []
+
+    async def forward(sender_id, fix):
+        relayed.append(fix)
+
+    throttle = tracking.LocationThrottle(forward, interval=1.0)
+    started = time.monotonic()
+    offered = 0
+    while time.monotonic() - started < seconds:
+        fix = tracking.Fix(1, 4_070_000 + offered, -7_400_000)
+        offered += 1
+        if throttle.admit(7, fix):
+            relayed.append(fix)
+        await asyncio.sleep(1 / rate_hz)
+    await asyncio.sleep(1.1)
+    print(f"throttle at 1 s per job and sender: {offered} fixes offered at {rate_hz} Hz over {seconds:.0f} s, "
+          f"{len(relayed)} relayed, newest relayed = newest offered: {relayed[-1].lat == fix.lat}")
+
+
+def main():
+    jobs = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    updates = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+    data = route(jobs, updates)
+    wire_size(data)
+    asyncio.run(through_manager(data, jobs))
+    asyncio.run(throttled())
+
+
+if __name__ == "__main__":
+    main()
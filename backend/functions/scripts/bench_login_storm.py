@@ -0,0 +1,96 @@
+"""
+Login p99 during a login storm while booking endpoints are being polled, with
+bcrypt on the shared threadpool ("threadpool") versus the dedicated hashing
+process pool ("engine").
+
+Usage: python scripts/bench_login_storm.py [logins] [concurrency] [bcrypt_rounds]
+"""
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))] * 1000
+
+
+async def storm(app, headers, logins, concurrency, email, password):
+    import httpx
+
+    login_times, booking_times = [], []
+    done = asyncio.Event()
+    transport = httpx.ASGITransport(app=app)
+
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        async def poll_bookings():
+            while not done.is_set():
+                start = time.perf_counter()
+                resp = await client.get("/api/bookings/customer", headers=headers)
+                booking_times.append(time.perf_counter() - start)
+                assert resp.status_code == 200
+
+        sem = asyncio.Semaphore(concurrency)
+
+        async def login():
+            async with sem:
+                start = time.perf_counter()
+                resp = await client.post("/api/users/login", json={"email": email, "password": password})
+                login_times.append(time.perf_counter() - start)
+                assert resp.status_code in (200, 503), resp.text
+
+        pollers = [asyncio.create_task(poll_bookings()) for _ in range(8)]
+        started = time.perf_counter()
+        await asyncio.gather(*(login() for _ in range(logins)))
+        elapsed = time.perf_counter() - started
+        done.set()
+        await asyncio.gather(*pollers)
+    return elapsed, login_times, booking_times
+
+
+def main():
+    logins = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    concurrency = int(sys.argv[2]) if len(sys.argv) > 2 else 64
+    rounds = int(sys.argv[3]) if len(sys.argv) > 3 else 10
+
+    os.environ["DATABASE_URL"] = f"sqlite:///{tempfile.mkdtemp()}/bench.db"
+    os.environ["BCRYPT_ROUNDS"] = str(rounds)
+    from datetime import timedelta
+    from main import app
+    from app import auth, hashing, models, startup
+    from app.database import SessionLocal
+
+    startup.prepare_database()
+    db = SessionLocal()
+    user = models.User(full_name="Storm", email="storm@example.com", phone="1",
+                       hashed_password=hashing.hash_password("pw", rounds), role="user")
+    db.add(user)
+    db.commit()
+    headers = {"Authorization": "Bearer " + auth.create_access_token(
+        {"email": user.email, "role": user.role, "user_id": user.id}, timedelta(minutes=30))}
+    db.close()
+
+    workers = hashing.PASSWORD_HASH_WORKERS
+    modes = [
+        ("threadpool", hashing.HashingEngine(workers=0, queue_limit=logins, rounds=rounds)),
+        (f"engine x{workers}", hashing.HashingEngine(workers=workers, queue_limit=logins, rounds=rounds)),
+    ]
+    print(f"{logins} logins, {concurrency} concurrent, bcrypt cost {rounds}, 8 booking pollers")
+    print(f"{'mode':14} {'wall s':>7} {'login p50':>10} {'login p99':>10} {'booking p50':>12} {'booking p99':>12}")
+    for name, engine in modes:
+        hashing.hasher = engine
+        if engine.workers:
+            asyncio.run(engine.verify("warm", hashing.hash_password("warm", 4)))
+        elapsed, login_times, booking_times = asyncio.run(
+            storm(app, headers, logins, concurrency, "storm@example.com", "pw"))
+        engine.shutdown()
+        print(f"{name:14} {elapsed:7.2f} {percentile(login_times, 50):10.1f} {percentile(login_times, 99):10.1f} "
+              f"{percentile(booking_times, 50):12.1f} {percentile(booking_times, 99):12.1f}")
+
+
+if __name__ == "__main__":
+    main()
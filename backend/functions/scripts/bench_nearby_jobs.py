@@ -0,0 +1,112 @@
+"""
+Compares the ways /api/bookings/available can find jobs for a partner, over
+100k open jobs spread across a metro area:
+
+  full-scan  every searching job, serialized (the old route behaviour)
+  db-cells   indexed geo_cell IN (...) query + exact distance filter
+  memory     the in-process GridIndex (NEARBY_JOBS_BACKEND=memory)
+
+Usage: python scripts/bench_nearby_jobs.py [jobs] [lookups]
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ["DATABASE_URL"] = f"sqlite:///{tempfile.mkdtemp()}/bench.db"
+
+from fastapi import Request, Response
+
+from app import geo, models, schemas, startup
+from app.database import SessionLocal, get_engine
+from app.pagination import PageParams
+from app.routes import booking
+
+SERVICES = ["Cleaning", "Plumbing", "Electrical", "Gardening", "Painting"]
+CENTER = (40.7128, -74.0060)
+SPREAD_DEGREES = 1.0
+PAGE_SIZE = 50
+
+
+def seed(jobs: int) -> int:
+    startup.prepare_database()
+    rng = random.Random(42)
+    db = SessionLocal()
+    customer = models.User(full_name="Bench", email="bench@example.com", phone="555",
+                           hashed_password="x", role="user")
+    partner = models.User(full_name="Partner", email="partner@example.com", phone="556",
+                          hashed_password="x", role="individual_partner")
+    db.add_all([customer, partner])
+    db.flush()
+    db.add(models.PartnerProfile(user_id=partner.id, service_radius=15.0, selected_services=SERVICES[:2]))
+    db.commit()
+    customer_id, partner_id = customer.id, partner.id
+    db.close()
+
+    rows = []
+    for _ in range(jobs):
+        lat = CENTER[0] + rng.uniform(-SPREAD_DEGREES, SPREAD_DEGREES)
+        lon = CENTER[1] + rng.uniform(-SPREAD_DEGREES, SPREAD_DEGREES)
+        rows.append({
+            "customer_id": customer_id, "status": "searching", "service_type": rng.choice(SERVICES),
+            "otp": "1234", "price": 40.0, "workers_needed": 1, "latitude": lat, "longitude": lon,
+            "address": "bench", "geo_cell": geo.cell_for(lat, lon),
+        })
+    with get_engine().begin() as conn:
+        conn.execute(models.Job.__table__.insert(), rows)
+    return partner_id
+
+
+def full_scan(db, partner, lat, lon):
+    jobs = db.query(models.Job).filter(models.Job.status == "searching").all()
+    return [schemas.JobResponse.model_validate(job) for job in jobs]
+
+
+def _available(db, partner, lat, lon):
+    request = Request({"type": "http", "method": "GET", "path": "/api/bookings/available", "headers": []})
+    return booking.get_available_jobs(request=request, response=Response(), latitude=lat, longitude=lon,
+                                      page=PageParams(None, PAGE_SIZE), db=db, current_user=partner)
+
+
+db_cells = memory = _available
+
+
+def run(name, fn, partner, points):
+    db = SessionLocal()
+    try:
+        started = time.perf_counter()
+        returned = 0
+        for lat, lon in points:
+            returned += len(fn(db, partner, lat, lon))
+            db.expunge_all()
+        elapsed = time.perf_counter() - started
+    finally:
+        db.close()
+    print(f"{name:<10} {elapsed / len(points) * 1000:9.2f} ms/lookup  {returned / len(points):8.1f} jobs/response")
+
+
+def main():
+    jobs = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    lookups = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+    started = time.perf_counter()
+    partner_id = seed(jobs)
+    print(f"seeded {jobs} open jobs in {time.perf_counter() - started:.1f}s")
+
+    partner = schemas.Principal(id=partner_id, role="individual_partner")
+    rng = random.Random(1)
+    points = [(CENTER[0] + rng.uniform(-0.5, 0.5), CENTER[1] + rng.uniform(-0.5, 0.5)) for _ in range(lookups)]
+
+    run("full-scan", full_scan, partner, points[: max(lookups // 10, 1)])
+    run("db-cells", db_cells, partner, points)
+
+    geo.NEARBY_JOBS_BACKEND = "memory"
+    started = time.perf_counter()
+    indexed = startup.load_open_jobs()
+    print(f"indexed {indexed} jobs in memory in {time.perf_counter() - started:.1f}s")
+    run("memory", memory, partner, points)
+
+
+if __name__ == "__main__":
+    main()
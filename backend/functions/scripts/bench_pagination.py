@@ -0,0 +1,81 @@
+"""
+Times the admin job listing at shallow and deep pages, OFFSET/LIMIT (the old
+/api/admin/jobs) against the (created_at, id) keyset cursor.
+
+Usage: python scripts/bench_pagination.py [jobs] [page_size]
+"""
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ["DATABASE_URL"] = f"sqlite:///{tempfile.mkdtemp()}/bench.db"
+
+from app import models, startup
+from app.database import SessionLocal, get_engine
+from app.pagination import PageParams, encode_cursor, newest_first
+
+REPEAT = 20
+EPOCH = datetime(2026, 1, 1)
+
+
+def seed(jobs: int):
+    startup.prepare_database()
+    with get_engine().begin() as conn:
+        customer_id = conn.execute(models.User.__table__.insert().values(
+            full_name="Bench", email="bench@example.com", phone="555", hashed_password="x", role="user",
+        )).inserted_primary_key[0]
+        batch = 50_000
+        for start in range(0, jobs, batch):
+            conn.execute(models.Job.__table__.insert(), [
+                {"customer_id": customer_id, "status": "completed", "service_type": "Cleaning", "otp": "1234",
+                 "price": 40.0, "workers_needed": 1, "latitude": 0.0, "longitude": 0.0, "address": "bench",
+                 # Spread over a few days; many rows share a second, so the id tie-breaker matters.
+                 "created_at": EPOCH + timedelta(seconds=(start + i) // 4)}
+                for i in range(min(batch, jobs - start))
+            ])
+
+
+def timed(fn) -> float:
+    started = time.perf_counter()
+    for _ in range(REPEAT):
+        fn()
+    return (time.perf_counter() - started) / REPEAT * 1000
+
+
+def main():
+    jobs = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    page_size = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+    started = time.perf_counter()
+    seed(jobs)
+    print(f"seeded {jobs} jobs in {time.perf_counter() - started:.1f}s")
+
+    db = SessionLocal()
+    try:
+        last_page = jobs // page_size - 1
+        for page_no in (1, last_page // 100, last_page // 10, last_page):
+            skip = (page_no - 1) * page_size
+
+            def offset():
+                return db.query(models.Job).order_by(models.Job.created_at.desc()).offset(skip).limit(page_size).all()
+
+            cursor = None
+            if skip:
+                prev = db.query(models.Job.created_at, models.Job.id).order_by(
+                    models.Job.created_at.desc(), models.Job.id.desc()).offset(skip - 1).first()
+                cursor = encode_cursor(prev.created_at, prev.id)
+            page = PageParams(cursor, page_size)
+
+            def keyset():
+                return newest_first(db.query(models.Job), models.Job, page).all()
+
+            print(f"page {page_no:>6}  offset {timed(offset):8.2f} ms   keyset {timed(keyset):6.2f} ms")
+            db.expunge_all()
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
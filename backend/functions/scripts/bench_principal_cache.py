@@ -0,0 +1,106 @@
+"""
+Counts the SQL statements issued by the /api/bookings/* and /api/wallet/* read
+paths with and without the principal cache.
+
+"legacy" resolves the caller with a users-table lookup on every request (the old
+get_current_user behaviour); "cached" uses the token principal / principal cache.
+
+Usage: python scripts/bench_principal_cache.py [requests_per_path]
+"""
+import os
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ["DATABASE_URL"] = f"sqlite:///{tempfile.mkdtemp()}/bench.db"
+
+from datetime import timedelta
+
+from fastapi import Depends
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+
+from main import app
+from app import auth, models, schemas, startup
+from app.database import SessionLocal, engine, get_db
+
+PATHS = [
+    "/api/bookings/customer",
+    "/api/bookings/worker",
+    "/api/bookings/available",
+    "/api/wallet/balance",
+    "/api/wallet/transactions",
+]
+
+statements = 0
+
+
+@event.listens_for(engine, "before_cursor_execute")
+def _count(conn, cursor, statement, parameters, context, executemany):
+    global statements
+    statements += 1
+
+
+def legacy_principal(token: str = Depends(auth.oauth2_scheme), db=Depends(get_db)):
+    payload = auth._decode_token(token)
+    user = db.query(models.User).filter(models.User.email == payload["email"]).first()
+    return schemas.Principal(id=user.id, role=user.role, email=user.email)
+
+
+def seed():
+    startup.prepare_database()
+    db = SessionLocal()
+    user = models.User(full_name="Bench", email="bench@example.com", phone="555",
+                       hashed_password="x", role="individual_partner")
+    db.add(user)
+    db.flush()
+    db.add(models.Wallet(user_id=user.id))
+    for i in range(20):
+        db.add(models.Job(customer_id=user.id, status="searching", service_type="cleaning",
+                          otp="1234", price=50.0, workers_needed=1, latitude=0.0,
+                          longitude=0.0, address=f"{i} Bench St"))
+    db.commit()
+    token = auth.create_access_token(
+        {"email": user.email, "role": user.role, "user_id": user.id}, timedelta(minutes=30)
+    )
+    db.close()
+    return {"Authorization": f"Bearer {token}"}
+
+
+def run(client, headers, n):
+    global statements
+    results = {}
+    for path in PATHS:
+        statements = 0
+        start = time.perf_counter()
+        for _ in range(n):
+            assert client.get(path, headers=headers).status_code == 200
+        elapsed = time.perf_counter() - start
+        results[path] = (statements / n, elapsed / n * 1000)
+    return results
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    client = TestClient(app)
+    headers = seed()
+
+    app.dependency_overrides[auth.get_current_principal] = legacy_principal
+    legacy = run(client, headers, n)
+    app.dependency_overrides.clear()
+    cached = run(client, headers, n)
+
+    print(f"{'path':28} {'legacy q/req':>13} {'cached q/req':>13} {'legacy ms':>10} {'cached ms':>10}")
+    saved = 0.0
+    for path in PATHS:
+        lq, lms = legacy[path]
+        cq, cms = cached[path]
+        saved += (lq - cq) * n
+        print(f"{path:28} {lq:13.2f} {cq:13.2f} {lms:10.2f} {cms:10.2f}")
+    print(f"queries saved over {n * len(PATHS)} requests: {int(saved)}")
+    print(f"principal cache: {auth.principal_cache.stats()}")
+
+
+if __name__ == "__main__":
+    main()
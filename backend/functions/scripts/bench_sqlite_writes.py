@@ -0,0 +1,115 @@
+"""
+Concurrent create_job/accept_job write throughput on the SQLite fallback with
+stock settings (SQLITE_TUNING=0) versus the production profile (WAL, PRAGMAs and
+the single-writer queue).
+
+Each mode runs in a fresh interpreter because the profile is applied when
+app.database builds its engine.
+
+Usage: python scripts/bench_sqlite_writes.py [threads] [jobs_per_thread] [processes]
+"""
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(BASE_DIR)
+
+
+def child(threads, jobs_per_thread):
+    from datetime import datetime
+    from sqlalchemy.exc import OperationalError
+    from app import models
+    from app.database import SessionLocal, engine
+
+    models.Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    user = models.User(full_name="Writer", email=f"w{os.getpid()}@example.com", phone=str(os.getpid()),
+                       hashed_password="x", role="individual_partner")
+    db.add(user)
+    db.commit()
+    user_id = user.id
+    db.close()
+
+    done, locked, other = [0], [0], [0]
+    lock = threading.Lock()
+
+    def writer():
+        for i in range(jobs_per_thread):
+            db = SessionLocal()
+            try:
+                job = models.Job(customer_id=user_id, status="searching", service_type="cleaning", otp="1234",
+                                 price=30.0, workers_needed=1, latitude=0.0, longitude=0.0, address=str(i))
+                db.add(job)
+                db.commit()
+                job.worker_id = user_id
+                job.status = "accepted"
+                job.accepted_at = datetime.utcnow()
+                db.commit()
+                with lock:
+                    done[0] += 1
+            except OperationalError as e:
+                db.rollback()
+                with lock:
+                    if "locked" in str(e):
+                        locked[0] += 1
+                    else:
+                        other[0] += 1
+            except Exception:
+                db.rollback()
+                with lock:
+                    other[0] += 1
+            finally:
+                db.close()
+
+    workers = [threading.Thread(target=writer) for _ in range(threads)]
+    start = time.perf_counter()
+    for t in workers:
+        t.start()
+    for t in workers:
+        t.join()
+    elapsed = time.perf_counter() - start
+    print(json.dumps({"done": done[0], "locked": locked[0], "other": other[0], "elapsed": elapsed}))
+
+
+def run_mode(tuned, threads, jobs_per_thread, processes):
+    database_url = f"sqlite:///{tempfile.mkdtemp()}/bench.db"
+    env = dict(os.environ, DATABASE_URL=database_url, SQLITE_TUNING="1" if tuned else "0",
+               DB_POOL_SIZE=str(threads), DB_MAX_OVERFLOW="0")
+    # Create the schema once so racing processes don't collide on DDL.
+    subprocess.run([sys.executable, __file__, "--child", "0", "0"], env=env, cwd=BASE_DIR, check=True,
+                   capture_output=True)
+    start = time.perf_counter()
+    procs = [
+        subprocess.Popen([sys.executable, __file__, "--child", str(threads), str(jobs_per_thread)],
+                         env=env, cwd=BASE_DIR, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+        for _ in range(processes)
+    ]
+    results = [json.loads(p.communicate()[0].strip().splitlines()[-1]) for p in procs]
+    elapsed = time.perf_counter() - start
+    totals = {k: sum(r[k] for r in results) for k in ("done", "locked", "other")}
+    totals["jobs_per_s"] = totals["done"] / max(max(r["elapsed"] for r in results), 1e-9)
+    totals["wall"] = elapsed
+    return totals
+
+
+def main():
+    threads = int(sys.argv[1]) if len(sys.argv) > 1 else 16
+    jobs_per_thread = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+    processes = int(sys.argv[3]) if len(sys.argv) > 3 else 2
+    print(f"{processes} processes x {threads} threads x {jobs_per_thread} create+accept")
+    print(f"{'mode':8} {'ok':>6} {'locked':>7} {'other':>6} {'jobs/s':>8}")
+    for name, tuned in (("stock", False), ("tuned", True)):
+        r = run_mode(tuned, threads, jobs_per_thread, processes)
+        print(f"{name:8} {r['done']:6d} {r['locked']:7d} {r['other']:6d} {r['jobs_per_s']:8.1f}")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "--child":
+        child(int(sys.argv[2]), int(sys.argv[3]))
+    else:
+        main()
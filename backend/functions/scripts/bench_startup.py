@@ -0,0 +1,64 @@
+"""
+Import time of `main` and time from launching uvicorn until /readyz reports
+ready (uvicorn only starts accepting once the lifespan warm-up has finished).
+
+Usage: python scripts/bench_startup.py [runs]
+"""
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def import_time(env):
+    start = time.perf_counter()
+    subprocess.run([sys.executable, "-c", "import main"], cwd=BASE_DIR, env=env, check=True,
+                   stderr=subprocess.DEVNULL)
+    return time.perf_counter() - start
+
+
+def server_startup(env):
+    port = free_port()
+    start = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=BASE_DIR, env=env, stderr=subprocess.DEVNULL,
+    )
+    ready = None
+    try:
+        while ready is None and time.perf_counter() - start < 60:
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{port}/readyz", timeout=1) as resp:
+                    if resp.status == 200:
+                        ready = time.perf_counter() - start
+            except OSError:
+                time.sleep(0.01)
+    finally:
+        server.terminate()
+        server.wait()
+    return ready
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    env = dict(os.environ, DATABASE_URL=f"sqlite:///{tempfile.mkdtemp()}/bench.db")
+    imports = [import_time(env) for _ in range(runs)]
+    boots = [server_startup(env) for _ in range(runs)]
+    print(f"import main:         median {statistics.median(imports) * 1000:7.1f} ms  (n={runs})")
+    print(f"/readyz ready:       median {statistics.median(boots) * 1000:7.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
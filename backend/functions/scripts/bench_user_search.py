@@ -0,0 +1,123 @@
+"""
+Latency of the admin user search (GET /api/admin/users/search) against a
+seeded users table, next to the LIKE '%q%' scan it replaces.
+
+Seeds synthetic users (a third of them partners with a business name and
+city) through the normal insert path, so the user_search triggers build the
+index, then times one 50-row page per query: the ranked search plus loading
+the users, as the route does. Broad queries ("gmail", a common first name)
+match hundreds of thousands of users and are the ones to watch.
+
+Usage: python scripts/bench_user_search.py [users]
+"""
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ["DATABASE_URL"] = f"sqlite:///{tempfile.mkdtemp()}/bench.db"
+os.environ.setdefault("DB_SLOW_SESSION_MS", "600000")
+
+from sqlalchemy import or_
+from sqlalchemy.orm import joinedload
+
+from app import models, search, startup
+from app.database import SessionLocal, get_engine
+
+FIRST = [a + b for a in ("Ma", "Jo", "An", "Li", "Ka", "Sa", "Da", "El", "Ro", "Ni", "Te", "Vi", "Ha", "Mi", "Pa")
+         for b in ("ria", "hn", "na", "am", "ren", "ra", "vid", "lis", "bert", "kos", "resa", "ktor", "ssan", "chel")]
+LAST = [a + b + c for a in ("Sil", "Okon", "Mendo", "Ivan", "Nakam", "Schmi", "Kowal", "Ander", "Rossi", "Patel")
+        for b in ("va", "kwo", "za", "ov", "ura", "dt", "ski", "sen", "ni", "el")
+        for c in ("", "son", "ez", "ich", "berg", "o", "a", "ley", "man", "ton")]
+DOMAINS = ("gmail.com", "yahoo.com", "outlook.com", "mail.example.com")
+CITIES = [a + b for a in ("Port", "Lake", "New", "San", "Fort", "East", "North", "Saint") for b in
+          ("ville", " Haven", "ford", "wood", " Rock", "mouth", " Springs", "field")]
+TRADES = ("Cleaning", "Sparkle", "Shine", "Fresh", "Home Care", "Maids", "Clean Co", "Services")
+
+
+def seed(users: int):
+    rng = random.Random(7)
+    batch = 20_000
+    with get_engine().begin() as conn:
+        for start in range(1, users + 1, batch):
+            rows, profiles = [], []
+            for i in range(start, min(start + batch, users + 1)):
+                first, last = rng.choice(FIRST), rng.choice(LAST)
+                partner = i % 3 == 0
+                rows.append({
+                    "id": i, "full_name": f"{first} {last}", "phone": f"9{i:09d}",
+                    "email": f"{first.lower()}.{last.lower()}{i}@{rng.choice(DOMAINS)}",
+                    "hashed_password": "x", "role": "individual_partner" if partner else "user",
+                })
+                if partner:
+                    profiles.append({
+                        "user_id": i, "business_type": "individual", "city": rng.choice(CITIES),
+                        "business_name": f"{last} {rng.choice(TRADES)}",
+                    })
+            conn.execute(models.User.__table__.insert(), rows)
+            conn.execute(models.PartnerProfile.__table__.insert(), profiles)
+
+
+def page(db, q: str, limit: int = 50):
+    hits = search.search(db, q, limit)
+    return db.query(models.User).options(joinedload(models.User.partner_profile)).filter(
+        models.User.id.in_([hit.user_id for hit in hits])
+    ).all()
+
+
+def like_scan(db, q: str, limit: int = 50):
+    pattern = f"%{q}%"
+    return db.query(models.User).outerjoin(models.PartnerProfile).filter(or_(
+        models.User.full_name.ilike(pattern), models.User.email.ilike(pattern), models.User.phone.like(pattern),
+        models.PartnerProfile.business_name.ilike(pattern), models.PartnerProfile.city.ilike(pattern),
+    )).limit(limit).all()
+
+
+def timed(fn, db, q: str, runs: int):
+    samples = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        found = len(fn(db, q))
+        samples.append((time.perf_counter() - started) * 1000)
+    samples.sort()
+    return found, statistics.median(samples), samples[int(len(samples) * 0.95) - 1]
+
+
+def main():
+    users = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    startup.prepare_database()
+    started = time.perf_counter()
+    seed(users)
+    print(f"{users} users seeded and indexed in {time.perf_counter() - started:.1f}s")
+
+    db = SessionLocal()
+    sample = db.get(models.User, users // 2 - users // 2 % 3)  # a partner
+    first, last = sample.full_name.lower().split()
+    queries = {
+        "first name": first,
+        "full name": f"{first} {last}",
+        "name prefixes": f"{first[:3]} {last[:5]}",
+        "email": sample.email,
+        "email prefix": sample.email[:len(first) + 4],
+        "phone": f"+{sample.phone[:1]} {sample.phone[1:4]} {sample.phone[4:7]}",
+        "business": sample.partner_profile.business_name.lower(),
+        "city": sample.partner_profile.city.lower(),
+        "domain": "gmail",
+        "two letters": "ma",
+        "no match": "zzzzzz",
+    }
+    try:
+        print(f"  {'query':<13} {'hits':>5} {'index p50':>10} {'p95':>8} {'LIKE p50':>10}")
+        for label, q in queries.items():
+            found, p50, p95 = timed(page, db, q, runs=50)
+            _, like_p50, _ = timed(like_scan, db, q, runs=3)
+            print(f"  {label:<13} {found:5d} {p50:8.2f}ms {p95:6.2f}ms {like_p50:8.1f}ms")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+"""
+Cross-worker websocket delivery: starts a bus broker and several worker
+processes, each holding simulated sockets for its share of the users, then
+has every worker send personal messages to random users. Reports how long a
+message takes to reach a socket in another process, and how many bus
+operations each worker received (routing sends each one only to the process
+that holds the user, instead of to everyone).
+
+Timestamps are time.monotonic(), which is system-wide on Linux, so latencies
+compare across processes on one host.
+
+Usage: python scripts/bench_ws_bus.py [workers] [users] [messages per worker] [unix|postgres]
+"""
+import asyncio
+import json
+import multiprocessing
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import bus
+from app.database import SQLALCHEMY_DATABASE_URL
+from app.routes.ws import ConnectionManager
+
+SEND_INTERVAL_SECONDS = 0.0005
+
+
+class FakeWebSocket:
+    def __init__(self, latencies):
+        self.latencies = latencies
+
+    async def send_text(self, text):
+        message = json.loads(text)
+        self.latencies.append((message["from"], time.monotonic() - message["sentAt"]))
+
+    async def close(self, code=1000):
+        pass
+
+
+def _transport(kind, path):
+    if kind == "postgres":
+        return bus.PostgresTransport(SQLALCHEMY_DATABASE_URL)
+    return bus.UnixSocketTransport(path)
+
+
+async def _worker(index, workers, users, messages, kind, path, barrier, results):
+    manager = ConnectionManager()
+    await manager.start_bus(bus.MessageBus(_transport(kind, path), process_id=f"w{index}"))
+    latencies = []
+    local = [user_id for user_id in range(users) if user_id % workers == index]
+    for user_id in local:
+        manager.register(FakeWebSocket(latencies), user_id)
+    while len(manager.bus.routes) < users - len(local):
+        await asyncio.sleep(0.01)
+    await asyncio.get_running_loop().run_in_executor(None, barrier.wait)
+
+    rng = random.Random(index)
+    started = time.monotonic()
+    for _ in range(messages):
+        await manager.send_personal_message(
+            {"type": "location_update", "from": index, "sentAt": time.monotonic()}, rng.randrange(users)
+        )
+        await asyncio.sleep(SEND_INTERVAL_SECONDS)
+    elapsed = time.monotonic() - started
+    await asyncio.get_running_loop().run_in_executor(None, barrier.wait)
+    await asyncio.sleep(1.0)  # let the last batches land
+
+    remote = [latency for sender, latency in latencies if sender != index]
+    results.put({"index": index, "elapsed": elapsed, "received": len(latencies), "remote": remote,
+                 "bus": manager.bus.stats()})
+    await manager.stop_bus()
+    manager.shutdown()
+
+
+def worker(*args):
+    asyncio.run(_worker(*args))
+
+
+def broker(path):
+    asyncio.run(bus._serve_forever(path))
+
+
+def percentiles(samples):
+    samples = sorted(samples)
+    p = lambda q: samples[min(int(q * len(samples)), len(samples) - 1)] * 1000
+    return f"p50 {statistics.median(samples) * 1000:6.2f} ms  p99 {p(0.99):6.2f} ms  max {samples[-1] * 1000:6.2f} ms"
+
+
+def main():
+    workers = int(sys.argv[1]) if len(sys.argv) > 1 else 4
+    users = int(sys.argv[2]) if len(sys.argv) > 2 else 2_000
+    messages = int(sys.argv[3]) if len(sys.argv) > 3 else 5_000
+    kind = sys.argv[4] if len(sys.argv) > 4 else "unix"
+
+    path = os.path.join(tempfile.mkdtemp(), "bus.sock")
+    broker_process = None
+    if kind == "unix":
+        broker_process = multiprocessing.Process(target=broker, args=(path,), daemon=True)
+        broker_process.start()
+        while not os.path.exists(path):
+            time.sleep(0.01)
+
+    barrier = multiprocessing.Barrier(workers)
+    results = multiprocessing.Queue()
+    processes = [
+        multiprocessing.Process(target=worker, args=(i, workers, users, messages, kind, path, barrier, results))
+        for i in range(workers)
+    ]
+    for process in processes:
+        process.start()
+    reports = sorted((results.get(timeout=300) for _ in processes), key=lambda r: r["index"])
+    for process in processes:
+        process.join()
+    if broker_process is not None:
+        broker_process.terminate()
+
+    sent = workers * messages
+    received = sum(r["received"] for r in reports)
+    remote = [latency for r in reports for latency in r["remote"]]
+    rate = sent / max(r["elapsed"] for r in reports)
+    print(f"{workers} workers over {kind}, {users} users, {sent} personal messages ({rate:,.0f}/s offered)")
+    print(f"delivered {received}/{sent}, cross-worker {len(remote)}: {percentiles(remote)}")
+    for r in reports:
+        stats = r["bus"]
+        print(f"  w{r['index']}: bus ops sent {stats['ops_sent']:6d} in {stats['payloads_sent']:5d} payloads, "
+              f"frames received {stats['frames_received']:6d} (of {sent - messages} sent by the other workers)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+"""
+Websocket fan-out with a few slow clients: broadcasts to many simulated
+sockets through the queued ConnectionManager, against the previous one-by-one
+`await send_json` loop.
+
+Sockets are in-process fakes: a normal one yields once per frame, a slow one
+takes SLOW_SEND_SECONDS per frame and a stalled one never completes a send.
+The last section sends a burst of location updates for one job to a client
+that is slower than the update rate, to show coalescing.
+
+Usage: python scripts/bench_ws_fanout.py [sockets] [broadcasts]
+"""
+import asyncio
+import json
+import os
+import statistics
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.routes.ws import ConnectionManager
+
+SLOW_SOCKETS = 5
+STALLED_SOCKETS = 2
+SLOW_SEND_SECONDS = 0.05
+
+
+class FakeWebSocket:
+    def __init__(self, delay=0.0, stalled=False):
+        self.delay = delay
+        self.stalled = stalled
+        self.received = 0
+        self.last = None
+        self.latencies = []
+        self.closed = False
+
+    async def send_text(self, text):
+        if self.stalled:
+            await asyncio.Event().wait()
+        await asyncio.sleep(self.delay)
+        self.received += 1
+        self.last = text
+        self.latencies.append(time.perf_counter() - json.loads(text)["sentAt"])
+
+    async def send_json(self, message):
+        await self.send_text(json.dumps(message, separators=(",", ":")))
+
+    async def close(self, code=1000):
+        self.closed = True
+
+
+def sockets(count, stalled=True):
+    fast = [FakeWebSocket() for _ in range(count - SLOW_SOCKETS - STALLED_SOCKETS)]
+    slow = [FakeWebSocket(delay=SLOW_SEND_SECONDS) for _ in range(SLOW_SOCKETS)]
+    # The old loop would wait forever on a stalled socket, so it gets slow ones instead.
+    stuck = [FakeWebSocket(stalled=stalled, delay=SLOW_SEND_SECONDS) for _ in range(STALLED_SOCKETS)]
+    # Slow clients sit in the middle of the fan-out order, where they hurt the old loop most.
+    middle = len(fast) // 2
+    return fast, slow + stuck, fast[:middle] + slow + stuck + fast[middle:]
+
+
+def percentiles(samples):
+    samples = sorted(samples)
+    p = lambda q: samples[min(int(q * len(samples)), len(samples) - 1)] * 1000
+    return f"p50 {statistics.median(samples) * 1000:8.1f} ms  p99 {p(0.99):8.1f} ms  max {samples[-1] * 1000:8.1f} ms"
+
+
+async def sequential(count, broadcasts):
+    fast, _, ordered = sockets(count, stalled=False)
+    started = time.perf_counter()
+    for i in range(broadcasts):
+        message = {"type": "announcement", "n": i, "sentAt": time.perf_counter()}
+        for websocket in ordered:
+            await websocket.send_json(message)
+    elapsed = time.perf_counter() - started
+    latencies = [latency for websocket in fast for latency in websocket.latencies]
+    print(f"sequential  {broadcasts} broadcasts in {elapsed:6.2f}s  fast-client delivery {percentiles(latencies)}")
+
+
+async def queued(count, broadcasts):
+    manager = ConnectionManager(queue_size=32, send_timeout=1.0)
+    fast, slow, ordered = sockets(count)
+    for user_id, websocket in enumerate(ordered):
+        manager.register(websocket, user_id)
+    started = time.perf_counter()
+    fan_out = []
+    for i in range(broadcasts):
+        t0 = time.perf_counter()
+        await manager.broadcast({"type": "announcement", "n": i, "sentAt": t0})
+        fan_out.append(time.perf_counter() - t0)
+        await asyncio.sleep(0)
+    while any(websocket.received < broadcasts for websocket in fast):
+        await asyncio.sleep(0.01)
+    elapsed = time.perf_counter() - started
+    latencies = [latency for websocket in fast for latency in websocket.latencies]
+    print(f"queued      {broadcasts} broadcasts in {elapsed:6.2f}s  fast-client delivery {percentiles(latencies)}")
+    print(f"            broadcast() call {percentiles(fan_out)}")
+    await asyncio.sleep(1.5)
+    stats = manager.stats()
+    print(f"            slow/stalled clients evicted: {sum(w.closed for w in slow)}/{len(slow)}  "
+          f"sent {stats['sent']}  evicted {stats['evicted']}")
+    manager.shutdown()
+
+
+async def coalescing(updates=1000, interval=0.001):
+    manager = ConnectionManager(send_timeout=5.0)
+    websocket = FakeWebSocket(delay=SLOW_SEND_SECONDS)
+    manager.register(websocket, 1)
+    for i in range(updates):
+        await manager.send_personal_message(
+            {"type": "location_update", "jobId": 1, "data": {"i": i}, "sentAt": time.perf_counter()}, 1,
+            coalesce=("location_update", 1),
+        )
+        await asyncio.sleep(interval)
+    while manager.active_connections[1][0].queue:
+        await asyncio.sleep(0.01)
+    await asyncio.sleep(SLOW_SEND_SECONDS * 2)
+    print(f"coalescing  {updates} location updates to a {SLOW_SEND_SECONDS * 1000:.0f} ms/frame client: "
+          f"{websocket.received} frames sent, {manager.coalesced} coalesced, "
+          f"last position is update {json.loads(websocket.last)['data']['i']}")
+    manager.shutdown()
+
+
+async def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10_000
+    broadcasts = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+    print(f"{count} sockets, {SLOW_SOCKETS + STALLED_SOCKETS} slow ({SLOW_SEND_SECONDS * 1000:.0f} ms/frame "
+          f"or stalled)")
+    await sequential(count, min(broadcasts, 5))
+    await queued(count, broadcasts)
+    await coalescing()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,66 @@
+import os
+import tempfile
+import uuid
+from datetime import timedelta
+
+import pytest
+
+# Point the app at a throwaway SQLite file before anything imports app.database.
+_TEST_DB_DIR = tempfile.mkdtemp(prefix="clenzy-tests-")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{_TEST_DB_DIR}/clenzy_test.db")
+# Minimum bcrypt cost keeps signup/login tests fast.
+os.environ.setdefault("BCRYPT_ROUNDS", "4")
+# Fail any request that runs more queries than its route's budget (N+1 guard).
+os.environ.setdefault("DB_QUERY_BUDGET_ENFORCE", "1")
+
+
+@pytest.fixture(scope="session", autouse=True)
+def _schema():
+    # Module-level TestClients don't run the app lifespan, so create the schema here.
+    from app import startup
+
+    startup.prepare_database()
+
+
+@pytest.fixture
+def create_user():
+    """Factory for users written straight to the database, skipping signup and bcrypt."""
+    from app import models
+    from app.database import SessionLocal
+
+    def create(role="user", full_name="Test User", email=None, phone=None, profile=None):
+        db = SessionLocal()
+        try:
+            user = models.User(
+                full_name=full_name,
+                email=email or f"{uuid.uuid4().hex}@example.com",
+                phone=phone or uuid.uuid4().hex[:12],
+                hashed_password="not-a-real-hash",
+                role=role,
+            )
+            db.add(user)
+            db.flush()
+            if profile is not None:
+                db.add(models.PartnerProfile(user_id=user.id, **profile))
+            db.commit()
+            db.refresh(user)
+            return user
+        finally:
+            db.close()
+
+    return create
+
+
+@pytest.fixture
+def auth_headers():
+    """Factory for a short-lived bearer token header for a user, plus any extra headers."""
+    from app import auth
+
+    def headers(user, **extra):
+        token = auth.create_access_token(
+            data={"email": user.email, "role": user.role, "user_id": user.id},
+            expires_delta=timedelta(minutes=5),
+        )
+        return {"Authorization": f"Bearer {token}", **extra}
+
+    return headers
@@ -0,0 +1,158 @@
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+
+from fastapi.testclient import TestClient
+
+from main import app
+from app import analytics, database, models
+from app.database import SessionLocal
+
+
+client = TestClient(app)
+
+
+def _totals(points):
+    return {name: sum(point[name] for point in points) for name in ("created", "accepted", "completed", "revenue")}
+
+
+def test_lifecycle_writes_feed_hourly_and_daily_points(create_user, auth_headers):
+    admin, customer, worker = create_user("admin"), create_user(), create_user("individual_partner")
+    service = f"Service {uuid.uuid4().hex[:8]}"
+    jobs = [client.post("/api/bookings/", headers=auth_headers(customer), json={
+        "service_type": service, "price": 25.5, "workers_needed": 1, "latitude": 6.0, "longitude": 6.0,
+        "address": "6 Chart Street", "city": "Chartville",
+    }).json() for _ in range(3)]
+    for job in jobs[:2]:
+        client.post(f"/api/bookings/{job['id']}/accept", headers=auth_headers(worker))
+    client.post(f"/api/bookings/{jobs[0]['id']}/verify-otp", headers=auth_headers(worker), params={"otp": jobs[0]["otp"]})
+
+    for period in ("hour", "day"):
+        response = client.get("/api/admin/analytics/jobs", headers=auth_headers(admin),
+                              params={"period": period, "service_type": service})
+        assert response.status_code == 200
+        points = response.json()["points"]
+        assert len(points) == (48 if period == "hour" else 30)
+        assert _totals(points) == {"created": 3, "accepted": 2, "completed": 1, "revenue": 25.5}
+        [latest] = [point for point in points if point["accepted"]]
+        assert latest["p50_seconds"] is not None and latest["accept_mean_seconds"] is not None
+        assert latest == points[-1]
+
+    rows = client.get("/api/admin/analytics/breakdown", headers=auth_headers(admin), params={"by": "service_type"}).json()["rows"]
+    [row] = [row for row in rows if row["key"] == service]
+    assert (row["created"], row["completed"], row["revenue_minor"]) == (3, 1, 2550)
+
+
+def test_all_rows_are_spread_over_shards(create_user, auth_headers):
+    admin, customer = create_user("admin"), create_user()
+    service = f"Sharded {uuid.uuid4().hex[:8]}"
+    for _ in range(12):
+        client.post("/api/bookings/", headers=auth_headers(customer), json={
+            "service_type": service, "price": 5.0, "workers_needed": 1, "latitude": 6.0, "longitude": 6.0,
+            "address": "6 Shard Street", "city": "Shardville",
+        })
+
+    db = SessionLocal()
+    try:
+        rollup = models.JobRollup
+        rows = db.query(rollup).filter(rollup.period == "day", rollup.service_type == service).all()
+    finally:
+        db.close()
+    assert {row.shard for row in rows if row.city == "Shardville"} == {0}
+    assert len({row.shard for row in rows if row.city == analytics.ALL}) > 1
+    points = client.get("/api/admin/analytics/jobs", headers=auth_headers(admin),
+                        params={"period": "day", "service_type": service}).json()["points"]
+    assert _totals(points)["created"] == 12
+
+
+def _job(customer, **values):
+    return models.Job(customer_id=customer.id, price=10.0, otp="1234", workers_needed=1, latitude=7.0,
+                      longitude=7.0, address="7 History Lane", **values)
+
+
+def test_catch_up_rebuilds_days_from_jobs(create_user):
+    customer = create_user()
+    service = f"Backfill {uuid.uuid4().hex[:8]}"
+    day = date(2026, 3, 14)
+    created = datetime(2026, 3, 14, 9, 30)
+    db = SessionLocal()
+    try:
+        # Written straight to the table, as an import or a bug would: no rollups.
+        db.add_all([
+            _job(customer, service_type=service, city="Oldtown", status="completed", created_at=created,
+                 accepted_at=created + timedelta(seconds=40), completed_at=created + timedelta(hours=2)),
+            _job(customer, service_type=service, city="Oldtown", status="accepted", created_at=created,
+                 accepted_at=created + timedelta(seconds=100)),
+            _job(customer, service_type=service, status="searching", created_at=created - timedelta(days=1)),
+        ])
+        db.commit()
+
+        assert dict(analytics.catch_up(SessionLocal, days=2, today=day))[day] > 0
+        assert dict(analytics.catch_up(SessionLocal, days=2, today=day)) == {day: 0, day - timedelta(days=1): 0}
+
+        hours = analytics.series(db, "hour", created, created + timedelta(hours=2), service_type=service)
+        assert [(p["created"], p["accepted"], p["completed"]) for p in hours] == [(2, 2, 0), (0, 0, 0), (0, 0, 1)]
+        assert hours[0]["accept_mean_seconds"] == 70.0
+        assert 30 <= hours[0]["p50_seconds"] <= 45 and 90 <= hours[0]["p90_seconds"] <= 120
+
+        [oldtown] = [row for row in analytics.breakdown(db, "city", "day", created - timedelta(days=1), created)
+                     if row["key"] == "Oldtown"]
+        assert (oldtown["created"], oldtown["revenue_minor"]) == (2, 1000)
+    finally:
+        db.close()
+
+
+def test_concurrent_catch_ups_correct_each_day_once(create_user):
+    customer = create_user()
+    service = f"Racing {uuid.uuid4().hex[:8]}"
+    day, created = date(2026, 4, 1), datetime(2026, 4, 1, 12, 0)
+    db = SessionLocal()
+    try:
+        db.add_all([_job(customer, service_type=service, status="searching", created_at=created) for _ in range(3)])
+        db.commit()
+
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            runs = list(pool.map(lambda _: dict(analytics.catch_up(SessionLocal, days=1, today=day)), range(4)))
+        assert sorted(run[day] > 0 for run in runs) == [False, False, False, True]
+        [point] = analytics.series(db, "day", created, created, service_type=service)
+        assert point["created"] == 3
+    finally:
+        db.close()
+
+
+def test_live_writes_do_not_wait_for_the_catch_up(create_user):
+    customer = create_user()
+    day = datetime.utcnow().date()
+    catching_up, live = SessionLocal(), SessionLocal()
+    try:
+        assert database.begin_reconcile_snapshot(catching_up, "analytics.catch_up")
+        stored = analytics._stored(catching_up, day).counters
+
+        started = time.perf_counter()
+        job = _job(customer, service_type="Live", status="searching")
+        live.add(job)
+        live.flush()
+        analytics.job_created(live, [job])
+        live.commit()
+        assert time.perf_counter() - started < 1
+
+        # The catch-up keeps reading its snapshot.
+        assert analytics._stored(catching_up, day).counters == stored
+    finally:
+        catching_up.close()
+        live.close()
+
+
+def test_percentiles_interpolate_within_histogram_buckets():
+    # 10 acceptances in (0, 5] s and 10 in (60, 90] s.
+    result = analytics._percentiles({0: 10, analytics.latency_bucket(75): 10})
+    assert result == {"p50_seconds": 5.0, "p90_seconds": 84.0, "p99_seconds": 89.4}
+    assert analytics._percentiles({})["p50_seconds"] is None
+
+
+def test_range_limits_and_admin_only(create_user, auth_headers):
+    admin, user = create_user("admin"), create_user()
+    too_long = {"period": "hour", "start": "2026-01-01T00:00:00", "end": "2026-06-01T00:00:00"}
+    assert client.get("/api/admin/analytics/jobs", headers=auth_headers(admin), params=too_long).status_code == 400
+    assert client.get("/api/admin/analytics/jobs", headers=auth_headers(user)).status_code == 403
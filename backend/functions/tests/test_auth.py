@@ -0,0 +1,124 @@
+import asyncio
+import os
+import signal
+import uuid
+
+from fastapi.testclient import TestClient
+
+from main import app
+from app import auth, hashing, models
+from app.database import SessionLocal
+
+
+client = TestClient(app)
+
+
+def test_current_user_is_served_from_principal_cache(create_user, auth_headers):
+    user = create_user()
+    headers = auth_headers(user)
+    auth.principal_cache.clear()
+    hits_before = auth.principal_cache.hits
+
+    first = client.get("/api/users/me", headers=headers)
+    second = client.get("/api/users/me", headers=headers)
+
+    assert first.status_code == 200, first.text
+    assert second.json() == first.json()
+    assert auth.principal_cache.hits == hits_before + 1
+
+
+def test_toggle_user_status_invalidates_cached_principal(create_user, auth_headers):
+    admin = create_user(role="admin")
+    user = create_user()
+    headers = auth_headers(user)
+
+    assert client.get("/api/users/me", headers=headers).json()["is_active"] is True
+
+    resp = client.put(
+        f"/api/admin/users/{user.id}/status",
+        params={"is_active": False},
+        headers=auth_headers(admin),
+    )
+    assert resp.status_code == 200, resp.text
+    assert client.get("/api/users/me", headers=headers).json()["is_active"] is False
+
+
+def test_wallet_route_authenticates_from_token_claims(create_user, auth_headers):
+    user = create_user(role="individual_partner")
+    resp = client.get("/api/wallet/balance", headers=auth_headers(user))
+    assert resp.status_code == 200
+    assert resp.json() == {"balance": 0.0, "total_earnings": 0.0}
+
+
+def test_token_only_routes_follow_status_and_role_changes(create_user, auth_headers):
+    admin, user = create_user(role="admin"), create_user()
+    headers = auth_headers(user)
+    assert client.post("/api/bookings/1/accept", headers=headers).status_code == 403
+
+    # Role upgraded behind the cache's back (e.g. scripts/create_admin.py): the
+    # stale token claim no longer decides once the entry is refreshed.
+    db = SessionLocal()
+    try:
+        db.query(models.User).filter(models.User.id == user.id).update({models.User.role: "individual_partner"})
+        db.commit()
+    finally:
+        db.close()
+    auth.principal_cache.clear()
+    assert client.post("/api/bookings/999999999/accept", headers=headers).status_code == 404
+
+    client.put(f"/api/admin/users/{user.id}/status", params={"is_active": False}, headers=auth_headers(admin))
+    assert client.get("/api/wallet/balance", headers=headers).status_code == 403
+    assert client.get("/api/bookings/customer", headers=headers).status_code == 403
+
+
+def test_login_rehashes_password_with_outdated_cost():
+    db = SessionLocal()
+    try:
+        user = models.User(
+            full_name="Rehash Test",
+            email=f"{uuid.uuid4().hex}@example.com",
+            phone=uuid.uuid4().hex[:12],
+            hashed_password=hashing.hash_password("s3cret-pass", rounds=hashing.BCRYPT_ROUNDS + 1),
+        )
+        db.add(user)
+        db.commit()
+        user_id = user.id
+        email = user.email
+    finally:
+        db.close()
+
+    resp = client.post("/api/users/login", json={"email": email, "password": "s3cret-pass"})
+    assert resp.status_code == 200, resp.text
+
+    db = SessionLocal()
+    try:
+        stored = db.query(models.User).filter(models.User.id == user_id).one().hashed_password
+    finally:
+        db.close()
+    assert hashing.hash_cost(stored) == hashing.BCRYPT_ROUNDS
+    assert hashing.check_password("s3cret-pass", stored)
+
+
+def test_login_returns_503_when_hashing_queue_is_full(create_user, monkeypatch):
+    saturated = hashing.HashingEngine(workers=1, queue_limit=0)
+    saturated._in_flight = saturated.capacity
+    monkeypatch.setattr(hashing, "hasher", saturated)
+
+    user = create_user()
+    resp = client.post("/api/users/login", json={"email": user.email, "password": "x"})
+    assert resp.status_code == 503
+    assert resp.headers["retry-after"] == "1"
+
+
+def test_hashing_engine_replaces_a_broken_pool():
+    engine = hashing.HashingEngine(workers=1, queue_limit=0, rounds=4)
+    engine.start()
+    try:
+        for process in list(engine._executor._processes.values()):
+            os.kill(process.pid, signal.SIGKILL)
+            process.join()
+        hashed = asyncio.run(engine.hash("after-a-crash"))
+        assert hashing.check_password("after-a-crash", hashed)
+        assert engine.restarts == 1
+    finally:
+        engine.shutdown()
@@ -0,0 +1,219 @@
+import asyncio
+import random
+
+import httpx
+from sqlalchemy import event
+from fastapi.testclient import TestClient
+
+from main import app
+from app import database, geo, models
+from app.database import SessionLocal, get_engine
+
+
+client = TestClient(app)
+
+
+def _post_job(auth_headers, customer, service_type, latitude, longitude):
+    response = client.post("/api/bookings/", headers=auth_headers(customer), json={
+        "service_type": service_type,
+        "price": 40.0,
+        "workers_needed": 1,
+        "latitude": latitude,
+        "longitude": longitude,
+        "address": "1 Test Street",
+    })
+    assert response.status_code == 200
+    return response.json()["id"]
+
+
+def test_available_jobs_respect_radius_services_and_distance_order(create_user, auth_headers):
+    # A spot no other test posts jobs near.
+    lat, lon = random.uniform(-60, 60), random.uniform(-170, 170)
+    customer = create_user()
+    partner = create_user(role="worker")
+    db = SessionLocal()
+    try:
+        db.add(models.PartnerProfile(user_id=partner.id, service_radius=10.0, selected_services=["Cleaning"]))
+        db.commit()
+    finally:
+        db.close()
+
+    km = 1 / geo.KM_PER_DEGREE_LAT
+    far = _post_job(auth_headers, customer, "Cleaning", lat + 8 * km, lon)
+    near = _post_job(auth_headers, customer, "cleaning", lat + 1 * km, lon)
+    _post_job(auth_headers, customer, "Cleaning", lat + 25 * km, lon)  # outside the radius
+    _post_job(auth_headers, customer, "Plumbing", lat + 2 * km, lon)  # service not selected
+
+    response = client.get(
+        "/api/bookings/available",
+        params={"latitude": lat, "longitude": lon},
+        headers=auth_headers(partner),
+    )
+    assert response.status_code == 200
+    jobs = response.json()
+    assert [job["id"] for job in jobs] == [near, far]
+    assert jobs[0]["distance_km"] < jobs[1]["distance_km"] <= 10.0
+
+    limited = client.get(
+        "/api/bookings/available",
+        params={"latitude": lat, "longitude": lon, "limit": 1},
+        headers=auth_headers(partner),
+    )
+    assert [job["id"] for job in limited.json()] == [near]
+    rest = client.get(
+        "/api/bookings/available",
+        params={"latitude": lat, "longitude": lon, "limit": 1, "cursor": limited.headers["X-Next-Cursor"]},
+        headers=auth_headers(partner),
+    )
+    assert [job["id"] for job in rest.json()] == [far]
+    assert "X-Next-Cursor" not in rest.headers
+
+
+def test_dense_nearby_pages_are_bounded_and_wrap_the_antimeridian(create_user, auth_headers):
+    rng = random.Random(11)
+    lat, lon = rng.uniform(-50, 50), 179.97
+    customer = create_user()
+    partner = create_user(role="worker", profile={"service_radius": 10.0, "selected_services": ["Dense"]})
+    spots = [(lat + rng.uniform(-0.06, 0.06), lon + rng.uniform(-0.08, 0.08)) for _ in range(40)]
+    spots = [(plat, plon - 360 if plon >= 180 else plon) for plat, plon in spots]
+    created = client.post("/api/bookings/bulk", headers=auth_headers(customer), json={"jobs": [
+        {"service_type": "Dense", "price": 10.0, "workers_needed": 1, "latitude": plat, "longitude": plon,
+         "address": "Dateline"} for plat, plon in spots
+    ]}).json()["created"]
+    expected = sorted(
+        (geo.haversine_km(lat, lon, plat, plon), item["id"])
+        for item, (plat, plon) in zip(created, spots) if geo.haversine_km(lat, lon, plat, plon) <= 10.0
+    )
+    assert any(plon < 0 for plat, plon in spots)
+
+    statements = []
+    listen = lambda conn, cursor, statement, *args: statements.append(statement)
+    engine = database.get_async_engine().sync_engine if database.DB_ASYNC_ROUTES else get_engine()
+    event.listen(engine, "before_cursor_execute", listen)
+    try:
+        seen, cursor = [], None
+        while True:
+            params = {"latitude": lat, "longitude": lon, "limit": 4, **({"cursor": cursor} if cursor else {})}
+            response = client.get("/api/bookings/available", params=params, headers=auth_headers(partner))
+            assert response.status_code == 200
+            seen += [job["id"] for job in response.json()]
+            cursor = response.headers.get("X-Next-Cursor")
+            if not cursor:
+                break
+    finally:
+        event.remove(engine, "before_cursor_execute", listen)
+    assert seen == [job_id for _, job_id in expected]
+    nearby = [statement for statement in statements if "geo_cell IN" in statement]
+    assert nearby and all("LIMIT" in statement for statement in nearby)
+
+
+def test_grid_index_matches_brute_force():
+    rng = random.Random(7)
+    index = geo.GridIndex()
+    points = {i: (rng.uniform(40.0, 41.0), rng.uniform(-74.5, -73.5)) for i in range(2000)}
+    for key, (lat, lon) in points.items():
+        index.upsert(key, lat, lon)
+    for key in range(0, 2000, 10):
+        index.remove(key)
+
+    lat, lon = 40.5, -74.0
+    expected = sorted(
+        (geo.haversine_km(lat, lon, plat, plon), key)
+        for key, (plat, plon) in points.items()
+        if key % 10 and geo.haversine_km(lat, lon, plat, plon) <= 12.0
+    )
+    hits = index.nearby(lat, lon, 12.0)
+    assert [key for _, key, _ in hits] == [key for _, key in expected]
+
+
+def test_concurrent_accepts_have_exactly_one_winner(create_user, auth_headers):
+    customer = create_user()
+    job_id = _post_job(auth_headers, customer, "Cleaning", 10.0, 10.0)
+    partners = [create_user(role="worker") for _ in range(200)]
+
+    # One event loop for all requests so they really overlap (and the async
+    # engine's pool stays on a single loop).
+    async def accept_all():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as ac:
+            async def accept(partner):
+                return partner.id, await ac.post(f"/api/bookings/{job_id}/accept", headers=auth_headers(partner))
+            return await asyncio.gather(*(accept(p) for p in partners))
+
+    results = asyncio.run(accept_all())
+
+    winners = [(partner_id, r.json()) for partner_id, r in results if r.status_code == 200]
+    assert len(winners) == 1
+    assert sorted({r.status_code for _, r in results}) == [200, 409]
+    winner_id, body = winners[0]
+    assert body["worker_id"] == winner_id and body["status"] == "accepted"
+
+    db = SessionLocal()
+    try:
+        job = db.get(models.Job, job_id)
+        assert (job.worker_id, job.status) == (winner_id, "accepted")
+    finally:
+        db.close()
+
+
+def test_accept_unknown_job_is_404(create_user, auth_headers):
+    partner = create_user(role="worker")
+    assert client.post("/api/bookings/999999999/accept", headers=auth_headers(partner)).status_code == 404
+
+
+def test_customer_jobs_are_cursor_paginated(create_user, auth_headers):
+    customer = create_user()
+    # Same-second created_at for all of them, so the id tie-breaker matters.
+    posted = [_post_job(auth_headers, customer, "Cleaning", 1.0, 1.0) for _ in range(7)]
+
+    seen, cursor, pages = [], None, 0
+    for _ in range(10):
+        params = {"limit": 3} if cursor is None else {"limit": 3, "cursor": cursor}
+        response = client.get("/api/bookings/customer", params=params, headers=auth_headers(customer))
+        assert response.status_code == 200
+        seen += [job["id"] for job in response.json()]
+        pages += 1
+        cursor = response.headers.get("X-Next-Cursor")
+        if cursor is None:
+            break
+
+    assert pages == 3
+    assert seen == sorted(posted, reverse=True)
+
+
+def test_admin_listings_still_accept_skip(create_user, auth_headers):
+    admin = create_user("admin")
+    first = client.get("/api/admin/users", params={"limit": 4}, headers=auth_headers(admin)).json()
+    skipped = client.get("/api/admin/users", params={"limit": 2, "skip": 1}, headers=auth_headers(admin))
+    assert [user["id"] for user in skipped.json()] == [user["id"] for user in first[1:3]]
+    rest = client.get("/api/admin/users", params={"limit": 1, "cursor": skipped.headers["X-Next-Cursor"]},
+                      headers=auth_headers(admin)).json()
+    assert [user["id"] for user in rest] == [first[3]["id"]]
+
+
+def test_malformed_cursor_is_rejected(create_user, auth_headers):
+    customer = create_user()
+    response = client.get("/api/bookings/customer", params={"cursor": "not-a-cursor"}, headers=auth_headers(customer))
+    assert response.status_code == 400
+
+
+def test_bulk_create_reports_per_item_errors(create_user, auth_headers):
+    customer = create_user()
+    good = {"service_type": "Cleaning", "price": 40.0, "workers_needed": 1,
+            "latitude": 3.0, "longitude": 3.0, "address": "1 Bulk Street"}
+    payload = {"jobs": [good, {**good, "price": "lots"}, dict(good, description="2nd"), "not-a-job"]}
+
+    response = client.post("/api/bookings/bulk", json=payload, headers=auth_headers(customer))
+    assert response.status_code == 200
+    body = response.json()
+    assert [item["index"] for item in body["created"]] == [0, 2]
+    assert [item["index"] for item in body["errors"]] == [1, 3]
+    assert body["errors"][0]["errors"][0]["loc"] == ["price"]
+
+    jobs = client.get("/api/bookings/customer", headers=auth_headers(customer)).json()
+    by_id = {job["id"]: job for job in jobs}
+    assert set(by_id) == {item["id"] for item in body["created"]}
+    for item in body["created"]:
+        assert by_id[item["id"]]["otp"] == item["otp"]
+        assert by_id[item["id"]]["status"] == "searching"
+    assert by_id[body["created"][1]["id"]]["description"] == "2nd"
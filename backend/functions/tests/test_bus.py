@@ -0,0 +1,253 @@
+import asyncio
+import json
+import multiprocessing
+import os
+import tempfile
+
+import pytest
+
+from app import bus, job_participants
+from app.routes.ws import ConnectionManager
+
+
+class FakeWebSocket:
+    def __init__(self):
+        self.frames = []
+
+    async def send_text(self, text):
+        self.frames.append(json.loads(text))
+
+    async def close(self, code=1000):
+        pass
+
+
+async def _until(predicate, timeout=2.0):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not predicate():
+        assert asyncio.get_running_loop().time() < deadline, "timed out"
+        await asyncio.sleep(0.005)
+
+
+def _transports(kind, path):
+    if kind == "memory":
+        hub = {}
+        return lambda: bus.MemoryTransport(hub)
+    return lambda: bus.UnixSocketTransport(path)
+
+
+@pytest.mark.parametrize("kind", ["memory", "unix"])
+def test_messages_reach_users_connected_to_other_processes(kind):
+    async def scenario(path):
+        broker = bus.Broker(path)
+        if kind == "unix":
+            await broker.start()
+        transport = _transports(kind, path)
+        a, b, c = (ConnectionManager() for _ in range(3))
+        for name, manager in zip("ab", (a, b)):
+            await manager.start_bus(bus.MessageBus(transport(), process_id=name, batch_ms=1))
+        socket_a, socket_b = FakeWebSocket(), FakeWebSocket()
+        a.register(socket_a, 1)
+        b.register(socket_b, 2)
+        await _until(lambda: a.is_connected(2) and b.is_connected(1))
+
+        # A process that starts later learns the existing routes from "hello".
+        await c.start_bus(bus.MessageBus(transport(), process_id="c", batch_ms=1))
+        await _until(lambda: c.bus.routes == {1: {"a"}, 2: {"b"}})
+
+        for i in range(50):
+            await a.send_personal_message({"type": "location_update", "i": i}, 2)
+        await c.send_personal_message({"type": "job_offer"}, 1)
+        await c.broadcast({"type": "announcement"})
+        await _until(lambda: len(socket_b.frames) == 51 and len(socket_a.frames) == 2)
+        # Ordered per sender and channel only: C's broadcast may overtake A's sends.
+        assert [f["i"] for f in socket_b.frames if "i" in f] == list(range(50))
+        assert {"type": "announcement"} in socket_b.frames
+        assert sorted(f["type"] for f in socket_a.frames) == ["announcement", "job_offer"]
+
+        # Routed, not broadcast: C saw no send ops, and A's 50 sends went out in few payloads.
+        assert c.bus.stats()["ops_received"] < 10
+        assert a.bus.payloads_sent < 10
+
+        b.disconnect(b.active_connections[2][0])
+        await _until(lambda: not a.is_connected(2))
+        await c.stop_bus()
+        await _until(lambda: "c" not in a.bus.processes)
+        for manager in (a, b):
+            await manager.stop_bus()
+            manager.shutdown()
+        await broker.stop()
+
+    with tempfile.TemporaryDirectory() as directory:
+        asyncio.run(scenario(os.path.join(directory, "bus.sock")))
+
+
+def test_payloads_are_split_under_the_size_limit():
+    message_bus = bus.MessageBus(bus.MemoryTransport({}), process_id="p", batch_bytes=200)
+    ops = [json.dumps(["send", 1, "x" * 40, None]) for _ in range(20)]
+    payloads = list(message_bus._payloads(ops))
+    assert len(payloads) > 1 and all(len(p) <= 200 for p in payloads)
+    assert sum(len(json.loads(p)["ops"]) for p in payloads) == 20
+
+
+class CappedTransport(bus.MemoryTransport):
+    """A memory hub with a NOTIFY-like payload cap that also fails on request."""
+
+    max_payload_bytes = 300
+
+    async def publish(self, channel, payload):
+        assert len(payload.encode()) <= self.max_payload_bytes
+        if "fail" in payload:
+            raise RuntimeError("publish failed")
+        await super().publish(channel, payload)
+
+
+def test_oversized_ops_are_dropped_and_failures_lose_only_their_payload():
+    async def scenario():
+        hub = {}
+        a, b = ConnectionManager(), ConnectionManager()
+        for name, manager in zip("ab", (a, b)):
+            await manager.start_bus(bus.MessageBus(CappedTransport(hub), process_id=name, batch_ms=1))
+        socket_b = FakeWebSocket()
+        b.register(socket_b, 2)
+        await _until(lambda: a.is_connected(2))
+
+        assert a.bus.send(2, json.dumps({"text": "é" * 200})) == 0
+        assert a.bus.stats()["oversized_ops"] == 1
+        # Each of these fills a payload on its own.
+        for text in ("first" + "w" * 150, "fail " + "x" * 150, "last " + "y" * 150):
+            await a.send_personal_message({"text": text}, 2)
+        await _until(lambda: len(socket_b.frames) == 2)
+        assert [frame["text"][:5] for frame in socket_b.frames] == ["first", "last "]
+        assert a.bus.stats()["publish_failures"] == 1
+
+        for manager in (a, b):
+            await manager.stop_bus()
+            manager.shutdown()
+
+    asyncio.run(scenario())
+
+
+def test_silent_peers_expire_and_are_asked_again_when_heard_from():
+    async def scenario():
+        hub = {}
+        a, b = ConnectionManager(), ConnectionManager()
+        for name, manager in zip("ab", (a, b)):
+            await manager.start_bus(bus.MessageBus(bus.MemoryTransport(hub), process_id=name, batch_ms=1,
+                                                   heartbeat_seconds=0.02, peer_timeout_seconds=0.1))
+        b.register(FakeWebSocket(), 2)
+        await _until(lambda: a.is_connected(2))
+
+        # B stops beating, as a process that died without "bye" would.
+        b.bus._heartbeat.cancel()
+        await _until(lambda: not a.is_connected(2))
+        assert "b" not in a.bus.processes and a.bus.stats()["peers_expired"] == 1
+
+        b.bus._enqueue(bus.CONTROL, ["beat"])
+        await _until(lambda: a.is_connected(2))
+
+        for manager in (a, b):
+            await manager.stop_bus()
+            manager.shutdown()
+
+    asyncio.run(scenario())
+
+
+def test_unix_transport_reconnects_and_rebuilds_routes(monkeypatch):
+    monkeypatch.setattr(bus, "WS_BUS_RECONNECT_SECONDS", 0.01)
+
+    async def scenario(path):
+        broker = bus.Broker(path)
+        await broker.start()
+        a, b = ConnectionManager(), ConnectionManager()
+        for name, manager in zip("ab", (a, b)):
+            await manager.start_bus(bus.MessageBus(bus.UnixSocketTransport(path), process_id=name, batch_ms=1))
+        socket_b = FakeWebSocket()
+        b.register(socket_b, 2)
+        await _until(lambda: a.is_connected(2))
+
+        await broker.stop()
+        await asyncio.sleep(0.05)
+        broker = bus.Broker(path)
+        await broker.start()
+        await _until(lambda: a.bus.reconnects == b.bus.reconnects == 1 and a.is_connected(2))
+        await a.send_personal_message({"type": "after_restart"}, 2)
+        await _until(lambda: socket_b.frames == [{"type": "after_restart"}])
+
+        for manager in (a, b):
+            await manager.stop_bus()
+            manager.shutdown()
+        await broker.stop()
+
+    with tempfile.TemporaryDirectory() as directory:
+        asyncio.run(scenario(os.path.join(directory, "bus.sock")))
+
+
+def test_read_your_writes_pins_reach_the_other_processes(monkeypatch):
+    pinned = []
+
+    class RecordingRouter:
+        def mark_write(self, client_key, share=True):
+            pinned.append((client_key, share))
+
+    monkeypatch.setattr(bus.database, "get_replica_router", RecordingRouter)
+
+    async def scenario():
+        hub = {}
+        a, b = ConnectionManager(), ConnectionManager()
+        for name, manager in zip("ab", (a, b)):
+            await manager.start_bus(bus.MessageBus(bus.MemoryTransport(hub), process_id=name, batch_ms=1))
+        await _until(lambda: "a" in b.bus.processes)
+        assert bus.database._share_pin == b.bus.pin_reads
+        bus.database._share_pin("user:7")
+        await _until(lambda: pinned == [("user:7", False)])
+        for manager in (a, b):
+            await manager.stop_bus()
+            manager.shutdown()
+
+    asyncio.run(scenario())
+    assert bus.database._share_pin is None
+
+
+def _follow_job_in_another_process(path, job_id, ready, seen):
+    """A second worker process: its participants table must follow the first one's changes."""
+    async def run():
+        manager = ConnectionManager()
+        await manager.start_bus(bus.MessageBus(bus.UnixSocketTransport(path), process_id="child", batch_ms=1))
+        job_participants.remember(job_participants.JobRow(job_id, 1, 2, "accepted"), share=False)
+        ready.set()
+        while job_participants.cache.get(job_id).status == "accepted":
+            await asyncio.sleep(0.01)
+        seen.put(job_participants.cache.get(job_id).status)
+        await manager.stop_bus()
+
+    asyncio.run(run())
+
+
+def test_job_status_changes_reach_the_participants_table_of_other_processes():
+    context = multiprocessing.get_context("spawn")
+    job_id = 424242
+
+    async def scenario(path):
+        broker = bus.Broker(path)
+        await broker.start()
+        manager = ConnectionManager()
+        await manager.start_bus(bus.MessageBus(bus.UnixSocketTransport(path), process_id="parent", batch_ms=1))
+        ready, seen = context.Event(), context.Queue()
+        child = context.Process(target=_follow_job_in_another_process, args=(path, job_id, ready, seen), daemon=True)
+        child.start()
+        try:
+            await _until(lambda: ready.is_set() and "child" in manager.bus.processes, timeout=30)
+            job_participants.remember(job_participants.JobRow(job_id, 1, 2, "completed"))
+            status = await asyncio.get_running_loop().run_in_executor(None, seen.get, True, 10)
+            assert status == "completed"
+        finally:
+            child.join(10)
+            if child.is_alive():
+                child.kill()
+            await manager.stop_bus()
+            manager.shutdown()
+            await broker.stop()
+        assert child.exitcode == 0
+
+    with tempfile.TemporaryDirectory() as directory:
+        asyncio.run(scenario(os.path.join(directory, "bus.sock")))
@@ -37,3 +37,13 @@ def test_signup_and_login_flow():
     assert "access_token" in data
     assert data.get("token_type") == "bearer"
 
+
+
+def test_readyz_flips_only_after_startup_warm_up():
+    # The module-level client never ran the lifespan.
+    assert client.get("/readyz").status_code == 503
+
+    with TestClient(app) as started:
+        resp = started.get("/readyz")
+        assert resp.status_code == 200, resp.text
+        assert resp.json()["status"] == "ready"
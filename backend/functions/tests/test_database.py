@@ -0,0 +1,148 @@
+import asyncio
+import logging
+import uuid
+from datetime import timedelta
+
+import pytest
+from fastapi import Request
+from fastapi.testclient import TestClient
+
+from main import app
+from app import auth, database, models
+from app.database import SessionLocal
+from app.db_metrics import pool_metrics
+
+
+client = TestClient(app)
+
+
+def _admin_headers():
+    db = SessionLocal()
+    try:
+        admin = models.User(
+            full_name="Pool Admin",
+            email=f"{uuid.uuid4().hex}@example.com",
+            phone=uuid.uuid4().hex[:12],
+            hashed_password="not-a-real-hash",
+            role="admin",
+        )
+        db.add(admin)
+        db.commit()
+        db.refresh(admin)
+    finally:
+        db.close()
+    token = auth.create_access_token(
+        data={"email": admin.email, "role": admin.role, "user_id": admin.id},
+        expires_delta=timedelta(minutes=5),
+    )
+    return {"Authorization": f"Bearer {token}"}
+
+
+def test_pool_metrics_attribute_sessions_to_routes():
+    headers = _admin_headers()
+    client.get("/api/admin/users", headers=headers)
+
+    resp = client.get("/api/admin/metrics", headers=headers)
+    assert resp.status_code == 200, resp.text
+    pool = resp.json()["db_pool"]
+    assert pool["routes"]["GET /api/admin/users"]["sessions"] >= 1
+    assert pool["checkout_wait"]["count"] >= 1
+
+
+def test_slow_sessions_are_logged_with_route(monkeypatch, caplog):
+    monkeypatch.setattr(database, "DB_SLOW_SESSION_MS", -1.0)
+    headers = _admin_headers()
+    slow_before = pool_metrics.slow_sessions
+
+    with caplog.at_level(logging.WARNING, logger="app.database"):
+        client.get("/api/admin/jobs", headers=headers)
+
+    assert pool_metrics.slow_sessions > slow_before
+    assert any("GET /api/admin/jobs" in record.getMessage() for record in caplog.records)
+
+
+def _make_replica(path, user_id, balance):
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import Session
+
+    url = f"sqlite:///{path}"
+    replica_engine = create_engine(url)
+    models.Base.metadata.create_all(replica_engine)
+    with Session(replica_engine) as db:
+        db.add(models.Wallet(user_id=user_id, balance=balance, total_earnings=balance))
+        db.commit()
+    replica_engine.dispose()
+    return url
+
+
+@pytest.mark.skipif(database.DB_ASYNC_ROUTES, reason="async handlers read from the primary")
+def test_reads_round_robin_over_replicas_until_client_writes(tmp_path):
+    db = SessionLocal()
+    try:
+        user = models.User(
+            full_name="Replica Reader",
+            email=f"{uuid.uuid4().hex}@example.com",
+            phone=uuid.uuid4().hex[:12],
+            hashed_password="not-a-real-hash",
+            role="individual_partner",
+        )
+        db.add(user)
+        db.commit()
+        db.refresh(user)
+    finally:
+        db.close()
+    token = auth.create_access_token(
+        data={"email": user.email, "role": user.role, "user_id": user.id},
+        expires_delta=timedelta(minutes=5),
+    )
+    headers = {"Authorization": f"Bearer {token}"}
+
+    database.configure_replicas([
+        _make_replica(tmp_path / "replica_a.db", user.id, 1.0),
+        _make_replica(tmp_path / "replica_b.db", user.id, 2.0),
+    ])
+    try:
+        balances = [client.get("/api/wallet/balance", headers=headers).json()["balance"] for _ in range(4)]
+        assert balances == [1.0, 2.0, 1.0, 2.0]
+
+        resp = client.post("/api/bookings/", headers=headers, json={
+            "service_type": "cleaning", "price": 20.0, "workers_needed": 1,
+            "latitude": 0.0, "longitude": 0.0, "address": "1 Replica Rd",
+        })
+        assert resp.status_code == 200, resp.text
+
+        # The primary has no wallet row for this user: reads fell back to it,
+        # also with a refreshed token.
+        assert client.get("/api/wallet/balance", headers=headers).json()["balance"] == 0.0
+        refreshed = auth.create_access_token(
+            data={"email": user.email, "role": user.role, "user_id": user.id},
+            expires_delta=timedelta(minutes=6),
+        )
+        assert client.get("/api/wallet/balance", headers={"Authorization": f"Bearer {refreshed}"}).json()["balance"] == 0.0
+        assert database.replica_router.stats()["primary_reads"] == 2
+    finally:
+        database.configure_replicas([])
+
+
+def test_async_session_writes_pin_the_client(tmp_path):
+    user_id = 10**6 + 7
+    token = auth.create_access_token(data={"email": "pinned@example.com", "role": "user", "user_id": user_id})
+    request = Request({"type": "http", "method": "POST", "path": "/",
+                       "headers": [(b"authorization", f"Bearer {token}".encode())]})
+
+    async def write():
+        async for db in database.get_async_db(request):
+            db.add(models.EventSequence(user_id=user_id, last_seq=0))
+            await db.commit()
+            await db.delete(await db.get(models.EventSequence, user_id))
+            await db.commit()
+
+    database.configure_replicas([_make_replica(tmp_path / "replica.db", user_id, 1.0)])
+    try:
+        assert database.replica_router.acquire(f"user:{user_id}") == 0
+        database.replica_router.release(0)
+        asyncio.run(write())
+        assert database.replica_router.acquire(f"user:{user_id}") is None
+    finally:
+        database.configure_replicas([])
+        asyncio.run(database.dispose_async_engine())
@@ -0,0 +1,135 @@
+import asyncio
+import random
+
+import pytest
+from fastapi.testclient import TestClient
+
+from main import app
+from app import dispatch, geo
+from app.routes import ws
+
+
+client = TestClient(app)
+
+
+def _serving(services):
+    return {"service_radius": 20.0, "selected_services": services}
+
+
+def _go_online(auth_headers, partner, latitude, longitude):
+    response = client.put("/api/users/status", headers=auth_headers(partner),
+                          json={"is_online": True, "latitude": latitude, "longitude": longitude})
+    assert response.status_code == 200
+    assert response.json() == {"is_online": True, "dispatchable": True}
+
+
+def test_new_job_is_pushed_to_nearest_online_partners(create_user, auth_headers, monkeypatch):
+    monkeypatch.setattr(dispatch.dispatcher, "wave_radii_km", [5.0])
+    monkeypatch.setattr(dispatch.dispatcher, "fanout", 2)
+    lat, lon = random.uniform(-60, 60), random.uniform(-170, 170)
+    km = 1 / geo.KM_PER_DEGREE_LAT
+
+    customer = create_user()
+    nearest = create_user("individual_partner", profile=_serving(["Cleaning"]))
+    second = create_user("individual_partner", profile=_serving([]))
+    third = create_user("individual_partner", profile=_serving(["Cleaning"]))  # beyond the fan-out
+    plumber = create_user("individual_partner", profile=_serving(["Plumbing"]))
+    _go_online(auth_headers, nearest, lat + 0.5 * km, lon)
+    _go_online(auth_headers, second, lat + 1 * km, lon)
+    _go_online(auth_headers, third, lat + 2 * km, lon)
+    _go_online(auth_headers, plumber, lat, lon)
+
+    with client.websocket_connect(f"/api/ws/{nearest.id}", headers=auth_headers(nearest)) as ws_nearest, \
+            client.websocket_connect(f"/api/ws/{second.id}", headers=auth_headers(second)) as ws_second, \
+            client.websocket_connect(f"/api/ws/{third.id}", headers=auth_headers(third)), \
+            client.websocket_connect(f"/api/ws/{plumber.id}", headers=auth_headers(plumber)):
+        job = client.post("/api/bookings/", headers=auth_headers(customer), json={
+            "service_type": "Cleaning", "price": 40.0, "workers_needed": 1,
+            "latitude": lat, "longitude": lon, "address": "1 Test Street",
+        }).json()
+
+        offer = ws_nearest.receive_json()
+        assert offer["type"] == "job_offer" and offer["wave"] == 1
+        assert offer["job"]["id"] == job["id"] and "otp" not in offer["job"]
+        assert ws_second.receive_json()["job"]["id"] == job["id"]
+        assert dispatch.dispatcher._offered[job["id"]] == {nearest.id, second.id}
+
+        assert client.post(f"/api/bookings/{job['id']}/accept", headers=auth_headers(nearest)).status_code == 200
+        assert ws_second.receive_json() == {"type": "job_taken", "jobId": job["id"]}
+        assert job["id"] not in dispatch.dispatcher._offered
+
+
+def test_going_offline_removes_partner_from_dispatch(create_user, auth_headers):
+    partner = create_user("individual_partner", profile=_serving([]))
+    _go_online(auth_headers, partner, 12.0, 12.0)
+    response = client.put("/api/users/status", headers=auth_headers(partner), json={"is_online": False})
+    assert response.json() == {"is_online": False, "dispatchable": False}
+    assert not dispatch.dispatcher.is_online(partner.id)
+
+    customer = create_user()
+    assert client.put("/api/users/status", headers=auth_headers(customer), json={"is_online": True}).status_code == 403
+
+
+def test_socket_failing_mid_message_still_takes_partner_offline(create_user, auth_headers, monkeypatch):
+    partner = create_user("individual_partner", profile=_serving([]))
+    _go_online(auth_headers, partner, 13.0, 13.0)
+
+    def broken_replay(user_id, after_seq):
+        raise RuntimeError("outbox unavailable")
+
+    monkeypatch.setattr(ws, "_replay", broken_replay)
+    with pytest.raises(RuntimeError), \
+            client.websocket_connect(f"/api/ws/{partner.id}", headers=auth_headers(partner)) as socket:
+        socket.send_json({"type": "resume", "lastSeq": 0})
+        socket.receive_json()
+    assert partner.id not in ws.manager.active_connections
+    assert not dispatch.dispatcher.is_online(partner.id)
+
+
+def test_only_the_jobs_worker_moves_with_its_location_updates(create_user, auth_headers):
+    customer = create_user()
+    worker = create_user("individual_partner", profile=_serving([]))
+    stranger = create_user("individual_partner", profile=_serving([]))
+    _go_online(auth_headers, worker, 14.0, 14.0)
+    _go_online(auth_headers, stranger, 14.0, 14.0)
+    job = client.post("/api/bookings/", headers=auth_headers(customer), json={
+        "service_type": "Cleaning", "price": 40.0, "workers_needed": 1,
+        "latitude": 14.0, "longitude": 14.0, "address": "1 Test Street",
+    }).json()
+    assert client.post(f"/api/bookings/{job['id']}/accept", headers=auth_headers(worker)).status_code == 200
+
+    for partner, position in ((stranger, (14.0, 14.0)), (worker, (14.5, 14.5))):
+        with client.websocket_connect(f"/api/ws/{partner.id}", headers=auth_headers(partner)) as socket:
+            socket.send_json({"type": "location_update", "jobId": job["id"],
+                              "data": {"latitude": 14.5, "longitude": 14.5}})
+            # Messages are handled in order, so the update is done by the reply.
+            socket.send_json({"type": "resume", "lastSeq": 10**9})
+            assert socket.receive_json()["type"] == "resumed"
+            assert dispatch.dispatcher.partners.get(partner.id)[:2] == position
+
+
+def test_offers_are_forgotten_once_the_last_wave_has_run():
+    class Manager:
+        def __init__(self):
+            self.sent = []
+
+        def is_connected(self, user_id):
+            return True
+
+        async def send_personal_message(self, message, user_id):
+            self.sent.append((user_id, message["type"]))
+
+    async def scenario():
+        dispatcher = dispatch.Dispatcher(fanout=5, wave_radii_km=[1.0, 5.0], wave_interval=0.01)
+        dispatcher.set_online(1, 20.0, 20.0)
+        dispatcher.set_online(2, 20.02, 20.0)
+        manager = Manager()
+        job = {"id": 1, "customer_id": 3, "service_type": "Cleaning", "latitude": 20.0, "longitude": 20.0}
+        assert await dispatcher.dispatch(job, manager) == 1
+        await asyncio.sleep(0.1)
+        assert manager.sent == [(1, "job_offer"), (2, "job_offer")]
+        assert dispatcher._offered == {} and dispatcher._waves == {}
+        await dispatcher.close(job["id"], manager, worker_id=1)
+        assert len(manager.sent) == 2
+
+    asyncio.run(scenario())
@@ -0,0 +1,117 @@
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+
+from main import app
+from app import etag, models
+from app.database import SessionLocal, get_engine
+
+
+client = TestClient(app)
+
+
+def _post_job(auth_headers, customer):
+    return client.post("/api/bookings/", headers=auth_headers(customer), json={
+        "service_type": "Cleaning", "price": 25.0, "workers_needed": 1,
+        "latitude": 2.0, "longitude": 2.0, "address": "2 Cache Lane",
+    }).json()
+
+
+def test_unchanged_listing_answers_304_without_querying(create_user, auth_headers):
+    customer = create_user()
+    _post_job(auth_headers, customer)
+    first = client.get("/api/bookings/customer", headers=auth_headers(customer))
+    assert first.status_code == 200 and len(first.json()) == 1
+    tag = first.headers["ETag"]
+
+    statements = []
+    listener = lambda conn, cursor, statement, *args: statements.append(statement)
+    event.listen(get_engine(), "before_cursor_execute", listener)
+    try:
+        again = client.get("/api/bookings/customer", headers=auth_headers(customer, **{"If-None-Match": tag}))
+    finally:
+        event.remove(get_engine(), "before_cursor_execute", listener)
+    assert again.status_code == 304 and again.content == b""
+    assert again.headers["ETag"] == tag
+    assert not any("FROM jobs" in statement for statement in statements)
+
+    # Another page of the same collection is a different resource.
+    paged = client.get("/api/bookings/customer", params={"limit": 1},
+                       headers=auth_headers(customer, **{"If-None-Match": tag}))
+    assert paged.status_code == 200
+
+    _post_job(auth_headers, customer)
+    changed = client.get("/api/bookings/customer", headers=auth_headers(customer, **{"If-None-Match": tag}))
+    assert changed.status_code == 200 and len(changed.json()) == 2
+    assert changed.headers["ETag"] != tag
+
+
+def test_job_lifecycle_invalidates_every_affected_collection(create_user, auth_headers):
+    customer, worker = create_user(), create_user("individual_partner")
+    job = _post_job(auth_headers, customer)
+    urls = {
+        "customer": ("/api/bookings/customer", customer),
+        "worker": ("/api/bookings/worker", worker),
+        "available": ("/api/bookings/available", worker),
+        "balance": ("/api/wallet/balance", worker),
+        "transactions": ("/api/wallet/transactions", worker),
+    }
+    tags = {name: client.get(url, headers=auth_headers(user)).headers["ETag"] for name, (url, user) in urls.items()}
+
+    def changed():
+        result = set()
+        for name, (url, user) in urls.items():
+            response = client.get(url, headers=auth_headers(user, **{"If-None-Match": tags[name]}))
+            if response.status_code == 200:
+                result.add(name)
+                tags[name] = response.headers["ETag"]
+            else:
+                assert response.status_code == 304
+        return result
+
+    assert changed() == set()
+    client.post(f"/api/bookings/{job['id']}/accept", headers=auth_headers(worker))
+    assert changed() == {"customer", "worker", "available"}
+    client.put(f"/api/bookings/{job['id']}/status", headers=auth_headers(worker), params={"new_status": "arrived"})
+    assert changed() == {"customer", "worker"}
+    client.post(f"/api/bookings/{job['id']}/verify-otp", headers=auth_headers(worker), params={"otp": job["otp"]})
+    assert changed() == {"customer", "worker", "balance", "transactions"}
+
+
+def test_available_jobs_tag_follows_open_job_shards_and_the_partner_profile(create_user, auth_headers):
+    customer = create_user()
+    partner = create_user("individual_partner", profile={"service_radius": 10.0, "selected_services": ["Cleaning"]})
+
+    def tag(previous=None):
+        extra = {"If-None-Match": previous} if previous else {}
+        response = client.get("/api/bookings/available", headers=auth_headers(partner, **extra))
+        assert response.status_code == (304 if response.headers["ETag"] == previous else 200)
+        return response.headers["ETag"]
+
+    current = tag()
+    for _ in range(12):  # whichever shard a new job bumps, the tag moves
+        _post_job(auth_headers, customer)
+        assert tag(current) != current
+        current = tag()
+    db = SessionLocal()
+    try:
+        bumped = db.query(models.CollectionVersion.key).filter(models.CollectionVersion.key.in_(etag.OPEN_JOBS)).count()
+        assert bumped > 1
+        assert tag(current) == current
+        db.query(models.PartnerProfile).filter(models.PartnerProfile.user_id == partner.id).update(
+            {"selected_services": ["Cleaning", "Plumbing"]}
+        )
+        db.commit()
+    finally:
+        db.close()
+    assert tag(current) != current
+
+
+def test_hit_rate_is_reported(create_user, auth_headers):
+    etag.metrics.reset()
+    customer = create_user()
+    tag = client.get("/api/wallet/balance", headers=auth_headers(customer)).headers["ETag"]
+    for _ in range(3):
+        assert client.get("/api/wallet/balance", headers=auth_headers(customer, **{"If-None-Match": tag})).status_code == 304
+
+    route = etag.metrics.snapshot()["routes"]["GET /api/wallet/balance"]
+    assert route == {"requests": 4, "conditional": 3, "not_modified": 3, "hit_rate": 0.75, "conditional_hit_rate": 1.0}
@@ -0,0 +1,89 @@
+import csv
+import io
+import json
+from datetime import datetime, timedelta
+
+from fastapi.testclient import TestClient
+from sqlalchemy import select
+
+from main import app
+from app import exports, models
+from app.database import get_engine
+
+
+client = TestClient(app)
+
+
+def _history(user, days=10, per_day=3):
+    base = datetime(2024, 3, 1, 9, 0, 0)
+    with get_engine().begin() as conn:
+        conn.execute(models.Transaction.__table__.insert(), [
+            {"user_id": user.id, "type": "earning" if i % 3 else "withdrawal", "amount_minor": 1000 + i,
+             "created_at": base + timedelta(days=i // per_day, minutes=i), "description": f"row {i}"}
+            for i in range(days * per_day)
+        ])
+    return base
+
+
+def test_admin_transaction_export_filters_and_formats(create_user, auth_headers):
+    admin, partner = create_user("admin"), create_user("individual_partner")
+    base = _history(partner)
+    params = {"start": (base + timedelta(days=2)).isoformat(), "end": (base + timedelta(days=5)).isoformat(),
+              "type": "earning"}
+
+    response = client.get("/api/admin/export/transactions", params=params, headers=auth_headers(admin))
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/csv")
+    assert "attachment" in response.headers["content-disposition"]
+    rows = list(csv.DictReader(io.StringIO(response.text)))
+    mine = [r for r in rows if r["user_id"] == str(partner.id)]
+    # Days 2, 3 and 4, minus the one withdrawal per day.
+    assert len(mine) == 6
+    assert all(r["type"] == "earning" for r in rows)
+    assert mine[0]["amount"] == str(int(mine[0]["amount_minor"]) / 100)
+    assert [r["id"] for r in rows] == sorted((r["id"] for r in rows), key=int)
+
+    ndjson = client.get("/api/admin/export/transactions", params={**params, "format": "ndjson"},
+                        headers=auth_headers(admin))
+    assert ndjson.headers["content-type"].startswith("application/x-ndjson")
+    lines = [json.loads(line) for line in ndjson.text.splitlines()]
+    assert [line["id"] for line in lines] == [int(r["id"]) for r in rows]
+    assert lines[0]["created_at"].startswith("2024-03-03")
+
+    assert client.get("/api/admin/export/transactions", headers=auth_headers(partner)).status_code == 403
+    assert client.get("/api/admin/export/transactions", params={"format": "xml"},
+                      headers=auth_headers(admin)).status_code == 422
+
+
+def test_job_export_never_includes_otp(create_user, auth_headers):
+    admin, customer = create_user("admin"), create_user()
+    client.post("/api/bookings/", headers=auth_headers(customer), json={
+        "service_type": "Cleaning", "price": 30.0, "workers_needed": 1,
+        "latitude": 3.0, "longitude": 3.0, "address": "3 Export Way",
+    })
+    response = client.get("/api/admin/export/jobs", params={"status": "searching", "format": "ndjson"},
+                          headers=auth_headers(admin))
+    jobs = [json.loads(line) for line in response.text.splitlines()]
+    assert jobs and all(job["status"] == "searching" for job in jobs)
+    assert customer.id in {job["customer_id"] for job in jobs}
+    assert all("otp" not in job for job in jobs)
+
+    header = client.get("/api/admin/export/jobs", params={"status": "no-such-status"},
+                        headers=auth_headers(admin)).text
+    assert header.splitlines() == [",".join(exports.JOB_FIELDS)]
+
+
+def test_partner_export_is_limited_to_own_transactions(create_user, auth_headers):
+    partner, other = create_user("individual_partner"), create_user("individual_partner")
+    _history(partner, days=2)
+    _history(other, days=2)
+    rows = list(csv.DictReader(io.StringIO(client.get("/api/wallet/export", headers=auth_headers(partner)).text)))
+    assert len(rows) == 6 and {r["user_id"] for r in rows} == {str(partner.id)}
+
+
+def test_rows_are_streamed_in_bounded_batches(create_user):
+    partner = create_user("individual_partner")
+    _history(partner, days=10)
+    statement = select(*exports.TRANSACTION_COLUMNS).where(models.Transaction.user_id == partner.id)
+    sizes = [len(batch) for batch in exports.stream_rows(statement, batch=7)]
+    assert sizes == [7, 7, 7, 7, 2]
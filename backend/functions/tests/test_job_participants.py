@@ -0,0 +1,81 @@
+import asyncio
+
+from fastapi.testclient import TestClient
+
+from main import app
+from app import job_participants
+
+
+client = TestClient(app)
+
+
+def _accepted_job(auth_headers, customer, worker):
+    job = client.post("/api/bookings/", headers=auth_headers(customer), json={
+        "service_type": "Cleaning", "price": 40.0, "workers_needed": 1,
+        "latitude": 1.0, "longitude": 1.0, "address": "1 Relay Road",
+    }).json()
+    assert client.post(f"/api/bookings/{job['id']}/accept", headers=auth_headers(worker)).status_code == 200
+    return job
+
+
+def _relay(auth_headers, customer, worker, job_id, latitude):
+    with client.websocket_connect(f"/api/ws/{customer.id}", headers=auth_headers(customer)) as ws_customer, \
+            client.websocket_connect(f"/api/ws/{worker.id}", headers=auth_headers(worker)) as ws_worker:
+        ws_worker.send_json({"type": "location_update", "jobId": job_id,
+                             "data": {"latitude": latitude, "longitude": 2.0}})
+        return ws_customer.receive_json()
+
+
+def test_location_relay_is_routed_from_the_participants_table(create_user, auth_headers):
+    customer, worker = create_user(), create_user("individual_partner")
+    job = _accepted_job(auth_headers, customer, worker)
+    assert job_participants.cache.get(job["id"]) == (customer.id, worker.id, "accepted")
+
+    misses = job_participants.cache.misses
+    frame = _relay(auth_headers, customer, worker, job["id"], 1.5)
+    assert frame == {"type": "location_update", "jobId": job["id"], "data": {"latitude": 1.5, "longitude": 2.0}}
+    assert job_participants.cache.misses == misses
+
+    response = client.put(f"/api/bookings/{job['id']}/status", headers=auth_headers(worker),
+                          params={"new_status": "arrived"})
+    assert response.status_code == 200
+    assert job_participants.cache.get(job["id"]).status == "arrived"
+
+    response = client.post(f"/api/bookings/{job['id']}/verify-otp", headers=auth_headers(worker),
+                           params={"otp": job["otp"]})
+    assert response.status_code == 200
+    assert job_participants.cache.get(job["id"]).status == "completed"
+
+
+def test_cache_miss_loads_participants_from_the_database(auth_headers, create_user):
+    customer, worker = create_user(), create_user("individual_partner")
+    job = _accepted_job(auth_headers, customer, worker)
+    job_participants.cache.clear()
+
+    frame = _relay(auth_headers, customer, worker, str(job["id"]), 3.0)
+    assert frame["jobId"] == job["id"] and frame["data"]["latitude"] == 3.0
+    assert job_participants.cache.get(job["id"]) == (customer.id, worker.id, "accepted")
+
+
+def test_settled_and_unknown_jobs_are_cached_briefly(auth_headers, create_user, monkeypatch):
+    customer, worker = create_user(), create_user("individual_partner")
+    job = _accepted_job(auth_headers, customer, worker)
+    client.post(f"/api/bookings/{job['id']}/verify-otp", headers=auth_headers(worker), params={"otp": job["otp"]})
+    job_participants.cache.clear()
+
+    loads = []
+    load = job_participants._load
+    monkeypatch.setattr(job_participants, "_load", lambda job_id: loads.append(job_id) or load(job_id))
+
+    async def frames():
+        for _ in range(64):
+            assert (await job_participants.lookup(job["id"])).status == "completed"
+            assert await job_participants.lookup(10**9) is None
+
+    asyncio.run(frames())
+    assert loads == [job["id"], 10**9]
+
+    monkeypatch.setattr(job_participants, "JOB_PARTICIPANTS_SETTLED_TTL_SECONDS", 0)
+    job_participants.cache.clear()
+    asyncio.run(frames())
+    assert len(loads) == 2 + 128
@@ -0,0 +1,157 @@
+import asyncio
+
+import pytest
+from fastapi import WebSocketDisconnect
+from fastapi.testclient import TestClient
+
+from main import app
+from app import models, outbox
+from app.database import SessionLocal
+from app.routes.ws import UNAUTHORIZED_CLOSE_CODE
+
+
+client = TestClient(app)
+
+
+class RecordingManager:
+    def __init__(self):
+        self.sent = []
+
+    async def send_personal_message(self, message: dict, user_id: int):
+        self.sent.append((user_id, message))
+        await asyncio.sleep(0)
+
+
+def _completed_job(auth_headers, customer, worker):
+    job = client.post("/api/bookings/", headers=auth_headers(customer), json={
+        "service_type": "Cleaning", "price": 40.0, "workers_needed": 1,
+        "latitude": 1.0, "longitude": 1.0, "address": "1 Outbox Road",
+    }).json()
+    assert client.post(f"/api/bookings/{job['id']}/accept", headers=auth_headers(worker)).status_code == 200
+    for new_status in ("arrived", "started"):
+        response = client.put(f"/api/bookings/{job['id']}/status", headers=auth_headers(worker),
+                              params={"new_status": new_status})
+        assert response.status_code == 200
+    response = client.post(f"/api/bookings/{job['id']}/verify-otp", headers=auth_headers(worker),
+                           params={"otp": job["otp"]})
+    assert response.status_code == 200
+    return job
+
+
+def _events(user):
+    db = SessionLocal()
+    try:
+        return db.query(models.OutboxEvent).filter(models.OutboxEvent.user_id == user.id) \
+            .order_by(models.OutboxEvent.seq).all()
+    finally:
+        db.close()
+
+
+def test_state_changes_write_sequenced_events(create_user, auth_headers):
+    customer, worker = create_user(), create_user("individual_partner")
+    job = _completed_job(auth_headers, customer, worker)
+
+    customer_events = _events(customer)
+    assert [(e.seq, e.type, e.payload["status"]) for e in customer_events] == [
+        (1, "job_accepted", "accepted"),
+        (2, "job_status_update", "arrived"),
+        (3, "job_status_update", "started"),
+        (4, "job_completed", "completed"),
+    ]
+    assert all(e.job_id == job["id"] and e.delivered_at is None for e in customer_events)
+    [payment] = _events(worker)
+    assert (payment.seq, payment.type, payment.payload) == (1, "payment_received", {"amount": 34.0, "amountMinor": 3400})
+
+    # A rejected transition writes nothing.
+    client.put(f"/api/bookings/{job['id']}/status", headers=auth_headers(worker), params={"new_status": "arrived"})
+    assert len(_events(customer)) == 4
+
+
+def test_relay_delivers_once_and_persists_notifications(auth_headers, create_user):
+    customer, worker = create_user(), create_user("individual_partner")
+    job = _completed_job(auth_headers, customer, worker)
+
+    manager = RecordingManager()
+    relay = outbox.OutboxRelay(batch_size=3)
+    relay.manager = manager
+    asyncio.run(relay.drain())
+
+    received = [m for user_id, m in manager.sent if user_id == customer.id]
+    assert [(m["type"], m["seq"]) for m in received] == [
+        ("job_accepted", 1), ("job_status_update", 2), ("job_status_update", 3), ("job_completed", 4),
+    ]
+    assert all(m["jobId"] == job["id"] for m in received)
+    assert all(e.delivered_at is not None for e in _events(customer) + _events(worker))
+
+    db = SessionLocal()
+    try:
+        notifications = db.query(models.Notification).filter(models.Notification.job_id == job["id"]).all()
+    finally:
+        db.close()
+    assert sorted((n.user_id, n.type) for n in notifications) == sorted(
+        [(customer.id, "job_accepted"), (customer.id, "job_status_update"), (customer.id, "job_status_update"),
+         (customer.id, "job_completed"), (worker.id, "payment_received")]
+    )
+
+    # Nothing left to relay: a second drain neither resends nor duplicates.
+    manager.sent.clear()
+    assert asyncio.run(relay.drain()) == 0
+    assert manager.sent == []
+
+
+def test_relays_of_several_workers_send_each_event_once(auth_headers, create_user):
+    users = [user for _ in range(3) for user in (create_user(), create_user("individual_partner"))]
+    for customer, worker in zip(users[::2], users[1::2]):
+        _completed_job(auth_headers, customer, worker)
+
+    manager = RecordingManager()
+    relays = [outbox.OutboxRelay(batch_size=2) for _ in range(4)]
+    for relay in relays:
+        relay.manager = manager
+
+    async def drain_all():
+        await asyncio.gather(*(relay.drain() for relay in relays))
+
+    asyncio.run(drain_all())
+    ids = {user.id for user in users}
+    sent = sorted((user_id, m["seq"]) for user_id, m in manager.sent if user_id in ids)
+    assert sent == sorted((event.user_id, event.seq) for user in users for event in _events(user))
+    assert all(event.delivered_at is not None for user in users for event in _events(user))
+
+
+def test_reconnecting_client_replays_missed_events(auth_headers, create_user):
+    customer, worker = create_user(), create_user("individual_partner")
+    _completed_job(auth_headers, customer, worker)
+
+    with client.websocket_connect(f"/api/ws/{customer.id}", headers=auth_headers(customer)) as ws:
+        ws.send_json({"type": "resume", "lastSeq": 2})
+        assert [ws.receive_json()["seq"] for _ in range(2)] == [3, 4]
+        assert ws.receive_json() == {"type": "resumed", "lastSeq": 4, "more": False}
+
+
+def test_websocket_requires_a_token_for_the_user_in_the_path(auth_headers, create_user):
+    customer, other = create_user(), create_user()
+    _completed_job(auth_headers, customer, create_user("individual_partner"))
+    token = auth_headers(customer)["Authorization"].split()[1]
+
+    for connect in (
+        lambda: client.websocket_connect(f"/api/ws/{customer.id}", headers=auth_headers(other)),
+        lambda: client.websocket_connect(f"/api/ws/{customer.id}?token=garbage"),
+    ):
+        with pytest.raises(WebSocketDisconnect) as closed, connect() as ws:
+            ws.receive_json()
+        assert closed.value.code == UNAUTHORIZED_CLOSE_CODE
+
+    # Without a token on the handshake, the first message has to carry it.
+    with pytest.raises(WebSocketDisconnect) as closed, client.websocket_connect(f"/api/ws/{customer.id}") as ws:
+        ws.send_json({"type": "resume", "lastSeq": 0})
+        ws.receive_json()
+    assert closed.value.code == UNAUTHORIZED_CLOSE_CODE
+
+    with client.websocket_connect(f"/api/ws/{customer.id}") as ws:
+        ws.send_json({"type": "auth", "token": token})
+        ws.send_json({"type": "resume", "lastSeq": 3})
+        assert ws.receive_json()["seq"] == 4
+    with client.websocket_connect(f"/api/ws/{customer.id}?token={token}") as ws:
+        ws.send_json({"type": "resume", "lastSeq": 3})
+        assert ws.receive_json()["seq"] == 4
@@ -0,0 +1,68 @@
+import pytest
+from fastapi.testclient import TestClient
+
+from main import app
+from app import models, query_budget
+from app.database import SessionLocal
+
+
+client = TestClient(app)
+
+
+def _queries(auth_headers, path, user, **params):
+    query_budget.route_stats.reset()
+    response = client.get(path, headers=auth_headers(user), params=params)
+    assert response.status_code == 200
+    [stats] = query_budget.route_stats.snapshot()["routes"].values()
+    return response.json(), stats["max_queries"]
+
+
+def test_pending_partners_load_users_without_n_plus_one(create_user, auth_headers):
+    admin = create_user("admin")
+    client.get("/api/admin/partner-approvals", headers=auth_headers(admin))  # warm the principal cache
+    for _ in range(3):
+        create_user("individual_partner", profile={"business_type": "individual", "city": "Testville"})
+    few, few_queries = _queries(auth_headers, "/api/admin/partner-approvals", admin, limit=3)
+    for _ in range(30):
+        create_user("individual_partner", profile={"business_type": "individual", "city": "Testville"})
+    many, many_queries = _queries(auth_headers, "/api/admin/partner-approvals", admin, limit=30)
+
+    assert len(few) == 3 and len(many) == 30
+    assert all(profile["user"]["id"] == profile["user_id"] for profile in many)
+    assert few_queries == many_queries <= 3
+
+
+def test_count_queries_sees_lazy_loads(create_user):
+    create_user("individual_partner", profile={"business_type": "individual", "city": "Testville"})
+    db = SessionLocal()
+    try:
+        with query_budget.count_queries() as log:
+            profiles = db.query(models.PartnerProfile).limit(5).all()
+            for profile in profiles:
+                profile.user.email
+    finally:
+        db.close()
+    assert log.count == 1 + len(profiles)
+
+
+def test_request_over_budget_fails_in_enforce_mode(create_user, auth_headers, monkeypatch):
+    monkeypatch.setattr(query_budget, "DB_QUERY_BUDGET_ENFORCE", True)
+    monkeypatch.setattr(query_budget, "DB_QUERY_BUDGET_DEFAULT", 0)
+    user = create_user()
+    with pytest.raises(query_budget.QueryBudgetExceeded, match=r"GET /api/users/me ran \d+ queries, budget is 0"):
+        client.get("/api/users/me", headers=auth_headers(user))
+
+    monkeypatch.setattr(query_budget, "DB_QUERY_BUDGET_ENFORCE", False)
+    assert client.get("/api/users/me", headers=auth_headers(user)).status_code == 200
+    assert query_budget.route_stats.snapshot()["routes"]["GET /api/users/me"]["over_budget"] >= 1
+
+
+def test_routes_are_labelled_by_their_template(create_user, auth_headers):
+    worker = create_user("individual_partner")
+    query_budget.route_stats.reset()
+    for job_id in (1, 999999, 123):
+        client.put(f"/api/bookings/{job_id}/status", headers=auth_headers(worker), params={"new_status": "arrived"})
+    client.get("/api/no/such/route")
+    assert sorted(query_budget.route_stats.snapshot()["routes"]) == [
+        "GET <unmatched>", "PUT /api/bookings/{job_id}/status",
+    ]
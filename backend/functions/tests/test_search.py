@@ -0,0 +1,102 @@
+import uuid
+
+from fastapi.testclient import TestClient
+
+from main import app
+from app import models, search
+from app.database import SessionLocal
+
+
+client = TestClient(app)
+
+
+def _search(auth_headers, admin, q, **params):
+    response = client.get("/api/admin/users/search", headers=auth_headers(admin), params={"q": q, **params})
+    assert response.status_code == 200
+    return response
+
+
+def _ids(auth_headers, admin, q, **params):
+    return [user["id"] for user in _search(auth_headers, admin, q, **params).json()]
+
+
+def test_matches_every_field_by_prefix(auth_headers, create_user):
+    admin = create_user("admin")
+    tag = uuid.uuid4().hex[:8]
+    user = create_user(full_name=f"Zelda {tag}Quill", email=f"zq{tag}@mail.example.com")
+    partner = create_user("individual_partner", full_name="Plain Name",
+                           profile={"business_name": f"Sparkle{tag} Cleaners", "city": f"Port{tag}"})
+
+    assert _ids(auth_headers, admin, f"{tag}quill") == [user.id]
+    assert _ids(auth_headers, admin, f"zelda {tag}qu") == [user.id]
+    assert _ids(auth_headers, admin, f"zq{tag}") == [user.id]
+    assert _ids(auth_headers, admin, f"sparkle{tag}") == [partner.id]
+    [hit] = _search(auth_headers, admin, f"port{tag}").json()
+    assert (hit["id"], hit["business_name"], hit["city"]) == (partner.id, f"Sparkle{tag} Cleaners", f"Port{tag}")
+    assert _ids(auth_headers, admin, f"zelda{tag} nobody") == []
+
+
+def test_phone_query_ignores_formatting(auth_headers, create_user):
+    admin = create_user("admin")
+    digits = str(uuid.uuid4().int)[:10]
+    user = create_user(phone=digits)
+    assert _ids(auth_headers, admin, f"+{digits[:3]} {digits[3:6]}-{digits[6:]}") == [user.id]
+    assert _ids(auth_headers, admin, digits[:7]) == [user.id]
+
+
+def test_name_hits_rank_above_city_hits(auth_headers, create_user):
+    admin = create_user("admin")
+    word = f"rank{uuid.uuid4().hex[:8]}"
+    by_city = create_user("individual_partner", profile={"business_name": "Other", "city": word.title()})
+    by_name = create_user(full_name=f"{word.title()} Person")
+    assert _ids(auth_headers, admin, word) == [by_name.id, by_city.id]
+    assert _ids(auth_headers, admin, word, role="individual_partner") == [by_city.id]
+
+
+def test_index_follows_updates_and_deletes(auth_headers, create_user):
+    admin = create_user("admin")
+    old, new = f"old{uuid.uuid4().hex[:8]}", f"new{uuid.uuid4().hex[:8]}"
+    user = create_user("individual_partner", full_name=f"{old} Person", profile={"city": old})
+
+    db = SessionLocal()
+    try:
+        row = db.get(models.User, user.id)
+        row.full_name = f"{new} Person"
+        db.commit()
+        assert _ids(auth_headers, admin, old) == [user.id]  # still the city
+        db.delete(row.partner_profile)
+        db.commit()
+        assert _ids(auth_headers, admin, old) == []
+        assert _ids(auth_headers, admin, new) == [user.id]
+        db.delete(row)
+        db.commit()
+    finally:
+        db.close()
+    assert _ids(auth_headers, admin, new) == []
+
+
+def test_pages_through_ranked_windows(auth_headers, create_user, monkeypatch):
+    monkeypatch.setattr(search, "SEARCH_RANK_WINDOW", 3)
+    admin = create_user("admin")
+    word = f"page{uuid.uuid4().hex[:8]}"
+    by_name = lambda: create_user(full_name=f"{word} Person")
+    by_city = lambda: create_user("individual_partner", profile={"business_name": "Other", "city": word})
+    a, b, c, d, e = by_name(), by_city(), by_name(), by_city(), by_name()
+
+    seen, cursor = [], None
+    while True:
+        params = {"limit": 2, **({"cursor": cursor} if cursor else {})}
+        response = _search(auth_headers, admin, word, **params)
+        seen += [user["id"] for user in response.json()]
+        cursor = response.headers.get("X-Next-Cursor")
+        if cursor is None:
+            break
+        by_name()  # users created while paging don't shift the listing
+    # Newest window of three first (e, d, c), ranked within; then (b, a).
+    assert seen == [e.id, c.id, d.id, a.id, b.id]
+
+
+def test_search_is_admin_only(create_user, auth_headers):
+    user = create_user()
+    response = client.get("/api/admin/users/search", headers=auth_headers(user), params={"q": "anything"})
+    assert response.status_code == 403
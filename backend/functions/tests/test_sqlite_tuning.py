@@ -0,0 +1,94 @@
+import threading
+import time
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import Session
+
+from app import sqlite_tuning
+
+
+def _engine(tmp_path, writer_queue=None):
+    engine = create_engine(f"sqlite:///{tmp_path}/tuned.db", connect_args={"check_same_thread": False})
+    sqlite_tuning.install(engine, busy_timeout_ms=2000, mmap_size=1 << 20, cache_size_kb=4096,
+                          writer_queue=writer_queue)
+    with engine.begin() as conn:
+        conn.execute(text("CREATE TABLE IF NOT EXISTS t (n INTEGER)"))
+    return engine
+
+
+def test_connections_get_the_production_pragmas(tmp_path):
+    engine = _engine(tmp_path)
+    with engine.connect() as conn:
+        pragma = lambda name: conn.exec_driver_sql(f"PRAGMA {name}").scalar()
+        assert pragma("journal_mode") == "wal"
+        assert pragma("synchronous") == 1  # NORMAL
+        assert pragma("busy_timeout") == 2000
+        assert pragma("mmap_size") == 1 << 20
+        assert pragma("cache_size") == -4096
+        assert pragma("temp_store") == 2  # MEMORY
+        assert conn.connection.dbapi_connection.isolation_level == "IMMEDIATE"
+    engine.dispose()
+
+
+def test_writers_get_the_slot_in_arrival_order():
+    queue = sqlite_tuning.SingleWriterQueue()
+    order = []
+    assert queue.acquire()
+
+    def writer(n):
+        assert queue.acquire(timeout=5)
+        order.append(n)
+        queue.release()
+
+    threads = []
+    for n in range(5):
+        threads.append(threading.Thread(target=writer, args=(n,)))
+        threads[-1].start()
+        while queue.stats()["queued"] < n + 1:
+            time.sleep(0.001)
+    queue.release()
+    for thread in threads:
+        thread.join()
+    assert order == [0, 1, 2, 3, 4]
+    assert queue.stats() == {"queued": 0, "acquired": 6, "timeouts": 0}
+
+
+def test_slot_is_released_on_commit_rollback_and_checkin(tmp_path):
+    queue = sqlite_tuning.SingleWriterQueue()
+    engine = _engine(tmp_path, queue)
+    free = lambda: not queue._waiters
+
+    with engine.connect() as conn:
+        conn.execute(text("INSERT INTO t VALUES (1)"))
+        assert not free()
+        conn.rollback()
+        assert free()
+        conn.execute(text("INSERT INTO t VALUES (2)"))
+        conn.commit()
+        assert free()
+
+    session = Session(engine)
+    session.execute(text("INSERT INTO t VALUES (3)"))
+    assert not free()
+    session.close()  # back to the pool without a commit
+    assert free()
+    engine.dispose()
+
+
+def test_second_connection_on_the_same_thread_does_not_wait_on_itself(tmp_path):
+    queue = sqlite_tuning.SingleWriterQueue()
+    engine = _engine(tmp_path, queue)
+    with engine.connect() as first, engine.connect() as second:
+        first.execute(text("INSERT INTO t VALUES (1)"))
+        first.commit()
+        first.execute(text("INSERT INTO t VALUES (2)"))
+        started = time.monotonic()
+        assert queue.acquire(timeout=1)  # as a write on `second` would
+        queue.release()
+        assert time.monotonic() - started < 0.5
+        first.rollback()
+        assert not queue._waiters
+        second.execute(text("INSERT INTO t VALUES (3)"))
+        second.commit()
+    assert queue.stats()["timeouts"] == 0
+    engine.dispose()
@@ -0,0 +1,89 @@
+from concurrent.futures import ThreadPoolExecutor
+import uuid
+
+from fastapi.testclient import TestClient
+
+from main import app
+from app import models, stats
+from app.database import SessionLocal
+
+
+client = TestClient(app)
+
+
+def _reconcile():
+    db = SessionLocal()
+    try:
+        return stats.reconcile(db)
+    finally:
+        db.close()
+
+
+def _counters():
+    db = SessionLocal()
+    try:
+        return stats.read(db), stats.recount(db)
+    finally:
+        db.close()
+
+
+def test_counters_follow_the_maintained_code_paths(create_user, auth_headers):
+    admin = create_user("admin")
+    _reconcile()
+    before, _ = _counters()
+
+    for role in ("user", "individual_partner"):
+        assert client.post("/api/users/signup", json={
+            "full_name": "Counted", "email": f"{uuid.uuid4().hex}@example.com", "phone": uuid.uuid4().hex[:12],
+            "password": "correct horse", "role": role,
+        }).status_code == 200
+    customer, worker = create_user(), create_user("individual_partner")
+    job = client.post("/api/bookings/", headers=auth_headers(customer), json={
+        "service_type": "Cleaning", "price": 19.99, "workers_needed": 1,
+        "latitude": 4.0, "longitude": 4.0, "address": "4 Count Street",
+    }).json()
+    client.post(f"/api/bookings/{job['id']}/accept", headers=auth_headers(worker))
+    client.post(f"/api/bookings/{job['id']}/verify-otp", headers=auth_headers(worker), params={"otp": job["otp"]})
+
+    db = SessionLocal()
+    try:
+        profile = models.PartnerProfile(user_id=worker.id, business_type="individual", city="Testville")
+        db.add(profile)
+        db.commit()
+        profile_id = profile.id
+    finally:
+        db.close()
+    client.put(f"/api/admin/partner-approvals/{profile_id}", headers=auth_headers(admin), params={"approve": True})
+
+    after, truth = _counters()
+    delta = {name: after[name] - before[name] for name in stats.COUNTERS}
+    # The two helper users and the profile were written straight to the
+    # database, so only reconciliation can know about them.
+    assert delta == {"total_users": 1, "total_partners": 1, "total_jobs": 1, "total_revenue_minor": 1999,
+                     "pending_partners": -1}
+    assert _reconcile() == {"total_users": 1, "total_partners": 1, "pending_partners": 1}
+    assert _counters()[0] == truth
+
+
+def test_dashboard_reads_cached_counters(create_user, auth_headers):
+    admin = create_user("admin")
+    _reconcile()
+    first = client.get("/api/admin/stats", headers=auth_headers(admin)).json()
+    create_user()
+    _reconcile()  # clears the cache
+    assert client.get("/api/admin/stats", headers=auth_headers(admin)).json()["total_users"] == first["total_users"] + 1
+
+    hits = stats.cache.hits
+    cached = client.get("/api/admin/stats", headers=auth_headers(admin)).json()
+    assert stats.cache.hits == hits + 1
+    assert cached["total_users"] == first["total_users"] + 1
+
+
+def test_concurrent_reconciles_correct_drift_once(create_user):
+    _reconcile()
+    create_user()
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        results = list(pool.map(lambda _: _reconcile(), range(4)))
+    assert sum(result.get("total_users", 0) for result in results if result is not None) == 1
+    before, truth = _counters()
+    assert before == truth
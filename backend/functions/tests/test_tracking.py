@@ -0,0 +1,82 @@
+import asyncio
+import json
+
+from fastapi.testclient import TestClient
+
+from main import app
+from app import tracking
+from app.routes import ws
+
+
+client = TestClient(app)
+
+
+def test_compact_events_round_trip_with_deltas_and_packing():
+    verbose = tracking.Fix.from_verbose(7, {"latitude": 40.7128049, "longitude": -74.0060051,
+                                            "heading": 181.6, "speed": 4.21})
+    assert (verbose.lat, verbose.lon, verbose.heading, verbose.speed) == (4071280, -7400601, 182, 42)
+
+    encoder = tracking.CompactEncoder()
+    first = encoder.encode([verbose])
+    moved = tracking.Fix(7, 4071290, -7400580, 182, 40)
+    other = tracking.Fix(8, 100, 200)
+    packed = encoder.encode([moved, other])
+    assert first == '[["L",7,4071280,-7400601,182,42]]'
+    assert packed == '[["D",7,10,21,182,40],["L",8,100,200]]'
+
+    # The receiving side rebuilds absolute positions; deltas need a base.
+    last = {}
+    fixes = tracking.parse(json.loads(first) + json.loads(packed), last)
+    assert [(f.job_id, f.lat, f.lon, f.heading, f.speed) for f in fixes] == [
+        (7, 4071280, -7400601, 182, 42), (7, 4071290, -7400580, 182, 40), (8, 100, 200, None, None),
+    ]
+    assert tracking.parse([["D", 9, 1, 1], ["L", 9, 9_100_000, 0], ["X", 1, 2, 3], "junk"], {}) == []
+    assert json.loads(moved.verbose())["data"] == {"latitude": 40.7129, "longitude": -74.0058,
+                                                   "heading": 182, "speed": 4.0}
+
+
+def test_throttle_holds_and_coalesces_fast_updates():
+    async def scenario():
+        forwarded = []
+
+        async def forward(sender_id, fix):
+            forwarded.append((sender_id, fix.lat))
+
+        throttle = tracking.LocationThrottle(forward, interval=0.05)
+        assert throttle.admit(1, tracking.Fix(5, 1, 0))
+        assert not throttle.admit(1, tracking.Fix(5, 2, 0))
+        assert not throttle.admit(1, tracking.Fix(5, 3, 0))
+        assert throttle.admit(2, tracking.Fix(5, 9, 0))  # the other party of the job has its own budget
+        await asyncio.sleep(0.1)
+        assert forwarded == [(1, 3)]
+        assert throttle.stats()["held"] == 1 and throttle.stats()["coalesced"] == 1
+
+    asyncio.run(scenario())
+
+
+def test_negotiated_compact_protocol_over_the_websocket(create_user, auth_headers, monkeypatch):
+    monkeypatch.setattr(ws.location_throttle, "interval", 0)
+    customer, worker = create_user(), create_user("individual_partner")
+    job = client.post("/api/bookings/", headers=auth_headers(customer), json={
+        "service_type": "Cleaning", "price": 40.0, "workers_needed": 1,
+        "latitude": 1.0, "longitude": 1.0, "address": "1 Tracking Way",
+    }).json()
+    assert client.post(f"/api/bookings/{job['id']}/accept", headers=auth_headers(worker)).status_code == 200
+
+    compact_protocol = [tracking.SUBPROTOCOL]
+    with client.websocket_connect(f"/api/ws/{customer.id}", headers=auth_headers(customer),
+                                  subprotocols=compact_protocol) as compact, \
+            client.websocket_connect(f"/api/ws/{customer.id}", headers=auth_headers(customer)) as verbose, \
+            client.websocket_connect(f"/api/ws/{worker.id}", headers=auth_headers(worker),
+                                     subprotocols=compact_protocol) as ws_worker:
+        assert compact.accepted_subprotocol == tracking.SUBPROTOCOL
+        # One fix at a time: a second fix for the job queued before the first
+        # was written would replace it.
+        ws_worker.send_json([["L", job["id"], 100_000, 200_000, 90, 52]])
+        assert compact.receive_json() == [["L", job["id"], 100_000, 200_000, 90, 52]]
+        assert verbose.receive_json() == {"type": "location_update", "jobId": job["id"], "data": {
+            "latitude": 1.0, "longitude": 2.0, "heading": 90, "speed": 5.2}}
+
+        ws_worker.send_json([["D", job["id"], 5, -3]])
+        assert compact.receive_json() == [["D", job["id"], 5, -3]]
+        assert verbose.receive_json()["data"] == {"latitude": 1.00005, "longitude": 1.99997}
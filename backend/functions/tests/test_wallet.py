@@ -0,0 +1,146 @@
+import asyncio
+import random
+from datetime import datetime, timedelta
+
+import httpx
+from fastapi.testclient import TestClient
+from sqlalchemy import func
+
+from main import app
+from app import ledger, models, rollups
+from app.database import SessionLocal, get_engine
+from app.money import to_minor
+from app.routes.wallet import SUMMARY_RECENT_ITEMS
+
+
+client = TestClient(app)
+
+
+def _started_jobs(customer, worker, prices):
+    with get_engine().begin() as conn:
+        conn.execute(models.Job.__table__.insert(), [
+            {"customer_id": customer.id, "worker_id": worker.id, "status": "started", "service_type": "Cleaning",
+             "otp": "4321", "price": price, "workers_needed": 1, "latitude": 0.0, "longitude": 0.0,
+             "address": "ledger"}
+            for price in prices
+        ])
+    db = SessionLocal()
+    try:
+        return [job_id for (job_id,) in db.query(models.Job.id).filter(models.Job.worker_id == worker.id)]
+    finally:
+        db.close()
+
+
+def test_split_is_exact_in_minor_units():
+    for price in (0.01, 0.07, 19.99, 33.33, 100.0, 1234.56):
+        worker, commission = ledger.split_price(to_minor(price))
+        assert worker + commission == to_minor(price)
+    assert ledger.split_price(to_minor(100.0)) == (8500, 1500)
+
+
+def test_concurrent_completions_post_each_job_exactly_once(create_user, auth_headers):
+    customer = create_user()
+    worker = create_user(role="individual_partner")
+    rng = random.Random(12)
+    prices = [round(rng.uniform(5, 250), 2) for _ in range(1000)]
+    job_ids = _started_jobs(customer, worker, prices)
+
+    # Every job is verified twice, concurrently, against the same wallet. In-flight
+    # requests stay below the pool size (5 + 10 overflow) so none time out waiting.
+    async def complete_all():
+        transport = httpx.ASGITransport(app=app)
+        in_flight = asyncio.Semaphore(12)
+        headers = auth_headers(worker)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as ac:
+            async def verify(job_id):
+                async with in_flight:
+                    return await ac.post(f"/api/bookings/{job_id}/verify-otp", params={"otp": "4321"}, headers=headers)
+            ids = job_ids * 2
+            random.Random(5).shuffle(ids)
+            return await asyncio.gather(*(verify(job_id) for job_id in ids))
+
+    responses = asyncio.run(complete_all())
+    assert {r.status_code for r in responses} == {200}
+
+    expected = sum(ledger.split_price(to_minor(p))[0] for p in prices)
+    db = SessionLocal()
+    try:
+        wallet = db.query(models.Wallet).filter(models.Wallet.user_id == worker.id).one()
+        assert wallet.balance_minor == expected
+        assert wallet.total_earnings_minor == expected
+        rows = db.query(models.Transaction.type, func.count(), func.sum(models.Transaction.amount_minor)).filter(
+            models.Transaction.job_id.in_(job_ids)
+        ).group_by(models.Transaction.type).all()
+        assert {t: (n, total) for t, n, total in rows} == {
+            "earning": (len(job_ids), expected),
+            "commission": (len(job_ids), sum(to_minor(p) for p in prices) - expected),
+        }
+    finally:
+        db.close()
+
+    balance = client.get("/api/wallet/balance", headers=auth_headers(worker)).json()
+    assert balance["balance"] == expected / 100
+
+    summary = client.get("/api/wallet/summary", params={"periods": 7}, headers=auth_headers(worker)).json()
+    assert summary["totals"]["today_minor"] == expected
+    assert summary["series"][-1]["amount_minor"] == expected and summary["series"][-1]["count"] == len(job_ids)
+    assert len(summary["series"]) == 7 and sum(b["amount_minor"] for b in summary["series"][:-1]) == 0
+
+
+def test_backfill_rebuilds_rollups_from_history(create_user, auth_headers):
+    worker = create_user(role="individual_partner")
+    today = datetime.utcnow().replace(hour=12, minute=0, second=0, microsecond=0)
+    rng = random.Random(7)
+    history = [(today - timedelta(days=rng.randrange(0, 120)), rng.randrange(100, 20000)) for _ in range(500)]
+    with get_engine().begin() as conn:
+        conn.execute(models.Transaction.__table__.insert(), [
+            {"user_id": worker.id, "type": "earning", "amount_minor": amount, "created_at": at,
+             "description": "history"}
+            for at, amount in history
+        ])
+
+    for _ in range(2):  # re-running must not double count
+        list(rollups.backfill(SessionLocal, batch_users=3))
+
+    weekly = {}
+    for at, amount in history:
+        start = rollups.period_start(at.date(), "week")
+        weekly[start] = weekly.get(start, 0) + amount
+    summary = client.get("/api/wallet/summary", params={"period": "week", "periods": 20},
+                         headers=auth_headers(worker)).json()
+    assert {b["start"]: b["amount_minor"] for b in summary["series"] if b["amount_minor"]} == {
+        start.isoformat(): total for start, total in weekly.items()
+        if start >= rollups.period_start(today.date(), "week") - timedelta(weeks=19)
+    }
+    assert summary["totals"]["today_minor"] == sum(a for at, a in history if at.date() == today.date())
+    assert len(summary["recent"]) == SUMMARY_RECENT_ITEMS
+
+
+def test_status_updates_cannot_complete_a_job_around_the_ledger(create_user, auth_headers):
+    customer = create_user()
+    worker = create_user(role="individual_partner")
+    started, legacy = _started_jobs(customer, worker, [20.0, 50.0])
+    headers = auth_headers(worker)
+
+    response = client.put(f"/api/bookings/{started}/status", params={"new_status": "completed"}, headers=headers)
+    assert response.status_code == 400
+    for _ in range(2):
+        response = client.post(f"/api/bookings/{started}/verify-otp", params={"otp": "4321"}, headers=headers)
+        assert response.status_code == 200 and response.json()["status"] == "completed"
+
+    # Completed by a status update before those were refused: still unpaid.
+    with get_engine().begin() as conn:
+        conn.execute(models.Job.__table__.update().where(models.Job.id == legacy).values(status="completed"))
+    for _ in range(2):
+        response = client.post(f"/api/bookings/{legacy}/verify-otp", params={"otp": "4321"}, headers=headers)
+        assert response.status_code == 200
+
+    db = SessionLocal()
+    try:
+        earnings = db.query(models.Transaction.job_id, models.Transaction.amount_minor).filter(
+            models.Transaction.user_id == worker.id
+        ).all()
+        assert sorted(earnings) == sorted([(started, 1700), (legacy, 4250)])
+        assert db.query(models.Wallet.balance_minor).filter(models.Wallet.user_id == worker.id).scalar() == 5950
+    finally:
+        db.close()
@@ -0,0 +1,110 @@
+import asyncio
+
+from app.routes.ws import ConnectionManager, EVICTED_CLOSE_CODE
+
+
+class FakeWebSocket:
+    """Records frames; `gate` (when set) holds every send until it is opened."""
+
+    def __init__(self, gate=None, fail=False):
+        self.frames = []
+        self.gate = gate
+        self.fail = fail
+        self.close_code = None
+
+    async def send_text(self, text):
+        if self.fail:
+            raise RuntimeError("connection reset")
+        if self.gate is not None:
+            await self.gate.wait()
+        self.frames.append(text)
+
+    async def close(self, code=1000):
+        self.close_code = code
+
+
+async def _settle():
+    for _ in range(10):
+        await asyncio.sleep(0)
+
+
+def test_slow_and_dead_sockets_do_not_hold_up_fan_out():
+    async def scenario():
+        manager = ConnectionManager(send_timeout=60)
+        stalled = FakeWebSocket(gate=asyncio.Event())
+        dead, fast = FakeWebSocket(fail=True), [FakeWebSocket() for _ in range(5)]
+        manager.register(stalled, 1)
+        manager.register(dead, 2)
+        for user_id, socket in enumerate(fast, start=3):
+            manager.register(socket, user_id)
+
+        await manager.broadcast({"type": "hello"})
+        await manager.send_personal_message({"type": "direct"}, 3)
+        await _settle()
+
+        assert [s.frames for s in fast] == [['{"type":"hello"}', '{"type":"direct"}']] + [['{"type":"hello"}']] * 4
+        assert stalled.frames == [] and 2 not in manager.active_connections
+        assert manager.stats()["send_failures"] == 1
+
+        stalled.gate.set()
+        await _settle()
+        assert stalled.frames == ['{"type":"hello"}']
+        manager.shutdown()
+
+    asyncio.run(scenario())
+
+
+def test_location_updates_coalesce_while_the_queue_is_backed_up():
+    async def scenario():
+        manager = ConnectionManager(send_timeout=60)
+        socket = FakeWebSocket(gate=asyncio.Event())
+        manager.register(socket, 1)
+
+        await manager.send_personal_message({"type": "first"}, 1)
+        await _settle()  # the writer is now blocked on "first"
+        for i in range(50):
+            for job_id in (7, 8):
+                await manager.send_personal_message({"type": "location_update", "jobId": job_id, "data": {"i": i}}, 1,
+                                                    coalesce=("location_update", job_id))
+            if i == 10:
+                await manager.send_personal_message({"type": "job_status_update"}, 1)
+
+        socket.gate.set()
+        await _settle()
+        assert socket.frames == [
+            '{"type":"first"}',
+            '{"type":"location_update","jobId":7,"data":{"i":49}}',
+            '{"type":"location_update","jobId":8,"data":{"i":49}}',
+            '{"type":"job_status_update"}',
+        ]
+        assert manager.stats()["coalesced"] == 98
+        manager.shutdown()
+
+    asyncio.run(scenario())
+
+
+def test_slow_consumer_is_evicted():
+    async def scenario():
+        manager = ConnectionManager(queue_size=3, send_timeout=60)
+        slow, other = FakeWebSocket(gate=asyncio.Event()), FakeWebSocket()
+        manager.register(slow, 1)
+        manager.register(other, 1)
+
+        for i in range(5):
+            await manager.send_personal_message({"n": i}, 1)
+            await _settle()
+
+        assert slow.close_code == EVICTED_CLOSE_CODE
+        assert [c.websocket for c in manager.active_connections[1]] == [other]
+        assert len(other.frames) == 5 and manager.stats()["evicted"] == 1
+
+        # A send that never completes is cut off by the timeout as well.
+        manager.send_timeout = 0.01
+        stuck = FakeWebSocket(gate=asyncio.Event())
+        manager.register(stuck, 2)
+        await manager.send_personal_message({"n": 0}, 2)
+        await asyncio.sleep(0.1)
+        assert stuck.close_code == EVICTED_CLOSE_CODE and 2 not in manager.active_connections
+        manager.shutdown()
+
+    asyncio.run(scenario())
@@ -1,6 +1,7 @@
 import 'dart:convert';
 import 'package:http/http.dart' as http;
 import '../services/auth_service.dart';
+import 'paged_listing.dart';
 
 class AdminService {
   final AuthService _authService = AuthService();
@@ -32,16 +33,7 @@ class AdminService {
 
   Future<List<dynamic>> getUsers() async {
     try {
-      final response = await http.get(
-        Uri.parse('$API_URL/admin/users'),
-        headers: await _getHeaders(),
-      );
-
-      if (response.statusCode == 200) {
-        return jsonDecode(response.body);
-      } else {
-        throw jsonDecode(response.body)['detail'] ?? 'Failed to fetch users';
-      }
+      return await getAllPages(Uri.parse('$API_URL/admin/users'), await _getHeaders());
     } catch (e) {
       throw 'Failed to fetch users: ${e.toString()}';
     }
@@ -64,16 +56,7 @@ class AdminService {
 
   Future<List<dynamic>> getPendingApprovals() async {
     try {
-      final response = await http.get(
-        Uri.parse('$API_URL/admin/partner-approvals'),
-        headers: await _getHeaders(),
-      );
-
-      if (response.statusCode == 200) {
-        return jsonDecode(response.body);
-      } else {
-        throw jsonDecode(response.body)['detail'] ?? 'Failed to fetch approvals';
-      }
+      return await getAllPages(Uri.parse('$API_URL/admin/partner-approvals'), await _getHeaders());
     } catch (e) {
       throw 'Failed to fetch approvals: ${e.toString()}';
     }
@@ -3,6 +3,7 @@ import 'dart:convert';
 import 'package:flutter/foundation.dart';
 import 'package:http/http.dart' as http;
 import 'package:flutter_secure_storage/flutter_secure_storage.dart';
+import 'paged_listing.dart';
 
 const String API_URL = 'http://127.0.0.1:8000/api';
 
@@ -38,11 +39,12 @@ class ApiService {
 
   Future<List<Map<String, dynamic>>> getUserBookings() async {
      final headers = await _getAuthHeaders();
-     final response = await http.get(Uri.parse('$API_URL/bookings/customer'), headers: headers);
-     if (response.statusCode == 200) {
-       return jsonDecode(response.body).cast<Map<String, dynamic>>();
+     try {
+       final data = await getAllPages(Uri.parse('$API_URL/bookings/customer'), headers);
+       return data.cast<Map<String, dynamic>>();
+     } on http.ClientException {
+       return [];
      }
-     return [];
   }
 
   Future<void> updateBookingStatus(String bookingId, String status) async {
@@ -58,10 +60,11 @@ class ApiService {
 
   Future<List<Map<String, dynamic>>> getPartnerJobs() async {
      final headers = await _getAuthHeaders();
-     final response = await http.get(Uri.parse('$API_URL/bookings/worker'), headers: headers);
-     if (response.statusCode == 200) {
-       return jsonDecode(response.body).cast<Map<String, dynamic>>();
+     try {
+       final data = await getAllPages(Uri.parse('$API_URL/bookings/worker'), headers);
+       return data.cast<Map<String, dynamic>>();
+     } on http.ClientException {
+       return [];
      }
-     return [];
   }
 }
@@ -4,6 +4,7 @@ import 'package:flutter/foundation.dart';
 import 'package:http/http.dart' as http;
 import 'package:flutter_secure_storage/flutter_secure_storage.dart';
 import 'package:web_socket_channel/web_socket_channel.dart';
+import 'paged_listing.dart';
 
 const String API_URL = 'http://127.0.0.1:8000/api';
 const String WS_URL = 'ws://127.0.0.1:8000/api/ws';
@@ -124,12 +125,12 @@ class JobService {
   // ============================================
 
   Stream<List<Map<String, dynamic>>> getCustomerJobs(String customerId) {
-    _fetchAndAdd(Uri.parse('$API_URL/bookings/customer'), _customerJobsController);
+    _fetchAndAdd(Uri.parse('$API_URL/bookings/customer'), _customerJobsController, allPages: true);
     return _customerJobsController.stream;
   }
 
   Stream<List<Map<String, dynamic>>> getWorkerJobs(String workerId) {
-    _fetchAndAdd(Uri.parse('$API_URL/bookings/worker'), _workerJobsController);
+    _fetchAndAdd(Uri.parse('$API_URL/bookings/worker'), _workerJobsController, allPages: true);
     return _workerJobsController.stream;
   }
 
@@ -144,9 +145,17 @@ class JobService {
     return _jobStreamController.stream;
   }
 
-  Future<void> _fetchAndAdd(Uri url, StreamController<List<Map<String, dynamic>>> controller) async {
+  // allPages follows X-Next-Cursor for full histories; the nearby
+  // /available feed only needs its first (nearest) page.
+  Future<void> _fetchAndAdd(Uri url, StreamController<List<Map<String, dynamic>>> controller,
+      {bool allPages = false}) async {
     try {
       final headers = await _getAuthHeaders();
+      if (allPages) {
+        final data = await getAllPages(url, headers);
+        controller.add(data.cast<Map<String, dynamic>>());
+        return;
+      }
       final response = await http.get(url, headers: headers);
       if (response.statusCode == 200) {
         List<dynamic> data = jsonDecode(response.body);
@@ -4,6 +4,7 @@ import 'package:flutter/foundation.dart';
 import 'package:http/http.dart' as http;
 import 'package:flutter_secure_storage/flutter_secure_storage.dart';
 import 'package:web_socket_channel/web_socket_channel.dart';
+import 'paged_listing.dart';
 
 const String API_URL = 'http://127.0.0.1:8000/api';
 const String WS_URL = 'ws://127.0.0.1:8000/api/ws';
@@ -30,9 +31,13 @@ class JobServiceClient {
   // Connect WebSocket to receive real-time updates for jobs
   Future<void> connectWebSocket() async {
     final userId = await _storage.read(key: 'userId');
-    if (userId == null) return;
+    final token = await _storage.read(key: 'jwt');
+    if (userId == null || token == null) return;
 
-    _channel = WebSocketChannel.connect(Uri.parse('$WS_URL/$userId'));
+    // The server closes sockets (code 4401) without a token for this user.
+    _channel = WebSocketChannel.connect(
+      Uri.parse('$WS_URL/$userId').replace(queryParameters: {'token': token}),
+    );
     _channel?.stream.listen((message) {
       final decoded = jsonDecode(message);
       // Depending on the signal (new_job, status_update), you could trigger a refetch or patch state directly.
@@ -149,11 +154,8 @@ class JobServiceClient {
   Future<void> fetchCustomerJobs() async {
     try {
       final headers = await _getAuthHeaders();
-      final response = await http.get(Uri.parse('$API_URL/bookings/customer'), headers: headers);
-      if (response.statusCode == 200) {
-        List<dynamic> data = jsonDecode(response.body);
-        _customerJobsController.add(data.cast<Map<String, dynamic>>());
-      }
+      final data = await getAllPages(Uri.parse('$API_URL/bookings/customer'), headers);
+      _customerJobsController.add(data.cast<Map<String, dynamic>>());
     } catch (e) {
       debugPrint("Error fetching customer jobs: $e");
     }
@@ -162,11 +164,8 @@ class JobServiceClient {
   Future<void> fetchWorkerJobs() async {
     try {
       final headers = await _getAuthHeaders();
-      final response = await http.get(Uri.parse('$API_URL/bookings/worker'), headers: headers);
-      if (response.statusCode == 200) {
-        List<dynamic> data = jsonDecode(response.body);
-        _workerJobsController.add(data.cast<Map<String, dynamic>>());
-      }
+      final data = await getAllPages(Uri.parse('$API_URL/bookings/worker'), headers);
+      _workerJobsController.add(data.cast<Map<String, dynamic>>());
     } catch (e) {
       debugPrint("Error fetching worker jobs: $e");
     }
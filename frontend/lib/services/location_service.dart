@@ -2,35 +2,94 @@ import 'dart:async';
 import 'dart:convert';
 import 'package:geolocator/geolocator.dart';
 import 'package:flutter/foundation.dart';
+import 'package:http/http.dart' as http;
 import 'package:web_socket_channel/web_socket_channel.dart';
 import 'package:flutter_secure_storage/flutter_secure_storage.dart';
 
 const String WS_URL = 'ws://127.0.0.1:8000/api/ws';
 const String API_URL = 'http://127.0.0.1:8000/api';
 
+// Compact location frames, offered when connecting (see the backend's
+// app/tracking.py): lists of ["L", jobId, lat, lon, heading?, speed?] or
+// ["D", jobId, dlat, dlon, ...] with coordinates in 1e-5 degrees, heading in
+// degrees and speed in 0.1 m/s.
+const String LOCATION_PROTOCOL = 'clenzy.loc1';
+const int COORD_SCALE = 100000;
+
 class LocationService {
   final _storage = const FlutterSecureStorage();
   
   Timer? _locationTimer;
   String? _activeJobId;
   WebSocketChannel? _channel;
+  bool _compact = false;
+  // Last position per job sent and received, the base of "D" events.
+  final Map<int, List<int>> _sent = {};
+  final Map<int, List<int>> _received = {};
   
   final _liveLocationController = StreamController<Map<String, dynamic>?>.broadcast();
 
   // Connect WebSocket to receive/send real-time location
   Future<void> connectWebSocket() async {
     final userId = await _storage.read(key: 'userId');
-    if (userId == null) return;
+    final token = await _storage.read(key: 'jwt');
+    if (userId == null || token == null) return;
 
-    _channel = WebSocketChannel.connect(Uri.parse('$WS_URL/$userId'));
+    // The server closes sockets (code 4401) without a token for this user.
+    _channel = WebSocketChannel.connect(
+      Uri.parse('$WS_URL/$userId').replace(queryParameters: {'token': token}),
+      protocols: [LOCATION_PROTOCOL],
+    );
+    _sent.clear();
+    _received.clear();
+    await _channel?.ready;
+    _compact = _channel?.protocol == LOCATION_PROTOCOL;
     _channel?.stream.listen((message) {
       final decoded = jsonDecode(message);
-      if (decoded['type'] == 'location_update') {
+      if (decoded is List) {
+        for (final event in decoded) {
+          final data = _decodeEvent(event);
+          if (data != null) _liveLocationController.add(data);
+        }
+      } else if (decoded['type'] == 'location_update') {
          _liveLocationController.add(decoded['data']);
       }
     });
   }
 
+  Map<String, dynamic>? _decodeEvent(List event) {
+    final int jobId = event[1];
+    int lat = event[2], lon = event[3];
+    if (event[0] == 'D') {
+      final base = _received[jobId];
+      if (base == null) return null;
+      lat += base[0];
+      lon += base[1];
+    }
+    _received[jobId] = [lat, lon];
+    return {
+      'latitude': lat / COORD_SCALE,
+      'longitude': lon / COORD_SCALE,
+      if (event.length > 4 && event[4] != null) 'heading': event[4],
+      if (event.length > 5 && event[5] != null) 'speed': event[5] / 10,
+    };
+  }
+
+  List<Object?> _encodeEvent(int jobId, Position position) {
+    final lat = (position.latitude * COORD_SCALE).round();
+    final lon = (position.longitude * COORD_SCALE).round();
+    final base = _sent[jobId];
+    _sent[jobId] = [lat, lon];
+    return [
+      base == null ? 'L' : 'D',
+      jobId,
+      base == null ? lat : lat - base[0],
+      base == null ? lon : lon - base[1],
+      position.heading >= 0 ? position.heading.round() % 360 : null,
+      position.speed >= 0 ? (position.speed * 10).round() : null,
+    ];
+  }
+
   // ============================================
   // GET CURRENT LOCATION
   // ============================================
@@ -88,6 +147,11 @@ class LocationService {
       if (position == null) return;
 
       // Broadcast location directly via WebSocket
+      final jobId = int.tryParse(_activeJobId!);
+      if (_compact && jobId != null) {
+        _channel?.sink.add(jsonEncode([_encodeEvent(jobId, position)]));
+        return;
+      }
       _channel?.sink.add(jsonEncode({
         'type': 'location_update',
         'jobId': _activeJobId,
@@ -120,9 +184,25 @@ class LocationService {
     Position? location,
   }) async {
     try {
-      // In a real application, this would be an HTTP POST
-      // to update the user's `is_online` and `latitude`/`longitude` fields.
-      // E.g., http.put('$API_URL/users/status', body: { isOnline, ... })
+      final token = await _storage.read(key: 'jwt');
+      if (token == null) throw Exception('No authentication token found');
+      // Going online with a position also makes the partner eligible for
+      // pushed job offers (`job_offer` messages on the websocket).
+      final response = await http.put(
+        Uri.parse('$API_URL/users/status'),
+        headers: {
+          'Content-Type': 'application/json',
+          'Authorization': 'Bearer $token',
+        },
+        body: jsonEncode({
+          'is_online': isOnline,
+          if (location != null) 'latitude': location.latitude,
+          if (location != null) 'longitude': location.longitude,
+        }),
+      );
+      if (response.statusCode != 200) {
+        throw Exception('Failed to update status: ${response.body}');
+      }
     } catch (e) {
       debugPrint('Error updating worker status: $e');
       rethrow;
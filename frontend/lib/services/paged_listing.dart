@@ -0,0 +1,30 @@
+import 'dart:convert';
+import 'package:http/http.dart' as http;
+
+// Listing endpoints (bookings, transactions, admin lists) return one page as a
+// JSON array; when more rows exist the cursor for the next page comes back in
+// the X-Next-Cursor header. These helpers follow it to the end.
+const String NEXT_CURSOR_HEADER = 'x-next-cursor';
+// The server's MAX_PAGE_SIZE, so a full history takes as few requests as possible.
+const int LISTING_PAGE_SIZE = 500;
+
+Future<List<dynamic>> getAllPages(Uri url, Map<String, String> headers) async {
+  final items = <dynamic>[];
+  String? cursor;
+  do {
+    final response = await http.get(
+      url.replace(queryParameters: {
+        ...url.queryParameters,
+        'limit': '$LISTING_PAGE_SIZE',
+        if (cursor != null) 'cursor': cursor,
+      }),
+      headers: headers,
+    );
+    if (response.statusCode != 200) {
+      throw http.ClientException('HTTP ${response.statusCode}: ${response.body}', url);
+    }
+    items.addAll(jsonDecode(response.body) as List<dynamic>);
+    cursor = response.headers[NEXT_CURSOR_HEADER];
+  } while (cursor != null);
+  return items;
+}
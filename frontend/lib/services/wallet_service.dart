@@ -3,6 +3,7 @@ import 'dart:convert';
 import 'package:flutter/foundation.dart';
 import 'package:http/http.dart' as http;
 import 'package:flutter_secure_storage/flutter_secure_storage.dart';
+import 'paged_listing.dart';
 
 const String API_URL = 'http://127.0.0.1:8000/api';
 
@@ -63,11 +64,8 @@ class WalletService {
   Future<void> fetchTransactions() async {
     try {
       final headers = await _getAuthHeaders();
-      final response = await http.get(Uri.parse('$API_URL/wallet/transactions'), headers: headers);
-      if (response.statusCode == 200) {
-        List<dynamic> data = jsonDecode(response.body);
-        _transactionsController.add(data.cast<Map<String, dynamic>>());
-      }
+      final data = await getAllPages(Uri.parse('$API_URL/wallet/transactions'), headers);
+      _transactionsController.add(data.cast<Map<String, dynamic>>());
     } catch (e) {
       debugPrint('Error fetching transactions: $e');
     }